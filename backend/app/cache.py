@@ -0,0 +1,459 @@
+"""
+In-process cache với TTL theo từng entry, giới hạn kích thước (LRU) và
+invalidation theo tag
+
+Thay cho các dict cache viết tay trong main.py (một timestamp chung cho cả
+dict, không giới hạn kích thước, một lần ghi xóa sạch mọi key).
+
+Ví dụ:
+    orders_cache = get_cache("admin_orders", maxsize=256, ttl=120)
+    orders_cache.set(key, response, tags=("orders",))
+    invalidate_tags("orders")  # chỉ xóa các entry gắn tag "orders"
+
+Với các query đắt (aggregation), dùng get_or_compute để các request đồng thời
+cùng key chỉ chạy 1 lần (single-flight) và phục vụ bản cũ trong lúc refresh
+nền (stale-while-revalidate):
+    response = await dashboard_cache.get_or_compute("dashboard", build, tags=("dashboard",))
+
+Chạy nhiều worker: start_backend(create_cache_backend()) khi startup - cache có
+shared=True dùng thêm L2 trên Redis, invalidate_tags() được phát tới mọi worker
+(xem app/cache_backend.py).
+
+Thông báo không phải invalidation (delta co-occurrence, event WebSocket dashboard...)
+dùng publish_event()/add_event_listener() - đi trên channel riêng, không tạo tag.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set
+
+from app.cache_backend import LocalCacheBackend
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+# Dọn _tag_invalidated_at tối đa 1 lần / khoảng này (seconds)
+TAG_TIMESTAMP_PRUNE_INTERVAL = 60
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "stale_until", "tags")
+
+    def __init__(self, value: Any, expires_at: float, stale_until: float, tags: frozenset):
+        self.value = value
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+        self.tags = tags
+
+
+class _Flight:
+    """Một lần compute đang chạy cho 1 key, các caller khác await chung task"""
+    __slots__ = ("task", "tags", "background", "discard")
+
+    def __init__(self, tags: frozenset, background: bool):
+        self.task: Optional[asyncio.Task] = None
+        self.tags = tags
+        self.background = background
+        # True nếu key/tag bị invalidate trong lúc đang compute -> không ghi kết quả vào cache
+        self.discard = False
+
+
+class TTLCache:
+    """
+    Cache LRU có giới hạn kích thước, TTL riêng cho từng entry
+
+    - get/set O(1), entry hết hạn bị xóa khi đọc tới (lazy expiry)
+    - Khi vượt maxsize, entry ít dùng nhất bị loại (LRU eviction)
+    - Mỗi entry có thể gắn nhiều tag, invalidate_tag() chỉ xóa các entry đó
+    - stale_ttl > 0: entry hết hạn vẫn được giữ thêm stale_ttl giây để
+      get_or_compute trả ngay bản cũ trong khi refresh nền
+    - shared=True: get_or_compute đọc/ghi thêm backend dùng chung (L2) giữa các worker,
+      value phải pickle được
+    """
+
+    def __init__(self, name: str, maxsize: int = 256, ttl: float = 60, stale_ttl: float = 0, shared: bool = False):
+        if maxsize <= 0:
+            raise ValueError("maxsize phải lớn hơn 0")
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.shared = shared
+        self._data: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._tag_index: Dict[str, Set[Hashable]] = {}
+        self._inflight: Dict[Hashable, _Flight] = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.coalesced = 0
+        self.stale_hits = 0
+        self.refresh_errors = 0
+
+    # ---------- internal ----------
+
+    def _unlink(self, key: Hashable, entry: _Entry):
+        for tag in entry.tags:
+            keys = self._tag_index.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_index[tag]
+
+    def _remove(self, key: Hashable) -> Optional[_Entry]:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._unlink(key, entry)
+        return entry
+
+    def _discard_inflight(self, key: Hashable = _MISSING, tag: Optional[str] = None):
+        """Đánh dấu các compute đang chạy (theo key/tag, hoặc tất cả) không được ghi vào cache"""
+        for flight_key, flight in self._inflight.items():
+            if key is _MISSING and tag is None:
+                flight.discard = True
+            elif key is not _MISSING and flight_key == key:
+                flight.discard = True
+            elif tag is not None and tag in flight.tags:
+                flight.discard = True
+
+    async def _run_flight(
+        self,
+        key: Hashable,
+        flight: _Flight,
+        compute: Callable[[], Awaitable[Any]],
+        ttl: Optional[float],
+    ):
+        ttl = self.ttl if ttl is None else ttl
+        backend = _backend if self.shared and _backend.shared else None
+
+        # L2: worker khác có thể đã tính xong
+        if backend is not None:
+            found, cached = await backend.get(self.name, key)
+            if found:
+                value, stored_at, remaining = cached
+                # Bỏ qua bản L2 ghi trước lần invalidate gần nhất của tag
+                # (lệnh xóa L2 chạy bất đồng bộ nên có thể chưa tới Redis)
+                if not _invalidated_since(flight.tags, stored_at):
+                    with self._lock:
+                        if not flight.discard and remaining > 0:
+                            self.set(key, value, ttl=remaining, tags=flight.tags)
+                    return value
+
+        value = await compute()
+        with self._lock:
+            discard = flight.discard
+            if not discard:
+                self.set(key, value, ttl=ttl, tags=flight.tags)
+        if backend is not None and not discard:
+            await backend.set(self.name, key, value, ttl, flight.tags)
+        return value
+
+    def _finish_flight(self, key: Hashable, flight: _Flight, task: asyncio.Task):
+        with self._lock:
+            if self._inflight.get(key) is flight:
+                del self._inflight[key]
+        if task.cancelled():
+            return
+        error = task.exception()  # luôn lấy exception để asyncio không cảnh báo "never retrieved"
+        if error is not None and flight.background:
+            # Refresh nền lỗi: giữ bản stale, lần hết hạn sau sẽ thử lại
+            self.refresh_errors += 1
+            logger.warning(f"Cache '{self.name}' background refresh failed for key {key!r}: {error}")
+
+    def _start_flight(
+        self,
+        key: Hashable,
+        compute: Callable[[], Awaitable[Any]],
+        ttl: Optional[float],
+        tags: Iterable[str],
+        background: bool = False,
+    ) -> _Flight:
+        flight = _Flight(frozenset(tags), background)
+        flight.task = asyncio.ensure_future(self._run_flight(key, flight, compute, ttl))
+        flight.task.add_done_callback(lambda task: self._finish_flight(key, flight, task))
+        self._inflight[key] = flight
+        return flight
+
+    # ---------- public API ----------
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Lấy giá trị còn hạn, trả về default nếu không có/hết hạn"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            now = time.monotonic()
+            if entry.expires_at <= now:
+                # Còn trong cửa sổ stale thì giữ lại cho get_or_compute
+                if entry.stale_until <= now:
+                    self._remove(key)
+                    self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    async def get_or_compute(
+        self,
+        key: Hashable,
+        compute: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None,
+        tags: Iterable[str] = (),
+    ) -> Any:
+        """
+        Lấy giá trị từ cache, nếu miss thì gọi compute() - mỗi key chỉ 1 compute chạy cùng lúc
+
+        - Entry còn hạn: trả về ngay
+        - Entry hết hạn nhưng còn trong cửa sổ stale: trả bản cũ, refresh nền (1 task)
+        - Miss: caller đầu tiên chạy compute, các caller đồng thời await chung kết quả
+          (exception của compute cũng được trả cho tất cả)
+
+        compute chạy trong task riêng nên vẫn hoàn tất và được cache dù request
+        khởi tạo bị hủy giữa chừng.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                now = time.monotonic()
+                if entry.expires_at > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return entry.value
+                if entry.stale_until > now:
+                    self.stale_hits += 1
+                    if key not in self._inflight:
+                        self._start_flight(key, compute, ttl, tags, background=True)
+                    return entry.value
+                self._remove(key)
+                self.expirations += 1
+
+            flight = self._inflight.get(key)
+            if flight is not None:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+                flight = self._start_flight(key, compute, ttl, tags)
+
+        return await asyncio.shield(flight.task)
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, tags: Iterable[str] = ()):
+        """Lưu giá trị với TTL (mặc định self.ttl) và danh sách tag"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        entry = _Entry(value, expires_at, expires_at + self.stale_ttl, frozenset(tags))
+        with self._lock:
+            self._remove(key)
+            self._data[key] = entry
+            for tag in entry.tags:
+                self._tag_index.setdefault(tag, set()).add(key)
+            while len(self._data) > self.maxsize:
+                old_key, old_entry = self._data.popitem(last=False)
+                self._unlink(old_key, old_entry)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> bool:
+        with self._lock:
+            self._discard_inflight(key=key)
+            return self._remove(key) is not None
+
+    def invalidate_tag(self, tag: str) -> int:
+        """Xóa tất cả entry gắn tag (kể cả bản stale), trả về số entry đã xóa"""
+        with self._lock:
+            self._discard_inflight(tag=tag)
+            keys = self._tag_index.pop(tag, None)
+            if not keys:
+                return 0
+            for key in list(keys):
+                self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._discard_inflight()
+            self.invalidations += len(self._data)
+            self._data.clear()
+            self._tag_index.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "stale_ttl": self.stale_ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "coalesced": self.coalesced,
+                "stale_hits": self.stale_hits,
+                "refresh_errors": self.refresh_errors,
+                "inflight": len(self._inflight),
+                "shared": self.shared,
+            }
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# Registry - để invalidate theo tag và xem thống kê trên tất cả cache
+_caches: Dict[str, TTLCache] = {}
+
+# Backend dùng chung giữa các worker (mặc định: không chia sẻ)
+_backend = LocalCacheBackend()
+_pending_publishes: Set[asyncio.Task] = set()
+
+# Thời điểm (wall clock) tag bị invalidate gần nhất - để loại bản L2 cũ
+# Chỉ cần giữ trong thời gian sống tối đa của 1 entry, sau đó bị _prune_tag_timestamps dọn
+_tag_invalidated_at: Dict[str, float] = {}
+_tag_pruned_at = 0.0
+
+# Listener nhận mọi invalidation (tags, remote) - cho các index in-memory ngoài cache
+_invalidation_listeners: List[Callable[[Iterable[str], bool], None]] = []
+
+# Listener theo topic cho event từ worker khác (publish_event)
+_event_listeners: Dict[str, List[Callable[[Any], Any]]] = {}
+_pending_event_handlers: Set[asyncio.Task] = set()
+
+
+def get_cache(name: str, maxsize: int = 256, ttl: float = 60, stale_ttl: float = 0, shared: bool = False) -> TTLCache:
+    """Lấy (hoặc tạo) cache theo tên"""
+    cache = _caches.get(name)
+    if cache is None:
+        cache = TTLCache(name, maxsize=maxsize, ttl=ttl, stale_ttl=stale_ttl, shared=shared)
+        _caches[name] = cache
+    return cache
+
+
+def _invalidated_since(tags: Iterable[str], timestamp: float) -> bool:
+    return any(_tag_invalidated_at.get(tag, 0) >= timestamp for tag in tags)
+
+
+def _prune_tag_timestamps(now: float):
+    """
+    Bỏ timestamp invalidate cũ hơn TTL + stale_ttl lớn nhất: không còn entry L2 nào
+    ghi trước thời điểm đó, giữ lại cũng không loại thêm được gì (tag theo user/sản phẩm
+    sẽ làm dict tăng mãi nếu không dọn)
+    """
+    global _tag_pruned_at
+    if now - _tag_pruned_at < TAG_TIMESTAMP_PRUNE_INTERVAL:
+        return
+    _tag_pruned_at = now
+    max_age = max((cache.ttl + cache.stale_ttl for cache in _caches.values()), default=0)
+    horizon = now - max_age - TAG_TIMESTAMP_PRUNE_INTERVAL
+    for tag in [tag for tag, at in _tag_invalidated_at.items() if at < horizon]:
+        del _tag_invalidated_at[tag]
+
+
+def add_invalidation_listener(listener: Callable[[Iterable[str], bool], None]):
+    """Đăng ký callback(tags, remote) được gọi sau mỗi lần invalidate (local hoặc từ worker khác)"""
+    _invalidation_listeners.append(listener)
+
+
+def _invalidate_local(tags: Iterable[str], remote: bool = False) -> int:
+    now = time.time()
+    _prune_tag_timestamps(now)
+    for tag in tags:
+        _tag_invalidated_at[tag] = now
+    removed = 0
+    for cache in _caches.values():
+        for tag in tags:
+            removed += cache.invalidate_tag(tag)
+    for listener in _invalidation_listeners:
+        try:
+            listener(tags, remote)
+        except Exception as e:
+            logger.warning(f"Invalidation listener failed: {e}")
+    return removed
+
+
+def invalidate_tags(*tags: str) -> int:
+    """
+    Invalidate các tag trên mọi cache đã đăng ký
+
+    L1 của worker hiện tại bị xóa ngay (đồng bộ). Nếu có backend dùng chung,
+    L2 + L1 của các worker khác được xóa bất đồng bộ qua pub/sub.
+    """
+    removed = _invalidate_local(tags)
+    if _backend.shared and tags:
+        _track(_pending_publishes, _backend.invalidate(tags))
+    return removed
+
+
+def _on_remote_invalidate(tags: Iterable[str]):
+    """Invalidation nhận từ worker khác - chỉ xóa local, không publish lại"""
+    _invalidate_local(tags, remote=True)
+
+
+def _track(tasks: Set[asyncio.Task], coro) -> None:
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        coro.close()
+        return
+    task = loop.create_task(coro)
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
+
+
+def add_event_listener(topic: str, listener: Callable[[Any], Any]):
+    """Đăng ký listener(data) cho event của topic do worker KHÁC publish (listener async cũng được)"""
+    _event_listeners.setdefault(topic, []).append(listener)
+
+
+def publish_event(topic: str, data: Any) -> None:
+    """
+    Gửi event tới các worker khác (fire-and-forget), data phải JSON hóa được
+
+    Worker hiện tại không nhận lại event của chính mình - caller tự xử lý local.
+    Chạy 1 worker (backend local) thì không làm gì.
+    """
+    if _backend.shared:
+        _track(_pending_publishes, _backend.publish_event(topic, data))
+
+
+def _on_remote_event(topic: str, data: Any):
+    for listener in _event_listeners.get(topic, ()):
+        try:
+            result = listener(data)
+            if asyncio.iscoroutine(result):
+                _track(_pending_event_handlers, result)
+        except Exception as e:
+            logger.warning(f"Event listener for '{topic}' failed: {e}")
+
+
+async def start_backend(backend) -> None:
+    """Gắn backend dùng chung (gọi trong startup event)"""
+    global _backend
+    await backend.start(_on_remote_invalidate, _on_remote_event)
+    _backend = backend
+    logger.info(f"Cache backend: {backend.stats().get('backend')}")
+
+
+async def stop_backend() -> None:
+    global _backend
+    if _pending_publishes:
+        await asyncio.gather(*_pending_publishes, return_exceptions=True)
+    await _backend.stop()
+    _backend = LocalCacheBackend()
+
+
+def cache_stats() -> Dict[str, Any]:
+    stats: Dict[str, Any] = {name: cache.stats() for name, cache in _caches.items()}
+    stats["_backend"] = _backend.stats()
+    return stats
@@ -0,0 +1,250 @@
+"""
+Backend cache dùng chung giữa nhiều worker (uvicorn --workers N / nhiều container)
+
+- LocalCacheBackend: mặc định, mỗi process một cache riêng (chạy 1 worker)
+- RedisCacheBackend: bật khi có REDIS_URL
+    + L2 dùng chung: worker A tính xong thì worker B đọc lại, không phải query lại MongoDB
+    + Invalidation theo tag được publish qua pub/sub, mọi worker xóa L1 của mình
+    + Event (WebSocket dashboard, delta co-occurrence...) đi trên channel riêng {prefix}:events,
+      không qua index tag của cache
+
+TTLCache trong app/cache.py vẫn là L1 (in-process), backend chỉ là lớp phía sau.
+Redis lỗi/mất kết nối thì cache tự rơi về chế độ local, request không bị lỗi.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import pickle
+import socket
+import time
+import uuid
+from typing import Any, Callable, Iterable, Optional, Tuple
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "")
+CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "vyron:cache")
+# Tag set phải sống lâu hơn mọi value gắn tag (các cache có TTL khác nhau dùng chung tag)
+TAG_SET_TTL = 3600  # seconds
+
+# Định danh worker - bỏ qua message invalidation do chính mình publish
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+_NOT_FOUND: Tuple[bool, Any] = (False, None)
+
+
+class LocalCacheBackend:
+    """Không chia sẻ gì - giữ hành vi 1 process như trước"""
+
+    shared = False
+
+    async def start(self, on_remote_invalidate: Callable[[Iterable[str]], None],
+                    on_remote_event: Optional[Callable[[str, Any], None]] = None):
+        return None
+
+    async def stop(self):
+        return None
+
+    async def publish_event(self, topic: str, data: Any):
+        return None
+
+    async def get(self, namespace: str, key: Any) -> Tuple[bool, Any]:
+        return _NOT_FOUND
+
+    async def set(self, namespace: str, key: Any, value: Any, ttl: float, tags: Iterable[str] = ()):
+        return None
+
+    async def invalidate(self, tags: Iterable[str]):
+        return None
+
+    def stats(self) -> dict:
+        return {"backend": "local", "worker_id": WORKER_ID}
+
+
+class RedisCacheBackend:
+    """
+    L2 cache + pub/sub invalidation trên Redis
+
+    Layout key:
+        {prefix}:v:{namespace}:{key}  -> pickle((stored_at, expires_at, value)), PX = ttl
+        {prefix}:t:{tag}              -> SET các value key gắn tag (để xóa theo tag)
+    """
+
+    shared = True
+
+    def __init__(self, url: str, prefix: str = CACHE_KEY_PREFIX):
+        if aioredis is None:
+            raise RuntimeError("Thiếu package 'redis' (pip install redis) để dùng REDIS_URL")
+        self.url = url
+        self.prefix = prefix
+        self.channel = f"{prefix}:invalidate"
+        self.events_channel = f"{prefix}:events"
+        self._redis = aioredis.from_url(url)
+        self._listener: Optional[asyncio.Task] = None
+        self._on_remote_invalidate: Optional[Callable[[Iterable[str]], None]] = None
+        self._on_remote_event: Optional[Callable[[str, Any], None]] = None
+        self.l2_hits = 0
+        self.l2_misses = 0
+        self.errors = 0
+        self.published = 0
+        self.received = 0
+        self.events_published = 0
+        self.events_received = 0
+
+    def _value_key(self, namespace: str, key: Any) -> str:
+        return f"{self.prefix}:v:{namespace}:{key}"
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.prefix}:t:{tag}"
+
+    # ---------- lifecycle ----------
+
+    async def start(self, on_remote_invalidate: Callable[[Iterable[str]], None],
+                    on_remote_event: Optional[Callable[[str, Any], None]] = None):
+        self._on_remote_invalidate = on_remote_invalidate
+        self._on_remote_event = on_remote_event
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._listener = None
+        await self._redis.aclose()
+
+    async def _listen(self):
+        """Nhận invalidation + event từ worker khác, tự reconnect khi mất kết nối"""
+        events_channel = self.events_channel.encode()
+        while True:
+            pubsub = self._redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel, self.events_channel)
+                logger.info(f"Cache invalidation listener subscribed to {self.channel}, {self.events_channel} ({WORKER_ID})")
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        payload = json.loads(message["data"])
+                    except (TypeError, ValueError):
+                        continue
+                    if payload.get("worker") == WORKER_ID:
+                        continue
+                    if message.get("channel") in (events_channel, self.events_channel):
+                        self.events_received += 1
+                        if payload.get("topic") and self._on_remote_event is not None:
+                            self._on_remote_event(payload["topic"], payload.get("data"))
+                        continue
+                    tags = payload.get("tags") or []
+                    self.received += 1
+                    if tags and self._on_remote_invalidate is not None:
+                        self._on_remote_invalidate(tags)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Cache invalidation listener error: {e}, reconnecting in 1s")
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    # ---------- L2 ----------
+
+    async def get(self, namespace: str, key: Any) -> Tuple[bool, Any]:
+        try:
+            raw = await self._redis.get(self._value_key(namespace, key))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Redis cache get failed: {e}")
+            return _NOT_FOUND
+        if raw is None:
+            self.l2_misses += 1
+            return _NOT_FOUND
+        try:
+            stored_at, expires_at, value = pickle.loads(raw)
+        except Exception:
+            self.l2_misses += 1
+            return _NOT_FOUND
+        self.l2_hits += 1
+        # Trả về TTL còn lại để L1 không giữ lâu hơn L2
+        return True, (value, stored_at, max(expires_at - time.time(), 0))
+
+    async def set(self, namespace: str, key: Any, value: Any, ttl: float, tags: Iterable[str] = ()):
+        if ttl <= 0:
+            return
+        value_key = self._value_key(namespace, key)
+        try:
+            now = time.time()
+            raw = pickle.dumps((now, now + ttl, value), protocol=pickle.HIGHEST_PROTOCOL)
+            ttl_ms = max(int(ttl * 1000), 1)
+            async with self._redis.pipeline(transaction=False) as pipe:
+                pipe.set(value_key, raw, px=ttl_ms)
+                for tag in tags:
+                    tag_key = self._tag_key(tag)
+                    pipe.sadd(tag_key, value_key)
+                    # Tag set sống lâu hơn value, value hết hạn thì member mồ côi vô hại
+                    pipe.pexpire(tag_key, max(ttl_ms * 2, TAG_SET_TTL * 1000))
+                await pipe.execute()
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Redis cache set failed: {e}")
+
+    async def invalidate(self, tags: Iterable[str]):
+        """Xóa L2 theo tag rồi publish để các worker khác xóa L1"""
+        tags = list(tags)
+        try:
+            for tag in tags:
+                tag_key = self._tag_key(tag)
+                value_keys = await self._redis.smembers(tag_key)
+                await self._redis.delete(tag_key, *value_keys)
+            await self._redis.publish(self.channel, json.dumps({"worker": WORKER_ID, "tags": tags}))
+            self.published += 1
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Redis cache invalidate failed: {e}")
+
+    async def publish_event(self, topic: str, data: Any):
+        """Publish 1 event cho các worker khác (không ghi gì vào Redis ngoài PUBLISH)"""
+        try:
+            payload = json.dumps({"worker": WORKER_ID, "topic": topic, "data": data}, default=str)
+            await self._redis.publish(self.events_channel, payload)
+            self.events_published += 1
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Redis event publish failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "backend": "redis",
+            "worker_id": WORKER_ID,
+            "l2_hits": self.l2_hits,
+            "l2_misses": self.l2_misses,
+            "invalidations_published": self.published,
+            "invalidations_received": self.received,
+            "events_published": self.events_published,
+            "events_received": self.events_received,
+            "errors": self.errors,
+            "listener_running": self._listener is not None and not self._listener.done(),
+        }
+
+
+def create_cache_backend():
+    """Chọn backend theo cấu hình: REDIS_URL -> Redis, ngược lại local"""
+    if REDIS_URL:
+        try:
+            return RedisCacheBackend(REDIS_URL)
+        except Exception as e:
+            logger.warning(f"Không khởi tạo được Redis cache backend ({e}), dùng cache local")
+    return LocalCacheBackend()
@@ -0,0 +1,359 @@
+"""
+Cây danh mục in-memory với số sản phẩm active được duy trì tăng dần
+
+Thay cho aggregation $lookup (categories x categories, categories x products)
+mỗi lần cache miss của GET /api/categories:
+
+- Build 1 lần lúc startup: đọc categories + (category.slug, status) của products
+- Mỗi node giữ danh sách con; số sản phẩm active đếm theo category slug
+  (direct), số tổng của cả cây con (rolled-up) tính lazy sau mỗi thay đổi - O(số danh mục)
+- Ghi danh mục (create/update/delete) -> upsert_category/remove_category
+- Ghi sản phẩm (create/update/delete/đổi status) -> refresh_product(product_id)
+  chỉ cộng/trừ count của slug cũ/mới
+- Worker khác ghi -> nhận tag qua invalidate_tags ("categories", "product:<id>",
+  "products:reindex") và đọc lại phần bị đổi
+
+Listing, cây con và breadcrumb đều trả lời từ bộ nhớ, không query MongoDB.
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+CATEGORY_PROJECTION = {
+    "name": 1,
+    "slug": 1,
+    "description": 1,
+    "parent_id": 1,
+    "status": 1,
+    "created_at": 1,
+    "updated_at": 1,
+}
+
+# Chỉ cần slug danh mục + status để đếm sản phẩm
+PRODUCT_COUNT_PROJECTION = {"category.slug": 1, "status": 1}
+
+_NODE_FIELDS = ("name", "slug", "description", "parent_id", "status", "created_at", "updated_at")
+
+
+def _active_slug(product: Optional[dict]) -> Optional[str]:
+    """Slug danh mục nếu sản phẩm đang active (sản phẩm khác không được đếm)"""
+    if not product or product.get("status", "active") != "active":
+        return None
+    category = product.get("category")
+    if not isinstance(category, dict):
+        return None
+    return category.get("slug") or None
+
+
+class CategoryTree:
+    """
+    Workflow:
+    1. attach(categories_collection, products_collection) + load() khi startup
+    2. upsert_category / remove_category sau mỗi lần ghi danh mục
+    3. refresh_product(product_id) sau mỗi lần ghi sản phẩm
+    4. list_categories / get_category / subtree / breadcrumb
+    """
+
+    def __init__(self):
+        self._categories_collection = None
+        self._products_collection = None
+        self._nodes: Dict[str, dict] = {}           # category_id -> node
+        self._children: Dict[Optional[str], List[str]] = {}  # parent_id -> [category_id] (đã sort)
+        self._by_slug: Dict[str, str] = {}           # slug -> category_id
+        self._product_slug: Dict[str, str] = {}      # product_id -> slug (chỉ sản phẩm active)
+        self._slug_counts: Dict[str, int] = {}       # slug -> số sản phẩm active
+        self._totals: Optional[Dict[str, Tuple[int, int]]] = None  # id -> (direct, rolled-up)
+        self._loading = False
+        self._changed_during_load: Set[str] = set()
+        self._tasks: set = set()
+        self.is_ready = False
+        self.last_built: Optional[datetime] = None
+
+    # ---------- build ----------
+
+    def attach(self, categories_collection, products_collection):
+        self._categories_collection = categories_collection
+        self._products_collection = products_collection
+
+    async def load(self, products: Optional[List[dict]] = None) -> int:
+        """
+        Build lại toàn bộ cây
+
+        Args:
+            products: Docs sản phẩm đã đọc sẵn (có category.slug + status) - None thì tự đọc
+        """
+        self._loading = True
+        self._changed_during_load.clear()
+        try:
+            categories = await self._categories_collection.find({}, CATEGORY_PROJECTION).to_list(length=None)
+            if products is None:
+                products = await self._products_collection.find({}, PRODUCT_COUNT_PROJECTION).to_list(length=None)
+            self.build(categories, products)
+        finally:
+            self._loading = False
+
+        # Sản phẩm được ghi trong lúc đang đọc: đọc lại cho chắc
+        changed, self._changed_during_load = self._changed_during_load, set()
+        for product_id in changed:
+            await self.refresh_product(product_id)
+        return len(self._nodes)
+
+    def build(self, categories: List[dict], products: Iterable[dict]):
+        product_slug = {}
+        slug_counts: Dict[str, int] = {}
+        for product in products:
+            slug = _active_slug(product)
+            if slug is not None:
+                product_slug[str(product["_id"])] = slug
+                slug_counts[slug] = slug_counts.get(slug, 0) + 1
+
+        self._nodes = {}
+        self._by_slug = {}
+        for category in categories:
+            node = self._make_node(category)
+            self._nodes[node["id"]] = node
+            self._by_slug[node["slug"]] = node["id"]
+        self._product_slug = product_slug
+        self._slug_counts = slug_counts
+        self._rebuild_children()
+        self.is_ready = True
+        self.last_built = datetime.now()
+        logger.info(f"Category tree built with {len(self._nodes)} categories, {len(product_slug)} active products")
+
+    def _make_node(self, category: dict) -> dict:
+        node = {"id": str(category["_id"])}
+        for field in _NODE_FIELDS:
+            node[field] = category.get(field)
+        node["description"] = node["description"] or ""
+        node["status"] = node["status"] or "active"
+        node["parent_id"] = node["parent_id"] or None
+        return node
+
+    def _rebuild_children(self):
+        """Danh sách con theo created_at, _id (cùng thứ tự với query cũ)"""
+        children: Dict[Optional[str], List[str]] = {}
+        for node in self._nodes.values():
+            children.setdefault(node["parent_id"], []).append(node["id"])
+        for ids in children.values():
+            ids.sort(key=self._sort_key)
+        self._children = children
+        self._totals = None
+
+    def _sort_key(self, category_id: str) -> tuple:
+        return (str(self._nodes[category_id].get("created_at") or ""), category_id)
+
+    # ---------- maintain ----------
+
+    def upsert_category(self, category: dict):
+        """Danh mục được tạo/sửa (doc đầy đủ sau khi ghi)"""
+        node = self._make_node(category)
+        old = self._nodes.get(node["id"])
+        if old is not None and self._by_slug.get(old["slug"]) == node["id"]:
+            del self._by_slug[old["slug"]]
+        self._nodes[node["id"]] = node
+        self._by_slug[node["slug"]] = node["id"]
+        self._rebuild_children()
+
+    def remove_category(self, category_id: str):
+        node = self._nodes.pop(category_id, None)
+        if node is None:
+            return
+        if self._by_slug.get(node["slug"]) == category_id:
+            del self._by_slug[node["slug"]]
+        self._rebuild_children()
+
+    def apply_product(self, product_id: str, product: Optional[dict]) -> bool:
+        """
+        Cập nhật count theo trạng thái mới của sản phẩm (None = đã xóa)
+
+        Returns:
+            True nếu count thay đổi
+        """
+        new_slug = _active_slug(product)
+        old_slug = self._product_slug.get(product_id)
+        if new_slug == old_slug:
+            return False
+        if old_slug is not None:
+            self._slug_counts[old_slug] -= 1
+            if self._slug_counts[old_slug] <= 0:
+                del self._slug_counts[old_slug]
+            del self._product_slug[product_id]
+        if new_slug is not None:
+            self._slug_counts[new_slug] = self._slug_counts.get(new_slug, 0) + 1
+            self._product_slug[product_id] = new_slug
+        self._totals = None
+        return True
+
+    async def refresh_product(self, product_id: str):
+        """Đọc lại category.slug + status của 1 sản phẩm sau khi ghi"""
+        if self._loading:
+            self._changed_during_load.add(product_id)
+        if not self.is_ready or self._products_collection is None:
+            return
+        try:
+            product = await self._products_collection.find_one(
+                {"_id": ObjectId(product_id)}, PRODUCT_COUNT_PROJECTION
+            )
+        except Exception as e:
+            logger.warning(f"Category tree refresh failed for {product_id}: {e}")
+            return
+        self.apply_product(product_id, product)
+
+    async def reload_categories(self):
+        """Chỉ đọc lại categories (giữ nguyên count sản phẩm) - dùng khi worker khác sửa danh mục"""
+        categories = await self._categories_collection.find({}, CATEGORY_PROJECTION).to_list(length=None)
+        self._nodes = {}
+        self._by_slug = {}
+        for category in categories:
+            node = self._make_node(category)
+            self._nodes[node["id"]] = node
+            self._by_slug[node["slug"]] = node["id"]
+        self._rebuild_children()
+
+    # ---------- counts ----------
+
+    def _compute_totals(self) -> Dict[str, Tuple[int, int]]:
+        """(direct, rolled-up) cho mọi node - duyệt post-order 1 lần, chịu được vòng lặp parent"""
+        if self._totals is not None:
+            return self._totals
+        totals: Dict[str, Tuple[int, int]] = {}
+        for category_id, node in self._nodes.items():
+            if category_id in totals:
+                continue
+            stack = [(category_id, False)]
+            visiting = set()
+            while stack:
+                current, expanded = stack.pop()
+                if current in totals:
+                    continue
+                if expanded:
+                    direct = self._slug_counts.get(self._nodes[current]["slug"], 0)
+                    total = direct + sum(
+                        totals[child][1] for child in self._children.get(current, []) if child in totals
+                    )
+                    totals[current] = (direct, total)
+                    continue
+                if current in visiting:
+                    continue
+                visiting.add(current)
+                stack.append((current, True))
+                for child in self._children.get(current, []):
+                    if child not in totals and child not in visiting:
+                        stack.append((child, False))
+        self._totals = totals
+        return totals
+
+    def _view(self, category_id: str) -> dict:
+        direct, total = self._compute_totals().get(category_id, (0, 0))
+        return {
+            **self._nodes[category_id],
+            "product_count": total,
+            "direct_product_count": direct,
+            "subcategories_count": len(self._children.get(category_id, [])),
+        }
+
+    # ---------- query ----------
+
+    def resolve(self, id_or_slug: str) -> Optional[str]:
+        """category_id từ id hoặc slug"""
+        if id_or_slug in self._nodes:
+            return id_or_slug
+        return self._by_slug.get(id_or_slug)
+
+    def list_categories(self, parent_id: Optional[str] = None, status: Optional[str] = None) -> List[dict]:
+        """
+        Cùng ngữ nghĩa với GET /api/categories:
+        - parent_id None: tất cả danh mục
+        - parent_id "null" / "": danh mục gốc
+        - parent_id <id>: danh mục con trực tiếp
+        """
+        if parent_id is None:
+            ids = sorted(self._nodes, key=self._sort_key)
+        elif parent_id in ("null", ""):
+            ids = self._children.get(None, [])
+        else:
+            ids = self._children.get(parent_id, [])
+        return [
+            self._view(category_id)
+            for category_id in ids
+            if not status or self._nodes[category_id]["status"] == status
+        ]
+
+    def get_category(self, id_or_slug: str) -> Optional[dict]:
+        category_id = self.resolve(id_or_slug)
+        return self._view(category_id) if category_id is not None else None
+
+    def subtree(self, id_or_slug: Optional[str] = None, status: Optional[str] = None) -> List[dict]:
+        """
+        Cây lồng nhau (mỗi node có "children")
+        id_or_slug None: cả cây từ các danh mục gốc; status lọc luôn cả nhánh con
+        """
+        if id_or_slug is None:
+            roots = self._children.get(None, [])
+        else:
+            category_id = self.resolve(id_or_slug)
+            roots = [category_id] if category_id is not None else []
+
+        def build(category_id: str, seen: Set[str]) -> Optional[dict]:
+            if category_id in seen or (status and self._nodes[category_id]["status"] != status):
+                return None
+            seen.add(category_id)
+            node = self._view(category_id)
+            node["children"] = [
+                child for child in (build(c, seen) for c in self._children.get(category_id, []))
+                if child is not None
+            ]
+            return node
+
+        seen: Set[str] = set()
+        return [node for node in (build(root, seen) for root in roots) if node is not None]
+
+    def breadcrumb(self, id_or_slug: str) -> List[dict]:
+        """[{id, name, slug}] từ danh mục gốc tới danh mục hiện tại (rỗng nếu không có)"""
+        category_id = self.resolve(id_or_slug)
+        path = []
+        seen = set()
+        while category_id is not None and category_id in self._nodes and category_id not in seen:
+            seen.add(category_id)
+            node = self._nodes[category_id]
+            path.append({"id": category_id, "name": node["name"], "slug": node["slug"]})
+            category_id = node["parent_id"]
+        path.reverse()
+        return path
+
+    def get_stats(self) -> dict:
+        return {
+            "is_ready": self.is_ready,
+            "categories": len(self._nodes),
+            "active_products": len(self._product_slug),
+            "distinct_slugs": len(self._slug_counts),
+            "last_built": self.last_built.isoformat() if self.last_built else None,
+        }
+
+    # ---------- cross-worker ----------
+
+    def on_invalidate(self, tags: Iterable[str], remote: bool):
+        """Worker khác ghi danh mục / sản phẩm thì đọc lại phần bị đổi"""
+        if not remote or not self.is_ready:
+            return
+        for tag in tags:
+            if tag == "products:reindex":
+                task = asyncio.ensure_future(self.load())
+            elif tag == "categories":
+                task = asyncio.ensure_future(self.reload_categories())
+            elif tag.startswith("product:"):
+                task = asyncio.ensure_future(self.refresh_product(tag.split(":", 1)[1]))
+            else:
+                continue
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+
+# Singleton instance
+category_tree = CategoryTree()
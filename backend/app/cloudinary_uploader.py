@@ -130,7 +130,7 @@ def upload_image(
         }
         
         logger.info(f"Upload success: {public_id}")
-        logger.debug(f"URL: {url}")
+        logger.debug("URL: %s", url)
         
         return url, metadata
         
@@ -0,0 +1,494 @@
+"""
+Collaborative Filtering từ co-occurrence (đơn hàng + wishlist)
+
+- "Frequently bought together": 2 sản phẩm cùng nằm trong 1 đơn hàng
+- "Customers also liked": 2 sản phẩm cùng nằm trong wishlist của 1 user
+
+Ma trận item-item thưa (scipy CSR) được build bằng 1 lần duyệt cursor theo batch
+(không load toàn bộ orders/users vào memory), sau đó cập nhật tăng dần khi có
+đơn hàng mới / hủy đơn / thay đổi wishlist. Score chuẩn hóa cosine:
+    co(i, j) / sqrt(count(i) * count(j))
+
+Build trong lúc vẫn có ghi: sự kiện xảy ra giữa chừng được ghi lại rồi áp dụng sau khi swap,
+trừ phần cursor đã đọc thấy (đơn hàng: high-water mark _id + trạng thái cursor đã đọc;
+wishlist: users.wishlist_version cursor đã đọc) - mỗi đơn / lượt toggle chỉ được tính 1 lần.
+
+Worker khác nhận delta qua publish_event(COOCCURRENCE_EVENT_TOPIC, event) - event mang sẵn
+product_id nên không phải đọc lại MongoDB.
+
+blend_recommendations() trộn score co-occurrence với similarity TF-IDF của
+ProductRecommender (content-based) cho API gợi ý sản phẩm.
+"""
+
+import asyncio
+import logging
+from array import array
+from datetime import datetime
+from itertools import permutations
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+STREAM_BATCH_SIZE = 1000        # Số document mỗi batch cursor
+MAX_BASKET_ITEMS = 50           # Đơn/wishlist lớn hơn chỉ lấy N item đầu (tránh O(n²) cặp)
+FLUSH_PAIRS = 200_000           # Gộp các cặp đang chờ vào CSR khi vượt ngưỡng
+MIN_COOCCURRENCE = 1            # Số lần xuất hiện chung tối thiểu để gợi ý
+REBUILD_INTERVAL = 6 * 3600     # Build lại định kỳ để đồng bộ tuyệt đối với DB (seconds)
+
+# Topic pub/sub cho delta giữa các worker (xem app.cache.publish_event)
+COOCCURRENCE_EVENT_TOPIC = "cooccurrence"
+
+# Trọng số trộn cho gợi ý hybrid (content + collaborative)
+HYBRID_WEIGHTS = {
+    "content": 0.5,
+    "bought": 0.3,
+    "liked": 0.2,
+}
+
+
+def _basket_ids(items: Iterable) -> List[str]:
+    """product_id duy nhất trong đơn hàng / wishlist (giữ thứ tự, bỏ id rỗng)"""
+    ids = []
+    for item in items or []:
+        product_id = item.get("product_id") if isinstance(item, dict) else item
+        if product_id:
+            ids.append(str(product_id))
+    return list(dict.fromkeys(ids))[:MAX_BASKET_ITEMS]
+
+
+class _CooccurrenceMatrix:
+    """
+    Ma trận co-occurrence thưa + số basket chứa mỗi item
+
+    Cặp mới được ghi vào buffer (array int32/float32), gộp vào CSR theo lô.
+    Đọc 1 dòng = slice CSR + các cặp trong buffer (buffer bị chặn bởi FLUSH_PAIRS).
+    """
+
+    def __init__(self):
+        self.matrix = sp.csr_matrix((0, 0), dtype=np.float32)
+        self.counts = np.zeros(0, dtype=np.float32)
+        self._rows = array("i")
+        self._cols = array("i")
+        self._vals = array("f")
+
+    @property
+    def pending(self) -> int:
+        return len(self._rows)
+
+    def add_basket(self, rows: List[int], weight: float = 1.0):
+        """Cộng (hoặc trừ nếu weight < 0) mọi cặp có thứ tự trong basket"""
+        self._ensure_size(max(rows) + 1 if rows else 0)
+        for i in rows:
+            self.counts[i] += weight
+        for i, j in permutations(rows, 2):
+            self._rows.append(i)
+            self._cols.append(j)
+            self._vals.append(weight)
+        if self.pending >= FLUSH_PAIRS:
+            self.flush()
+
+    def add_pairs(self, row: int, others: List[int], weight: float = 1.0):
+        """Cộng cặp (row, other) theo 2 chiều - dùng khi 1 item được thêm vào basket đã có"""
+        self._ensure_size(max([row, *others]) + 1)
+        self.counts[row] += weight
+        for other in others:
+            if other == row:
+                continue
+            self._rows.extend((row, other))
+            self._cols.extend((other, row))
+            self._vals.extend((weight, weight))
+        if self.pending >= FLUSH_PAIRS:
+            self.flush()
+
+    def _ensure_size(self, size: int):
+        if size > len(self.counts):
+            capacity = max(size, len(self.counts) * 2, 1024)
+            counts = np.zeros(capacity, dtype=np.float32)
+            counts[:len(self.counts)] = self.counts
+            self.counts = counts
+
+    def flush(self):
+        """Gộp buffer vào CSR (cộng dồn trùng lặp, bỏ ô <= 0)"""
+        size = len(self.counts)
+        if self.matrix.shape[0] < size:
+            self.matrix.resize((size, size))
+        if not self.pending:
+            return
+        delta = sp.coo_matrix(
+            (
+                np.frombuffer(self._vals, dtype=np.float32),
+                (np.frombuffer(self._rows, dtype=np.int32), np.frombuffer(self._cols, dtype=np.int32))
+            ),
+            shape=(size, size)
+        ).tocsr()
+        matrix = (self.matrix + delta).tocsr()
+        matrix.data[matrix.data < 0] = 0
+        matrix.eliminate_zeros()
+        self.matrix = matrix
+        self._rows = array("i")
+        self._cols = array("i")
+        self._vals = array("f")
+
+    def row(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(cột, co-count) của dòng i, gồm cả các cặp chưa flush"""
+        if i < self.matrix.shape[0]:
+            start, end = self.matrix.indptr[i], self.matrix.indptr[i + 1]
+            cols = self.matrix.indices[start:end]
+            vals = self.matrix.data[start:end]
+        else:
+            cols = np.empty(0, dtype=np.int32)
+            vals = np.empty(0, dtype=np.float32)
+        if self.pending:
+            rows = np.frombuffer(self._rows, dtype=np.int32)
+            mask = rows == i
+            if mask.any():
+                cols = np.concatenate([cols, np.frombuffer(self._cols, dtype=np.int32)[mask]])
+                vals = np.concatenate([vals, np.frombuffer(self._vals, dtype=np.float32)[mask]])
+                cols, inverse = np.unique(cols, return_inverse=True)
+                vals = np.bincount(inverse, weights=vals).astype(np.float32)
+        return cols, vals
+
+    def scores(self, i: int, min_count: float = MIN_COOCCURRENCE) -> Tuple[np.ndarray, np.ndarray]:
+        """(cột, score cosine) của dòng i"""
+        cols, vals = self.row(i)
+        mask = vals >= min_count
+        cols, vals = cols[mask], vals[mask]
+        if not cols.size or i >= len(self.counts) or self.counts[i] <= 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        norms = np.sqrt(self.counts[i] * np.maximum(self.counts[cols], 1))
+        return cols, np.minimum(vals / norms, 1.0).astype(np.float32)
+
+    def stats(self) -> dict:
+        return {
+            "pairs": int(self.matrix.nnz),
+            "pending_pairs": self.pending,
+            "memory_bytes": int(self.matrix.data.nbytes + self.matrix.indices.nbytes + self.matrix.indptr.nbytes),
+        }
+
+
+class CooccurrenceEngine:
+    """
+    Engine co-occurrence cho "mua cùng" và "cũng thích"
+
+    Workflow:
+    1. attach(orders, users) + build() khi startup (duyệt cursor theo batch)
+    2. add_order/remove_order khi tạo/hủy đơn, add/remove_wishlist_item khi toggle wishlist
+    3. frequently_bought_together / also_liked / scores cho API gợi ý
+    """
+
+    def __init__(self):
+        self._ids: List[str] = []
+        self._index: Dict[str, int] = {}
+        self.bought = _CooccurrenceMatrix()
+        self.liked = _CooccurrenceMatrix()
+        self.is_ready = False
+        self.last_built: Optional[datetime] = None
+        self.orders_processed = 0
+        self.wishlists_processed = 0
+
+        self._orders_collection = None
+        self._users_collection = None
+        self._lock = asyncio.Lock()
+        # Sự kiện xảy ra trong lúc build: áp dụng lại lên dữ liệu mới sau khi swap
+        self._building = False
+        self._replay: List[tuple] = []
+        self._scheduler: Optional[asyncio.Task] = None
+        self._tasks: set = set()
+
+    def attach(self, orders_collection, users_collection):
+        self._orders_collection = orders_collection
+        self._users_collection = users_collection
+
+    def _rows(self, product_ids: Iterable[str], create: bool = True) -> List[int]:
+        rows = []
+        for product_id in product_ids:
+            row = self._index.get(product_id)
+            if row is None and create:
+                row = len(self._ids)
+                self._ids.append(product_id)
+                self._index[product_id] = row
+            if row is not None:
+                rows.append(row)
+        return rows
+
+    # ---------- build ----------
+
+    async def build(self) -> bool:
+        """
+        Build lại toàn bộ từ orders + wishlists bằng 1 lần duyệt cursor
+        Dữ liệu cũ vẫn phục vụ cho tới khi build xong
+        """
+        if self._orders_collection is None:
+            return False
+        async with self._lock:
+            self._building = True
+            self._replay = []
+            try:
+                engine = CooccurrenceEngine()
+
+                # High-water mark: đơn tạo sau mốc này cursor không đọc, chỉ được tính qua replay
+                latest = await self._orders_collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+                order_mark = latest["_id"] if latest else None
+                # Đơn cursor thấy đã hủy (không tính) - để replay biết đơn nào đã được đếm
+                cancelled_seen = set()
+                if order_mark is not None:
+                    cursor = self._orders_collection.find(
+                        {"_id": {"$lte": order_mark}},
+                        {"items.product_id": 1, "status": 1}
+                    ).batch_size(STREAM_BATCH_SIZE)
+                    async for order in cursor:
+                        engine.orders_processed += 1
+                        if engine.orders_processed % STREAM_BATCH_SIZE == 0:
+                            await asyncio.sleep(0)  # Nhường event loop giữa các batch
+                        # Đơn hàng đã hủy không tính
+                        if order.get("status") == "cancelled":
+                            cancelled_seen.add(str(order["_id"]))
+                            continue
+                        rows = engine._rows(_basket_ids(order.get("items")))
+                        if rows:
+                            engine.bought.add_basket(rows)
+
+                # wishlist_version cursor đọc được: toggle có version <= mức này đã nằm trong dữ liệu
+                wishlist_versions: Dict[str, int] = {}
+                cursor = self._users_collection.find(
+                    {"wishlist.0": {"$exists": True}},
+                    {"wishlist": 1, "wishlist_version": 1}
+                ).batch_size(STREAM_BATCH_SIZE)
+                async for user in cursor:
+                    if user.get("wishlist_version"):
+                        wishlist_versions[str(user["_id"])] = user["wishlist_version"]
+                    rows = engine._rows(_basket_ids(user.get("wishlist")))
+                    if rows:
+                        engine.liked.add_basket(rows)
+                    engine.wishlists_processed += 1
+                    if engine.wishlists_processed % STREAM_BATCH_SIZE == 0:
+                        await asyncio.sleep(0)
+
+                engine.bought.flush()
+                engine.liked.flush()
+
+                # Swap
+                self._ids = engine._ids
+                self._index = engine._index
+                self.bought = engine.bought
+                self.liked = engine.liked
+                self.orders_processed = engine.orders_processed
+                self.wishlists_processed = engine.wishlists_processed
+                self.is_ready = True
+                self.last_built = datetime.now()
+
+                replay, self._replay = self._replay, []
+                self._building = False
+                skipped = self._apply_replay(replay, order_mark, cancelled_seen, wishlist_versions)
+
+                logger.info(
+                    f"✅ Co-occurrence built: {self.orders_processed} orders, "
+                    f"{self.wishlists_processed} wishlists, {len(self._ids)} products "
+                    f"(replayed {len(replay) - skipped}/{len(replay)} events)"
+                )
+                return True
+            except Exception as e:
+                logger.error(f"❌ Error building co-occurrence: {e}")
+                return False
+            finally:
+                self._building = False
+                self._replay = []
+
+    def _apply_replay(self, replay: List[dict], order_mark: Optional[ObjectId],
+                      cancelled_seen: set, wishlist_versions: Dict[str, int]) -> int:
+        """
+        Áp dụng các event xảy ra trong lúc build, bỏ phần cursor đã đếm
+        Trả về số event bị bỏ qua
+        """
+        # Đơn hàng: cursor đã đếm đơn nếu _id <= mốc và lúc đọc chưa hủy.
+        # Mỗi event đưa đơn về trạng thái "được tính" (weight > 0) hoặc không - chỉ áp dụng
+        # khi khác với trạng thái hiện có trong dữ liệu
+        counted: Dict[str, bool] = {}
+        skipped = 0
+        for event in replay:
+            if event["kind"] == "order":
+                order_id = event.get("order_id")
+                if order_id is not None:
+                    if order_id not in counted:
+                        counted[order_id] = (
+                            order_mark is not None and ObjectId.is_valid(order_id)
+                            and ObjectId(order_id) <= order_mark and order_id not in cancelled_seen
+                        )
+                    if counted[order_id] == (event["weight"] > 0):
+                        skipped += 1
+                        continue
+                    counted[order_id] = event["weight"] > 0
+                self.apply_event(event)
+            else:
+                version = event.get("version")
+                if version is not None and version <= wishlist_versions.get(event.get("user_id"), 0):
+                    skipped += 1
+                    continue
+                self.apply_event(event)
+        return skipped
+
+    # ---------- incremental ----------
+
+    def add_order(self, items: Iterable, weight: float = 1.0, order_id: Optional[str] = None) -> dict:
+        """
+        Đơn hàng mới (weight=-1 khi hủy đơn, +1 khi mở lại)
+        Trả về event để publish cho worker khác
+        """
+        return self.apply_event({
+            "kind": "order",
+            "order_id": str(order_id) if order_id is not None else None,
+            "product_ids": _basket_ids(items),
+            "weight": weight,
+        })
+
+    def remove_order(self, items: Iterable, order_id: Optional[str] = None) -> dict:
+        return self.add_order(items, weight=-1.0, order_id=order_id)
+
+    def add_wishlist_item(self, product_id: str, other_ids: Iterable[str], weight: float = 1.0,
+                          user_id: Optional[str] = None, version: Optional[int] = None) -> dict:
+        """
+        User thêm product_id vào wishlist đang có other_ids (weight=-1 khi xóa)
+        version: users.wishlist_version sau lần toggle này (để build bỏ event đã đọc thấy)
+        Trả về event để publish cho worker khác
+        """
+        return self.apply_event({
+            "kind": "wishlist",
+            "user_id": user_id,
+            "product_id": product_id,
+            "other_ids": _basket_ids(other_ids),
+            "weight": weight,
+            "version": version,
+        })
+
+    def remove_wishlist_item(self, product_id: str, other_ids: Iterable[str], **kwargs) -> dict:
+        return self.add_wishlist_item(product_id, other_ids, weight=-1.0, **kwargs)
+
+    def apply_event(self, event: dict) -> dict:
+        """Áp dụng 1 event (local hoặc từ worker khác), đang build thì ghi lại để replay"""
+        if self._building:
+            self._replay.append(event)
+        weight = float(event["weight"])
+        if event["kind"] == "order":
+            rows = self._rows(event["product_ids"])
+            if rows:
+                self.bought.add_basket(rows, weight)
+        else:
+            row = self._rows([event["product_id"]])[0]
+            others = self._rows(event["other_ids"])
+            self.liked.add_pairs(row, others, weight)
+        return event
+
+    def on_event(self, event: dict):
+        """Delta từ worker khác (add_event_listener(COOCCURRENCE_EVENT_TOPIC, ...))"""
+        try:
+            self.apply_event(event)
+        except Exception as e:
+            logger.warning(f"Co-occurrence remote update failed ({event}): {e}")
+
+    # ---------- query ----------
+
+    def scores(self, product_id: str, kind: str) -> Dict[str, float]:
+        """{product_id: score} theo "bought" hoặc "liked" """
+        row = self._index.get(product_id)
+        if row is None:
+            return {}
+        matrix = self.bought if kind == "bought" else self.liked
+        cols, vals = matrix.scores(row)
+        return {self._ids[col]: float(val) for col, val in zip(cols.tolist(), vals.tolist())}
+
+    def _top(self, product_id: str, kind: str, n: int, exclude_ids: Optional[Iterable[str]] = None) -> List[Tuple[str, float]]:
+        row = self._index.get(product_id)
+        if row is None:
+            return []
+        matrix = self.bought if kind == "bought" else self.liked
+        cols, vals = matrix.scores(row)
+        if exclude_ids:
+            excluded = np.asarray(self._rows(exclude_ids, create=False), dtype=np.int32)
+            if excluded.size:
+                mask = ~np.isin(cols, excluded)
+                cols, vals = cols[mask], vals[mask]
+        if cols.size > n:
+            top = np.argpartition(-vals, n - 1)[:n]
+            cols, vals = cols[top], vals[top]
+        order = np.lexsort((cols, -vals))
+        return [(self._ids[cols[i]], round(float(vals[i]), 4)) for i in order]
+
+    def frequently_bought_together(self, product_id: str, n: int = 8, exclude_ids: Optional[Iterable[str]] = None) -> List[Tuple[str, float]]:
+        return self._top(product_id, "bought", n, exclude_ids)
+
+    def also_liked(self, product_id: str, n: int = 8, exclude_ids: Optional[Iterable[str]] = None) -> List[Tuple[str, float]]:
+        return self._top(product_id, "liked", n, exclude_ids)
+
+    # ---------- background ----------
+
+    async def _rebuild_loop(self, interval: float):
+        """Build lần đầu ngay (không chặn startup), sau đó build lại định kỳ"""
+        while True:
+            await self.build()
+            await asyncio.sleep(interval)
+
+    def start_scheduler(self, interval: float = REBUILD_INTERVAL):
+        if self._scheduler is None or self._scheduler.done():
+            self._scheduler = asyncio.create_task(self._rebuild_loop(interval))
+
+    async def stop_scheduler(self):
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+            try:
+                await self._scheduler
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._scheduler = None
+
+    def get_stats(self) -> dict:
+        return {
+            "is_ready": self.is_ready,
+            "products": len(self._ids),
+            "orders_processed": self.orders_processed,
+            "wishlists_processed": self.wishlists_processed,
+            "bought": self.bought.stats(),
+            "liked": self.liked.stats(),
+            "last_built": self.last_built.isoformat() if self.last_built else None,
+        }
+
+
+def blend_recommendations(
+    content_scores: Dict[str, float],
+    bought_scores: Dict[str, float],
+    liked_scores: Dict[str, float],
+    n: int,
+    allowed: Optional[Iterable[str]] = None,
+    weights: Dict[str, float] = HYBRID_WEIGHTS
+) -> List[Tuple[str, float, Dict[str, float]]]:
+    """
+    Trộn score các nguồn: score = Σ weight_nguồn × score_nguồn (mọi score trong [0, 1])
+
+    Args:
+        allowed: Chỉ giữ các product_id này (vd. sản phẩm còn active)
+
+    Returns:
+        [(product_id, score, {nguồn: score})] giảm dần theo score
+    """
+    sources = {"content": content_scores, "bought": bought_scores, "liked": liked_scores}
+    candidates = set().union(*sources.values())
+    if allowed is not None:
+        candidates &= set(allowed)
+    blended = []
+    for product_id in candidates:
+        breakdown = {
+            name: round(scores[product_id], 4)
+            for name, scores in sources.items()
+            if product_id in scores
+        }
+        score = sum(weights[name] * value for name, value in breakdown.items())
+        blended.append((product_id, round(score, 4), breakdown))
+    blended.sort(key=lambda item: (-item[1], item[0]))
+    return blended[:n]
+
+
+# Singleton instance
+cooccurrence = CooccurrenceEngine()
@@ -2,6 +2,7 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo import MongoClient
 import os
 from dotenv import load_dotenv
+from app.metrics import mongo_command_listener
 
 load_dotenv()
 
@@ -26,7 +27,8 @@ if not MONGODB_URL:
 DATABASE_NAME = os.getenv("DATABASE_NAME", "vyronfashion_db")
 
 # Async MongoDB client
-client = AsyncIOMotorClient(MONGODB_URL)
+# CommandListener đo thời gian từng command theo collection (xem /metrics)
+client = AsyncIOMotorClient(MONGODB_URL, event_listeners=[mongo_command_listener])
 database = client[DATABASE_NAME]
 
 # Collections
@@ -42,7 +44,7 @@ returns_collection = database.returns
 settings_collection = database.settings
 
 # Sync MongoDB client for validation (optional)
-sync_client = MongoClient(MONGODB_URL)
+sync_client = MongoClient(MONGODB_URL, event_listeners=[mongo_command_listener])
 sync_database = sync_client[DATABASE_NAME]
 
 async def close_db():
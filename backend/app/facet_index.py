@@ -0,0 +1,574 @@
+"""
+In-memory faceted index cho trang danh sách sản phẩm
+
+Filter sizes/colors/brands/category/status + khoảng giá + sort + phân trang
+được trả lời hoàn toàn trong process, không query MongoDB:
+
+- Mỗi sản phẩm có 1 row (số nguyên), mỗi giá trị facet giữ 1 bitset (Python int,
+  bit thứ i = row i). Filter = OR trong cùng facet, AND giữa các facet.
+- Giá (pricing.sale) lưu trong mảng đã sort, khoảng giá = 2 lần bisect.
+- Thứ tự sort được tính sẵn (lazy) cho từng sort spec, trang = duyệt thứ tự và
+  lấy các row có trong bitset kết quả.
+- Facet counts cho sidebar: đếm popcount(bitset kết quả bỏ filter của chính facet đó
+  AND bitset giá trị) - chọn "Đen" vẫn thấy số lượng các màu khác.
+
+Ngữ nghĩa khớp với query MongoDB trong get_products ($in trên dotted path qua mảng,
+so sánh giá chỉ với số, null/missing xếp đầu khi sort tăng dần).
+"""
+
+import asyncio
+import bisect
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+
+from app.pagination import get_field
+
+logger = logging.getLogger(__name__)
+
+# Tên facet -> dotted path trong product document
+FACET_FIELDS: Dict[str, str] = {
+    "sizes": "variants.sizes.name",
+    "colors": "variants.colors.slug",
+    "brands": "brand.slug",
+    "categories": "category.slug",
+    "status": "status",
+}
+
+PRICE_FIELD = "pricing.sale"
+
+
+# Path đã tách sẵn để không split lại cho mỗi sản phẩm
+_FACET_PATHS: Dict[str, List[str]] = {name: path.split(".") for name, path in FACET_FIELDS.items()}
+
+# Số khoảng giá giữ bitset sẵn (cập nhật tăng dần khi ghi)
+MAX_CACHED_PRICE_RANGES = 32
+
+# Event (publish_event) khi 1 field đếm đổi ($inc wishlist_count...): worker khác cộng delta
+# vào index của mình thay vì đọc lại cả sản phẩm
+PRODUCT_COUNTER_EVENT_TOPIC = "product_counters"
+
+
+def _path_values(doc: Any, parts: List[str]) -> set:
+    """Tất cả giá trị scalar tại dotted path, đi xuyên qua mảng như MongoDB"""
+    values = [doc]
+    for part in parts:
+        next_values = []
+        for value in values:
+            if isinstance(value, dict) and part in value:
+                child = value[part]
+                if isinstance(child, list):
+                    next_values.extend(child)
+                else:
+                    next_values.append(child)
+        values = next_values
+    return {value for value in values if value is not None and not isinstance(value, (dict, list))}
+
+
+def _price_of(doc: dict) -> Optional[float]:
+    price = get_field(doc, PRICE_FIELD)
+    if isinstance(price, bool) or not isinstance(price, (int, float)):
+        return None
+    return price
+
+
+def _bson_sort_key(value: Any) -> tuple:
+    """Khóa so sánh theo thứ tự kiểu BSON: null < số < chuỗi < object < ObjectId < bool < date"""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (6, value)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, dict):
+        return (3, str(value))
+    if isinstance(value, ObjectId):
+        return (5, value)
+    if isinstance(value, datetime):
+        return (7, value)
+    return (4, str(value))
+
+
+def _rows_to_mask(rows: Iterable[int], size: int) -> int:
+    buf = bytearray((size + 7) // 8)
+    for row in rows:
+        buf[row >> 3] |= 1 << (row & 7)
+    return int.from_bytes(buf, "little")
+
+
+def _mask_rows(mask: int) -> List[int]:
+    rows = []
+    data = mask.to_bytes((mask.bit_length() + 7) // 8, "little")
+    for i, byte in enumerate(data):
+        if byte:
+            base = i << 3
+            for bit in range(8):
+                if byte & (1 << bit):
+                    rows.append(base + bit)
+    return rows
+
+
+class _Ordering:
+    """
+    Thứ tự các row theo 1 sort spec
+
+    Khóa sort của từng row được giữ lại, lần ghi chỉ cập nhật khóa của row đó và
+    đánh dấu dirty - sort lại trên danh sách gần như đã sắp xếp (timsort ~O(n))
+    thay vì tính lại khóa cho toàn bộ sản phẩm.
+    """
+    __slots__ = ("spec", "rows", "rank", "keys", "dirty")
+
+    def __init__(self, spec: Tuple[Tuple[str, int], ...]):
+        self.spec = spec
+        self.rows: List[int] = []
+        self.rank: List[int] = []
+        self.keys: List[Optional[tuple]] = []
+        self.dirty = True
+
+    def key_of(self, doc: dict) -> tuple:
+        return tuple(_bson_sort_key(get_field(doc, field)) for field, _ in self.spec)
+
+    def set_key(self, row: int, key: Optional[tuple]):
+        if row >= len(self.keys):
+            self.keys.extend([None] * (row + 1 - len(self.keys)))
+        self.keys[row] = key
+        if key is not None:
+            self.rows.append(row)
+        self.dirty = True
+
+    def resort(self):
+        keys = self.keys
+        seen = set()
+        rows = [
+            row for row in self.rows
+            if keys[row] is not None and not (row in seen or seen.add(row))
+        ]
+        directions = {direction for _, direction in self.spec}
+        if len(directions) == 1:
+            rows.sort(key=keys.__getitem__, reverse=directions.pop() < 0)
+        else:
+            # Sort ổn định nhiều lượt: field phụ trước, field chính sau
+            for i in reversed(range(len(self.spec))):
+                rows.sort(key=lambda r: keys[r][i], reverse=self.spec[i][1] < 0)
+        rank = [0] * len(keys)
+        for position, row in enumerate(rows):
+            rank[row] = position
+        self.rows = rows
+        self.rank = rank
+        self.dirty = False
+
+
+class ProductFacetIndex:
+    """
+    Facet index cho products
+
+    Workflow:
+    1. load() khi startup - đọc toàn bộ products với projection list view
+    2. refresh(product_id) / remove(product_id) sau mỗi lần ghi sản phẩm
+    3. query(...) trả về docs của trang + total + facet counts
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._collection = None
+        self._projection: Optional[dict] = None
+        self._reset()
+        self._tasks: set = set()
+        self.is_ready = False
+        self.last_built: Optional[datetime] = None
+
+    def _reset(self):
+        self._docs: List[Optional[dict]] = []
+        self._row_of: Dict[str, int] = {}
+        self._free_rows: List[int] = []
+        self._row_facets: List[Optional[Dict[str, set]]] = []
+        self._row_price: List[Optional[float]] = []
+        self._live = 0
+        self._facets: Dict[str, Dict[Any, int]] = {name: {} for name in FACET_FIELDS}
+        # Giá: bitset theo từng mức giá + danh sách mức giá đã sort
+        self._price_bits: Dict[float, int] = {}
+        self._price_values: List[float] = []
+        self._price_masks: Dict[Tuple[Optional[float], Optional[float]], int] = {}
+        self._orders: Dict[tuple, _Ordering] = {}
+
+    # ---------- build / maintain ----------
+
+    def attach(self, collection, projection: Optional[dict] = None):
+        """Gắn collection + projection dùng cho load()/refresh()"""
+        self._collection = collection
+        self._projection = projection
+
+    async def load(self) -> int:
+        """Build lại toàn bộ index từ MongoDB"""
+        products = await self._collection.find({}, self._projection).to_list(length=None)
+        self.build(products)
+        return len(products)
+
+    def build(self, products: List[dict]):
+        """
+        Build toàn bộ index - gom row theo từng giá trị rồi tạo bitset 1 lần
+        (OR từng bit vào int lớn sẽ là O(n^2) khi có nhiều sản phẩm)
+        """
+        with self._lock:
+            self._reset()
+            value_rows: Dict[str, Dict[Any, List[int]]] = {name: {} for name in FACET_FIELDS}
+            price_rows: Dict[float, List[int]] = {}
+            for product in products:
+                product_id = str(product.get("_id", ""))
+                if not product_id or product_id in self._row_of:
+                    continue
+                row = len(self._docs)
+                facet_values = {}
+                for name, parts in _FACET_PATHS.items():
+                    values = _path_values(product, parts)
+                    facet_values[name] = values
+                    for value in values:
+                        value_rows[name].setdefault(value, []).append(row)
+                price = _price_of(product)
+                if price is not None:
+                    price_rows.setdefault(price, []).append(row)
+                self._docs.append(product)
+                self._row_facets.append(facet_values)
+                self._row_price.append(price)
+                self._row_of[product_id] = row
+
+            size = len(self._docs)
+            for name, values in value_rows.items():
+                self._facets[name] = {value: _rows_to_mask(rows, size) for value, rows in values.items()}
+            self._price_bits = {price: _rows_to_mask(rows, size) for price, rows in price_rows.items()}
+            self._price_values = sorted(self._price_bits)
+            self._live = (1 << size) - 1
+            self.is_ready = True
+            self.last_built = datetime.now()
+        logger.info(f"Facet index built with {len(self._row_of)} products")
+
+    async def refresh(self, product_id: str):
+        """Đọc lại 1 sản phẩm từ MongoDB và cập nhật index (xóa nếu không còn)"""
+        if not self.is_ready or self._collection is None:
+            return
+        try:
+            product = await self._collection.find_one({"_id": ObjectId(product_id)}, self._projection)
+        except Exception as e:
+            logger.warning(f"Facet index refresh failed for {product_id}: {e}")
+            return
+        if product is None:
+            self.remove(product_id)
+        else:
+            self.upsert(product)
+
+    def upsert(self, product: dict):
+        with self._lock:
+            product_id = str(product.get("_id", ""))
+            if product_id in self._row_of:
+                self._unlink(self._row_of[product_id])
+            self._insert(product)
+
+    def remove(self, product_id: str):
+        with self._lock:
+            row = self._row_of.get(product_id)
+            if row is not None:
+                self._unlink(row)
+
+    def set_counter(self, product_id: str, field: str, value: Any) -> bool:
+        """
+        Đổi 1 field đếm (wishlist_count...) của sản phẩm đã có trong index
+        Facet / giá không đổi: chỉ thay doc và khóa sort của các ordering dùng field đó
+
+        Returns:
+            False nếu sản phẩm chưa có trong index
+        """
+        with self._lock:
+            row = self._row_of.get(product_id)
+            if row is None:
+                return False
+            # Doc cũ có thể đang được request khác đọc - thay bằng bản copy
+            doc = {**self._docs[row], field: value}
+            self._docs[row] = doc
+            for ordering in self._orders.values():
+                if any(name == field for name, _ in ordering.spec):
+                    ordering.set_key(row, ordering.key_of(doc))
+            return True
+
+    def on_counter_event(self, data: dict):
+        """Delta field đếm từ worker khác (add_event_listener(PRODUCT_COUNTER_EVENT_TOPIC, ...))"""
+        with self._lock:
+            row = self._row_of.get(data["product_id"])
+            if row is None:
+                return
+            current = self._docs[row].get(data["field"]) or 0
+            self.set_counter(data["product_id"], data["field"], max(0, current + data["delta"]))
+
+    def _insert(self, product: dict):
+        product_id = str(product.get("_id", ""))
+        if not product_id:
+            return
+        if self._free_rows:
+            row = self._free_rows.pop()
+        else:
+            row = len(self._docs)
+            self._docs.append(None)
+            self._row_facets.append(None)
+            self._row_price.append(None)
+
+        bit = 1 << row
+        facet_values = {}
+        for name, parts in _FACET_PATHS.items():
+            values = _path_values(product, parts)
+            facet_values[name] = values
+            index = self._facets[name]
+            for value in values:
+                index[value] = index.get(value, 0) | bit
+
+        price = _price_of(product)
+        if price is not None:
+            if price not in self._price_bits:
+                bisect.insort(self._price_values, price)
+            self._price_bits[price] = self._price_bits.get(price, 0) | bit
+            for (lo, hi), mask in self._price_masks.items():
+                if (lo is None or price >= lo) and (hi is None or price <= hi):
+                    self._price_masks[(lo, hi)] = mask | bit
+
+        self._docs[row] = product
+        self._row_facets[row] = facet_values
+        self._row_price[row] = price
+        self._row_of[product_id] = row
+        self._live |= bit
+        for ordering in self._orders.values():
+            ordering.set_key(row, ordering.key_of(product))
+
+    def _unlink(self, row: int):
+        """Xóa row khỏi mọi bitset, row được tái sử dụng cho sản phẩm sau"""
+        clear = ~(1 << row)
+        for name, values in (self._row_facets[row] or {}).items():
+            index = self._facets[name]
+            for value in values:
+                bits = index.get(value, 0) & clear
+                if bits:
+                    index[value] = bits
+                else:
+                    index.pop(value, None)
+
+        price = self._row_price[row]
+        if price is not None:
+            bits = self._price_bits.get(price, 0) & clear
+            if bits:
+                self._price_bits[price] = bits
+            else:
+                self._price_bits.pop(price, None)
+                pos = bisect.bisect_left(self._price_values, price)
+                if pos < len(self._price_values) and self._price_values[pos] == price:
+                    self._price_values.pop(pos)
+            for price_range, mask in self._price_masks.items():
+                self._price_masks[price_range] = mask & clear
+
+        doc = self._docs[row]
+        if doc is not None:
+            self._row_of.pop(str(doc.get("_id", "")), None)
+        self._docs[row] = None
+        self._row_facets[row] = None
+        self._row_price[row] = None
+        self._live &= clear
+        self._free_rows.append(row)
+        for ordering in self._orders.values():
+            ordering.set_key(row, None)
+
+    # ---------- query ----------
+
+    def _ordering(self, sort_spec: List[Tuple[str, int]]) -> _Ordering:
+        """Thứ tự row theo sort spec (tính lần đầu, sau đó cập nhật tăng dần)"""
+        spec = tuple(sort_spec)
+        ordering = self._orders.get(spec)
+        if ordering is None:
+            ordering = _Ordering(spec)
+            ordering.keys = [
+                ordering.key_of(doc) if doc is not None else None
+                for doc in self._docs
+            ]
+            ordering.rows = [row for row, doc in enumerate(self._docs) if doc is not None]
+            self._orders[spec] = ordering
+        if ordering.dirty:
+            ordering.resort()
+        return ordering
+
+    def _price_mask(self, price_min: Optional[float], price_max: Optional[float]) -> int:
+        price_range = (price_min, price_max)
+        mask = self._price_masks.get(price_range)
+        if mask is not None:
+            return mask
+        lo = 0 if price_min is None else bisect.bisect_left(self._price_values, price_min)
+        hi = len(self._price_values) if price_max is None else bisect.bisect_right(self._price_values, price_max)
+        mask = 0
+        for price in self._price_values[lo:hi]:
+            mask |= self._price_bits[price]
+        if len(self._price_masks) >= MAX_CACHED_PRICE_RANGES:
+            self._price_masks.pop(next(iter(self._price_masks)))
+        self._price_masks[price_range] = mask
+        return mask
+
+    def _facet_mask(self, name: str, values: Iterable[Any]) -> int:
+        index = self._facets[name]
+        mask = 0
+        for value in values:
+            mask |= index.get(value, 0)
+        return mask
+
+    def query(
+        self,
+        filters: Dict[str, List[Any]],
+        price_min: Optional[float] = None,
+        price_max: Optional[float] = None,
+        sort_spec: Optional[List[Tuple[str, int]]] = None,
+        skip: int = 0,
+        limit: int = 24,
+        include_facets: bool = False,
+    ) -> dict:
+        """
+        Args:
+            filters: {facet_name: [values]} - facet_name thuộc FACET_FIELDS
+            price_min, price_max: Khoảng pricing.sale (bao gồm 2 đầu)
+            sort_spec: Sort spec (đã có _id tiebreaker)
+            skip, limit: Phân trang (lấy dư 1 doc để biết còn trang sau)
+
+        Returns:
+            {"products": [...tối đa limit+1 docs], "total": int, "facets": {...} | None}
+            Docs là object trong index - chỉ đọc, không được sửa
+        """
+        with self._lock:
+            facet_masks = {
+                name: self._facet_mask(name, values)
+                for name, values in filters.items()
+                if values
+            }
+            has_price = price_min is not None or price_max is not None
+            price_mask = self._price_mask(price_min, price_max) if has_price else None
+
+            mask = self._live
+            for facet_mask in facet_masks.values():
+                mask &= facet_mask
+            if price_mask is not None:
+                mask &= price_mask
+
+            total = mask.bit_count()
+            products = []
+            if total and skip < total:
+                ordering = self._ordering(sort_spec or [("_id", -1)])
+                rows, rank = ordering.rows, ordering.rank
+                wanted = limit + 1
+                if total * 8 < len(rows):
+                    # Kết quả thưa: lấy row từ bitset rồi sort theo rank
+                    matched = _mask_rows(mask)
+                    matched.sort(key=rank.__getitem__)
+                    page_rows = matched[skip:skip + wanted]
+                else:
+                    data = mask.to_bytes((len(self._docs) + 7) // 8, "little")
+                    page_rows = []
+                    seen = 0
+                    for row in rows:
+                        if data[row >> 3] >> (row & 7) & 1:
+                            if seen >= skip:
+                                page_rows.append(row)
+                                if len(page_rows) >= wanted:
+                                    break
+                            seen += 1
+                products = [self._docs[row] for row in page_rows]
+
+            facets = None
+            if include_facets:
+                facets = self._facet_counts(facet_masks, price_mask)
+
+            return {"products": products, "total": total, "facets": facets}
+
+    def facet_counts(
+        self,
+        filters: Dict[str, List[Any]],
+        price_min: Optional[float] = None,
+        price_max: Optional[float] = None,
+    ) -> dict:
+        """Chỉ tính facet counts (khi trang sản phẩm được lấy từ MongoDB, vd: phân trang cursor)"""
+        with self._lock:
+            facet_masks = {
+                name: self._facet_mask(name, values)
+                for name, values in filters.items()
+                if values
+            }
+            has_price = price_min is not None or price_max is not None
+            price_mask = self._price_mask(price_min, price_max) if has_price else None
+            return self._facet_counts(facet_masks, price_mask)
+
+    def _facet_counts(self, facet_masks: Dict[str, int], price_mask: Optional[int]) -> dict:
+        """Đếm theo từng facet với filter của các facet khác (disjunctive faceting)"""
+        facets: Dict[str, Any] = {}
+        for name in FACET_FIELDS:
+            base = self._live
+            for other, other_mask in facet_masks.items():
+                if other != name:
+                    base &= other_mask
+            if price_mask is not None:
+                base &= price_mask
+            counts = {}
+            for value, bits in self._facets[name].items():
+                count = (base & bits).bit_count()
+                if count:
+                    counts[str(value)] = count
+            facets[name] = dict(sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+
+        # Khoảng giá của các sản phẩm khớp filter facet (không tính filter giá)
+        base = self._live
+        for facet_mask in facet_masks.values():
+            base &= facet_mask
+        price_min = next((price for price in self._price_values if base & self._price_bits[price]), None)
+        price_max = next((price for price in reversed(self._price_values) if base & self._price_bits[price]), None)
+        facets["price"] = {"min": price_min, "max": price_max}
+        return facets
+
+    def get_docs(self, product_ids: Iterable[str]) -> Dict[str, dict]:
+        """
+        Lấy docs theo id (hydrate kết quả search) - chỉ đọc, không được sửa
+        Id không có trong index thì bỏ qua
+        """
+        with self._lock:
+            docs = {}
+            for product_id in product_ids:
+                row = self._row_of.get(product_id)
+                if row is not None:
+                    docs[product_id] = self._docs[row]
+            return docs
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "is_ready": self.is_ready,
+                "total_products": len(self._row_of),
+                "facet_values": {name: len(values) for name, values in self._facets.items()},
+                "price_levels": len(self._price_values),
+                "cached_orderings": len(self._orders),
+                "last_built": self.last_built.isoformat() if self.last_built else None,
+            }
+
+    # ---------- cross-worker ----------
+
+    def on_invalidate(self, tags: Iterable[str], remote: bool):
+        """
+        Listener cho invalidate_tags: worker khác ghi sản phẩm thì đọc lại từ DB
+        (worker ghi đã tự cập nhật index của mình nên bỏ qua invalidation local)
+        """
+        if not remote or not self.is_ready:
+            return
+        for tag in tags:
+            if tag == "products:reindex":
+                task = asyncio.ensure_future(self.load())
+            elif tag.startswith("product:"):
+                task = asyncio.ensure_future(self.refresh(tag.split(":", 1)[1]))
+            else:
+                continue
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+
+# Singleton instance
+facet_index = ProductFacetIndex()
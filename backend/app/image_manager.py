@@ -327,7 +327,7 @@ class ImageManager:
                     file_path.unlink()
                     stats['deleted'] += 1
                     stats['freed_space'] += file_size
-                    logger.debug(f"Deleted unused: {file_path.name} ({file_size / 1024:.1f}KB)")
+                    logger.debug("Deleted unused: %s (%.1fKB)", file_path.name, file_size / 1024)
                 except Exception as e:
                     logger.error(f"Error deleting {file_path.name}: {str(e)}")
         
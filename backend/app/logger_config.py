@@ -1,48 +1,234 @@
 """
 Centralized logging configuration
+
+Pipeline không chặn event loop:
+    logger.info(...) -> QueueHandler (chỉ put vào queue, gắn request_id + sampling)
+                     -> QueueListener (thread riêng) -> stdout + file xoay vòng, định dạng JSON
+
+- Mỗi request có correlation id (header X-Request-ID hoặc tự sinh) trong contextvar,
+  mọi log trong request đó đều mang request_id
+- Log DEBUG được lấy mẫu theo request (LOG_DEBUG_SAMPLE_RATE): request được chọn thì
+  giữ toàn bộ debug của request đó, các request khác bỏ hết
+- Cấu hình qua env: LOG_LEVEL, LOG_CONSOLE_LEVEL, LOG_FILE, LOG_FORMAT (json/text),
+  LOG_DEBUG_SAMPLE_RATE
+- Nhiều worker (WEB_CONCURRENCY > 1): RotatingFileHandler không an toàn khi nhiều process
+  cùng xoay 1 file, nên chỉ ghi stdout; đặt LOG_FILE thì mỗi process ghi file riêng
+  <tên>.<pid>.log
 """
 
+import atexit
+import contextvars
+import json
 import logging
+import logging.handlers
+import os
+import queue
 import sys
+import uuid
+import zlib
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Optional
 
 # Create logs directory
 LOGS_DIR = Path("logs")
 LOGS_DIR.mkdir(exist_ok=True)
 
-def setup_logging(name: str = "vyron_fashion", level: str = "INFO"):
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_CONSOLE_LEVEL = os.getenv("LOG_CONSOLE_LEVEL", "INFO").upper()
+LOG_FILE = os.getenv("LOG_FILE", "")
+DEFAULT_LOG_FILE = str(LOGS_DIR / "vyron_fashion.log")
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1") or 1)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1"))
+LOG_FILE_MAX_BYTES = 20 * 1024 * 1024
+LOG_FILE_BACKUPS = 5
+REQUEST_ID_HEADER = "x-request-id"
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+# Thuộc tính chuẩn của LogRecord - phần còn lại (extra=...) được đưa vào JSON
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+
+class RequestContextFilter(logging.Filter):
+    """Gắn request_id (chạy ở thread gọi log, nơi contextvar còn giá trị)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """
+    Lấy mẫu log <= DEBUG theo request_id (cả request giữ hoặc bỏ cùng nhau)
+    Log ngoài request (startup, job nền) lấy mẫu theo từng dòng
+    """
+
+    def __init__(self, rate: float = LOG_DEBUG_SAMPLE_RATE):
+        super().__init__()
+        self.rate = max(0.0, min(1.0, rate))
+        self._counter = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        if self.rate <= 0.0:
+            return False
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            return (zlib.crc32(request_id.encode()) % 10_000) < self.rate * 10_000
+        self._counter += 1
+        return (self._counter * self.rate) % 1.0 < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """1 dòng JSON / record"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            payload["request_id"] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__(
+            '%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
+
+    def format(self, record: logging.LogRecord) -> str:
+        if not hasattr(record, "request_id"):
+            record.request_id = None
+        return super().format(record)
+
+
+def _log_file_path() -> Optional[str]:
+    """File log của process hiện tại (None = chỉ ghi stdout)"""
+    if WEB_CONCURRENCY <= 1:
+        return LOG_FILE or DEFAULT_LOG_FILE
+    if not LOG_FILE:
+        return None
+    path = Path(LOG_FILE)
+    return str(path.with_name(f"{path.stem}.{os.getpid()}{path.suffix or '.log'}"))
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.handlers.QueueHandler] = None
+
+
+def _configure_root():
+    """Gắn QueueHandler vào root logger 1 lần cho cả process"""
+    global _listener, _queue_handler
+    if _queue_handler is not None:
+        return
+
+    formatter = JsonFormatter() if LOG_FORMAT == "json" else TextFormatter()
+
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setLevel(getattr(logging, LOG_CONSOLE_LEVEL, logging.INFO))
+    console_handler.setFormatter(formatter)
+
+    handlers = [console_handler]
+    log_file = _log_file_path()
+    if log_file is not None:
+        Path(log_file).parent.mkdir(parents=True, exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS, encoding='utf-8'
+        )
+        file_handler.setLevel(logging.DEBUG)
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _queue_handler = logging.handlers.QueueHandler(log_queue)
+    _queue_handler.addFilter(RequestContextFilter())
+    _queue_handler.addFilter(DebugSamplingFilter())
+
+    root = logging.getLogger()
+    root.handlers = [h for h in root.handlers if not isinstance(h, logging.handlers.QueueHandler)]
+    root.addHandler(_queue_handler)
+    root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Flush queue và dừng thread ghi log (shutdown)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def setup_logging(name: str = "vyron_fashion", level: Optional[str] = None):
     """
-    Setup logging configuration
-    
+    Lấy logger đã nối vào pipeline queue + JSON
+
     Args:
         name: Logger name
-        level: Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
+        level: Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL) - mặc định LOG_LEVEL
     """
+    _configure_root()
     logger = logging.getLogger(name)
-    logger.setLevel(getattr(logging, level.upper()))
-    
-    # Remove existing handlers
+    logger.setLevel(getattr(logging, (level or LOG_LEVEL).upper()))
+    # Handler riêng (nếu có từ cấu hình cũ) sẽ ghi đồng bộ - chỉ đi qua root
     logger.handlers.clear()
-    
-    # Format
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    
-    # Console handler (only WARNING and above to reduce spam)
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(logging.WARNING)
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
-    
-    # File handler (all levels)
-    file_handler = logging.FileHandler(LOGS_DIR / f"{name}.log", encoding='utf-8')
-    file_handler.setLevel(logging.DEBUG)
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-    
+    logger.propagate = True
     return logger
 
+
+class CorrelationIdMiddleware:
+    """
+    ASGI middleware: lấy X-Request-ID từ request (hoặc sinh mới), đặt vào contextvar
+    và trả lại trong response header
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for key, value in scope.get("headers", []):
+            if key == REQUEST_ID_HEADER.encode():
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex[:16]
+        token = request_id_var.set(request_id)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((REQUEST_ID_HEADER.encode(), request_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
+
+
 # Default logger
 logger = setup_logging()
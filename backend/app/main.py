@@ -2,13 +2,24 @@ from fastapi import FastAPI, HTTPException, status, Path, Response, Query, Body,
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
-from typing import Optional
+from typing import Optional, List, Dict
 import json
 import mimetypes
 from app.database import users_collection, categories_collection, products_collection, reviews_collection, orders_collection, cart_collection, addresses_collection, coupons_collection, returns_collection, settings_collection, close_db
 from app.cloudinary_uploader import upload_image as cloudinary_upload, upload_multiple_images as cloudinary_upload_multiple, delete_product_images as cloudinary_delete_product, is_cloudinary_configured
 from app.recommendation import recommender  # Content-Based Filtering
-from .logger_config import setup_logging
+from app.cooccurrence import cooccurrence, blend_recommendations, COOCCURRENCE_EVENT_TOPIC  # Collaborative Filtering (orders + wishlist)
+from app.pagination import with_tiebreaker, encode_cursor, apply_keyset
+from app.cache import get_cache, invalidate_tags, cache_stats, add_invalidation_listener, add_event_listener, publish_event, start_backend as start_cache_backend, stop_backend as stop_cache_backend
+from app.cache_backend import create_cache_backend
+from app.metrics import MetricsMiddleware, mongo_command_listener, register_collector, render_metrics
+from app.review_summary import compute_rating, distribution_of, has_summary, apply_rating_change, rating_reconciler
+from app.passwords import password_hasher  # bcrypt trong thread pool riêng (không chặn event loop)
+from app.facet_index import facet_index, PRODUCT_COUNTER_EVENT_TOPIC
+from app.category_tree import category_tree
+from app.search_engine import search_engine
+from app.text_utils import remove_accents, fold_text
+from .logger_config import setup_logging, CorrelationIdMiddleware
 from app.schemas import (
     UserCreate,
     UserLogin,
@@ -34,10 +45,17 @@ from app.schemas import (
     ProductUpdate,
     ProductResponse,
     ProductListResponse,
+    ProductSearchResponse,
+    AutocompleteResponse,
+    RecommendationBatchRequest,
     ProductDeleteResponse,
     WishlistResponse,
     WishlistToggleResponse,
+    WishlistItem,
+    WishlistProductListResponse,
+    WishlistProductResponse,
     ReviewCreate,
+    ReviewUpdate,
     ReviewResponse,
     ReviewListResponse,
     OrderCreate,
@@ -90,8 +108,10 @@ from app.schemas import (
 )
 from app.email_utils import send_verification_email, send_reset_password_email, send_promotion_email, send_2fa_code_email
 from datetime import datetime, timedelta
-import bcrypt
 from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import secrets
 import os
 import re
@@ -156,6 +176,13 @@ async def create_product_indexes():
         await products_collection.create_index([("category.id", 1)], name="idx_category_id")
         await products_collection.create_index([("updated_at", -1)], name="idx_updated_at_desc")
 
+        # Keyset pagination indexes - khớp với sort spec (có _id tiebreaker) của get_products
+        await products_collection.create_index([("created_at", -1), ("_id", -1)], name="idx_created_at_id")
+        await products_collection.create_index([("pricing.sale", 1), ("_id", 1)], name="idx_price_id")
+        await products_collection.create_index([("sold_count", -1), ("created_at", -1), ("_id", -1)], name="idx_sold_count_id")
+        await products_collection.create_index([("wishlist_count", -1), ("created_at", -1), ("_id", -1)], name="idx_wishlist_count_id")
+        await products_collection.create_index([("category.slug", 1), ("created_at", -1), ("_id", -1)], name="idx_category_created_at_id")
+
         # Text search (optional, improves search by name)
         try:
             await products_collection.create_index([("name", "text"), ("slug", "text"), ("sku", "text")], name="idx_text_search")
@@ -208,11 +235,41 @@ app.add_middleware(
     max_age=3600,  # Cache preflight request trong 1 giờ
 )
 
+# Metrics middleware - latency theo route, in-flight, status code
+app.add_middleware(MetricsMiddleware)
+# Correlation id (ngoài cùng) - mọi log trong request mang cùng request_id
+app.add_middleware(CorrelationIdMiddleware)
+
+
+def _cache_metrics() -> List[str]:
+    """Hit/miss của các TTLCache cho /metrics"""
+    lines = [
+        "# HELP app_cache_requests_total Số lần đọc cache theo kết quả",
+        "# TYPE app_cache_requests_total counter",
+    ]
+    size_lines = [
+        "# HELP app_cache_entries Số entry đang có trong cache",
+        "# TYPE app_cache_entries gauge",
+    ]
+    for name, stats in cache_stats().items():
+        if not isinstance(stats, dict) or "hits" not in stats:
+            continue
+        for result in ("hits", "misses", "stale_hits", "coalesced"):
+            lines.append(f'app_cache_requests_total{{cache="{name}",result="{result}"}} {stats.get(result, 0)}')
+        size_lines.append(f'app_cache_entries{{cache="{name}"}} {stats.get("size", 0)}')
+    return lines + size_lines
+
+
+register_collector(_cache_metrics)
+
 @app.on_event("startup")
 async def startup_event():
     """Tạo indexes khi khởi động server để tối ưu performance"""
     try:
-        print("🚀 Creating database indexes...")
+        # Cache dùng chung giữa các worker (REDIS_URL), mặc định cache local
+        await start_cache_backend(create_cache_backend())
+        
+        logger.info("🚀 Creating database indexes...")
         
         # Use the robust index creation function for products and categories
         await create_product_indexes()
@@ -228,26 +285,65 @@ async def startup_event():
         # Reviews collection indexes
         await reviews_collection.create_index("product_id")
         await reviews_collection.create_index("user_id")
+        # Danh sách review theo sản phẩm (keyset pagination theo từng kiểu sort / lọc theo sao)
+        await reviews_collection.create_index([("product_id", 1), ("created_at", -1), ("_id", -1)])
+        await reviews_collection.create_index([("product_id", 1), ("rating", -1), ("created_at", -1), ("_id", -1)])
+        # Mỗi user 1 review / sản phẩm (chặn 2 request tạo review song song)
+        try:
+            await reviews_collection.create_index([("product_id", 1), ("user_id", 1)], unique=True)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not create unique review index (duplicate reviews?): {e}")
         
-        print("✅ Database indexes created successfully")
-        
-        # Load recommendation model
-        print("🧠 Loading recommendation model...")
-        products = await products_collection.find({}).to_list(length=None)
-        if products:
-            success = await recommender.fit(products)
-            if success:
-                print(f"✅ Recommendation model loaded with {len(recommender.product_ids)} products")
-            else:
-                print("⚠️ Not enough products for recommendations")
+        # Cart: mỗi user 1 giỏ hàng (upsert song song không tạo 2 cart)
+        try:
+            await cart_collection.create_index("user_id", unique=True)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not create unique cart index (duplicate carts?): {e}")
+        
+        logger.info("✅ Database indexes created successfully")
+        
+        # Facet index + search index cho trang danh sách sản phẩm (filter/sort/tìm kiếm trong memory)
+        logger.info("🗂️ Building product facet & search index...")
+        facet_index.attach(products_collection, PRODUCT_LIST_PROJECTION)
+        search_engine.attach(products_collection, PRODUCT_LIST_PROJECTION)
+        add_invalidation_listener(facet_index.on_invalidate)
+        add_event_listener(PRODUCT_COUNTER_EVENT_TOPIC, facet_index.on_counter_event)
+        add_invalidation_listener(search_engine.on_invalidate)
+        category_tree.attach(categories_collection, products_collection)
+        add_invalidation_listener(category_tree.on_invalidate)
+        indexed_count = await rebuild_product_indexes()
+        logger.info(f"✅ Facet & search index built with {indexed_count} products")
+        
+        # Load recommendation model (cập nhật tăng dần sau mỗi lần ghi, fit lại chạy nền)
+        # Snapshot trên đĩa còn khớp catalog thì chỉ cần mmap, ngược lại fit nền (không chặn startup)
+        logger.info("🧠 Loading recommendation model...")
+        recommender.attach(products_collection)
+        add_invalidation_listener(recommender.on_invalidate)
+        recommender.start_scheduler()
+        # Co-occurrence (mua cùng / cũng thích) build nền từ orders + wishlists
+        cooccurrence.attach(orders_collection, users_collection)
+        add_event_listener(COOCCURRENCE_EVENT_TOPIC, cooccurrence.on_event)
+        cooccurrence.start_scheduler()
+        # Đối soát products.rating với reviews định kỳ (sửa lệch do ghi lỗi giữa chừng)
+        rating_reconciler.attach(products_collection, reviews_collection, sync_product_index)
+        rating_reconciler.start_scheduler()
+        
+        if await recommender.restore_snapshot():
+            logger.info(f"✅ Recommendation model restored from snapshot with {recommender.get_stats()['total_products']} products")
         else:
-            print("⚠️ No products found for recommendation model")
+            job = recommender.start_rebuild(reason="startup")
+            logger.info(f"⏳ Recommendation snapshot missing or stale, fitting in background (job {job['job_id']})")
             
     except Exception as e:
-        print(f"⚠️ Error creating indexes: {str(e)}")
+        logger.error(f"⚠️ Error creating indexes: {str(e)}")
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    await recommender.stop_scheduler()
+    await cooccurrence.stop_scheduler()
+    await rating_reconciler.stop_scheduler()
+    await password_hasher.shutdown()
+    await stop_cache_backend()
     await close_db()
 
 @app.get("/health")
@@ -255,6 +351,19 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "healthy"}
 
+@app.get("/metrics")
+async def metrics():
+    """Metrics định dạng Prometheus (HTTP theo route, MongoDB theo collection/command, cache)"""
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/metrics/slow-commands")
+async def slow_mongo_commands():
+    """Mẫu các MongoDB command chậm gần nhất (filter/pipeline đã ẩn giá trị)"""
+    return {
+        "threshold_ms": mongo_command_listener.slow_ms,
+        "commands": mongo_command_listener.get_slow_samples()
+    }
+
 @app.get("/")
 async def root():
     return {"message": "Vyron Fashion API", "status": "running"}
@@ -298,15 +407,15 @@ async def websocket_admin_dashboard(websocket: WebSocket, client_id: str = None)
                         from app.websocket_manager import notify_dashboard_refresh
                         await notify_dashboard_refresh()
                     except Exception as e:
-                        print(f"Error triggering refresh: {e}")
+                        logger.error(f"Error triggering refresh: {e}")
                         
             except json.JSONDecodeError:
-                print(f"Invalid JSON received from client {client_id}")
+                logger.warning(f"Invalid JSON received from client {client_id}")
                 
     except WebSocketDisconnect:
         dashboard_manager.disconnect(websocket)
     except Exception as e:
-        print(f"WebSocket error: {e}")
+        logger.error(f"WebSocket error: {e}")
         dashboard_manager.disconnect(websocket)
 
 
@@ -317,10 +426,6 @@ async def get_websocket_stats():
 
 # ==================== END WEBSOCKET ====================
 
-def remove_accents(input_str):
-    import unicodedata
-    return ''.join((c for c in unicodedata.normalize('NFKD', input_str) if not unicodedata.combining(c)))
-
 # Color name to hex mapping (hỗ trợ cả có dấu và không dấu)
 COLOR_HEX_MAP = {
     # Black / Đen
@@ -493,10 +598,7 @@ async def register(user_data: UserCreate):
             raise HTTPException(status_code=400, detail="Mật khẩu không được chứa ngày sinh (yyyyMMdd)")
         
         # Hash password
-        hashed_password = bcrypt.hashpw(
-            user_data.password.encode('utf-8'),
-            bcrypt.gensalt()
-        ).decode('utf-8')
+        hashed_password = await password_hasher.hash(user_data.password)
 
         verification_code = secrets.token_hex(3).upper()
 
@@ -574,14 +676,20 @@ async def login(credentials: UserLogin):
             )
         
         # Kiểm tra password trước
-        if not bcrypt.checkpw(
-            credentials.password.encode('utf-8'),
-            user["password"].encode('utf-8')
-        ):
+        if not await password_hasher.verify(credentials.password, user["password"]):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Tên đăng nhập hoặc mật khẩu không đúng"
             )
+        
+        # Hash cũ có cost thấp hơn BCRYPT_ROUNDS -> hash lại nền (chỉ ghi nếu password chưa bị đổi)
+        async def save_upgraded_hash(new_hash: str) -> bool:
+            result = await users_collection.update_one(
+                {"_id": user["_id"], "password": user["password"]},
+                {"$set": {"password": new_hash}}
+            )
+            return result.modified_count > 0
+        password_hasher.schedule_rehash(credentials.password, user["password"], save_upgraded_hash)
 
         # Kiểm tra tài khoản bị khóa
         if user.get("is_banned", False):
@@ -773,15 +881,15 @@ async def resend_verification(payload: dict):
         if not username:
             return {"success": False, "error": "Thiếu username"}
         
-        print(f"🔍 Tìm user: {username}")
+        logger.debug("🔍 Tìm user: %s", username)
         user = await users_collection.find_one({"username": username})
         
         if not user:
-            print(f"❌ Không tìm thấy user: {username}")
+            logger.error(f"❌ Không tìm thấy user: {username}")
             return {"success": False, "error": "Không tìm thấy người dùng"}
 
         if user.get("emailVerified", False):
-            print(f"✅ User {username} đã verify rồi")
+            logger.debug("✅ User %s đã verify rồi", username)
             return {
                 "success": True,
                 "message": "Email đã được xác minh",
@@ -791,14 +899,14 @@ async def resend_verification(payload: dict):
 
         # Tạo mã xác minh mới
         verification_code = secrets.token_hex(3).upper()
-        print(f"🔑 Tạo mã mới: {verification_code}")
+        logger.debug("🔑 Tạo mã mới cho %s", username)
 
         # Cập nhật mã mới vào database
         await users_collection.update_one(
             {"_id": user["_id"]},
             {"$set": {"verificationCode": verification_code}}
         )
-        print(f"💾 Đã lưu mã vào DB")
+        logger.debug("💾 Đã lưu mã vào DB")
 
         # Gửi email xác minh
         email_sent = await send_verification_email(user["email"], user["username"], verification_code, user.get("name"))
@@ -811,7 +919,7 @@ async def resend_verification(payload: dict):
         }
         
     except Exception as e:
-        print(f"❌ LỖI NGHIÊM TRỌNG: {str(e)}")
+        logger.error(f"❌ LỖI NGHIÊM TRỌNG: {str(e)}")
         import traceback
         traceback.print_exc()
         return {
@@ -965,10 +1073,7 @@ async def reset_password(request: ResetPasswordRequest):
                     raise HTTPException(status_code=400, detail="Mật khẩu không được chứa ngày sinh")
         
         # Hash password mới
-        hashed_password = bcrypt.hashpw(
-            request.new_password.encode('utf-8'),
-            bcrypt.gensalt()
-        ).decode('utf-8')
+        hashed_password = await password_hasher.hash(request.new_password)
         
         # Cập nhật password và xóa reset token
         await users_collection.update_one(
@@ -997,8 +1102,8 @@ async def reset_password(request: ResetPasswordRequest):
 # ==================== CATEGORY API ENDPOINTS ====================
 
 # Cache categories data trong 5 phút
-categories_cache = {"data": None, "timestamp": None}
 CATEGORIES_CACHE_DURATION = 300  # seconds
+categories_cache = get_cache("categories", maxsize=64, ttl=CATEGORIES_CACHE_DURATION, stale_ttl=60, shared=True)
 
 @app.get("/api/categories", response_model=CategoryListResponse)
 async def get_categories(parent_id: Optional[str] = Query(None), status: Optional[str] = Query(None)):
@@ -1008,165 +1113,198 @@ async def get_categories(parent_id: Optional[str] = Query(None), status: Optiona
     - parent_id=null hoặc không gửi: Lấy danh mục chính (parent_id = None)
     - parent_id=<id>: Lấy danh mục con
     - status: Lọc theo trạng thái (active/inactive)
+    
+    Trả lời từ cây danh mục in-memory (count duy trì tăng dần), chỉ dùng
+    aggregation khi cây chưa build xong
     """
     try:
+        if category_tree.is_ready:
+            result = [
+                CategoryResponse(**node)
+                for node in category_tree.list_categories(parent_id, status)
+            ]
+            return CategoryListResponse(success=True, categories=result, total=len(result))
+        
         # Tạo cache key từ params
         cache_key = f"{parent_id}_{status}"
         
-        # Check cache
-        now = datetime.now()
-        if categories_cache.get("data") and categories_cache.get("timestamp"):
-            cached_data = categories_cache["data"].get(cache_key)
-            if cached_data:
-                cache_age = (now - categories_cache["timestamp"]).total_seconds()
-                if cache_age < CATEGORIES_CACHE_DURATION:
-                    print(f"✅ Returning cached categories data (age: {cache_age:.1f}s)")
-                    return cached_data
-        
-        print(f"🔄 Generating fresh categories data...")
-        
-        query = {}
-        # Xử lý parent_id: nếu là "null" string hoặc None, lấy danh mục chính
-        if parent_id is not None:
-            if parent_id == "null" or parent_id == "":
-                query["parent_id"] = None
-            else:
-                query["parent_id"] = parent_id
-        
-        if status:
-            query["status"] = status
-        
-        print(f"🔍 Query categories with: {query}")
-        
-        # ========== AGGREGATION PIPELINE - TỐI ƯU ==========
-        
-        # Pipeline để lấy categories với subcategories count và product count
-        pipeline = [
-            {"$match": query},
-            {"$sort": {"created_at": 1, "_id": 1}},
-            # Lookup subcategories count
-            {
-                "$lookup": {
-                    "from": "categories",
-                    "let": {"cat_id": {"$toString": "$_id"}},
-                    "pipeline": [
-                        {"$match": {"$expr": {"$eq": ["$parent_id", "$$cat_id"]}}}
-                    ],
-                    "as": "subcategories"
-                }
-            },
-            # Lookup products count (chỉ active)
-            {
-                "$lookup": {
-                    "from": "products",
-                    "localField": "slug",
-                    "foreignField": "category.slug",
-                    "pipeline": [
-                        {"$match": {"status": "active"}}
-                    ],
-                    "as": "direct_products"
-                }
-            },
-            # Project final result
-            {
-                "$project": {
-                    "name": 1,
-                    "slug": 1,
-                    "description": 1,
-                    "parent_id": 1,
-                    "status": 1,
-                    "created_at": 1,
-                    "updated_at": 1,
-                    "subcategories_count": {"$size": "$subcategories"},
-                    "subcategory_slugs": "$subcategories.slug",
-                    "direct_product_count": {"$size": "$direct_products"}
-                }
-            }
-        ]
-        
-        categories = await categories_collection.aggregate(pipeline).to_list(length=None)
-        
-        # Tính product count cho từng category (bao gồm subcategories)
-        # Lấy tất cả subcategory slugs một lần
-        all_subcategory_slugs = set()
-        for cat in categories:
-            all_subcategory_slugs.update(cat.get("subcategory_slugs", []))
-        
-        # Query products một lần cho tất cả subcategories
-        subcategory_products = {}
-        if all_subcategory_slugs:
-            pipeline_products = [
+        async def build_response():
+            logger.debug("🔄 Generating fresh categories data...")
+            
+            query = {}
+            # Xử lý parent_id: nếu là "null" string hoặc None, lấy danh mục chính
+            if parent_id is not None:
+                if parent_id == "null" or parent_id == "":
+                    query["parent_id"] = None
+                else:
+                    query["parent_id"] = parent_id
+            
+            if status:
+                query["status"] = status
+            
+            logger.debug("🔍 Query categories with: %s", query)
+            
+            # ========== AGGREGATION PIPELINE - TỐI ƯU ==========
+            
+            # Pipeline để lấy categories với subcategories count và product count
+            pipeline = [
+                {"$match": query},
+                {"$sort": {"created_at": 1, "_id": 1}},
+                # Lookup subcategories count
                 {
-                    "$match": {
-                        "category.slug": {"$in": list(all_subcategory_slugs)},
-                        "status": "active"
+                    "$lookup": {
+                        "from": "categories",
+                        "let": {"cat_id": {"$toString": "$_id"}},
+                        "pipeline": [
+                            {"$match": {"$expr": {"$eq": ["$parent_id", "$$cat_id"]}}}
+                        ],
+                        "as": "subcategories"
                     }
                 },
+                # Lookup products count (chỉ active)
                 {
-                    "$group": {
-                        "_id": "$category.slug",
-                        "count": {"$sum": 1}
+                    "$lookup": {
+                        "from": "products",
+                        "localField": "slug",
+                        "foreignField": "category.slug",
+                        "pipeline": [
+                            {"$match": {"status": "active"}}
+                        ],
+                        "as": "direct_products"
+                    }
+                },
+                # Project final result
+                {
+                    "$project": {
+                        "name": 1,
+                        "slug": 1,
+                        "description": 1,
+                        "parent_id": 1,
+                        "status": 1,
+                        "created_at": 1,
+                        "updated_at": 1,
+                        "subcategories_count": {"$size": "$subcategories"},
+                        "subcategory_slugs": "$subcategories.slug",
+                        "direct_product_count": {"$size": "$direct_products"}
                     }
                 }
             ]
-            product_counts = await products_collection.aggregate(pipeline_products).to_list(length=None)
-            subcategory_products = {item["_id"]: item["count"] for item in product_counts}
-        
-        # Build result
-        result = []
-        for cat in categories:
-            cat_id = str(cat["_id"])
-            cat_slug = cat["slug"]
             
-            # Tính tổng product count (direct + subcategories)
-            direct_count = cat.get("direct_product_count", 0)
-            sub_count = sum(subcategory_products.get(slug, 0) for slug in cat.get("subcategory_slugs", []))
-            total_product_count = direct_count + sub_count
+            categories = await categories_collection.aggregate(pipeline).to_list(length=None)
             
-            result.append(CategoryResponse(
-                id=cat_id,
-                name=cat["name"],
-                slug=cat_slug,
-                description=cat.get("description", ""),
-                parent_id=cat.get("parent_id"),
-                status=cat.get("status", "active"),
-                product_count=total_product_count,
-                subcategories_count=cat.get("subcategories_count", 0),
-                created_at=cat.get("created_at"),
-                updated_at=cat.get("updated_at")
-            ))
+            # Tính product count cho từng category (bao gồm subcategories)
+            # Lấy tất cả subcategory slugs một lần
+            all_subcategory_slugs = set()
+            for cat in categories:
+                all_subcategory_slugs.update(cat.get("subcategory_slugs", []))
+            
+            # Query products một lần cho tất cả subcategories
+            subcategory_products = {}
+            if all_subcategory_slugs:
+                pipeline_products = [
+                    {
+                        "$match": {
+                            "category.slug": {"$in": list(all_subcategory_slugs)},
+                            "status": "active"
+                        }
+                    },
+                    {
+                        "$group": {
+                            "_id": "$category.slug",
+                            "count": {"$sum": 1}
+                        }
+                    }
+                ]
+                product_counts = await products_collection.aggregate(pipeline_products).to_list(length=None)
+                subcategory_products = {item["_id"]: item["count"] for item in product_counts}
+            
+            # Build result
+            result = []
+            for cat in categories:
+                cat_id = str(cat["_id"])
+                cat_slug = cat["slug"]
+                
+                # Tính tổng product count (direct + subcategories)
+                direct_count = cat.get("direct_product_count", 0)
+                sub_count = sum(subcategory_products.get(slug, 0) for slug in cat.get("subcategory_slugs", []))
+                total_product_count = direct_count + sub_count
+                
+                result.append(CategoryResponse(
+                    id=cat_id,
+                    name=cat["name"],
+                    slug=cat_slug,
+                    description=cat.get("description", ""),
+                    parent_id=cat.get("parent_id"),
+                    status=cat.get("status", "active"),
+                    product_count=total_product_count,
+                    direct_product_count=direct_count,
+                    subcategories_count=cat.get("subcategories_count", 0),
+                    created_at=cat.get("created_at"),
+                    updated_at=cat.get("updated_at")
+                ))
+            
+            response = CategoryListResponse(
+                success=True,
+                categories=result,
+                total=len(result)
+            )
+            
+            return response
         
-        response = CategoryListResponse(
-            success=True,
-            categories=result,
-            total=len(result)
+        # Single-flight: các request đồng thời cùng key chỉ chạy aggregation 1 lần,
+        # hết hạn thì trả bản cũ và refresh nền (stale-while-revalidate)
+        # product_count phụ thuộc products nên gắn cả tag "products"
+        return await categories_cache.get_or_compute(
+            cache_key, build_response, tags=("categories", "products")
         )
         
-        # Cache response
-        if categories_cache.get("data") is None:
-            categories_cache["data"] = {}
-        categories_cache["data"][cache_key] = response
-        categories_cache["timestamp"] = now
-        
-        print(f"✅ Categories data generated and cached")
-        return response
-        
     except Exception as e:
-        print(f"❌ Error in get_categories: {str(e)}")
+        logger.error(f"❌ Error in get_categories: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Lỗi server: {str(e)}"
         )
 
+@app.get("/api/categories/tree")
+async def get_category_tree(
+    root: Optional[str] = Query(None, description="ID hoặc slug danh mục gốc của cây con (mặc định: cả cây)"),
+    category_status: Optional[str] = Query(None, alias="status", description="Lọc theo trạng thái (active/inactive)")
+):
+    """Cây danh mục lồng nhau với product_count (cả cây con) và direct_product_count"""
+    if not category_tree.is_ready:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Cây danh mục đang được khởi tạo")
+    if root is not None and category_tree.resolve(root) is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy danh mục")
+    tree = category_tree.subtree(root, category_status)
+    return {"success": True, "categories": tree, "total": len(tree)}
+
+
+@app.get("/api/categories/{category_id}/breadcrumb")
+async def get_category_breadcrumb(category_id: str = Path(..., description="ID hoặc slug danh mục")):
+    """Breadcrumb từ danh mục gốc tới danh mục hiện tại"""
+    if not category_tree.is_ready:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Cây danh mục đang được khởi tạo")
+    path = category_tree.breadcrumb(category_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="Không tìm thấy danh mục")
+    return {"success": True, "breadcrumb": path}
+
+
 @app.get("/api/categories/{category_id}", response_model=CategoryResponse)
 async def get_category(category_id: str = Path(...)):
     """Lấy thông tin một danh mục"""
     try:
+        if category_tree.is_ready:
+            node = category_tree.get_category(category_id)
+            if node is None:
+                raise HTTPException(status_code=404, detail="Không tìm thấy danh mục")
+            return CategoryResponse(**node)
+        
         category = await categories_collection.find_one({"_id": ObjectId(category_id)})
         if not category:
             raise HTTPException(status_code=404, detail="Không tìm thấy danh mục")
         
-        product_count = 0  # TODO: tính từ products collection
+        product_count = 0  # Cây danh mục chưa sẵn sàng
         
         return CategoryResponse(
             id=str(category["_id"]),
@@ -1191,7 +1329,7 @@ async def get_category(category_id: str = Path(...)):
 async def create_category(category_data: CategoryCreate):
     """Tạo danh mục mới"""
     try:
-        print(f"📝 Creating category: {category_data.name}, parent_id: {category_data.parent_id}")
+        logger.debug("📝 Creating category: %s, parent_id: %s", category_data.name, category_data.parent_id)
         
         # Kiểm tra slug đã tồn tại chưa
         existing = await categories_collection.find_one({"slug": category_data.slug})
@@ -1217,14 +1355,14 @@ async def create_category(category_data: CategoryCreate):
             "updated_at": datetime.now().isoformat()
         }
         
-        print(f"💾 Saving category to DB: {new_category}")
+        logger.debug("💾 Saving category to DB: %s", new_category)
         result = await categories_collection.insert_one(new_category)
-        print(f"✅ Category saved with ID: {result.inserted_id}")
+        logger.debug("✅ Category saved with ID: %s", result.inserted_id)
+        category_tree.upsert_category({**new_category, "_id": result.inserted_id})
         
         # Clear cache
-        categories_cache["data"] = None
-        categories_cache["timestamp"] = None
-        print("🗑️  Categories cache cleared")
+        invalidate_tags("categories")
+        logger.debug("🗑️ Categories cache cleared")
         
         return CategoryResponse(
             id=str(result.inserted_id),
@@ -1281,11 +1419,12 @@ async def update_category(category_id: str = Path(...), category_data: CategoryU
         )
         
         # Clear cache
-        categories_cache["data"] = None
-        categories_cache["timestamp"] = None
-        print("🗑️  Categories cache cleared")
+        invalidate_tags("categories")
+        logger.debug("🗑️ Categories cache cleared")
         
         updated = await categories_collection.find_one({"_id": ObjectId(category_id)})
+        category_tree.upsert_category(updated)
+        node = category_tree.get_category(category_id) or {}
         
         return CategoryResponse(
             id=str(updated["_id"]),
@@ -1294,7 +1433,9 @@ async def update_category(category_id: str = Path(...), category_data: CategoryU
             description=updated.get("description", ""),
             parent_id=updated.get("parent_id"),
             status=updated.get("status", "active"),
-            product_count=updated.get("product_count", 0),
+            product_count=node.get("product_count", 0),
+            direct_product_count=node.get("direct_product_count", 0),
+            subcategories_count=node.get("subcategories_count", 0),
             created_at=updated.get("created_at"),
             updated_at=updated.get("updated_at")
         )
@@ -1326,11 +1467,12 @@ async def delete_category(category_id: str = Path(...)):
         
         # Xóa danh mục chính
         await categories_collection.delete_one({"_id": ObjectId(category_id)})
+        for removed_id in subcategory_ids + [category_id]:
+            category_tree.remove_category(removed_id)
         
         # Clear cache
-        categories_cache["data"] = None
-        categories_cache["timestamp"] = None
-        print("🗑️  Categories cache cleared")
+        invalidate_tags("categories")
+        logger.debug("🗑️ Categories cache cleared")
         
         # TODO: Xóa hoặc cập nhật products trong danh mục này
         
@@ -1376,6 +1518,191 @@ async def delete_category(category_id: str = Path(...)):
 
 # ==================== PRODUCT API ENDPOINTS ====================
 
+# Cache danh sách sản phẩm (2 phút - frequently updated)
+PRODUCTS_CACHE_DURATION = 120  # seconds
+products_cache = get_cache("products", maxsize=512, ttl=PRODUCTS_CACHE_DURATION, stale_ttl=30, shared=True)
+
+# Cache tổng số sản phẩm theo filter (total_mode=cached/estimated)
+PRODUCT_COUNT_CACHE_DURATION = 300  # seconds
+product_count_cache = get_cache("product_counts", maxsize=256, ttl=PRODUCT_COUNT_CACHE_DURATION)
+
+# Projection cho list view - chỉ lấy các field cần thiết để giảm data transfer
+# List view chỉ cần ảnh chính, không cần gallery và color images
+PRODUCT_LIST_PROJECTION = {
+    "_id": 1,
+    "name": 1,
+    "slug": 1,
+    "sku": 1,
+    "brand": 1,
+    "category": 1,
+    "pricing": 1,
+    "short_description": 1,
+    "image": 1,  # Chỉ ảnh chính
+    # "images": 0,  # Không lấy gallery trong list view
+    "variants.colors.name": 1,  # Lấy tên màu
+    "variants.colors.slug": 1,  # Lấy slug màu
+    "variants.colors.hex": 1,   # Lấy hex màu
+    "variants.colors.available": 1,  # Lấy trạng thái available
+    "variants.colors.images": 1,  # Lấy ảnh màu cho hover preview
+    "variants.sizes": 1,
+    "inventory": 1,
+    "status": 1,
+    "rating": 1,
+    "wishlist_count": 1,
+    "sold_count": 1,
+    "created_at": 1,
+    "updated_at": 1
+}
+
+async def sync_product_index(product_id: str):
+    """
+    Cập nhật facet index sau khi ghi 1 sản phẩm (create/update/delete, sold_count, wishlist_count)
+    và phát tag product:<id> để các worker khác đọc lại sản phẩm đó
+    """
+    await facet_index.refresh(product_id)
+    await search_engine.refresh(product_id)
+    await category_tree.refresh_product(product_id)
+    invalidate_tags(f"product:{product_id}")
+
+def sync_product_counter(product_id: str, field: str, value: int, delta: int):
+    """
+    Field đếm ($inc) đổi: chỉ facet index dùng (hiển thị + sort), không cần sync_product_index
+    (đọc lại sản phẩm cho từng index). Worker khác nhận delta qua event
+    """
+    facet_index.set_counter(product_id, field, value)
+    publish_event(PRODUCT_COUNTER_EVENT_TOPIC, {"product_id": product_id, "field": field, "delta": delta})
+
+async def rebuild_product_indexes() -> int:
+    """Build lại facet index + search index + cây danh mục từ 1 lần đọc collection (startup, migration hàng loạt)"""
+    products = await products_collection.find({}, PRODUCT_LIST_PROJECTION).to_list(length=None)
+    facet_index.build(products)
+    search_engine.build(products)
+    await category_tree.load(products)
+    return len(products)
+
+def get_product_index_filters(
+    category_slug: Optional[str],
+    product_status: Optional[str],
+    sizes: Optional[str],
+    colors: Optional[str],
+    brands: Optional[str]
+) -> dict:
+    """Chuyển query params của get_products thành filter cho facet index"""
+    filters = {}
+    if category_slug:
+        filters["categories"] = [category_slug]
+    if product_status:
+        filters["status"] = [product_status]
+    if sizes:
+        filters["sizes"] = [s.strip() for s in sizes.split(',')]
+    if colors:
+        filters["colors"] = [c.strip() for c in colors.split(',')]
+    if brands:
+        filters["brands"] = [b.strip() for b in brands.split(',')]
+    return filters
+
+def get_product_sort_spec(sort: Optional[str]):
+    """Trả về (scope, sort spec có _id tiebreaker) cho từng kiểu sort"""
+    if sort == 'price_asc':
+        return "price_asc", with_tiebreaker([("pricing.sale", 1)])
+    if sort == 'price_desc':
+        return "price_desc", with_tiebreaker([("pricing.sale", -1)])
+    if sort == 'popular' or sort == 'most_wishlisted':
+        # Sort by wishlist_count desc, then by created_at
+        return "popular", with_tiebreaker([("wishlist_count", -1), ("created_at", -1)])
+    if sort == 'best_sellers' or sort == 'most_sold':
+        # Sort by sold_count desc (most sold first)
+        return "best_sellers", with_tiebreaker([("sold_count", -1), ("created_at", -1)])
+    return "newest", with_tiebreaker([("created_at", -1)])
+
+async def count_products(query: dict, total_mode: str):
+    """
+    Đếm tổng số sản phẩm theo total_mode
+
+    Returns:
+        (total, is_estimate)
+    """
+    if total_mode == 'exact':
+        return await products_collection.count_documents(query), False
+    
+    # Không có filter: dùng metadata của collection, không cần scan
+    if total_mode == 'estimated' and not query:
+        return await products_collection.estimated_document_count(), True
+    
+    count_key = json.dumps(query, sort_keys=True, default=str)
+    cached_total = product_count_cache.get(count_key)
+    if cached_total is not None:
+        return cached_total, True
+    
+    total = await products_collection.count_documents(query)
+    product_count_cache.set(count_key, total, tags=("products",))
+    return total, False
+
+def build_product_list_item(product: dict, is_single_product_request: bool = False) -> ProductResponse:
+    """
+    Chuyển product document thành ProductResponse cho list view
+    (không sửa document gốc - docs có thể đến từ facet index trong memory)
+    """
+    # Get variants from database (full data)
+    variants = product.get("variants", {})
+    
+    # Debug log for single product
+    if is_single_product_request:
+        logger.debug("📸 Single product variants from DB: %s", variants)
+    
+    # Only remove color images for list view (not single product)
+    if not is_single_product_request:
+        if isinstance(variants, dict) and "colors" in variants:
+            variant_colors = variants.get("colors", [])
+            if isinstance(variant_colors, list):
+                # Giữ lại ảnh đầu tiên của mỗi màu cho hover preview
+                variants = {
+                    **variants,
+                    "colors": [
+                        {
+                            "name": c.get("name", ""),
+                            "slug": c.get("slug", ""),
+                            "hex": c.get("hex", "#000000"),
+                            "available": c.get("available", True),
+                            "images": c.get("images", [])[:1]  # Chỉ lấy ảnh đầu tiên cho hover
+                        }
+                        for c in variant_colors
+                    ]
+                }
+    
+    # For single product, include full data (gallery images, color images)
+    product_images = product.get("images", []) if is_single_product_request else []
+    
+    return ProductResponse(
+        id=str(product["_id"]),
+        name=product["name"],
+        slug=product["slug"],
+        sku=product["sku"],
+        brand=product.get("brand", {"name": "VYRON", "slug": "vyron"}),
+        category=product.get("category", {"name": "", "slug": ""}),
+        pricing=product.get("pricing", {
+            "original": 0,
+            "sale": 0,
+            "discount_percent": 0,
+            "currency": "VND"
+        }),
+        short_description=product.get("short_description", ""),
+        image=product.get("image", ""),
+        images=product_images,  # Full images for single product, empty for list view
+        variants=normalize_variants(variants),
+        inventory=product.get("inventory", {
+            "in_stock": True,
+            "quantity": 0,
+            "low_stock_threshold": 10
+        }),
+        status=product.get("status", "active"),
+        rating=product.get("rating", {"average": 0.0, "count": 0}),
+        wishlist_count=product.get("wishlist_count", 0),
+        sold_count=product.get("sold_count", 0),
+        created_at=safe_datetime_to_str(product.get("created_at")),
+        updated_at=safe_datetime_to_str(product.get("updated_at"))
+    )
+
 @app.get("/api/products", response_model=ProductListResponse)
 async def get_products(
     category_slug: Optional[str] = Query(None),
@@ -1389,7 +1716,10 @@ async def get_products(
     price_max: Optional[int] = Query(None),
     page: int = Query(1, ge=1),
     limit: int = Query(24, ge=1, le=100),
-    sort: Optional[str] = Query('newest')
+    sort: Optional[str] = Query('newest'),
+    cursor: Optional[str] = Query(None),  # Keyset pagination token (next_cursor của trang trước)
+    total_mode: str = Query('exact', pattern="^(exact|estimated|cached)$"),
+    include_facets: bool = Query(False)  # Trả về facet counts cho sidebar
 ):
     """
     Lấy danh sách sản phẩm với filter hỗ trợ - VERSION TỐI ƯU VỚI CACHE
@@ -1404,234 +1734,264 @@ async def get_products(
     - page: Trang hiện tại
     - limit: Số lượng mỗi trang
     - sort: Sắp xếp (newest, price_asc, price_desc)
+    - cursor: Phân trang keyset - truyền next_cursor của trang trước thay cho page (response có page=null),
+      độ trễ không phụ thuộc độ sâu trang
+    - total_mode: exact (count_documents), cached (đếm 1 lần rồi cache theo filter),
+      estimated (metadata của collection khi không có filter)
+    - include_facets: Trả về số lượng theo sizes/colors/brands/categories/status + khoảng giá
+
+    Khi không có search/slug, filter + sort + phân trang được trả lời từ facet index
+    trong memory (total luôn chính xác), không query MongoDB.
     """
     try:
-        # Cache key based on all parameters
-        cache_key = f"{category_slug}_{product_status}_{slug}_{search}_{sizes}_{colors}_{brands}_{price_min}_{price_max}_{page}_{limit}_{sort}"
-        now = datetime.now()
-        
-        # Check cache (2 minutes for products - frequently updated)
-        if admin_products_cache.get("data"):
-            cached = admin_products_cache["data"].get(cache_key)
-            if cached:
-                cache_age = (now - admin_products_cache["timestamp"]).total_seconds()
-                if cache_age < ADMIN_CACHE_DURATION:
-                    print(f"✅ Returning cached products (age: {cache_age:.1f}s)")
-                    return cached
-        
-        print(f"🔄 Generating fresh products data...")
+        # Cursor mode: page không có ý nghĩa (không trả về, không tách cache key)
+        if cursor:
+            page = None
         
-        query = {}
+        # Cache key based on all parameters
+        cache_key = f"{category_slug}_{product_status}_{slug}_{search}_{sizes}_{colors}_{brands}_{price_min}_{price_max}_{page}_{limit}_{sort}_{cursor}_{total_mode}_{include_facets}"
         
-        # Search by name, SKU, or slug (server-side search)
-        if search:
-            import re
-            search_pattern = re.escape(search)  # Escape special regex characters
-            query["$or"] = [
-                {"name": {"$regex": search_pattern, "$options": "i"}},
-                {"sku": {"$regex": search_pattern, "$options": "i"}},
-                {"slug": {"$regex": search_pattern, "$options": "i"}}
-            ]
-            print(f"🔍 Searching products with: '{search}'")
-        elif slug:
-            # Try exact match first, then case-insensitive regex match
-            print(f"🔍 Searching for product with slug: '{slug}'")
+        async def build_response():
+            logger.debug("🔄 Generating fresh products data...")
             
-            # First try exact match
-            query["slug"] = slug
-            count = await products_collection.count_documents(query)
+            query = {}
             
-            if count == 0:
-                # Try case-insensitive match
-                print(f"⚠️ No exact match, trying case-insensitive search...")
-                query["slug"] = {"$regex": f"^{slug}$", "$options": "i"}
+            # Search by name, SKU, or slug (server-side search)
+            if search:
+                import re
+                search_pattern = re.escape(search)  # Escape special regex characters
+                query["$or"] = [
+                    {"name": {"$regex": search_pattern, "$options": "i"}},
+                    {"sku": {"$regex": search_pattern, "$options": "i"}},
+                    {"slug": {"$regex": search_pattern, "$options": "i"}}
+                ]
+                logger.debug("🔍 Searching products with: '%s'", search)
+            elif slug:
+                # Try exact match first, then case-insensitive regex match
+                logger.debug("🔍 Searching for product with slug: '%s'", slug)
+                
+                # First try exact match
+                query["slug"] = slug
                 count = await products_collection.count_documents(query)
                 
                 if count == 0:
-                    # Try without special characters normalization
-                    print(f"⚠️ No case-insensitive match, trying partial match...")
-                    query["slug"] = {"$regex": slug, "$options": "i"}
+                    # Try case-insensitive match
+                    logger.debug("⚠️ No exact match, trying case-insensitive search...")
+                    query["slug"] = {"$regex": f"^{slug}$", "$options": "i"}
                     count = await products_collection.count_documents(query)
-                    print(f"📊 Found {count} products with partial match")
-        elif category_slug:
-            query["category.slug"] = category_slug
-        
-        if product_status:
-            query["status"] = product_status
-        
-        # Filter by sizes
-        if sizes:
-            size_list = [s.strip() for s in sizes.split(',')]
-            query["variants.sizes.name"] = {"$in": size_list}
-        
-        # Filter by colors
-        if colors:
-            color_list = [c.strip() for c in colors.split(',')]
-            query["variants.colors.slug"] = {"$in": color_list}
-        
-        # Filter by brands
-        if brands:
-            brand_list = [b.strip() for b in brands.split(',')]
-            query["brand.slug"] = {"$in": brand_list}
-        
-        # Filter by price range
-        if price_min is not None or price_max is not None:
-            price_query = {}
-            if price_min is not None:
-                price_query["$gte"] = price_min
-            if price_max is not None:
-                price_query["$lte"] = price_max
-            query["pricing.sale"] = price_query
-        
-        print(f"🔍 Query products with: {query}")
-        
-        # Tính toán skip
-        skip = (page - 1) * limit
-        
-        # Sort
-        sort_dict = {}
-        if sort == 'newest':
-            sort_dict = {"created_at": -1}
-        elif sort == 'price_asc':
-            sort_dict = {"pricing.sale": 1}
-        elif sort == 'price_desc':
-            sort_dict = {"pricing.sale": -1}
-        elif sort == 'popular' or sort == 'most_wishlisted':
-            sort_dict = {"wishlist_count": -1, "created_at": -1}  # Sort by wishlist_count desc, then by created_at
-        elif sort == 'best_sellers' or sort == 'most_sold':
-            sort_dict = {"sold_count": -1, "created_at": -1}  # Sort by sold_count desc (most sold first)
-        else:
-            sort_dict = {"created_at": -1}
-        
-        # Đếm tổng số (tối ưu với hint index)
-        total = await products_collection.count_documents(query)
-        total_pages = (total + limit - 1) // limit
+                    
+                    if count == 0:
+                        # Try without special characters normalization
+                        logger.debug("⚠️ No case-insensitive match, trying partial match...")
+                        query["slug"] = {"$regex": slug, "$options": "i"}
+                        count = await products_collection.count_documents(query)
+                        logger.debug("📊 Found %s products with partial match", count)
+            elif category_slug:
+                query["category.slug"] = category_slug
+            
+            if product_status:
+                query["status"] = product_status
+            
+            # Filter by sizes
+            if sizes:
+                size_list = [s.strip() for s in sizes.split(',')]
+                query["variants.sizes.name"] = {"$in": size_list}
+            
+            # Filter by colors
+            if colors:
+                color_list = [c.strip() for c in colors.split(',')]
+                query["variants.colors.slug"] = {"$in": color_list}
+            
+            # Filter by brands
+            if brands:
+                brand_list = [b.strip() for b in brands.split(',')]
+                query["brand.slug"] = {"$in": brand_list}
+            
+            # Filter by price range
+            if price_min is not None or price_max is not None:
+                price_query = {}
+                if price_min is not None:
+                    price_query["$gte"] = price_min
+                if price_max is not None:
+                    price_query["$lte"] = price_max
+                query["pricing.sale"] = price_query
+            
+            logger.debug("🔍 Query products with: %s", query)
+            
+            # Sort (luôn có _id làm tiebreaker để cursor xác định duy nhất vị trí)
+            sort_scope, sort_spec = get_product_sort_spec(sort)
+            
+            # Keyset pagination: bỏ qua skip, lọc "sau bản ghi cuối của trang trước"
+            if cursor:
+                try:
+                    page_query = apply_keyset(query, sort_spec, cursor, sort_scope)
+                except ValueError as e:
+                    raise HTTPException(status_code=400, detail=str(e))
+                skip = 0
+            else:
+                page_query = query
+                skip = (page - 1) * limit
+            
+            # Check if this is a single product request (by slug)
+            is_single_product_request = slug is not None and limit == 1
+            logger.debug("📌 is_single_product_request: %s, slug: %s, limit: %s", is_single_product_request, slug, limit)
+            
+            # Facet index: filter + sort + phân trang trong memory khi không có search/slug
+            use_facet_index = facet_index.is_ready and not search and not slug
+            index_filters = get_product_index_filters(category_slug, product_status, sizes, colors, brands)
+            facets = None
+            
+            if use_facet_index and not cursor:
+                index_result = facet_index.query(
+                    index_filters,
+                    price_min=price_min,
+                    price_max=price_max,
+                    sort_spec=sort_spec,
+                    skip=skip,
+                    limit=limit,
+                    include_facets=include_facets
+                )
+                products = index_result["products"]
+                total, total_is_estimate = index_result["total"], False
+                facets = index_result["facets"]
+            else:
+                # Đếm tổng số theo total_mode
+                total, total_is_estimate = await count_products(query, total_mode)
+                
+                # Single product: lấy full data (bao gồm images, color images)
+                projection = None if is_single_product_request else PRODUCT_LIST_PROJECTION
+                
+                # Lấy sản phẩm với projection (lấy dư 1 bản ghi để biết còn trang sau không)
+                db_cursor = products_collection.find(page_query, projection).sort(sort_spec)
+                if skip:
+                    db_cursor = db_cursor.skip(skip)
+                products = await db_cursor.limit(limit + 1).to_list(length=None)
+                
+                if include_facets and use_facet_index:
+                    facets = facet_index.facet_counts(index_filters, price_min, price_max)
+            
+            total_pages = (total + limit - 1) // limit
+            
+            has_more = len(products) > limit
+            products = products[:limit]
+            next_cursor = encode_cursor(products[-1], sort_spec, sort_scope) if has_more and products else None
+            
+            result = [build_product_list_item(product, is_single_product_request) for product in products]
+            
+            response = ProductListResponse(
+                success=True,
+                products=result,
+                total=total,
+                page=page,
+                limit=limit,
+                totalPages=total_pages,
+                next_cursor=next_cursor,
+                total_is_estimate=total_is_estimate,
+                facets=facets
+            )
+            
+            return response
         
-        # Check if this is a single product request (by slug)
-        is_single_product_request = slug is not None and limit == 1
-        print(f"📌 is_single_product_request: {is_single_product_request}, slug: {slug}, limit: {limit}")
+        # Cache 2 phút, single-flight + stale-while-revalidate khi hết hạn
+        return await products_cache.get_or_compute(cache_key, build_response, tags=("products",))
         
-        # Projection - chỉ lấy các field cần thiết để giảm data transfer
-        # List view chỉ cần ảnh chính, không cần gallery và color images
-        if is_single_product_request:
-            # Single product: lấy full data (bao gồm images, color images)
-            projection = None  # None = lấy tất cả fields
-        else:
-            # List view: chỉ lấy các fields cần thiết
-            projection = {
-                "_id": 1,
-                "name": 1,
-                "slug": 1,
-                "sku": 1,
-                "brand": 1,
-                "category": 1,
-                "pricing": 1,
-                "short_description": 1,
-                "image": 1,  # Chỉ ảnh chính
-                # "images": 0,  # Không lấy gallery trong list view
-                "variants.colors.name": 1,  # Lấy tên màu
-                "variants.colors.slug": 1,  # Lấy slug màu
-                "variants.colors.hex": 1,   # Lấy hex màu
-                "variants.colors.available": 1,  # Lấy trạng thái available
-                "variants.colors.images": 1,  # Lấy ảnh màu cho hover preview
-                "variants.sizes": 1,
-                "inventory": 1,
-                "status": 1,
-                "rating": 1,
-                "wishlist_count": 1,
-                "sold_count": 1,
-                "created_at": 1,
-                "updated_at": 1
-            }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Error in get_products: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Lỗi server: {str(e)}"
+        )
+
+# ==================== PRODUCT SEARCH ====================
+
+search_cache = get_cache("search", maxsize=1024, ttl=60, shared=True)
+
+@app.get("/api/search", response_model=ProductSearchResponse)
+async def search_products(
+    q: str = Query(..., min_length=1, max_length=200),
+    category_slug: Optional[str] = Query(None),
+    page: int = Query(1, ge=1),
+    limit: int = Query(24, ge=1, le=100)
+):
+    """
+    Tìm kiếm sản phẩm full-text (search engine trong memory)
+    - Không phân biệt dấu: "ao thun" khớp "Áo Thun"
+    - Từ cuối khớp theo prefix, chịu lỗi chính tả 1-2 ký tự
+    - Xếp hạng BM25 trên name, SKU, category, brand, màu, mô tả ngắn
+    - Chỉ trả về sản phẩm active
+    """
+    try:
+        if not search_engine.is_ready:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Search index đang được build, vui lòng thử lại sau"
+            )
         
-        # Lấy sản phẩm với projection
-        cursor = products_collection.find(query, projection).sort(list(sort_dict.items())).skip(skip).limit(limit)
-        products = await cursor.to_list(length=None)
+        cache_key = f"{fold_text(q).strip()}_{category_slug}_{page}_{limit}"
         
-        result = []
-        for product in products:
-            # Get variants from database (full data)
-            variants = product.get("variants", {})
+        async def build_response():
+            offset = (page - 1) * limit
+            hits, total = search_engine.search(q, offset=offset, limit=limit, category_slug=category_slug)
+            product_ids = [product_id for product_id, _ in hits]
             
-            # Debug log for single product
-            if is_single_product_request:
-                print(f"📸 Single product variants from DB: {variants}")
+            # Hydrate từ facet index, thiếu thì đọc MongoDB 1 lần bằng $in
+            docs = facet_index.get_docs(product_ids)
+            missing = [ObjectId(product_id) for product_id in product_ids if product_id not in docs]
+            if missing:
+                async for product in products_collection.find({"_id": {"$in": missing}}, PRODUCT_LIST_PROJECTION):
+                    docs[str(product["_id"])] = product
             
-            # Only remove color images for list view (not single product)
-            if not is_single_product_request:
-                if isinstance(variants, dict) and "colors" in variants:
-                    colors = variants.get("colors", [])
-                    if isinstance(colors, list):
-                        # Giữ lại ảnh đầu tiên của mỗi màu cho hover preview
-                        variants["colors"] = [
-                            {
-                                "name": c.get("name", ""),
-                                "slug": c.get("slug", ""),
-                                "hex": c.get("hex", "#000000"),
-                                "available": c.get("available", True),
-                                "images": c.get("images", [])[:1]  # Chỉ lấy ảnh đầu tiên cho hover
-                            }
-                            for c in colors
-                        ]
-            
-            # For single product, include full data (gallery images, color images)
-            product_images = product.get("images", []) if is_single_product_request else []
-            
-            result.append(ProductResponse(
-                id=str(product["_id"]),
-                name=product["name"],
-                slug=product["slug"],
-                sku=product["sku"],
-                brand=product.get("brand", {"name": "VYRON", "slug": "vyron"}),
-                category=product.get("category", {"name": "", "slug": ""}),
-                pricing=product.get("pricing", {
-                    "original": 0,
-                    "sale": 0,
-                    "discount_percent": 0,
-                    "currency": "VND"
-                }),
-                short_description=product.get("short_description", ""),
-                image=product.get("image", ""),
-                images=product_images,  # Full images for single product, empty for list view
-                variants=normalize_variants(variants),
-                inventory=product.get("inventory", {
-                    "in_stock": True,
-                    "quantity": 0,
-                    "low_stock_threshold": 10
-                }),
-                status=product.get("status", "active"),
-                rating=product.get("rating", {"average": 0.0, "count": 0}),
-                wishlist_count=product.get("wishlist_count", 0),
-                sold_count=product.get("sold_count", 0),
-                created_at=safe_datetime_to_str(product.get("created_at")),
-                updated_at=safe_datetime_to_str(product.get("updated_at"))
-            ))
+            return ProductSearchResponse(
+                success=True,
+                query=q,
+                products=[build_product_list_item(docs[product_id]) for product_id in product_ids if product_id in docs],
+                scores={product_id: score for product_id, score in hits},
+                total=total,
+                page=page,
+                limit=limit,
+                totalPages=(total + limit - 1) // limit
+            )
         
-        response = ProductListResponse(
-            success=True,
-            products=result,
-            total=total,
-            page=page,
-            limit=limit,
-            totalPages=total_pages
-        )
+        return await search_cache.get_or_compute(cache_key, build_response, tags=("products",))
         
-        # Cache response
-        if admin_products_cache.get("data") is None:
-            admin_products_cache["data"] = {}
-        admin_products_cache["data"][cache_key] = response
-        admin_products_cache["timestamp"] = now
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Error in search_products: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Lỗi server: {str(e)}"
+        )
+
+@app.get("/api/search/autocomplete", response_model=AutocompleteResponse)
+async def search_autocomplete(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(8, ge=1, le=20)
+):
+    """
+    Gợi ý khi đang gõ: từ khóa hoàn thành + sản phẩm khớp nhất (không đọc MongoDB)
+    """
+    try:
+        if not search_engine.is_ready:
+            return AutocompleteResponse(success=True, query=q)
         
-        print(f"✅ Products data cached")
-        return response
+        suggestions = search_engine.autocomplete(q, limit=limit)
+        return AutocompleteResponse(success=True, query=q, **suggestions)
         
     except Exception as e:
-        print(f"❌ Error in get_products: {str(e)}")
+        logger.error(f"❌ Error in search_autocomplete: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Lỗi server: {str(e)}"
         )
 
+@app.get("/api/search/stats")
+async def get_search_stats():
+    """Thống kê search index"""
+    return search_engine.get_stats()
+
 # ==================== IMAGE UPLOAD ROUTES (MUST BE BEFORE /{product_id}) ====================
 
 @app.post("/api/products/upload-images")
@@ -1762,7 +2122,7 @@ async def upload_product_image(
         # Read file content
         file_content = await file.read()
         
-        print(f"☁️ Uploading to Cloudinary: {file.filename}")
+        logger.info(f"☁️ Uploading to Cloudinary: {file.filename}")
         
         # Upload to Cloudinary
         url, metadata = cloudinary_upload(
@@ -1773,7 +2133,7 @@ async def upload_product_image(
             is_main=is_main
         )
         
-        print(f"✅ Uploaded: {url[:60]}...")
+        logger.info(f"✅ Uploaded: {url[:60]}...")
         
         return {
             "success": True,
@@ -1839,74 +2199,245 @@ async def get_product(product_id: str = Path(...)):
 
 # ==================== PRODUCT RECOMMENDATIONS ====================
 
+# Field cho card gợi ý khi phải đọc DB (facet index không có sản phẩm)
+RECOMMENDATION_CARD_PROJECTION = {
+    "_id": 1,
+    "name": 1,
+    "slug": 1,
+    "image": 1,
+    "pricing": 1,
+    "category": 1,
+    "rating": 1,
+    "inventory.in_stock": 1,
+    "status": 1
+}
+
+
+def is_product_in_stock(product: dict) -> bool:
+    return (product.get("inventory") or {}).get("in_stock", True)
+
+
+async def get_product_summaries(product_ids: List[str], in_stock_only: bool = False) -> Dict[str, dict]:
+    """
+    Thông tin hiển thị cho card gợi ý - chỉ sản phẩm active (và còn hàng nếu in_stock_only)
+    Đọc từ facet index (luôn đồng bộ với DB khi ghi sản phẩm), thiếu thì 1 query $in
+    """
+    docs = facet_index.get_docs(product_ids)
+    missing = []
+    for product_id in product_ids:
+        if product_id not in docs and ObjectId.is_valid(product_id):
+            missing.append(ObjectId(product_id))
+    if missing:
+        async for product in products_collection.find({"_id": {"$in": missing}}, RECOMMENDATION_CARD_PROJECTION):
+            docs[str(product["_id"])] = product
+    
+    summaries = {}
+    for product_id, product in docs.items():
+        if product.get("status", "active") != "active":
+            continue
+        if in_stock_only and not is_product_in_stock(product):
+            continue
+        summaries[product_id] = {
+            "id": product_id,
+            "name": product.get("name", ""),
+            "slug": product.get("slug", ""),
+            "image": product.get("image", ""),
+            "pricing": product.get("pricing", {}),
+            "category": product.get("category", {}),
+            "rating": product.get("rating", {"average": 0, "count": 0}),
+            "in_stock": is_product_in_stock(product)
+        }
+    return summaries
+
+
+async def hydrate_recommendations(
+    ranked: List[tuple],
+    limit: int,
+    in_stock_only: bool = False,
+    summaries: Optional[Dict[str, dict]] = None
+) -> List[dict]:
+    """
+    [(product_id, score)] từ recommender -> card hiển thị (giá/tồn kho hiện tại)
+    Sản phẩm không còn active / hết hàng bị bỏ, lấy tiếp candidate sau
+    """
+    if summaries is None:
+        summaries = await get_product_summaries([product_id for product_id, _ in ranked], in_stock_only)
+    return [
+        {**summaries[product_id], "similarity_score": score}
+        for product_id, score in ranked
+        if product_id in summaries
+    ][:limit]
+
 @app.get("/api/products/{product_id}/recommendations")
 async def get_product_recommendations(
     product_id: str = Path(..., description="ID sản phẩm"),
-    limit: int = Query(8, ge=1, le=20, description="Số lượng sản phẩm gợi ý")
+    limit: int = Query(8, ge=1, le=20, description="Số lượng sản phẩm gợi ý"),
+    strategy: str = Query("hybrid", pattern="^(hybrid|content)$", description="hybrid (content + mua cùng + cũng thích) hoặc content"),
+    in_stock_only: bool = Query(True, description="Chỉ gợi ý sản phẩm còn hàng")
 ):
     """
-    Lấy danh sách sản phẩm tương tự (Content-Based Filtering)
-    Sử dụng TF-IDF + Cosine Similarity
+    Lấy danh sách sản phẩm tương tự
+    - content: Content-Based Filtering (TF-IDF + Cosine Similarity)
+    - hybrid: trộn similarity TF-IDF với co-occurrence từ đơn hàng và wishlist
     """
     try:
         # Kiểm tra product tồn tại
-        product = await products_collection.find_one({"_id": ObjectId(product_id)})
+        product = await products_collection.find_one({"_id": ObjectId(product_id)}, {"name": 1})
         if not product:
             raise HTTPException(status_code=404, detail="Không tìm thấy sản phẩm")
         
-        # Nếu recommender chưa được train, train lại
+        # Chưa train xong thì trả về rỗng, scheduler nền sẽ fit (không train trong request)
         if not recommender.is_fitted:
-            print("🔄 Recommender not fitted, retraining...")
-            products = await products_collection.find({}).to_list(length=None)
-            await recommender.fit(products)
+            recommender.request_refit()
+        
+        if strategy == "content" or not cooccurrence.is_ready:
+            # Lấy dư candidate để bù sản phẩm hết hàng / không còn active
+            ranked = recommender.get_recommendations(product_id, n=limit * 2)
+            recommendations = await hydrate_recommendations(ranked, limit, in_stock_only)
+        else:
+            content_scores = recommender.get_similarity_scores(product_id)
+            bought_scores = cooccurrence.scores(product_id, "bought")
+            liked_scores = cooccurrence.scores(product_id, "liked")
+            candidate_ids = list({**content_scores, **bought_scores, **liked_scores})
+            summaries = await get_product_summaries([pid for pid in candidate_ids if pid != product_id], in_stock_only)
+            blended = blend_recommendations(content_scores, bought_scores, liked_scores, n=limit, allowed=summaries)
+            recommendations = [
+                {**summaries[pid], "similarity_score": score, "score_breakdown": breakdown}
+                for pid, score, breakdown in blended
+            ]
+        
+        return {
+            "product_id": product_id,
+            "product_name": product.get("name", ""),
+            "strategy": strategy,
+            "recommendations": recommendations,
+            "total": len(recommendations),
+            "model_stats": recommender.get_stats()
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting recommendations: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Lỗi server: {str(e)}"
+        )
+
+
+async def _cooccurrence_response(product_id: str, limit: int, kind: str) -> dict:
+    """Response chung cho frequently-bought-together / also-liked"""
+    # Lấy dư để bù các sản phẩm không còn active
+    if kind == "bought":
+        ranked = cooccurrence.frequently_bought_together(product_id, n=limit * 2)
+    else:
+        ranked = cooccurrence.also_liked(product_id, n=limit * 2)
+    summaries = await get_product_summaries([pid for pid, _ in ranked], in_stock_only=True)
+    products = [
+        {**summaries[pid], "score": score}
+        for pid, score in ranked
+        if pid in summaries
+    ][:limit]
+    return {
+        "product_id": product_id,
+        "products": products,
+        "total": len(products),
+        "stats": cooccurrence.get_stats()
+    }
+
+
+@app.get("/api/products/{product_id}/frequently-bought-together")
+async def get_frequently_bought_together(
+    product_id: str = Path(..., description="ID sản phẩm"),
+    limit: int = Query(4, ge=1, le=20)
+):
+    """Sản phẩm thường được mua cùng (co-occurrence trong đơn hàng)"""
+    try:
+        return await _cooccurrence_response(product_id, limit, "bought")
+    except Exception as e:
+        logger.error(f"Error getting frequently bought together: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Lỗi server: {str(e)}"
+        )
+
+
+@app.get("/api/products/{product_id}/also-liked")
+async def get_also_liked(
+    product_id: str = Path(..., description="ID sản phẩm"),
+    limit: int = Query(8, ge=1, le=20)
+):
+    """Khách hàng thích sản phẩm này cũng thích (co-occurrence trong wishlist)"""
+    try:
+        return await _cooccurrence_response(product_id, limit, "liked")
+    except Exception as e:
+        logger.error(f"Error getting also liked: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Lỗi server: {str(e)}"
+        )
+
+
+@app.get("/api/recommendations/cooccurrence/stats")
+async def get_cooccurrence_stats():
+    """Thống kê co-occurrence engine"""
+    return cooccurrence.get_stats()
+
+
+@app.post("/api/recommendations/batch")
+async def get_batch_recommendations(request: RecommendationBatchRequest):
+    """
+    Lấy gợi ý cho nhiều sản phẩm trong 1 request (giỏ hàng, wishlist, đơn hàng gần đây)
+    """
+    try:
+        product_ids = list(dict.fromkeys(request.product_ids))
+        ranked = recommender.get_recommendations_batch(
+            product_ids,
+            n=request.limit * 2,
+            exclude_ids=product_ids if request.exclude_input else None
+        )
         
-        # Lấy recommendations
-        recommendations = recommender.get_recommendations(product_id, n=limit)
+        # Hydrate tất cả candidate của mọi sản phẩm trong 1 lần (facet index / 1 query $in)
+        candidate_ids = list(dict.fromkeys(pid for items in ranked.values() for pid, _ in items))
+        summaries = await get_product_summaries(candidate_ids, request.in_stock_only)
+        recommendations = {}
+        for product_id, items in ranked.items():
+            recommendations[product_id] = await hydrate_recommendations(items, request.limit, summaries=summaries)
         
         return {
-            "product_id": product_id,
-            "product_name": product.get("name", ""),
             "recommendations": recommendations,
-            "total": len(recommendations),
+            "total": sum(len(items) for items in recommendations.values()),
             "model_stats": recommender.get_stats()
         }
         
-    except HTTPException:
-        raise
     except Exception as e:
-        logger.error(f"Error getting recommendations: {str(e)}")
+        logger.error(f"Error getting batch recommendations: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Lỗi server: {str(e)}"
         )
 
 
-@app.post("/api/recommendations/rebuild")
+@app.post("/api/recommendations/rebuild", status_code=status.HTTP_202_ACCEPTED)
 async def rebuild_recommendation_model():
     """
     Rebuild recommendation model (Admin only)
     Gọi khi cần refresh model sau nhiều thay đổi sản phẩm
+    
+    Fit chạy nền trong process riêng, trả về job_id ngay - theo dõi tiến độ qua
+    GET /api/recommendations/rebuild/{job_id}. Model cũ vẫn phục vụ cho tới khi xong.
     """
     try:
-        print("🔄 Rebuilding recommendation model...")
-        products = await products_collection.find({}).to_list(length=None)
+        logger.info("🔄 Rebuilding recommendation model...")
+        job = recommender.start_rebuild(reason="manual")
         
-        if not products:
-            return {"success": False, "message": "Không có sản phẩm nào"}
-        
-        success = await recommender.fit(products)
-        
-        if success:
-            return {
-                "success": True,
-                "message": "Model đã được rebuild thành công",
-                "stats": recommender.get_stats()
-            }
-        else:
-            return {
-                "success": False,
-                "message": "Không đủ sản phẩm để train model"
-            }
+        return {
+            "success": True,
+            "message": "Đang rebuild model",
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "progress": job["progress"]
+        }
             
     except Exception as e:
         logger.error(f"Error rebuilding model: {str(e)}")
@@ -1916,12 +2447,135 @@ async def rebuild_recommendation_model():
         )
 
 
+@app.get("/api/recommendations/rebuild/{job_id}")
+async def get_rebuild_job_status(job_id: str = Path(..., description="ID job rebuild")):
+    """Trạng thái job rebuild: queued/loading/preparing/fitting/swapping/completed/failed + progress (%)"""
+    job = recommender.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy job rebuild")
+    return {"success": True, **job}
+
+
 @app.get("/api/recommendations/stats")
 async def get_recommendation_stats():
     """Lấy thống kê về recommendation model"""
     return recommender.get_stats()
 
 
+# ---------- Gợi ý cá nhân hóa theo user ----------
+USER_RECOMMENDATIONS_CACHE_DURATION = 600  # 10 phút (bị invalidate khi giỏ hàng/wishlist/đơn hàng đổi)
+USER_RECOMMENDATION_CANDIDATES = 50  # Số candidate tính sẵn cho mỗi user, request chỉ cắt + hydrate
+USER_PROFILE_RECENT_ORDERS = 20
+# Trọng số tương tác: mua > giỏ hàng > wishlist; đơn cũ hơn giảm dần theo ORDER_RECENCY_DECAY
+USER_PROFILE_WEIGHTS = {"order": 3.0, "cart": 2.0, "wishlist": 1.0}
+ORDER_RECENCY_DECAY = 0.85
+
+user_recommendations_cache = get_cache(
+    "user_recommendations",
+    maxsize=10000,
+    ttl=USER_RECOMMENDATIONS_CACHE_DURATION,
+    stale_ttl=60
+)
+
+
+def invalidate_user_recommendations(user_id: str):
+    """Giỏ hàng / wishlist / đơn hàng của user thay đổi -> tính lại gợi ý ở lần truy cập sau (mọi worker)"""
+    if user_id:
+        invalidate_tags(f"recommendations:user:{user_id}")
+
+
+async def build_user_profile(user_id: str) -> Dict[str, float]:
+    """{product_id: trọng số} từ wishlist, giỏ hàng và các đơn hàng gần nhất"""
+    weights: Dict[str, float] = {}
+    
+    def add(product_id, weight: float):
+        if product_id:
+            product_id = str(product_id)
+            weights[product_id] = weights.get(product_id, 0.0) + weight
+    
+    user = None
+    if ObjectId.is_valid(user_id):
+        user = await users_collection.find_one({"_id": ObjectId(user_id)}, {"wishlist": 1})
+    for item in (user or {}).get("wishlist", []) or []:
+        add(item.get("product_id") if isinstance(item, dict) else item, USER_PROFILE_WEIGHTS["wishlist"])
+    
+    cart = await cart_collection.find_one({"user_id": user_id}, {"items.product_id": 1})
+    for item in (cart or {}).get("items", []):
+        add(item.get("product_id"), USER_PROFILE_WEIGHTS["cart"])
+    
+    orders = orders_collection.find(
+        {"user_id": user_id, "status": {"$ne": "cancelled"}},
+        {"items.product_id": 1}
+    ).sort("created_at", -1).limit(USER_PROFILE_RECENT_ORDERS)
+    rank = 0
+    async for order in orders:
+        weight = USER_PROFILE_WEIGHTS["order"] * (ORDER_RECENCY_DECAY ** rank)
+        for item in order.get("items", []):
+            add(item.get("product_id"), weight)
+        rank += 1
+    
+    return weights
+
+
+@app.get("/api/users/{user_id}/recommendations")
+async def get_user_recommendations(
+    user_id: str = Path(..., description="User ID"),
+    limit: int = Query(12, ge=1, le=USER_RECOMMENDATION_CANDIDATES, description="Số lượng sản phẩm gợi ý"),
+    in_stock_only: bool = Query(True, description="Chỉ gợi ý sản phẩm còn hàng")
+):
+    """
+    Gợi ý cá nhân hóa cho trang chủ
+    
+    - Profile = trọng số TF-IDF của sản phẩm trong wishlist, giỏ hàng, đơn hàng gần đây
+    - Score toàn catalog bằng 1 sparse mat-vec, top candidates cache theo user
+    - Cache bị invalidate khi giỏ hàng / wishlist / đơn hàng của user thay đổi
+    - Hydrate thông tin sản phẩm mỗi request (giá, tồn kho, trạng thái luôn mới)
+    """
+    try:
+        if not recommender.is_fitted:
+            # Model chưa sẵn sàng - không cache kết quả rỗng
+            recommender.request_refit()
+            return {"user_id": user_id, "personalized": False, "profile_size": 0, "recommendations": [], "total": 0}
+        
+        async def build_candidates():
+            weights = await build_user_profile(user_id)
+            return {
+                "profile_size": len(weights),
+                "candidates": recommender.get_recommendations_for_profile(
+                    weights,
+                    n=USER_RECOMMENDATION_CANDIDATES,
+                    exclude_ids=list(weights)
+                )
+            }
+        
+        cached = await user_recommendations_cache.get_or_compute(
+            user_id,
+            build_candidates,
+            tags=(f"recommendations:user:{user_id}",)
+        )
+        candidates = cached["candidates"]
+        
+        # Chỉ hydrate phần cần hiển thị (+ dư một chút bù sản phẩm hết hàng / không còn active)
+        recommendations = await hydrate_recommendations(candidates[:limit * 2], limit, in_stock_only)
+        
+        return {
+            "user_id": user_id,
+            "personalized": cached["profile_size"] > 0,
+            "profile_size": cached["profile_size"],
+            "recommendations": recommendations,
+            "total": len(recommendations)
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting user recommendations: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Lỗi server: {str(e)}"
+        )
+
+
 @app.post("/api/products", response_model=ProductResponse, status_code=status.HTTP_201_CREATED)
 async def create_product(product_data: ProductCreate):
     """Tạo sản phẩm mới"""
@@ -1947,7 +2601,7 @@ async def create_product(product_data: ProductCreate):
         # Convert and validate variants
         variants_dict = product_data.variants.dict()
         
-        logger.debug(f"Processing variants data for {product_data.name}")
+        logger.debug("Processing variants data for %s", product_data.name)
         
         # Ensure each color has images field and remove duplicates
         if 'colors' in variants_dict:
@@ -1962,7 +2616,7 @@ async def create_product(product_data: ProductCreate):
                         seen.add(img)
                         unique_images.append(img)
                 color['images'] = unique_images
-                logger.debug(f"Color {idx}: {color.get('name', 'N/A')} - {len(color['images'])} images")
+                logger.debug("Color %s: %s - %s images", idx, color.get('name', 'N/A'), len(color['images']))
         
         # Remove duplicates from main images array
         if product_data.images:
@@ -1996,15 +2650,16 @@ async def create_product(product_data: ProductCreate):
             "updated_at": now
         }
         
-        logger.debug(f"Saving product {product_data.name} to DB...")
+        logger.debug("Saving product %s to DB...", product_data.name)
         result = await products_collection.insert_one(new_product)
         logger.info(f"Product saved with ID: {result.inserted_id}")
         
-        # Clear product cache
-        admin_products_cache["data"] = None
+        # Clear product cache (danh sách, tổng số, product_count của categories)
+        invalidate_tags("products")
+        await sync_product_index(str(result.inserted_id))
         
-        # Mark recommender for rebuild
-        recommender.mark_dirty()
+        # Cập nhật recommender tăng dần (chỉ các danh sách láng giềng bị ảnh hưởng)
+        await recommender.refresh(str(result.inserted_id))
         
         return ProductResponse(
             id=str(result.inserted_id),
@@ -2118,11 +2773,12 @@ async def update_product(product_id: str = Path(...), product_data: ProductUpdat
         
         updated = await products_collection.find_one({"_id": ObjectId(product_id)})
         
-        # Clear product cache
-        admin_products_cache["data"] = None
+        # Clear product cache (danh sách, tổng số, product_count của categories)
+        invalidate_tags("products")
+        await sync_product_index(product_id)
         
-        # Mark recommender for rebuild
-        recommender.mark_dirty()
+        # Cập nhật recommender tăng dần (chỉ các danh sách láng giềng bị ảnh hưởng)
+        await recommender.refresh(product_id)
         
         return ProductResponse(
             id=str(updated["_id"]),
@@ -2171,22 +2827,23 @@ async def delete_product(product_id: str = Path(...)):
         
         # Xóa tất cả ảnh của sản phẩm trên Cloudinary
         product_slug = product.get('slug', '')
-        print(f"\n🗑️  Đang xóa ảnh của sản phẩm: {product.get('name')}")
+        logger.info(f"🗑️ Đang xóa ảnh của sản phẩm: {product.get('name')}")
         
         if product_slug:
             image_stats = cloudinary_delete_product(product_slug)
-            print(f"✅ Đã xóa {image_stats.get('deleted', 0)} ảnh trên Cloudinary")
+            logger.info(f"✅ Đã xóa {image_stats.get('deleted', 0)} ảnh trên Cloudinary")
         else:
             image_stats = {"deleted": 0}
         
         # Xóa sản phẩm khỏi database
         await products_collection.delete_one({"_id": ObjectId(product_id)})
         
-        # Clear product cache
-        admin_products_cache["data"] = None
+        # Clear product cache (danh sách, tổng số, product_count của categories)
+        invalidate_tags("products")
+        await sync_product_index(product_id)
         
-        # Mark recommender for rebuild
-        recommender.mark_dirty()
+        # Cập nhật recommender tăng dần (chỉ các danh sách láng giềng bị ảnh hưởng)
+        await recommender.refresh(product_id)
         
         product_response = ProductResponse(
             id=str(product["_id"]),
@@ -2340,8 +2997,10 @@ async def cleanup_duplicate_images():
                 )
                 fixed_count += 1
         
-        # Clear cache
-        admin_products_cache["data"] = None
+        # Clear cache + build lại facet/search index (mọi worker)
+        if fixed_count:
+            await rebuild_product_indexes()
+        invalidate_tags("products", "products:reindex")
         
         return {
             "success": True,
@@ -2393,9 +3052,20 @@ async def get_storage_statistics():
 
 # ==================== WISHLIST API ENDPOINTS ====================
 
-# Cache for wishlist to reduce DB load
-wishlist_cache = {}
+# Cache for wishlist to reduce DB load (giới hạn số user, LRU)
 WISHLIST_CACHE_DURATION = 300  # 5 minutes
+wishlist_cache = get_cache("wishlist", maxsize=2048, ttl=WISHLIST_CACHE_DURATION)
+
+def wishlist_entries(wishlist: list) -> List[dict]:
+    """users.wishlist -> [{product_id, added_at}] (hỗ trợ format cũ chỉ là string product_id)"""
+    entries = []
+    for item in wishlist or []:
+        if isinstance(item, dict):
+            if item.get("product_id"):
+                entries.append({"product_id": str(item["product_id"]), "added_at": item.get("added_at")})
+        elif item:
+            entries.append({"product_id": str(item), "added_at": None})
+    return entries
 
 @app.post("/api/wishlist/toggle", response_model=WishlistToggleResponse)
 async def toggle_wishlist(
@@ -2406,61 +3076,78 @@ async def toggle_wishlist(
     Thêm hoặc xóa sản phẩm khỏi wishlist
     - Nếu sản phẩm chưa có trong wishlist → thêm vào và tăng wishlist_count
     - Nếu đã có → xóa khỏi wishlist và giảm wishlist_count
+    
+    Mỗi bước là 1 update atomic ($push có điều kiện / $pull, $inc) - 2 request song song
+    không ghi đè wishlist của nhau, wishlist_count không bị mất lượt
     """
     try:
-        # Kiểm tra user tồn tại
-        user = await users_collection.find_one({"_id": ObjectId(user_id)})
-        if not user:
-            raise HTTPException(status_code=404, detail="Không tìm thấy người dùng")
-        
-        # Kiểm tra product tồn tại
-        product = await products_collection.find_one({"_id": ObjectId(product_id)})
-        if not product:
-            raise HTTPException(status_code=404, detail="Không tìm thấy sản phẩm")
-        
-        # Lấy wishlist hiện tại của user
-        wishlist = user.get("wishlist", [])
-        wishlist_product_ids = [item.get("product_id") if isinstance(item, dict) else item for item in wishlist]
-        
-        is_added = False
-        if product_id in wishlist_product_ids:
-            # Xóa khỏi wishlist
-            wishlist = [item for item in wishlist if (item.get("product_id") if isinstance(item, dict) else item) != product_id]
-            # Giảm wishlist_count
-            new_count = max(0, product.get("wishlist_count", 0) - 1)
-            await products_collection.update_one(
-                {"_id": ObjectId(product_id)},
-                {"$set": {"wishlist_count": new_count}}
+        if not ObjectId.is_valid(user_id) or not ObjectId.is_valid(product_id):
+            raise HTTPException(status_code=400, detail="ID không hợp lệ")
+        user_oid, product_oid = ObjectId(user_id), ObjectId(product_id)
+        
+        # Sản phẩm đã bị xóa thì chỉ cho phép bỏ khỏi wishlist
+        product_exists = await products_collection.find_one({"_id": product_oid}, {"_id": 1}) is not None
+        
+        # Mỗi lần ghi tăng wishlist_version - build co-occurrence dùng để bỏ các toggle nó đã đọc thấy
+        # Trả về wishlist trước khi ghi: co-occurrence cần các product_id còn lại để ghép cặp
+        # (projection "wishlist.product_id" sẽ bỏ mất entry format cũ dạng string)
+        projection = {"wishlist": 1, "wishlist_version": 1}
+        before = None
+        if product_exists:
+            # Thêm: chỉ push khi chưa có (cả format {product_id, added_at} lẫn format cũ string)
+            before = await users_collection.find_one_and_update(
+                {"_id": user_oid, "wishlist.product_id": {"$ne": product_id}, "wishlist": {"$ne": product_id}},
+                {
+                    "$push": {"wishlist": {"product_id": product_id, "added_at": datetime.now().isoformat()}},
+                    "$inc": {"wishlist_version": 1}
+                },
+                projection=projection,
+                return_document=ReturnDocument.BEFORE
             )
-            message = "Đã xóa khỏi danh sách yêu thích"
-        else:
-            # Thêm vào wishlist
-            wishlist.append({
-                "product_id": product_id,
-                "added_at": datetime.now().isoformat()
-            })
-            # Tăng wishlist_count
-            new_count = product.get("wishlist_count", 0) + 1
-            await products_collection.update_one(
-                {"_id": ObjectId(product_id)},
-                {"$set": {"wishlist_count": new_count}}
+        is_added = before is not None
+        if not is_added:
+            before = await users_collection.find_one_and_update(
+                {"_id": user_oid, "wishlist.product_id": product_id},
+                {"$pull": {"wishlist": {"product_id": product_id}}, "$inc": {"wishlist_version": 1}},
+                projection=projection,
+                return_document=ReturnDocument.BEFORE
+            ) or await users_collection.find_one_and_update(
+                {"_id": user_oid, "wishlist": product_id},
+                {"$pull": {"wishlist": product_id}, "$inc": {"wishlist_version": 1}},
+                projection=projection,
+                return_document=ReturnDocument.BEFORE
             )
-            is_added = True
-            message = "Đã thêm vào danh sách yêu thích"
-        
-        # Cập nhật wishlist của user
-        await users_collection.update_one(
-            {"_id": ObjectId(user_id)},
-            {"$set": {"wishlist": wishlist}}
-        )
-        
-        # Invalidate cache
-        if user_id in wishlist_cache:
-            del wishlist_cache[user_id]
+            if before is None:
+                if not product_exists:
+                    raise HTTPException(status_code=404, detail="Không tìm thấy sản phẩm")
+                raise HTTPException(status_code=404, detail="Không tìm thấy người dùng")
+        
+        # Cập nhật wishlist_count bằng $inc (không đọc - sửa - ghi), chỉ trả về field đếm
+        delta = 1 if is_added else -1
+        product = await products_collection.find_one_and_update(
+            {"_id": product_oid} if is_added else {"_id": product_oid, "wishlist_count": {"$gt": 0}},
+            {"$inc": {"wishlist_count": delta}},
+            projection={"wishlist_count": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        # None: sản phẩm đã bị xóa hoặc wishlist_count đã về 0 - không có gì để cập nhật
+        new_count = product.get("wishlist_count", 0) if product else 0
+        if product is not None:
+            sync_product_counter(product_id, "wishlist_count", new_count, delta)
+        
+        # Cập nhật co-occurrence "cũng thích" (worker khác nhận delta qua pub/sub)
+        # + invalidate cache wishlist (mọi worker)
+        other_product_ids = [pid for pid in (entry["product_id"] for entry in wishlist_entries(before.get("wishlist"))) if pid != product_id]
+        publish_event(COOCCURRENCE_EVENT_TOPIC, cooccurrence.add_wishlist_item(
+            product_id, other_product_ids, 1 if is_added else -1,
+            user_id=user_id, version=before.get("wishlist_version", 0) + 1
+        ))
+        invalidate_tags(f"wishlist:user:{user_id}")
+        invalidate_user_recommendations(user_id)
         
         return WishlistToggleResponse(
             success=True,
-            message=message,
+            message="Đã thêm vào danh sách yêu thích" if is_added else "Đã xóa khỏi danh sách yêu thích",
             is_added=is_added,
             wishlist_count=new_count
         )
@@ -2472,6 +3159,37 @@ async def toggle_wishlist(
             detail=f"Lỗi server: {str(e)}"
         )
 
+async def get_wishlist_product_ids(user_id: str) -> frozenset:
+    """Tập product_id trong wishlist của user (cache, bị invalidate khi toggle) - kiểm tra O(1)"""
+    async def load():
+        user = await users_collection.find_one({"_id": ObjectId(user_id)}, {"wishlist": 1})
+        return frozenset(entry["product_id"] for entry in wishlist_entries((user or {}).get("wishlist")))
+    return await wishlist_cache.get_or_compute(f"ids:{user_id}", load, tags=(f"wishlist:user:{user_id}",))
+
+@app.get("/api/wishlist/{user_id}/contains")
+async def check_wishlist_products(
+    user_id: str = Path(...),
+    product_ids: str = Query(..., description="Danh sách product_id, phân cách bởi dấu phẩy")
+):
+    """Kiểm tra hàng loạt sản phẩm nào đã được user yêu thích (trang danh sách sản phẩm)"""
+    try:
+        if not ObjectId.is_valid(user_id):
+            raise HTTPException(status_code=400, detail="Invalid User ID")
+        ids = [pid.strip() for pid in product_ids.split(",") if pid.strip()][:200]
+        wishlisted = await get_wishlist_product_ids(user_id)
+        return {
+            "success": True,
+            "user_id": user_id,
+            "wishlisted": {pid: pid in wishlisted for pid in ids}
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Lỗi server: {str(e)}"
+        )
+
 @app.get("/api/wishlist/{user_id}", response_model=WishlistResponse)
 async def get_wishlist(user_id: str = Path(...)):
     """Lấy danh sách wishlist của user"""
@@ -2481,11 +3199,9 @@ async def get_wishlist(user_id: str = Path(...)):
             raise HTTPException(status_code=400, detail="Invalid User ID")
 
         # Check cache
-        if user_id in wishlist_cache:
-            entry = wishlist_cache[user_id]
-            age = (datetime.now() - entry["timestamp"]).total_seconds()
-            if age < WISHLIST_CACHE_DURATION:
-                return entry["data"]
+        cached = wishlist_cache.get(user_id)
+        if cached:
+            return cached
 
         user = await users_collection.find_one({"_id": ObjectId(user_id)})
         if not user:
@@ -2516,7 +3232,7 @@ async def get_wishlist(user_id: str = Path(...)):
         )
         
         # Set cache
-        wishlist_cache[user_id] = {"data": response, "timestamp": datetime.now()}
+        wishlist_cache.set(user_id, response, tags=(f"wishlist:user:{user_id}",))
         
         return response
     except HTTPException:
@@ -2527,70 +3243,66 @@ async def get_wishlist(user_id: str = Path(...)):
             detail=f"Lỗi server: {str(e)}"
         )
 
-@app.get("/api/wishlist/{user_id}/products", response_model=ProductListResponse)
-async def get_wishlist_products(user_id: str = Path(...)):
-    """Lấy danh sách sản phẩm trong wishlist của user"""
+@app.get("/api/wishlist/{user_id}/products", response_model=WishlistProductListResponse)
+async def get_wishlist_products(
+    user_id: str = Path(...),
+    page: int = Query(1, ge=1),
+    limit: int = Query(48, ge=1, le=100)
+):
+    """
+    Lấy danh sách sản phẩm trong wishlist của user (theo thứ tự wishlist, có phân trang)
+    - Sản phẩm lấy từ facet index (projection list view), thiếu thì 1 query $in
+    - is_available / unavailable_reason: sản phẩm ngừng bán hoặc hết hàng
+    - missing: sản phẩm đã bị xóa khỏi hệ thống
+    """
     try:
         if not ObjectId.is_valid(user_id):
             raise HTTPException(status_code=400, detail="Invalid User ID")
 
-        user = await users_collection.find_one({"_id": ObjectId(user_id)})
+        user = await users_collection.find_one({"_id": ObjectId(user_id)}, {"wishlist": 1})
         if not user:
             raise HTTPException(status_code=404, detail="Không tìm thấy người dùng")
         
-        wishlist = user.get("wishlist", [])
-        product_ids = []
-        for item in wishlist:
-            if isinstance(item, dict):
-                product_ids.append(item.get("product_id"))
-            else:
-                product_ids.append(item)
+        entries = wishlist_entries(user.get("wishlist", []))
+        total = len(entries)
+        page_entries = entries[(page - 1) * limit:page * limit]
+        product_ids = [entry["product_id"] for entry in page_entries]
+        
+        docs = facet_index.get_docs(product_ids)
+        missing_ids = [ObjectId(pid) for pid in product_ids if pid not in docs and ObjectId.is_valid(pid)]
+        if missing_ids:
+            async for product in products_collection.find({"_id": {"$in": missing_ids}}, PRODUCT_LIST_PROJECTION):
+                docs[str(product["_id"])] = product
         
-        # Lấy products
         products = []
-        for product_id in product_ids:
-            try:
-                product = await products_collection.find_one({"_id": ObjectId(product_id)})
-                if product:
-                    products.append(ProductResponse(
-                        id=str(product["_id"]),
-                        name=product["name"],
-                        slug=product["slug"],
-                        sku=product["sku"],
-                        brand=product.get("brand", {"name": "VYRON", "slug": "vyron"}),
-                        category=product.get("category", {"name": "", "slug": ""}),
-                        pricing=product.get("pricing", {
-                            "original": 0,
-                            "sale": 0,
-                            "discount_percent": 0,
-                            "currency": "VND"
-                        }),
-                        short_description=product.get("short_description", ""),
-                        image=product.get("image", ""),
-                        images=product.get("images", []),
-                        variants=normalize_variants(product.get("variants", {})),
-                        inventory=product.get("inventory", {
-                            "in_stock": True,
-                            "quantity": 0,
-                            "low_stock_threshold": 10
-                        }),
-                        status=product.get("status", "active"),
-                        rating=product.get("rating", {"average": 0.0, "count": 0}),
-                        wishlist_count=product.get("wishlist_count", 0),
-                        sold_count=product.get("sold_count", 0),
-                        created_at=safe_datetime_to_str(product.get("created_at")),
-                        updated_at=safe_datetime_to_str(product.get("updated_at"))
-                    ))
-            except:
+        missing = []
+        for entry in page_entries:
+            product = docs.get(entry["product_id"])
+            if product is None:
+                missing.append(WishlistItem(**{key: value for key, value in entry.items() if value}))
                 continue
+            if product.get("status", "active") != "active":
+                unavailable_reason = "inactive"
+            elif not is_product_in_stock(product):
+                unavailable_reason = "out_of_stock"
+            else:
+                unavailable_reason = None
+            item = build_product_list_item(product)
+            products.append(WishlistProductResponse(
+                **item.model_dump(),
+                added_at=entry["added_at"],
+                is_available=unavailable_reason is None,
+                unavailable_reason=unavailable_reason
+            ))
         
-        return ProductListResponse(
+        return WishlistProductListResponse(
             success=True,
             products=products,
-            total=len(products),
-            page=1,
-            limit=len(products),
-            totalPages=1
+            missing=missing,
+            total=total,
+            page=page,
+            limit=limit,
+            totalPages=(total + limit - 1) // limit
         )
     except HTTPException:
         raise
@@ -2637,22 +3349,17 @@ async def create_review(review_data: ReviewCreate):
             "updated_at": datetime.now().isoformat()
         }
         
-        result = await reviews_collection.insert_one(new_review)
-        
-        # Cập nhật rating của sản phẩm
-        all_reviews = await reviews_collection.find({"product_id": review_data.product_id}).to_list(length=None)
-        total_rating = sum(r.get("rating", 0) for r in all_reviews)
-        average_rating = total_rating / len(all_reviews) if all_reviews else 0
+        try:
+            result = await reviews_collection.insert_one(new_review)
+        except DuplicateKeyError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Bạn đã đánh giá sản phẩm này rồi"
+            )
         
-        await products_collection.update_one(
-            {"_id": ObjectId(review_data.product_id)},
-            {"$set": {
-                "rating": {
-                    "average": round(average_rating, 1),
-                    "count": len(all_reviews)
-                }
-            }}
-        )
+        # Cập nhật rating của sản phẩm bằng $inc (không đọc lại toàn bộ reviews)
+        await apply_rating_change(products_collection, reviews_collection, review_data.product_id, added=review_data.rating)
+        await sync_product_index(review_data.product_id)
         
         return ReviewResponse(
             id=str(result.inserted_id),
@@ -2673,38 +3380,183 @@ async def create_review(review_data: ReviewCreate):
             detail=f"Lỗi server: {str(e)}"
         )
 
+# Mỗi sort phải trùng (hoặc ngược hẳn) với 1 index (product_id, ...) ở startup, kể cả _id tiebreaker
+REVIEW_SORTS = {
+    "newest": [("created_at", -1)],
+    "oldest": [("created_at", 1)],
+    "highest": [("rating", -1), ("created_at", -1)],
+    "lowest": [("rating", 1), ("created_at", 1)],
+}
+REVIEW_AUTHOR_PROJECTION = {"name": 1, "username": 1, "avatar": 1}
+
+async def get_review_authors(user_ids: List[str]) -> Dict[str, dict]:
+    """Tên + avatar của người viết review - 1 query $in cho cả trang"""
+    object_ids = []
+    for user_id in set(user_ids):
+        try:
+            object_ids.append(ObjectId(user_id))
+        except (InvalidId, TypeError):
+            continue
+    if not object_ids:
+        return {}
+    users = await users_collection.find({"_id": {"$in": object_ids}}, REVIEW_AUTHOR_PROJECTION).to_list(length=None)
+    return {str(user["_id"]): user for user in users}
+
+@app.put("/api/reviews/{review_id}", response_model=ReviewResponse)
+async def update_review(review_id: str = Path(...), review_data: ReviewUpdate = None):
+    """Sửa số sao / bình luận của review (chỉ người viết)"""
+    try:
+        if not review_data or (review_data.rating is None and review_data.comment is None):
+            raise HTTPException(status_code=400, detail="Không có dữ liệu để cập nhật")
+        
+        update_data = {"updated_at": datetime.now().isoformat()}
+        if review_data.rating is not None:
+            update_data["rating"] = review_data.rating
+        if review_data.comment is not None:
+            update_data["comment"] = review_data.comment
+        
+        # Trả về bản trước khi sửa để biết số sao cũ (atomic, không cần đọc riêng)
+        old_review = await reviews_collection.find_one_and_update(
+            {"_id": ObjectId(review_id), "user_id": review_data.user_id},
+            {"$set": update_data},
+            return_document=ReturnDocument.BEFORE
+        )
+        if not old_review:
+            raise HTTPException(status_code=404, detail="Không tìm thấy đánh giá")
+        
+        product_id = old_review.get("product_id")
+        old_rating = old_review.get("rating")
+        if review_data.rating is not None and review_data.rating != old_rating:
+            await apply_rating_change(products_collection, reviews_collection, product_id,
+                                      added=review_data.rating, removed=old_rating)
+            await sync_product_index(product_id)
+        
+        user = await users_collection.find_one({"_id": ObjectId(review_data.user_id)}, REVIEW_AUTHOR_PROJECTION)
+        review = {**old_review, **update_data}
+        return ReviewResponse(
+            id=review_id,
+            product_id=product_id,
+            user_id=review_data.user_id,
+            rating=review.get("rating", 0),
+            comment=review.get("comment", ""),
+            user_name=user.get("name", user.get("username", "Người dùng")) if user else "Người dùng",
+            user_avatar=user.get("avatar", "") if user else "",
+            created_at=review.get("created_at", update_data["updated_at"]),
+            updated_at=update_data["updated_at"]
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Lỗi server: {str(e)}"
+        )
+
+async def remove_review(query: dict):
+    """Xóa 1 review khớp query (atomic) rồi trừ số sao khỏi products.rating"""
+    review = await reviews_collection.find_one_and_delete(query)
+    if not review:
+        raise HTTPException(status_code=404, detail="Không tìm thấy đánh giá")
+    
+    product_id = review.get("product_id")
+    await apply_rating_change(products_collection, reviews_collection, product_id, removed=review.get("rating"))
+    await sync_product_index(product_id)
+
+@app.delete("/api/reviews/{review_id}")
+async def delete_review(review_id: str = Path(...), user_id: str = Query(..., description="Người viết review")):
+    """Xóa review (chỉ người viết) - admin xóa qua DELETE /api/admin/reviews/{review_id}"""
+    try:
+        await remove_review({"_id": ObjectId(review_id), "user_id": user_id})
+        return {"success": True, "message": "Đã xóa đánh giá"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Lỗi server: {str(e)}"
+        )
+
+@app.delete("/api/admin/reviews/{review_id}")
+async def admin_delete_review(review_id: str = Path(...)):
+    """Admin xóa review bất kỳ (kiểm duyệt)"""
+    try:
+        await remove_review({"_id": ObjectId(review_id)})
+        return {"success": True, "message": "Đã xóa đánh giá"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Lỗi server: {str(e)}"
+        )
+
+@app.post("/api/admin/reviews/reconcile-ratings")
+async def reconcile_product_ratings():
+    """Đối soát ngay products.rating với reviews (bình thường chạy nền định kỳ)"""
+    try:
+        result = await rating_reconciler.reconcile()
+        return {"success": True, **result}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Lỗi server: {str(e)}"
+        )
+
 @app.get("/api/reviews/product/{product_id}", response_model=ReviewListResponse)
-async def get_product_reviews(product_id: str = Path(...)):
-    """Lấy danh sách đánh giá của sản phẩm"""
+async def get_product_reviews(
+    product_id: str = Path(...),
+    rating: Optional[int] = Query(None, ge=1, le=5, description="Chỉ lấy review có số sao này"),
+    user_id: Optional[str] = Query(None, description="Chỉ lấy review của user này (kiểm tra đã đánh giá chưa)"),
+    sort: str = Query("newest", pattern="^(newest|oldest|highest|lowest)$"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor của trang trước")
+):
+    """
+    Lấy danh sách đánh giá của sản phẩm (phân trang bằng cursor)
+    - rating: lọc theo số sao
+    - user_id: review của 1 user (total = số review khớp trong trang)
+    - sort: newest, oldest, highest, lowest
+    - average_rating / rating_distribution đọc từ products.rating (không quét toàn bộ reviews)
+    """
     try:
         # Kiểm tra product tồn tại
-        product = await products_collection.find_one({"_id": ObjectId(product_id)})
+        product = await products_collection.find_one({"_id": ObjectId(product_id)}, {"rating": 1})
         if not product:
             raise HTTPException(status_code=404, detail="Không tìm thấy sản phẩm")
         
-        # Lấy tất cả reviews
-        cursor = reviews_collection.find({"product_id": product_id}).sort("created_at", -1)
-        reviews = await cursor.to_list(length=None)
+        # Sản phẩm cũ chưa có phân bố sao -> tính 1 lần bằng $group rồi lưu lại
+        summary = product.get("rating")
+        if not has_summary(summary):
+            summary = await compute_rating(reviews_collection, product_id)
+            await products_collection.update_one({"_id": product["_id"]}, {"$set": {"rating": summary}})
+        distribution = distribution_of(summary)
+        
+        query = {"product_id": product_id}
+        if rating is not None:
+            query["rating"] = rating
+        if user_id:
+            query["user_id"] = user_id
+        sort_spec = with_tiebreaker(REVIEW_SORTS[sort])
+        try:
+            page_query = apply_keyset(query, sort_spec, cursor, sort)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        reviews = await reviews_collection.find(page_query).sort(sort_spec).limit(limit + 1).to_list(length=limit + 1)
+        has_more = len(reviews) > limit
+        reviews = reviews[:limit]
         
-        # Tính toán rating distribution
-        rating_distribution = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
-        total_rating = 0
+        # Thông tin người viết: 1 query $in thay vì find_one cho từng review
+        authors = await get_review_authors([review.get("user_id") for review in reviews])
         
         result_reviews = []
         for review in reviews:
-            rating = review.get("rating", 0)
-            if 1 <= rating <= 5:
-                rating_distribution[rating] = rating_distribution.get(rating, 0) + 1
-                total_rating += rating
-            
-            # Lấy thông tin user
-            user = await users_collection.find_one({"_id": ObjectId(review.get("user_id"))})
-            
+            user = authors.get(review.get("user_id"))
             result_reviews.append(ReviewResponse(
                 id=str(review["_id"]),
                 product_id=review.get("product_id", ""),
                 user_id=review.get("user_id", ""),
-                rating=rating,
+                rating=review.get("rating", 0),
                 comment=review.get("comment", ""),
                 user_name=user.get("name", user.get("username", "Người dùng")) if user else "Người dùng",
                 user_avatar=user.get("avatar", "") if user else "",
@@ -2712,14 +3564,14 @@ async def get_product_reviews(product_id: str = Path(...)):
                 updated_at=review.get("updated_at")
             ))
         
-        average_rating = total_rating / len(reviews) if reviews else 0
-        
         return ReviewListResponse(
             success=True,
             reviews=result_reviews,
-            total=len(result_reviews),
-            average_rating=round(average_rating, 1),
-            rating_distribution=rating_distribution
+            total=len(result_reviews) if user_id else (distribution[rating] if rating is not None else summary.get("count", 0)),
+            average_rating=summary.get("average", 0.0),
+            rating_distribution=distribution,
+            limit=limit,
+            next_cursor=encode_cursor(reviews[-1], sort_spec, sort) if has_more and reviews else None
         )
     except HTTPException:
         raise
@@ -2789,9 +3641,14 @@ async def create_order(order_data: OrderCreate):
         }
         
         result = await orders_collection.insert_one(new_order)
+        invalidate_tags("orders")
         
         new_order["_id"] = result.inserted_id
         
+        # Cập nhật co-occurrence "mua cùng" (worker khác nhận delta qua pub/sub)
+        publish_event(COOCCURRENCE_EVENT_TOPIC, cooccurrence.add_order(new_order["items"], order_id=result.inserted_id))
+        invalidate_user_recommendations(order_data.user_id)
+        
         # Cập nhật sold_count cho các sản phẩm trong đơn hàng
         for item in order_data.items:
             product_id = item.product_id
@@ -2801,8 +3658,9 @@ async def create_order(order_data: OrderCreate):
                     {"_id": ObjectId(product_id)},
                     {"$inc": {"sold_count": quantity}}
                 )
+                await sync_product_index(product_id)
             except Exception as e:
-                print(f"Error updating sold_count for product {product_id}: {e}")
+                logger.error(f"Error updating sold_count for product {product_id}: {e}")
         
         # Convert shipping_address from dict to ShippingAddress object for response
         from app.schemas import ShippingAddress
@@ -2826,7 +3684,7 @@ async def create_order(order_data: OrderCreate):
                     "created_at": new_order["created_at"]
                 })
             except Exception as ws_error:
-                print(f"WebSocket notification error: {ws_error}")
+                logger.warning(f"WebSocket notification error: {ws_error}")
         
         return OrderResponse(
             id=str(result.inserted_id),
@@ -2895,58 +3753,46 @@ async def vietqr_initiate(payload: schemas.VietQRInitiateRequest):
 @app.post("/api/payments/casso/webhook")
 async def casso_webhook(request: Request):
     """Nhận webhook từ Casso khi có giao dịch mới."""
-    print("\n" + "="*60)
-    print("🔔 WEBHOOK RECEIVED FROM CASSO")
-    print("="*60)
-    
     # Đọc raw body
     body = await request.body()
     body_str = body.decode()
     
-    print(f"📦 Raw body: {body_str[:200]}...")
-    print(f"🔑 Headers: {dict(request.headers)}")
+    # Không log header / payload (chứa chữ ký, thông tin giao dịch) - chỉ log kích thước
+    logger.info("Casso webhook received", extra={"body_bytes": len(body)})
     
     # Parse JSON
     try:
         import json
         webhook_data = json.loads(body_str)
-        print(f"✅ JSON parsed successfully")
-        print(f"📊 Webhook data: {webhook_data}")
     except Exception as e:
-        print(f"❌ JSON parse error: {e}")
+        logger.warning(f"Casso webhook JSON parse error: {e}")
         raise HTTPException(status_code=400, detail="Invalid JSON")
     
     # Xác thực webhook signature
     signature = request.headers.get("X-Signature", "")
-    print(f"🔐 Signature check: {'Present' if signature else 'Missing'}")
     
     if not payment_integration.verify_casso_webhook(body_str, signature):
-        print(f"❌ Invalid signature!")
+        logger.warning(f"Casso webhook invalid signature (signature {'present' if signature else 'missing'})")
         raise HTTPException(status_code=401, detail="Invalid signature")
-    
-    print(f"✅ Signature valid")
 
     # Casso gửi data trong format: {"error": 0, "data": [transaction1, transaction2, ...]}
     transactions = webhook_data.get("data", [])
     if not transactions:
-        print(f"⚠️  No transactions in webhook")
+        logger.warning("Casso webhook has no transactions")
         return {"success": False, "message": "Không có giao dịch nào trong webhook"}
     
-    print(f"💰 Processing {len(transactions)} transaction(s)")
+    logger.info(f"Casso webhook: processing {len(transactions)} transaction(s)")
     
     # Xử lý từng transaction (thường chỉ có 1)
     results = []
     for idx, transaction in enumerate(transactions):
-        print(f"\n--- Transaction #{idx + 1} ---")
         description = transaction.get("description", "")
         amount = transaction.get("amount", 0)
         tid = transaction.get("tid", "")
         when = transaction.get("when", "")
         casso_id = transaction.get("id", 0)
         
-        print(f"💵 Amount: {amount:,}đ")
-        print(f"📝 Description: {description}")
-        print(f"🔖 Transaction ID: {tid}")
+        logger.debug("Casso transaction #%s: tid=%s, amount=%sđ", idx + 1, tid, amount)
         
         # Tìm order_id trong description
         order_id = None
@@ -2954,11 +3800,10 @@ async def casso_webhook(request: Request):
         match = re.search(r'[a-f0-9]{24}', description.lower())
         if match:
             order_id = match.group(0)
-            print(f"🎯 Found Order ID: {order_id}")
         
         if not order_id:
             msg = f"Không tìm thấy order_id trong: {description}"
-            print(f"❌ {msg}")
+            logger.warning(f"Casso transaction {tid}: order_id not found in description")
             results.append({"success": False, "message": msg})
             continue
 
@@ -2966,17 +3811,16 @@ async def casso_webhook(request: Request):
         order = await orders_collection.find_one({"_id": ObjectId(order_id)})
         if not order:
             msg = f"Order {order_id} không tồn tại"
-            print(f"❌ {msg}")
+            logger.warning(f"Casso transaction {tid}: {msg}")
             results.append({"success": False, "message": msg})
             continue
 
         # Kiểm tra số tiền khớp
         expected_amount = order.get("total_amount", 0)
-        print(f"💵 Expected: {expected_amount:,}đ | Received: {amount:,}đ")
         
         if abs(amount - expected_amount) > 1:  # Cho phép sai lệch 1đ
             msg = f"Số tiền không khớp: nhận {amount}, mong đợi {expected_amount}"
-            print(f"❌ {msg}")
+            logger.warning(f"Casso transaction {tid} for order {order_id}: {msg}")
             results.append({
                 "success": False, 
                 "message": msg
@@ -2984,7 +3828,6 @@ async def casso_webhook(request: Request):
             continue
 
         # Cập nhật payment status
-        print(f"🔄 Updating order {order_id}...")
         await orders_collection.update_one(
             {"_id": ObjectId(order_id)},
             {"$set": {
@@ -3000,7 +3843,7 @@ async def casso_webhook(request: Request):
         )
         
         # Clear admin cache so admin sees the update immediately
-        admin_orders_cache["data"] = None
+        invalidate_tags("orders")
         
         # 🔔 WebSocket: Notify admin clients about new paid order (VietQR)
         try:
@@ -3015,22 +3858,17 @@ async def casso_webhook(request: Request):
                 "payment_method": "VietQR",
                 "created_at": order.get("created_at", datetime.now().isoformat())
             })
-            print(f"📢 WebSocket: Notified admin about paid order {order_id}")
         except Exception as ws_error:
-            print(f"WebSocket notification error: {ws_error}")
+            logger.warning(f"WebSocket notification error: {ws_error}")
         
         msg = f"Đã cập nhật thanh toán cho order {order_id}"
-        print(f"✅ {msg}")
+        logger.info(f"Casso transaction {tid}: {msg}")
         results.append({
             "success": True, 
             "message": msg,
             "order_id": order_id
         })
 
-    print("\n" + "="*60)
-    print(f"✅ WEBHOOK PROCESSED: {len(results)} result(s)")
-    print("="*60 + "\n")
-    
     return {"success": True, "processed": len(results), "results": results}
 
 
@@ -3168,20 +4006,17 @@ async def get_order_by_id(order_id: str = Path(...)):
 # ==================== ADMIN ORDERS API ====================
 
 # Cache cho order stats
-admin_order_stats_cache = {"data": None, "timestamp": None}
 ORDER_STATS_CACHE_DURATION = 60  # 1 phút
+admin_order_stats_cache = get_cache("admin_order_stats", maxsize=4, ttl=ORDER_STATS_CACHE_DURATION)
 
 @app.get("/api/admin/orders/stats")
 async def get_order_stats():
     """Lấy thống kê số lượng đơn hàng theo trạng thái - NHANH"""
     try:
-        now = datetime.now()
-        
         # Check cache
-        if admin_order_stats_cache.get("data"):
-            cache_age = (now - admin_order_stats_cache["timestamp"]).total_seconds()
-            if cache_age < ORDER_STATS_CACHE_DURATION:
-                return admin_order_stats_cache["data"]
+        cached = admin_order_stats_cache.get("stats")
+        if cached:
+            return cached
         
         # Base query: Exclude awaiting_payment orders
         base_query = {
@@ -3211,8 +4046,7 @@ async def get_order_stats():
         }
         
         # Cache result
-        admin_order_stats_cache["data"] = result
-        admin_order_stats_cache["timestamp"] = now
+        admin_order_stats_cache.set("stats", result, tags=("orders",))
         
         return result
         
@@ -3237,11 +4071,10 @@ async def get_pending_orders_count():
         )
 
 # Cache cho admin queries
-admin_orders_cache = {"data": None, "timestamp": None}
-admin_customers_cache = {"data": None, "timestamp": None}
-admin_returns_cache = {"data": None, "timestamp": None}
-admin_products_cache = {"data": None, "timestamp": None}
 ADMIN_CACHE_DURATION = 120  # 2 phút
+admin_orders_cache = get_cache("admin_orders", maxsize=256, ttl=ADMIN_CACHE_DURATION)
+admin_customers_cache = get_cache("admin_customers", maxsize=128, ttl=ADMIN_CACHE_DURATION)
+admin_returns_cache = get_cache("admin_returns", maxsize=32, ttl=ADMIN_CACHE_DURATION)
 
 @app.get("/api/admin/orders", response_model=OrderListResponse)
 async def get_all_orders(
@@ -3261,18 +4094,14 @@ async def get_all_orders(
     try:
         # Cache key
         cache_key = f"{status}_{page}_{limit}_{search}"
-        now = datetime.now()
         
         # Check cache
-        if admin_orders_cache.get("data"):
-            cached = admin_orders_cache["data"].get(cache_key)
-            if cached:
-                cache_age = (now - admin_orders_cache["timestamp"]).total_seconds()
-                if cache_age < ADMIN_CACHE_DURATION:
-                    print(f"✅ Returning cached admin orders (age: {cache_age:.1f}s)")
-                    return cached
+        cached = admin_orders_cache.get(cache_key)
+        if cached:
+            logger.debug("✅ Returning cached admin orders")
+            return cached
         
-        print(f"🔄 Generating fresh admin orders data...")
+        logger.debug("🔄 Generating fresh admin orders data...")
         
         # Base query: Exclude orders with payment_status = "awaiting_payment"
         # This means VietQR orders that haven't been paid yet won't show up
@@ -3372,16 +4201,13 @@ async def get_all_orders(
         )
         
         # Cache response
-        if admin_orders_cache.get("data") is None:
-            admin_orders_cache["data"] = {}
-        admin_orders_cache["data"][cache_key] = response
-        admin_orders_cache["timestamp"] = now
+        admin_orders_cache.set(cache_key, response, tags=("orders",))
         
-        print(f"✅ Admin orders data cached")
+        logger.debug("✅ Admin orders data cached")
         return response
         
     except Exception as e:
-        print(f"❌ Error in get_all_orders: {str(e)}")
+        logger.error(f"❌ Error in get_all_orders: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Lỗi server: {str(e)}"
@@ -3425,7 +4251,15 @@ async def update_order_status(
         )
         
         # Clear admin cache to reflect changes immediately
-        admin_orders_cache["data"] = None
+        invalidate_tags("orders")
+        
+        # Hủy đơn (hoặc mở lại đơn đã hủy) thì cập nhật co-occurrence "mua cùng"
+        was_cancelled = order.get("status") == "cancelled"
+        is_cancelled = status_update.status == "cancelled"
+        if was_cancelled != is_cancelled:
+            weight = -1 if is_cancelled else 1
+            publish_event(COOCCURRENCE_EVENT_TOPIC, cooccurrence.add_order(order.get("items", []), weight, order_id=order_id))
+            invalidate_user_recommendations(order.get("user_id"))
         
         # Get updated order
         updated_order = await orders_collection.find_one({"_id": ObjectId(order_id)})
@@ -3471,7 +4305,7 @@ async def update_order_status(
         try:
             await notify_order_update(order_id, status_update.status)
         except Exception as ws_error:
-            print(f"WebSocket notification error: {ws_error}")
+            logger.warning(f"WebSocket notification error: {ws_error}")
         
         return OrderUpdateResponse(
             success=True,
@@ -3487,14 +4321,52 @@ async def update_order_status(
         )
 
 # ==================== CART API ====================
+CART_ADD_RETRIES = 3
+CART_PRODUCT_PROJECTION = {"name": 1, "image": 1, "pricing": 1, "variants.colors": 1}
+
+def cart_item_match(product_id: str, color: Optional[str], size: Optional[str]) -> dict:
+    """Điều kiện khớp 1 item trong cart.items (product + biến thể màu/size)"""
+    return {"product_id": product_id, "variant_color": color, "variant_size": size}
+
+async def pull_cart_item(user_id: str, match: dict) -> bool:
+    """
+    Xóa item khớp match khỏi giỏ hàng bằng 1 lệnh $pull
+    Raise 404 nếu không có giỏ hàng, trả về False nếu giỏ hàng không có item đó
+    """
+    result = await cart_collection.update_one(
+        {"user_id": user_id, "items": {"$elemMatch": match}},
+        {"$pull": {"items": match}, "$set": {"updated_at": datetime.now().isoformat()}}
+    )
+    if result.matched_count:
+        return True
+    if not await cart_collection.find_one({"user_id": user_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Không tìm thấy giỏ hàng")
+    return False
+
+async def get_cart_item_at(user_id: str, item_index: int) -> dict:
+    """Đọc đúng 1 item theo index ($slice) - 404 nếu không có cart, 400 nếu index không hợp lệ"""
+    if item_index < 0:
+        raise HTTPException(status_code=400, detail="Index không hợp lệ")
+    cart = await cart_collection.find_one({"user_id": user_id}, {"items": {"$slice": [item_index, 1]}})
+    if not cart:
+        raise HTTPException(status_code=404, detail="Không tìm thấy giỏ hàng")
+    if not cart.get("items"):
+        raise HTTPException(status_code=400, detail="Index không hợp lệ")
+    return cart["items"][0]
+
 @app.post("/api/cart/add")
 async def add_to_cart(user_id: str = Query(...), product_id: str = Query(...), 
                       color: Optional[str] = None, size: Optional[str] = None, 
                       quantity: int = Query(1, ge=1)):
-    """Thêm sản phẩm vào giỏ hàng"""
+    """
+    Thêm sản phẩm vào giỏ hàng
+    - Đã có cùng product + màu + size → $inc quantity tại đúng vị trí
+    - Chưa có → $push item mới (upsert tạo cart nếu user chưa có)
+    Không đọc cart, 2 tab thêm cùng lúc không ghi đè items của nhau
+    """
     try:
         # Lấy thông tin sản phẩm
-        product = await products_collection.find_one({"_id": ObjectId(product_id)})
+        product = await products_collection.find_one({"_id": ObjectId(product_id)}, CART_PRODUCT_PROJECTION)
         if not product:
             raise HTTPException(status_code=404, detail="Không tìm thấy sản phẩm")
         
@@ -3508,50 +4380,43 @@ async def add_to_cart(user_id: str = Query(...), product_id: str = Query(...),
                         product_image = color_obj["images"][0]
                         break
         
-        # Tìm cart của user
-        cart = await cart_collection.find_one({"user_id": user_id})
-        
+        match = cart_item_match(product_id, color, size)
         cart_item = {
-            "product_id": product_id,
+            **match,
             "product_name": product.get("name", ""),
             "product_image": product_image,  # Ảnh theo màu đã chọn
-            "variant_color": color,
-            "variant_size": size,
             "quantity": quantity,
             "price": product.get("pricing", {}).get("sale") or product.get("pricing", {}).get("original", 0)
         }
         
-        if cart:
-            # Kiểm tra xem item đã có chưa
-            items = cart.get("items", [])
-            existing_index = None
-            for i, item in enumerate(items):
-                if (item.get("product_id") == product_id and 
-                    item.get("variant_color") == color and 
-                    item.get("variant_size") == size):
-                    existing_index = i
-                    break
-            
-            if existing_index is not None:
-                # Update quantity
-                items[existing_index]["quantity"] += quantity
-            else:
-                # Add new item
-                items.append(cart_item)
-            
-            await cart_collection.update_one(
-                {"user_id": user_id},
-                {"$set": {"items": items, "updated_at": datetime.now().isoformat()}}
+        for _ in range(CART_ADD_RETRIES):
+            now = datetime.now().isoformat()
+            # Item đã có → tăng quantity
+            result = await cart_collection.update_one(
+                {"user_id": user_id, "items": {"$elemMatch": match}},
+                {"$inc": {"items.$.quantity": quantity}, "$set": {"updated_at": now}}
             )
+            if result.matched_count:
+                break
+            # Item chưa có → push (cart chưa tồn tại thì upsert tạo mới)
+            try:
+                await cart_collection.update_one(
+                    {"user_id": user_id, "items": {"$not": {"$elemMatch": match}}},
+                    {
+                        "$push": {"items": cart_item},
+                        "$set": {"updated_at": now},
+                        "$setOnInsert": {"created_at": now}
+                    },
+                    upsert=True
+                )
+                break
+            except DuplicateKeyError:
+                # Request khác vừa thêm cùng item (upsert đụng unique index user_id) → quay lại $inc
+                continue
         else:
-            # Tạo cart mới
-            await cart_collection.insert_one({
-                "user_id": user_id,
-                "items": [cart_item],
-                "created_at": datetime.now().isoformat(),
-                "updated_at": datetime.now().isoformat()
-            })
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Giỏ hàng đang được cập nhật, vui lòng thử lại")
         
+        invalidate_user_recommendations(user_id)
         return {"success": True, "message": "Đã thêm vào giỏ hàng"}
     except HTTPException:
         raise
@@ -3584,25 +4449,56 @@ async def get_cart(user_id: str = Path(...)):
             detail=f"Lỗi server: {str(e)}"
         )
 
+@app.put("/api/cart/{user_id}/item")
+async def update_cart_item_quantity_by_variant(
+    user_id: str = Path(...),
+    product_id: str = Query(...),
+    color: Optional[str] = Query(None),
+    size: Optional[str] = Query(None),
+    quantity: int = Query(..., ge=1)
+):
+    """
+    Cập nhật số lượng item theo product_id và variant
+    $elemMatch + items.$ như add_to_cart - tab khác thêm/xóa item làm lệch index cũng không sửa nhầm item
+    """
+    try:
+        result = await cart_collection.update_one(
+            {"user_id": user_id, "items": {"$elemMatch": cart_item_match(product_id, color, size)}},
+            {"$set": {"items.$.quantity": quantity, "updated_at": datetime.now().isoformat()}}
+        )
+        if result.matched_count == 0:
+            if not await cart_collection.find_one({"user_id": user_id}, {"_id": 1}):
+                raise HTTPException(status_code=404, detail="Không tìm thấy giỏ hàng")
+            raise HTTPException(status_code=404, detail="Không tìm thấy sản phẩm trong giỏ hàng")
+        
+        return {"success": True, "message": "Đã cập nhật số lượng"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Lỗi server: {str(e)}"
+        )
+
 @app.put("/api/cart/{user_id}/{item_index}")
 async def update_cart_item_quantity(user_id: str = Path(...), item_index: int = Path(...), 
                                    quantity: int = Query(..., ge=1)):
-    """Cập nhật số lượng item trong giỏ hàng"""
+    """
+    Cập nhật số lượng item theo index (legacy endpoint - dùng PUT /api/cart/{user_id}/item)
+    $set đúng phần tử, không ghi lại cả mảng
+    """
     try:
-        cart = await cart_collection.find_one({"user_id": user_id})
-        if not cart:
-            raise HTTPException(status_code=404, detail="Không tìm thấy giỏ hàng")
-        
-        items = cart.get("items", [])
-        if item_index < 0 or item_index >= len(items):
+        if item_index < 0:
             raise HTTPException(status_code=400, detail="Index không hợp lệ")
         
-        items[item_index]["quantity"] = quantity
-        
-        await cart_collection.update_one(
-            {"user_id": user_id},
-            {"$set": {"items": items, "updated_at": datetime.now().isoformat()}}
+        result = await cart_collection.update_one(
+            {"user_id": user_id, f"items.{item_index}": {"$exists": True}},
+            {"$set": {f"items.{item_index}.quantity": quantity, "updated_at": datetime.now().isoformat()}}
         )
+        if result.matched_count == 0:
+            # Phân biệt không có cart / index vượt quá số item
+            await get_cart_item_at(user_id, item_index)
+            raise HTTPException(status_code=400, detail="Index không hợp lệ")
         
         return {"success": True, "message": "Đã cập nhật số lượng"}
     except HTTPException:
@@ -3621,31 +4517,11 @@ async def remove_cart_item_by_variant(
     size: Optional[str] = Query(None)
 ):
     """Xóa item khỏi giỏ hàng theo product_id và variant"""
-    try:
-        cart = await cart_collection.find_one({"user_id": user_id})
-        if not cart:
-            raise HTTPException(status_code=404, detail="Không tìm thấy giỏ hàng")
-        
-        items = cart.get("items", [])
-        
-        # Tìm và xóa item khớp với product_id và variant
-        found = False
-        for i, item in enumerate(items):
-            if (item.get("product_id") == product_id and 
-                item.get("variant_color") == color and 
-                item.get("variant_size") == size):
-                items.pop(i)
-                found = True
-                break
-        
-        if not found:
+    try:
+        if not await pull_cart_item(user_id, cart_item_match(product_id, color, size)):
             raise HTTPException(status_code=404, detail="Không tìm thấy sản phẩm trong giỏ hàng")
         
-        await cart_collection.update_one(
-            {"user_id": user_id},
-            {"$set": {"items": items, "updated_at": datetime.now().isoformat()}}
-        )
-        
+        invalidate_user_recommendations(user_id)
         return {"success": True, "message": "Đã xóa khỏi giỏ hàng"}
     except HTTPException:
         raise
@@ -3657,23 +4533,18 @@ async def remove_cart_item_by_variant(
 
 @app.delete("/api/cart/{user_id}/{item_index}")
 async def remove_cart_item(user_id: str = Path(...), item_index: int = Path(...)):
-    """Xóa item khỏi giỏ hàng (legacy endpoint)"""
+    """
+    Xóa item khỏi giỏ hàng (legacy endpoint)
+    MongoDB không $pull theo index → đọc đúng item tại index rồi $pull theo product + biến thể,
+    tab khác thêm/xóa item trong lúc đó cũng không làm xóa nhầm item
+    """
     try:
-        cart = await cart_collection.find_one({"user_id": user_id})
-        if not cart:
-            raise HTTPException(status_code=404, detail="Không tìm thấy giỏ hàng")
-        
-        items = cart.get("items", [])
-        if item_index < 0 or item_index >= len(items):
+        item = await get_cart_item_at(user_id, item_index)
+        match = cart_item_match(item.get("product_id"), item.get("variant_color"), item.get("variant_size"))
+        if not await pull_cart_item(user_id, match):
             raise HTTPException(status_code=400, detail="Index không hợp lệ")
         
-        items.pop(item_index)
-        
-        await cart_collection.update_one(
-            {"user_id": user_id},
-            {"$set": {"items": items, "updated_at": datetime.now().isoformat()}}
-        )
-        
+        invalidate_user_recommendations(user_id)
         return {"success": True, "message": "Đã xóa khỏi giỏ hàng"}
     except HTTPException:
         raise
@@ -3695,17 +4566,16 @@ async def clear_cart(user_id: str = Path(..., description="User ID")):
                 detail="User ID không hợp lệ"
             )
         
-        cart = await cart_collection.find_one({"user_id": user_id})
-        if not cart:
-            # Không có giỏ hàng cũng coi là success
-            return {"success": True, "message": "Giỏ hàng đã trống"}
-        
         # Xóa toàn bộ items
-        await cart_collection.update_one(
+        result = await cart_collection.update_one(
             {"user_id": user_id},
             {"$set": {"items": [], "updated_at": datetime.now().isoformat()}}
         )
+        if result.matched_count == 0:
+            # Không có giỏ hàng cũng coi là success
+            return {"success": True, "message": "Giỏ hàng đã trống"}
         
+        invalidate_user_recommendations(user_id)
         return {"success": True, "message": "Đã xóa toàn bộ giỏ hàng"}
     except HTTPException:
         raise
@@ -3914,20 +4784,17 @@ async def delete_address(address_id: str = Path(...)):
 # ==================== ADMIN CUSTOMER MANAGEMENT ====================
 
 # Cache cho customer stats
-admin_customer_stats_cache = {"data": None, "timestamp": None}
 CUSTOMER_STATS_CACHE_DURATION = 120  # 2 phút
+admin_customer_stats_cache = get_cache("admin_customer_stats", maxsize=4, ttl=CUSTOMER_STATS_CACHE_DURATION)
 
 @app.get("/api/admin/customers/stats")
 async def get_customer_stats():
     """Lấy thống kê số lượng khách hàng - NHANH"""
     try:
-        now = datetime.now()
-        
         # Check cache
-        if admin_customer_stats_cache.get("data"):
-            cache_age = (now - admin_customer_stats_cache["timestamp"]).total_seconds()
-            if cache_age < CUSTOMER_STATS_CACHE_DURATION:
-                return admin_customer_stats_cache["data"]
+        cached = admin_customer_stats_cache.get("stats")
+        if cached:
+            return cached
         
         # Count in parallel
         total_task = users_collection.count_documents({})
@@ -3950,8 +4817,7 @@ async def get_customer_stats():
         }
         
         # Cache result
-        admin_customer_stats_cache["data"] = result
-        admin_customer_stats_cache["timestamp"] = now
+        admin_customer_stats_cache.set("stats", result, tags=("customers",))
         
         return result
         
@@ -3973,18 +4839,14 @@ async def get_all_customers(
     try:
         # Cache key
         cache_key = f"{page}_{limit}_{search}_{role}_{is_banned}"
-        now = datetime.now()
         
         # Check cache
-        if admin_customers_cache.get("data"):
-            cached = admin_customers_cache["data"].get(cache_key)
-            if cached:
-                cache_age = (now - admin_customers_cache["timestamp"]).total_seconds()
-                if cache_age < ADMIN_CACHE_DURATION:
-                    print(f"✅ Returning cached admin customers (age: {cache_age:.1f}s)")
-                    return cached
+        cached = admin_customers_cache.get(cache_key)
+        if cached:
+            logger.debug("✅ Returning cached admin customers")
+            return cached
         
-        print(f"🔄 Generating fresh admin customers data...")
+        logger.debug("🔄 Generating fresh admin customers data...")
         
         # Xây dựng query filter
         query = {}
@@ -4085,17 +4947,14 @@ async def get_all_customers(
             limit=limit
         )
         
-        # Cache response
-        if admin_customers_cache.get("data") is None:
-            admin_customers_cache["data"] = {}
-        admin_customers_cache["data"][cache_key] = response
-        admin_customers_cache["timestamp"] = now
+        # Cache response (total_orders/total_spent phụ thuộc orders)
+        admin_customers_cache.set(cache_key, response, tags=("customers", "orders"))
         
-        print(f"✅ Admin customers data cached")
+        logger.debug("✅ Admin customers data cached")
         return response
         
     except Exception as e:
-        print(f"❌ Error in get_all_customers: {str(e)}")
+        logger.error(f"❌ Error in get_all_customers: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Lỗi server: {str(e)}"
@@ -4117,6 +4976,7 @@ async def ban_unban_customer(
             {"_id": ObjectId(user_id)},
             {"$set": {"is_banned": ban_data.is_banned, "updated_at": datetime.now().isoformat()}}
         )
+        invalidate_tags("customers")
         
         # Lấy lại user đã cập nhật
         updated_user = await users_collection.find_one({"_id": ObjectId(user_id)})
@@ -4171,6 +5031,7 @@ async def update_customer_role(
             {"_id": ObjectId(user_id)},
             {"$set": {"role": role_data.role, "updated_at": datetime.now().isoformat()}}
         )
+        invalidate_tags("customers")
         
         # Lấy lại user đã cập nhật
         updated_user = await users_collection.find_one({"_id": ObjectId(user_id)})
@@ -4237,7 +5098,7 @@ async def send_promotion_emails(request: PromotionEmailRequest):
                 else:
                     failed_count += 1
             except Exception as e:
-                print(f"[ERROR] Lỗi khi gửi email cho {user['email']}: {str(e)}")
+                logger.error(f"[ERROR] Lỗi khi gửi email cho {user['email']}: {str(e)}")
                 failed_count += 1
         
         return PromotionEmailResponse(
@@ -4601,18 +5462,14 @@ async def get_all_returns(status: Optional[str] = Query(None, description="Lọc
     try:
         # Cache key
         cache_key = f"returns_{status}"
-        now = datetime.now()
         
         # Check cache
-        if admin_returns_cache.get("data"):
-            cached = admin_returns_cache["data"].get(cache_key)
-            if cached:
-                cache_age = (now - admin_returns_cache["timestamp"]).total_seconds()
-                if cache_age < ADMIN_CACHE_DURATION:
-                    print(f"✅ Returning cached admin returns (age: {cache_age:.1f}s)")
-                    return cached
+        cached = admin_returns_cache.get(cache_key)
+        if cached:
+            logger.debug("✅ Returning cached admin returns")
+            return cached
         
-        print(f"🔄 Generating fresh admin returns data...")
+        logger.debug("🔄 Generating fresh admin returns data...")
         
         query = {}
         if status and status != 'all':
@@ -4649,16 +5506,13 @@ async def get_all_returns(status: Optional[str] = Query(None, description="Lọc
         )
         
         # Cache response
-        if admin_returns_cache.get("data") is None:
-            admin_returns_cache["data"] = {}
-        admin_returns_cache["data"][cache_key] = response
-        admin_returns_cache["timestamp"] = now
+        admin_returns_cache.set(cache_key, response, tags=("returns",))
         
-        print(f"✅ Admin returns data cached")
+        logger.debug("✅ Admin returns data cached")
         return response
         
     except Exception as e:
-        print(f"❌ Error in get_all_returns: {str(e)}")
+        logger.error(f"❌ Error in get_all_returns: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Lỗi server: {str(e)}"
@@ -4783,6 +5637,7 @@ async def create_return(return_data: ReturnCreate, user_id: str = Query(..., des
         }
         
         result = await returns_collection.insert_one(new_return)
+        invalidate_tags("returns")
         
         return ReturnResponse(
             id=str(result.inserted_id),
@@ -4841,8 +5696,8 @@ async def update_return(return_id: str = Path(...), update_data: ReturnUpdate =
             )
             
             # Invalidate admin returns cache
-            admin_returns_cache["data"] = None
-            print("🗑️ Admin returns cache invalidated")
+            invalidate_tags("returns")
+            logger.debug("🗑️ Admin returns cache invalidated")
         
         # Lấy lại return đã cập nhật
         updated_return = await returns_collection.find_one({"_id": ObjectId(return_id)})
@@ -4876,362 +5731,354 @@ async def update_return(return_id: str = Path(...), update_data: ReturnUpdate =
 # ==================== DASHBOARD API ENDPOINTS ====================
 
 # Cache dashboard data trong 2 phút
-dashboard_cache = {"data": None, "timestamp": None}
 CACHE_DURATION = 120  # seconds
+dashboard_cache = get_cache("dashboard", maxsize=4, ttl=CACHE_DURATION, stale_ttl=60, shared=True)
 
 @app.get("/api/admin/dashboard", response_model=DashboardResponse)
 async def get_dashboard_stats():
     """Lấy thống kê dashboard cho admin - VERSION TỐI ƯU"""
     try:
-        # Check cache
-        now = datetime.now()
-        if dashboard_cache["data"] and dashboard_cache["timestamp"]:
-            cache_age = (now - dashboard_cache["timestamp"]).total_seconds()
-            if cache_age < CACHE_DURATION:
-                print(f"✅ Returning cached dashboard data (age: {cache_age:.1f}s)")
-                return dashboard_cache["data"]
-        
-        print("🔄 Generating fresh dashboard data...")
-        
-        # Tính toán ngày
-        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        yesterday = today - timedelta(days=1)
-        today_end = today + timedelta(days=1)
-        date_30_days_ago = today - timedelta(days=30)
-        
-        # ========== AGGREGATION PIPELINE - TỐI ƯU ==========
-        
-        # 1A. BIỂU ĐỒ DOANH THU 30 NGÀY - Tất cả đơn hàng theo created_at
-        revenue_chart_pipeline = [
-            {
-                "$addFields": {
-                    "amount": {"$ifNull": ["$total_amount", 0]},
-                    "day_str": {
-                        "$switch": {
-                            "branches": [
-                                {
-                                    "case": {"$eq": [{"$type": "$created_at"}, "date"]},
-                                    "then": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}
-                                },
-                                {
-                                    "case": {"$eq": [{"$type": "$created_at"}, "string"]},
-                                    "then": {"$substr": ["$created_at", 0, 10]}
-                                }
-                            ],
-                            "default": "unknown"
+        async def build_response():
+            now = datetime.now()
+            logger.debug("🔄 Generating fresh dashboard data...")
+            
+            # Tính toán ngày
+            today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            yesterday = today - timedelta(days=1)
+            today_end = today + timedelta(days=1)
+            date_30_days_ago = today - timedelta(days=30)
+            
+            # ========== AGGREGATION PIPELINE - TỐI ƯU ==========
+            
+            # 1A. BIỂU ĐỒ DOANH THU 30 NGÀY - Tất cả đơn hàng theo created_at
+            revenue_chart_pipeline = [
+                {
+                    "$addFields": {
+                        "amount": {"$ifNull": ["$total_amount", 0]},
+                        "day_str": {
+                            "$switch": {
+                                "branches": [
+                                    {
+                                        "case": {"$eq": [{"$type": "$created_at"}, "date"]},
+                                        "then": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}
+                                    },
+                                    {
+                                        "case": {"$eq": [{"$type": "$created_at"}, "string"]},
+                                        "then": {"$substr": ["$created_at", 0, 10]}
+                                    }
+                                ],
+                                "default": "unknown"
+                            }
                         }
                     }
-                }
-            },
-            {
-                "$match": {
-                    "day_str": {
-                        "$gte": date_30_days_ago.strftime("%Y-%m-%d"),
-                        "$ne": "unknown"
+                },
+                {
+                    "$match": {
+                        "day_str": {
+                            "$gte": date_30_days_ago.strftime("%Y-%m-%d"),
+                            "$ne": "unknown"
+                        }
                     }
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$day_str",
-                    "revenue": {"$sum": "$amount"},
-                    "orders_count": {"$sum": 1}
-                }
-            },
-            {"$sort": {"_id": 1}}
-        ]
-        
-        # 1B. KPI HÔM NAY - Doanh thu và đơn hàng theo created_at (ngày đặt hàng)
-        today_kpi_pipeline = [
-            {
-                "$addFields": {
-                    "amount": {"$ifNull": ["$total_amount", 0]},
-                    "day_str": {
-                        "$switch": {
-                            "branches": [
-                                {
-                                    "case": {"$eq": [{"$type": "$created_at"}, "date"]},
-                                    "then": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}
-                                },
-                                {
-                                    "case": {"$eq": [{"$type": "$created_at"}, "string"]},
-                                    "then": {"$substr": ["$created_at", 0, 10]}
-                                }
-                            ],
-                            "default": "unknown"
+                },
+                {
+                    "$group": {
+                        "_id": "$day_str",
+                        "revenue": {"$sum": "$amount"},
+                        "orders_count": {"$sum": 1}
+                    }
+                },
+                {"$sort": {"_id": 1}}
+            ]
+            
+            # 1B. KPI HÔM NAY - Doanh thu và đơn hàng theo created_at (ngày đặt hàng)
+            today_kpi_pipeline = [
+                {
+                    "$addFields": {
+                        "amount": {"$ifNull": ["$total_amount", 0]},
+                        "day_str": {
+                            "$switch": {
+                                "branches": [
+                                    {
+                                        "case": {"$eq": [{"$type": "$created_at"}, "date"]},
+                                        "then": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}
+                                    },
+                                    {
+                                        "case": {"$eq": [{"$type": "$created_at"}, "string"]},
+                                        "then": {"$substr": ["$created_at", 0, 10]}
+                                    }
+                                ],
+                                "default": "unknown"
+                            }
                         }
                     }
-                }
-            },
-            {
-                "$match": {
-                    "day_str": {
-                        "$gte": yesterday.strftime("%Y-%m-%d"),
-                        "$ne": "unknown"
+                },
+                {
+                    "$match": {
+                        "day_str": {
+                            "$gte": yesterday.strftime("%Y-%m-%d"),
+                            "$ne": "unknown"
+                        }
                     }
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$day_str",
-                    "revenue": {"$sum": "$amount"},
-                    "orders_count": {"$sum": 1}
-                }
-            }
-        ]
-        
-        # 2. Customers mới (hôm nay và hôm qua)
-        customers_pipeline = [
-            {
-                "$match": {
-                    "createdAt": {"$gte": yesterday}
-                }
-            },
-            {
-                "$project": {
-                    "is_today": {
-                        "$gte": ["$createdAt", today]
+                },
+                {
+                    "$group": {
+                        "_id": "$day_str",
+                        "revenue": {"$sum": "$amount"},
+                        "orders_count": {"$sum": 1}
                     }
                 }
-            },
-            {
-                "$group": {
-                    "_id": "$is_today",
-                    "count": {"$sum": 1}
-                }
-            }
-        ]
-        
-        # 3. Pending orders với customer info - 1 query với lookup
-        pending_orders_pipeline = [
-            {
-                "$match": {"status": "pending"}
-            },
-            {"$sort": {"created_at": -1}},
-            {"$limit": 5},
-            {
-                "$addFields": {
-                    "user_object_id": {"$toObjectId": "$user_id"}
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "users",
-                    "localField": "user_object_id",
-                    "foreignField": "_id",
-                    "as": "user_info"
-                }
-            },
-            {
-                "$project": {
-                    "order_number": 1,
-                    "total_amount": 1,
-                    "created_at": 1,
-                    "status": 1,
-                    "items": 1,
-                    "customer_name": {
-                        "$ifNull": [
-                            {"$arrayElemAt": ["$user_info.name", 0]},
-                            {"$ifNull": [
-                                {"$arrayElemAt": ["$user_info.username", 0]},
-                                "Khách hàng"
-                            ]}
-                        ]
+            ]
+            
+            # 2. Customers mới (hôm nay và hôm qua)
+            customers_pipeline = [
+                {
+                    "$match": {
+                        "createdAt": {"$gte": yesterday}
                     }
-                }
-            }
-        ]
-        
-        # 4. Low stock products - với điều kiện trong query
-        low_stock_pipeline = [
-            {
-                "$match": {
-                    "status": "active",
-                    "$expr": {
-                        "$lte": [
-                            {"$ifNull": ["$inventory.quantity", 0]},
-                            {"$ifNull": ["$inventory.low_stock_threshold", 10]}
-                        ]
+                },
+                {
+                    "$project": {
+                        "is_today": {
+                            "$gte": ["$createdAt", today]
+                        }
+                    }
+                },
+                {
+                    "$group": {
+                        "_id": "$is_today",
+                        "count": {"$sum": 1}
                     }
                 }
-            },
-            {
-                "$project": {
-                    "name": 1,
-                    "sku": 1,
-                    "quantity": {"$ifNull": ["$inventory.quantity", 0]},
-                    "threshold": {"$ifNull": ["$inventory.low_stock_threshold", 10]}
+            ]
+            
+            # 3. Pending orders với customer info - 1 query với lookup
+            pending_orders_pipeline = [
+                {
+                    "$match": {"status": "pending"}
+                },
+                {"$sort": {"created_at": -1}},
+                {"$limit": 5},
+                {
+                    "$addFields": {
+                        "user_object_id": {"$toObjectId": "$user_id"}
+                    }
+                },
+                {
+                    "$lookup": {
+                        "from": "users",
+                        "localField": "user_object_id",
+                        "foreignField": "_id",
+                        "as": "user_info"
+                    }
+                },
+                {
+                    "$project": {
+                        "order_number": 1,
+                        "total_amount": 1,
+                        "created_at": 1,
+                        "status": 1,
+                        "items": 1,
+                        "customer_name": {
+                            "$ifNull": [
+                                {"$arrayElemAt": ["$user_info.name", 0]},
+                                {"$ifNull": [
+                                    {"$arrayElemAt": ["$user_info.username", 0]},
+                                    "Khách hàng"
+                                ]}
+                            ]
+                        }
+                    }
                 }
-            },
-            {"$sort": {"quantity": 1}},
-            {"$limit": 10}
-        ]
-        
-        # ========== CHẠY TẤT CẢ QUERIES SONG SONG ==========
-        revenue_chart_data_raw, today_kpi_data, customers_data, pending_orders_data, low_stock_data = await asyncio.gather(
-            orders_collection.aggregate(revenue_chart_pipeline).to_list(length=None),
-            orders_collection.aggregate(today_kpi_pipeline).to_list(length=None),
-            users_collection.aggregate(customers_pipeline).to_list(length=None),
-            orders_collection.aggregate(pending_orders_pipeline).to_list(length=None),
-            products_collection.aggregate(low_stock_pipeline).to_list(length=None)
-        )
-        
-        # DEBUG: Log data
-        print(f"📊 DEBUG Dashboard - Revenue chart data count: {len(revenue_chart_data_raw)}")
-        for item in revenue_chart_data_raw:
-            print(f"   - Day: {item.get('_id')}, Revenue: {item.get('revenue')}, Orders: {item.get('orders_count')}")
-        print(f"📊 DEBUG Dashboard - Today KPI data: {today_kpi_data}")
-        
-        # ========== XỬ LÝ KẾT QUẢ ==========
-        
-        # KPI HÔM NAY - Doanh thu và đơn hàng theo ngày đặt (created_at)
-        today_str = today.strftime("%Y-%m-%d")
-        yesterday_str = yesterday.strftime("%Y-%m-%d")
-        today_revenue = 0
-        yesterday_revenue = 0
-        today_orders_count = 0
-        yesterday_orders_count = 0
-        
-        for item in today_kpi_data:
-            day_id = item.get("_id", "")
-            revenue = item.get("revenue", 0) or 0
-            orders = item.get("orders_count", 0) or 0
+            ]
             
-            if day_id == today_str:
-                today_revenue = revenue
-                today_orders_count = orders
-            elif day_id == yesterday_str:
-                yesterday_revenue = revenue
-                yesterday_orders_count = orders
-        
-        # BIỂU ĐỒ 30 NGÀY - Doanh thu đơn completed theo updated_at
-        revenue_chart_data = []
-        
-        for item in revenue_chart_data_raw:
-            revenue = item.get("revenue", 0) or 0
-            day_id = item.get("_id", "")
+            # 4. Low stock products - với điều kiện trong query
+            low_stock_pipeline = [
+                {
+                    "$match": {
+                        "status": "active",
+                        "$expr": {
+                            "$lte": [
+                                {"$ifNull": ["$inventory.quantity", 0]},
+                                {"$ifNull": ["$inventory.low_stock_threshold", 10]}
+                            ]
+                        }
+                    }
+                },
+                {
+                    "$project": {
+                        "name": 1,
+                        "sku": 1,
+                        "quantity": {"$ifNull": ["$inventory.quantity", 0]},
+                        "threshold": {"$ifNull": ["$inventory.low_stock_threshold", 10]}
+                    }
+                },
+                {"$sort": {"quantity": 1}},
+                {"$limit": 10}
+            ]
             
-            # Chart data (30 ngày gần nhất - chỉ ngày có data)
-            try:
-                date_str = datetime.strptime(day_id, "%Y-%m-%d").strftime("%d/%m")
-            except:
-                date_str = day_id[-5:] if len(day_id) >= 5 else day_id  # Fallback
+            # ========== CHẠY TẤT CẢ QUERIES SONG SONG ==========
+            revenue_chart_data_raw, today_kpi_data, customers_data, pending_orders_data, low_stock_data = await asyncio.gather(
+                orders_collection.aggregate(revenue_chart_pipeline).to_list(length=None),
+                orders_collection.aggregate(today_kpi_pipeline).to_list(length=None),
+                users_collection.aggregate(customers_pipeline).to_list(length=None),
+                orders_collection.aggregate(pending_orders_pipeline).to_list(length=None),
+                products_collection.aggregate(low_stock_pipeline).to_list(length=None)
+            )
             
-            revenue_chart_data.append(DashboardRevenueData(
-                date=date_str,
-                revenue=int(revenue)
-            ))
-        
-        print(f"📈 Revenue chart data count: {len(revenue_chart_data)}")
-        
-        # Tính % thay đổi
-        revenue_change = ((today_revenue - yesterday_revenue) / yesterday_revenue * 100) if yesterday_revenue > 0 else 0
-        orders_change = ((today_orders_count - yesterday_orders_count) / yesterday_orders_count * 100) if yesterday_orders_count > 0 else 0
-        
-        # Customers
-        today_customers_count = 0
-        yesterday_customers_count = 0
-        for item in customers_data:
-            if item["_id"]:  # is_today = true
-                today_customers_count = item["count"]
-            else:
-                yesterday_customers_count = item["count"]
-        
-        customers_change = ((today_customers_count - yesterday_customers_count) / yesterday_customers_count * 100) if yesterday_customers_count > 0 else 0
-        
-        # Mock visits
-        today_visits = today_orders_count * 60
-        yesterday_visits = yesterday_orders_count * 60
-        visits_change = ((today_visits - yesterday_visits) / yesterday_visits * 100) if yesterday_visits > 0 else 0
-        
-        # Pending Orders
-        pending_orders = []
-        for order in pending_orders_data:
-            created_at = datetime.fromisoformat(order.get("created_at", now.isoformat()))
-            time_diff = now - created_at
+            logger.debug(
+                "📊 Dashboard - revenue chart days: %s, today KPI rows: %s",
+                len(revenue_chart_data_raw), len(today_kpi_data)
+            )
             
-            if time_diff.total_seconds() < 3600:
-                time_ago = f"{int(time_diff.total_seconds() / 60)} phút trước"
-            elif time_diff.total_seconds() < 86400:
-                time_ago = f"{int(time_diff.total_seconds() / 3600)} giờ trước"
-            else:
-                time_ago = f"{int(time_diff.total_seconds() / 86400)} ngày trước"
+            # ========== XỬ LÝ KẾT QUẢ ==========
             
-            pending_orders.append(DashboardPendingOrder(
-                id=str(order["_id"]),
-                order_number=order.get("order_number", f"ORD{str(order['_id'])[:8].upper()}"),
-                customer_name=order.get("customer_name", "Khách hàng"),
-                total_amount=order.get("total_amount", 0),
-                items_count=len(order.get("items", [])),
-                time_ago=time_ago,
-                status=order.get("status", "pending")
-            ))
-        
-        # Low Stock Products
-        low_stock_products = [
-            DashboardLowStockProduct(
-                id=str(product["_id"]),
-                name=product.get("name", ""),
-                sku=product.get("sku", ""),
-                stock=product.get("quantity", 0),
-                threshold=product.get("threshold", 10)
-            )
-            for product in low_stock_data
-        ]
-        
-        # KPIs
-        kpis = [
-            DashboardKPIMetric(
-                id="revenue",
-                title="Doanh thu hôm nay",
-                value=today_revenue,
-                change=revenue_change,
-                trend="up" if revenue_change >= 0 else "down",
-                is_currency=True
-            ),
-            DashboardKPIMetric(
-                id="orders",
-                title="Đơn hôm nay",
-                value=today_orders_count,
-                change=orders_change,
-                trend="up" if orders_change >= 0 else "down",
-                is_currency=False
-            ),
-            DashboardKPIMetric(
-                id="customers",
-                title="Khách mới",
-                value=today_customers_count,
-                change=customers_change,
-                trend="up" if customers_change >= 0 else "down",
-                is_currency=False
-            ),
-            DashboardKPIMetric(
-                id="visits",
-                title="Lượt truy cập",
-                value=today_visits,
-                change=visits_change,
-                trend="up" if visits_change >= 0 else "down",
-                is_currency=False
+            # KPI HÔM NAY - Doanh thu và đơn hàng theo ngày đặt (created_at)
+            today_str = today.strftime("%Y-%m-%d")
+            yesterday_str = yesterday.strftime("%Y-%m-%d")
+            today_revenue = 0
+            yesterday_revenue = 0
+            today_orders_count = 0
+            yesterday_orders_count = 0
+            
+            for item in today_kpi_data:
+                day_id = item.get("_id", "")
+                revenue = item.get("revenue", 0) or 0
+                orders = item.get("orders_count", 0) or 0
+                
+                if day_id == today_str:
+                    today_revenue = revenue
+                    today_orders_count = orders
+                elif day_id == yesterday_str:
+                    yesterday_revenue = revenue
+                    yesterday_orders_count = orders
+            
+            # BIỂU ĐỒ 30 NGÀY - Doanh thu đơn completed theo updated_at
+            revenue_chart_data = []
+            
+            for item in revenue_chart_data_raw:
+                revenue = item.get("revenue", 0) or 0
+                day_id = item.get("_id", "")
+                
+                # Chart data (30 ngày gần nhất - chỉ ngày có data)
+                try:
+                    date_str = datetime.strptime(day_id, "%Y-%m-%d").strftime("%d/%m")
+                except:
+                    date_str = day_id[-5:] if len(day_id) >= 5 else day_id  # Fallback
+                
+                revenue_chart_data.append(DashboardRevenueData(
+                    date=date_str,
+                    revenue=int(revenue)
+                ))
+            
+            logger.debug("📈 Revenue chart data count: %s", len(revenue_chart_data))
+            
+            # Tính % thay đổi
+            revenue_change = ((today_revenue - yesterday_revenue) / yesterday_revenue * 100) if yesterday_revenue > 0 else 0
+            orders_change = ((today_orders_count - yesterday_orders_count) / yesterday_orders_count * 100) if yesterday_orders_count > 0 else 0
+            
+            # Customers
+            today_customers_count = 0
+            yesterday_customers_count = 0
+            for item in customers_data:
+                if item["_id"]:  # is_today = true
+                    today_customers_count = item["count"]
+                else:
+                    yesterday_customers_count = item["count"]
+            
+            customers_change = ((today_customers_count - yesterday_customers_count) / yesterday_customers_count * 100) if yesterday_customers_count > 0 else 0
+            
+            # Mock visits
+            today_visits = today_orders_count * 60
+            yesterday_visits = yesterday_orders_count * 60
+            visits_change = ((today_visits - yesterday_visits) / yesterday_visits * 100) if yesterday_visits > 0 else 0
+            
+            # Pending Orders
+            pending_orders = []
+            for order in pending_orders_data:
+                created_at = datetime.fromisoformat(order.get("created_at", now.isoformat()))
+                time_diff = now - created_at
+                
+                if time_diff.total_seconds() < 3600:
+                    time_ago = f"{int(time_diff.total_seconds() / 60)} phút trước"
+                elif time_diff.total_seconds() < 86400:
+                    time_ago = f"{int(time_diff.total_seconds() / 3600)} giờ trước"
+                else:
+                    time_ago = f"{int(time_diff.total_seconds() / 86400)} ngày trước"
+                
+                pending_orders.append(DashboardPendingOrder(
+                    id=str(order["_id"]),
+                    order_number=order.get("order_number", f"ORD{str(order['_id'])[:8].upper()}"),
+                    customer_name=order.get("customer_name", "Khách hàng"),
+                    total_amount=order.get("total_amount", 0),
+                    items_count=len(order.get("items", [])),
+                    time_ago=time_ago,
+                    status=order.get("status", "pending")
+                ))
+            
+            # Low Stock Products
+            low_stock_products = [
+                DashboardLowStockProduct(
+                    id=str(product["_id"]),
+                    name=product.get("name", ""),
+                    sku=product.get("sku", ""),
+                    stock=product.get("quantity", 0),
+                    threshold=product.get("threshold", 10)
+                )
+                for product in low_stock_data
+            ]
+            
+            # KPIs
+            kpis = [
+                DashboardKPIMetric(
+                    id="revenue",
+                    title="Doanh thu hôm nay",
+                    value=today_revenue,
+                    change=revenue_change,
+                    trend="up" if revenue_change >= 0 else "down",
+                    is_currency=True
+                ),
+                DashboardKPIMetric(
+                    id="orders",
+                    title="Đơn hôm nay",
+                    value=today_orders_count,
+                    change=orders_change,
+                    trend="up" if orders_change >= 0 else "down",
+                    is_currency=False
+                ),
+                DashboardKPIMetric(
+                    id="customers",
+                    title="Khách mới",
+                    value=today_customers_count,
+                    change=customers_change,
+                    trend="up" if customers_change >= 0 else "down",
+                    is_currency=False
+                ),
+                DashboardKPIMetric(
+                    id="visits",
+                    title="Lượt truy cập",
+                    value=today_visits,
+                    change=visits_change,
+                    trend="up" if visits_change >= 0 else "down",
+                    is_currency=False
+                )
+            ]
+            
+            response = DashboardResponse(
+                success=True,
+                kpis=kpis,
+                revenue_chart=revenue_chart_data,
+                pending_orders=pending_orders,
+                low_stock_products=low_stock_products
             )
-        ]
-        
-        response = DashboardResponse(
-            success=True,
-            kpis=kpis,
-            revenue_chart=revenue_chart_data,
-            pending_orders=pending_orders,
-            low_stock_products=low_stock_products
-        )
-        
-        # Cache response
-        dashboard_cache["data"] = response
-        dashboard_cache["timestamp"] = now
+            
+            return response
         
-        print(f"✅ Dashboard data generated and cached")
-        return response
+        # Single-flight: nhiều admin mở dashboard cùng lúc chỉ chạy các aggregation 1 lần,
+        # hết hạn thì trả bản cũ và refresh nền
+        return await dashboard_cache.get_or_compute("dashboard", build_response, tags=("dashboard",))
         
     except Exception as e:
-        print(f"❌ Error in dashboard: {str(e)}")
+        logger.error(f"❌ Error in dashboard: {str(e)}")
         import traceback
         traceback.print_exc()
         raise HTTPException(
@@ -5319,6 +6166,12 @@ async def debug_dashboard():
         import traceback
         return {"error": str(e), "traceback": traceback.format_exc()}
 
+
+@app.get("/api/admin/cache/stats")
+async def get_cache_stats():
+    """Thống kê hit/miss/eviction của các cache trong process"""
+    return cache_stats()
+
 # ==================== SECURITY API (2FA & PASSWORD) ====================
 
 @app.get("/api/security/2fa/status/{user_id}", response_model=Get2FAStatusResponse)
@@ -5386,7 +6239,7 @@ async def disable_2fa(request: Disable2FARequest):
             raise HTTPException(status_code=404, detail="Không tìm thấy người dùng")
         
         # Xác minh mật khẩu
-        if not bcrypt.checkpw(request.password.encode('utf-8'), user["password"].encode('utf-8')):
+        if not await password_hasher.verify(request.password, user["password"]):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Mật khẩu không chính xác"
@@ -5494,21 +6347,21 @@ async def change_password(request: ChangePasswordRequest):
             raise HTTPException(status_code=404, detail="Không tìm thấy người dùng")
         
         # Xác minh mật khẩu hiện tại
-        if not bcrypt.checkpw(request.current_password.encode('utf-8'), user["password"].encode('utf-8')):
+        if not await password_hasher.verify(request.current_password, user["password"]):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Mật khẩu hiện tại không chính xác"
             )
         
         # Kiểm tra mật khẩu mới không trùng với mật khẩu cũ
-        if bcrypt.checkpw(request.new_password.encode('utf-8'), user["password"].encode('utf-8')):
+        if await password_hasher.verify(request.new_password, user["password"]):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Mật khẩu mới không được trùng với mật khẩu hiện tại"
             )
         
         # Hash mật khẩu mới
-        hashed_password = bcrypt.hashpw(request.new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        hashed_password = await password_hasher.hash(request.new_password)
         
         # Cập nhật mật khẩu
         await users_collection.update_one(
@@ -5727,6 +6580,10 @@ async def migrate_color_images():
         
         logging.info(f"✅ Migration completed: {updated_count} updated, {skipped_count} skipped")
         
+        if updated_count:
+            await rebuild_product_indexes()
+            invalidate_tags("products", "products:reindex")
+        
         return {
             "success": True,
             "message": f"Migration hoàn tất",
@@ -5755,6 +6612,6 @@ if __name__ == "__main__":
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", "8000"))
     
-    print(f"🚀 Starting server on {host}:{port}")
+    logger.info(f"🚀 Starting server on {host}:{port}")
     uvicorn.run(app, host=host, port=port)
 
@@ -0,0 +1,324 @@
+"""
+Metrics in-process + xuất định dạng Prometheus (text exposition 0.0.4)
+
+- MetricsMiddleware (ASGI thuần): latency histogram theo route template
+  (/api/products/{product_id}, không phải URL thật), số request đang xử lý,
+  số request theo status code
+- MongoCommandMetrics (pymongo CommandListener, đăng ký trong database.py):
+  thời gian theo collection + command, lỗi, mẫu các command chậm
+  (filter/pipeline chỉ giữ cấu trúc, giá trị bị thay bằng "?")
+- Password hashing (app/passwords.py): thời gian bcrypt, thời gian chờ trong queue,
+  số việc đang chờ, số request bị từ chối khi quá tải, số hash được nâng cost
+- render_metrics(): nội dung cho GET /metrics
+
+Không phụ thuộc prometheus_client. Metrics là của từng process - chạy nhiều
+worker thì Prometheus scrape từng worker (label instance khác nhau).
+CommandListener được gọi từ thread pool của motor nên mọi metric đều có lock.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import monitoring
+
+# Command chậm hơn ngưỡng này được lưu mẫu (ms)
+MONGO_SLOW_COMMAND_MS = float(os.getenv("MONGO_SLOW_COMMAND_MS", "100"))
+SLOW_COMMAND_SAMPLES = 50
+
+PASSWORD_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# Command nội bộ của driver (handshake, auth...) - không đo
+_IGNORED_COMMANDS = frozenset({
+    "hello", "ismaster", "isMaster", "ping", "saslStart", "saslContinue",
+    "authenticate", "getnonce", "buildinfo", "buildInfo", "endSessions", "killCursors",
+})
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], Any] = {}
+
+    def _key(self, labels: Tuple) -> Tuple[str, ...]:
+        return tuple(str(value) for value in labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            lines.extend(self._render_sample(labels, value))
+        return lines
+
+    def _render_sample(self, labels: Tuple[str, ...], value: Any) -> List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount: float = 1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (), buckets: Tuple[float, ...] = HTTP_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [count theo từng bucket (không cộng dồn)..., +Inf], sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts = state[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            state[1] += value
+
+    def _render_sample(self, labels: Tuple[str, ...], value: Any) -> List[str]:
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}")
+        label_str = _format_labels(self.label_names, labels)
+        lines.append(f"{self.name}_sum{label_str} {_format_value(total)}")
+        lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+# ==================== REGISTRY ====================
+
+_metrics: List[_Metric] = []
+_collectors: List[Callable[[], Iterable[str]]] = []
+
+
+def _register(metric: _Metric) -> _Metric:
+    _metrics.append(metric)
+    return metric
+
+
+def register_collector(collector: Callable[[], Iterable[str]]):
+    """Collector trả về các dòng Prometheus tính lúc scrape (vd. cache stats)"""
+    _collectors.append(collector)
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        try:
+            lines.extend(collector())
+        except Exception:
+            continue
+    return "\n".join(lines) + "\n"
+
+
+http_requests_total = _register(Counter(
+    "http_requests_total", "Số HTTP request theo route và status code", ("method", "route", "status")
+))
+http_request_duration_seconds = _register(Histogram(
+    "http_request_duration_seconds", "Thời gian xử lý HTTP request (giây)", ("method", "route"), HTTP_BUCKETS
+))
+http_requests_in_flight = _register(Gauge(
+    "http_requests_in_flight", "Số HTTP request đang xử lý", ("method",)
+))
+mongodb_command_duration_seconds = _register(Histogram(
+    "mongodb_command_duration_seconds", "Thời gian MongoDB command (giây)", ("collection", "command"), MONGO_BUCKETS
+))
+mongodb_command_failures_total = _register(Counter(
+    "mongodb_command_failures_total", "Số MongoDB command lỗi", ("collection", "command")
+))
+mongodb_slow_commands_total = _register(Counter(
+    "mongodb_slow_commands_total", f"Số MongoDB command chậm hơn {MONGO_SLOW_COMMAND_MS:g}ms", ("collection", "command")
+))
+password_hash_duration_seconds = _register(Histogram(
+    "password_hash_duration_seconds", "Thời gian bcrypt hash/verify trong thread pool (giây)", ("operation",), PASSWORD_BUCKETS
+))
+password_hash_queue_wait_seconds = _register(Histogram(
+    "password_hash_queue_wait_seconds", "Thời gian chờ thread bcrypt rảnh (giây)", ("operation",), PASSWORD_BUCKETS
+))
+password_hash_pending = _register(Gauge(
+    "password_hash_pending", "Số việc bcrypt đang chạy + đang chờ"
+))
+password_hash_rejected_total = _register(Counter(
+    "password_hash_rejected_total", "Số việc bcrypt bị từ chối do queue đầy (HTTP 503)", ("operation",)
+))
+password_hash_upgrades_total = _register(Counter(
+    "password_hash_upgrades_total", "Số mật khẩu được hash lại với cost mới khi đăng nhập", ("result",)
+))
+
+
+# ==================== HTTP MIDDLEWARE ====================
+
+class MetricsMiddleware:
+    """
+    ASGI middleware đo mọi HTTP request
+    Label route lấy từ route đã match (template) - URL không khớp route nào gom vào "unmatched"
+    để số time series không tăng theo URL bất kỳ
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope.get("method", "GET")
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc(method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            http_requests_in_flight.dec(method)
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            http_request_duration_seconds.observe(duration, method, route_path)
+            http_requests_total.inc(method, route_path, status_holder["status"])
+
+
+# ==================== MONGODB COMMAND LISTENER ====================
+
+def _shape(value: Any, depth: int = 0) -> Any:
+    """Giữ cấu trúc filter/pipeline, thay giá trị bằng "?" (không log dữ liệu user)"""
+    if depth > 6:
+        return "…"
+    if isinstance(value, dict):
+        return {key: _shape(item, depth + 1) for key, item in list(value.items())[:20]}
+    if isinstance(value, (list, tuple)):
+        return [_shape(item, depth + 1) for item in list(value)[:10]]
+    return "?"
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Đo thời gian từng MongoDB command theo collection + command name"""
+
+    def __init__(self, slow_ms: float = MONGO_SLOW_COMMAND_MS, samples: int = SLOW_COMMAND_SAMPLES):
+        self.slow_ms = slow_ms
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[Any, int], Tuple[str, Optional[dict]]] = {}
+        self.slow_samples: deque = deque(maxlen=samples)
+
+    @staticmethod
+    def _key(event) -> Tuple[Any, int]:
+        return (event.connection_id, event.request_id)
+
+    def started(self, event):
+        if event.command_name in _IGNORED_COMMANDS:
+            return
+        command = event.command
+        collection = command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = "-"
+        # Chỉ giữ phần cần cho mẫu command chậm
+        detail = None
+        for field in ("filter", "pipeline", "q", "query", "updates", "deletes", "sort"):
+            if field in command:
+                detail = detail or {}
+                detail[field] = _shape(command[field])
+        with self._lock:
+            if len(self._pending) > 10_000:
+                # Event succeeded/failed bị mất (không nên xảy ra) - tránh giữ mãi
+                self._pending.clear()
+            self._pending[self._key(event)] = (collection, detail)
+
+    def _finish(self, event, failed: bool):
+        with self._lock:
+            pending = self._pending.pop(self._key(event), None)
+        if pending is None:
+            return
+        collection, detail = pending
+        command_name = event.command_name
+        seconds = event.duration_micros / 1_000_000
+        mongodb_command_duration_seconds.observe(seconds, collection, command_name)
+        if failed:
+            mongodb_command_failures_total.inc(collection, command_name)
+        duration_ms = seconds * 1000
+        if duration_ms >= self.slow_ms:
+            mongodb_slow_commands_total.inc(collection, command_name)
+            self.slow_samples.append({
+                "at": datetime.now().isoformat(),
+                "collection": collection,
+                "command": command_name,
+                "duration_ms": round(duration_ms, 2),
+                "failed": failed,
+                "detail": detail,
+            })
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+    def get_slow_samples(self) -> List[dict]:
+        """Mẫu command chậm mới nhất trước"""
+        return list(reversed(self.slow_samples))
+
+
+# Singleton - đăng ký vào MongoClient trong database.py
+mongo_command_listener = MongoCommandMetrics()
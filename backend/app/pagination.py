@@ -0,0 +1,125 @@
+"""
+Keyset (cursor) pagination helpers
+
+Thay vì skip((page - 1) * limit) - chi phí tăng tuyến tính theo độ sâu trang -
+cursor lưu giá trị sort key của bản ghi cuối cùng, trang tiếp theo chỉ cần
+query "sau bản ghi này" và đi thẳng vào index.
+
+Cursor là chuỗi opaque (base64 của Extended JSON) để giữ đúng kiểu
+datetime/ObjectId khi decode.
+"""
+
+import base64
+from typing import Any, List, Optional, Tuple
+
+from bson import json_util
+
+SortSpec = List[Tuple[str, int]]
+
+
+def get_field(doc: dict, path: str) -> Any:
+    """Lấy giá trị theo dotted path (vd: 'pricing.sale'), None nếu thiếu"""
+    value: Any = doc
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def with_tiebreaker(sort_spec: SortSpec) -> SortSpec:
+    """Thêm _id vào cuối sort spec để thứ tự luôn xác định (deterministic)"""
+    if any(field == "_id" for field, _ in sort_spec):
+        return list(sort_spec)
+    direction = sort_spec[-1][1] if sort_spec else -1
+    return list(sort_spec) + [("_id", direction)]
+
+
+def encode_cursor(doc: dict, sort_spec: SortSpec, scope: str = "") -> str:
+    """
+    Tạo cursor từ document cuối cùng của trang hiện tại
+
+    Args:
+        doc: Document cuối cùng đã trả về
+        sort_spec: Sort spec (đã có _id tiebreaker)
+        scope: Chuỗi định danh chế độ sort, dùng để phát hiện cursor dùng sai sort
+    """
+    payload = {
+        "s": scope,
+        "v": [get_field(doc, field) for field, _ in sort_spec],
+    }
+    raw = json_util.dumps(payload).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_spec: SortSpec, scope: str = "") -> list:
+    """
+    Giải mã cursor, trả về list giá trị sort key
+
+    Raises:
+        ValueError: Cursor không hợp lệ hoặc không khớp với sort hiện tại
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json_util.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise ValueError("Cursor không hợp lệ")
+
+    if not isinstance(payload, dict) or payload.get("s") != scope:
+        raise ValueError("Cursor không khớp với kiểu sắp xếp hiện tại")
+
+    values = payload.get("v")
+    if not isinstance(values, list) or len(values) != len(sort_spec):
+        raise ValueError("Cursor không hợp lệ")
+    return values
+
+
+def build_keyset_filter(sort_spec: SortSpec, values: list) -> dict:
+    """
+    Tạo filter "sau bản ghi có giá trị `values`" theo thứ tự `sort_spec`
+
+    Với sort (a DESC, b DESC, _id DESC) và giá trị (va, vb, vid):
+        a < va
+        OR (a == va AND b < vb)
+        OR (a == va AND b == vb AND _id < vid)
+
+    MongoDB xếp null/missing thấp hơn mọi giá trị khác, nên:
+    - ASC sau null  -> mọi giá trị khác null
+    - DESC sau giá trị v -> nhỏ hơn v HOẶC null/missing
+    - DESC sau null -> không còn gì thấp hơn, bỏ nhánh đó
+    """
+    clauses = []
+    for i, (field, direction) in enumerate(sort_spec):
+        value = values[i]
+        prefix = {sort_spec[j][0]: values[j] for j in range(i)}
+
+        if direction == 1:
+            if value is None:
+                condition = {field: {"$ne": None}}
+            else:
+                condition = {field: {"$gt": value}}
+        else:
+            if value is None:
+                continue
+            condition = {"$or": [{field: {"$lt": value}}, {field: None}]}
+
+        if prefix:
+            clauses.append({"$and": [prefix, condition]})
+        else:
+            clauses.append(condition)
+
+    if not clauses:
+        # Cursor trỏ tới bản ghi cuối cùng có thể có -> không còn gì
+        return {"_id": {"$exists": False}}
+    return {"$or": clauses}
+
+
+def apply_keyset(query: dict, sort_spec: SortSpec, cursor: Optional[str], scope: str = "") -> dict:
+    """Kết hợp query gốc với keyset filter (nếu có cursor)"""
+    if not cursor:
+        return query
+    values = decode_cursor(cursor, sort_spec, scope)
+    keyset = build_keyset_filter(sort_spec, values)
+    if not query:
+        return keyset
+    return {"$and": [query, keyset]}
@@ -0,0 +1,159 @@
+"""
+Hash / verify mật khẩu bằng bcrypt trong thread pool riêng
+
+bcrypt cố ý chậm (~100-300ms mỗi lần ở cost 12) - gọi trực tiếp trong async handler sẽ chặn
+event loop, 1 đợt đăng nhập làm đứng mọi request khác. Ở đây:
+- Mọi lần hash/verify chạy trong ThreadPoolExecutor riêng (bcrypt nhả GIL khi tính)
+- Số việc đang chờ bị giới hạn: vượt PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_QUEUE thì trả
+  HTTP 503 ngay (Retry-After) thay vì xếp hàng vô hạn rồi timeout
+- Hash cũ có cost thấp hơn BCRYPT_ROUNDS được hash lại nền sau khi đăng nhập thành công
+- Metrics: xem password_hash_* trong app/metrics.py
+
+Cấu hình qua env: PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE, BCRYPT_ROUNDS
+"""
+
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Optional, Set
+
+import bcrypt
+from fastapi import HTTPException, status
+
+from app.metrics import (
+    password_hash_duration_seconds,
+    password_hash_pending,
+    password_hash_queue_wait_seconds,
+    password_hash_rejected_total,
+    password_hash_upgrades_total,
+)
+
+logger = logging.getLogger(__name__)
+
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "32"))
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+RETRY_AFTER_SECONDS = 1
+
+
+class PasswordHasherBusy(HTTPException):
+    """Queue bcrypt đầy - handler để nguyên (except HTTPException: raise) -> HTTP 503"""
+
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Hệ thống đang bận, vui lòng thử lại sau giây lát",
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+        )
+
+
+def _hash_cost(hashed: str) -> Optional[int]:
+    """Cost factor trong hash dạng $2b$12$... (None nếu không đọc được)"""
+    parts = hashed.split("$")
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+class PasswordHasher:
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_queue: int = PASSWORD_HASH_MAX_QUEUE,
+                 rounds: int = BCRYPT_ROUNDS):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.rounds = rounds
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0  # Chỉ đổi trên event loop, không cần lock
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def _run(self, operation: str, fn: Callable, *args):
+        if self._pending >= self.workers + self.max_queue:
+            password_hash_rejected_total.inc(operation)
+            logger.warning("Password hashing queue full, rejecting", extra={"operation": operation, "pending": self._pending})
+            raise PasswordHasherBusy()
+
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            password_hash_queue_wait_seconds.observe(started - submitted, operation)
+            try:
+                return fn(*args)
+            finally:
+                password_hash_duration_seconds.observe(time.perf_counter() - started, operation)
+
+        self._pending += 1
+        password_hash_pending.inc()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, timed)
+        finally:
+            self._pending -= 1
+            password_hash_pending.dec()
+
+    async def hash(self, password: str) -> str:
+        """bcrypt hash với cost BCRYPT_ROUNDS"""
+        hashed = await self._run("hash", lambda: bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(self.rounds)))
+        return hashed.decode('utf-8')
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        """So khớp mật khẩu với hash đã lưu (hash hỏng/không phải bcrypt -> False)"""
+        def check() -> bool:
+            try:
+                return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+            except ValueError:
+                return False
+        return await self._run("verify", check)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        cost = _hash_cost(hashed)
+        return cost is not None and cost < self.rounds
+
+    def schedule_rehash(self, password: str, hashed: str, save: Callable[[str], Awaitable[bool]]):
+        """
+        Sau khi verify thành công: hash cũ có cost thấp -> hash lại nền và lưu qua save(new_hash)
+        Không làm chậm request đăng nhập; queue đầy thì bỏ qua, lần đăng nhập sau thử lại
+        """
+        if not self.needs_rehash(hashed):
+            return
+
+        async def upgrade():
+            try:
+                new_hash = await self.hash(password)
+                saved = await save(new_hash)
+                password_hash_upgrades_total.inc("upgraded" if saved else "skipped")
+            except PasswordHasherBusy:
+                password_hash_upgrades_total.inc("busy")
+            except Exception as e:
+                password_hash_upgrades_total.inc("failed")
+                logger.error(f"Password rehash failed: {e}")
+
+        task = asyncio.create_task(upgrade())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def get_stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "rounds": self.rounds,
+            "pending": self._pending,
+        }
+
+    async def shutdown(self):
+        """Chờ các lần rehash nền xong rồi đóng thread pool (shutdown)"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+# Singleton instance
+password_hasher = PasswordHasher()
@@ -2,19 +2,199 @@
 Content-Based Filtering Recommendation System
 Sử dụng TF-IDF và Cosine Similarity để gợi ý sản phẩm tương tự
 
+Chỉ lưu top-K sản phẩm láng giềng cho mỗi sản phẩm (int32 index + float32 score),
+không giữ ma trận similarity N×N: memory O(N·K) thay vì O(N²).
+
+Thêm/sửa/xóa 1 sản phẩm được cập nhật tăng dần trên vocabulary đã fit
+(chỉ tính lại danh sách láng giềng bị ảnh hưởng). Fit lại toàn bộ chạy nền
+khi vocabulary drift / số thay đổi vượt ngưỡng.
+
+Fit (TF-IDF + top-K) chạy trong process riêng (ProcessPoolExecutor): event loop
+không bị chặn, model cũ vẫn phục vụ cho tới khi model mới được swap vào.
+
+Model được lưu snapshot trên đĩa (app/recommender_snapshot.py), khởi động lại
+chỉ cần mmap snapshot nếu catalog chưa đổi.
+
+Recommender chỉ trả về (product_id, score): thông tin hiển thị (giá, ảnh, tồn kho)
+được caller hydrate từ facet index / 1 query $in nên luôn mới, không phải chờ fit lại.
+
 Author: Vyron Fashion
 """
 
+import hashlib
+import multiprocessing
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import numpy as np
+import scipy.sparse as sp
+from bson import ObjectId
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
-from typing import List, Dict, Optional
+from app.recommender_snapshot import (
+    SNAPSHOT_VERSION,
+    compute_fingerprint,
+    read_meta,
+    save_snapshot,
+    load_snapshot,
+)
+from typing import Iterable, List, Dict, Optional, Tuple
 import logging
 import asyncio
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Số láng giềng lưu cho mỗi sản phẩm (API chỉ trả tối đa 20)
+TOP_K_NEIGHBORS = 50
+# Giới hạn kích thước 1 block similarity (số phần tử float32) khi tính theo chunk
+# 16M phần tử ~ 64MB, không phụ thuộc số sản phẩm
+SIMILARITY_CHUNK_ELEMENTS = 16_000_000
+
+# Điều kiện fit lại toàn bộ (kiểm tra bởi scheduler nền)
+REFIT_CHECK_INTERVAL = 60        # seconds
+VOCAB_DRIFT_THRESHOLD = 0.15     # Tỉ lệ term chưa có trong vocabulary của các bản cập nhật
+VOCAB_DRIFT_MIN_TERMS = 200      # Chưa đủ term thì chưa tính drift
+CHURN_THRESHOLD = 0.2            # Số sản phẩm thêm/sửa/xóa so với lúc fit
+DEAD_ROWS_THRESHOLD = 0.2        # Row đã xóa chưa được dọn (compact khi fit lại)
+
+# Số job rebuild giữ lại để tra cứu trạng thái
+MAX_TRACKED_JOBS = 20
+
+# Buffer cho sản phẩm thêm tăng dần: capacity tăng theo hệ số (amortized O(1) mỗi lần thêm)
+ROW_GROWTH_FACTOR = 1.5
+MIN_GROWTH_ROWS = 64
+
+# Chỉ đọc các field dùng để tính content (+ status)
+RECOMMENDER_PROJECTION = {
+    "_id": 1,
+    "name": 1,
+    "category.name": 1,
+    "brand.name": 1,
+    "short_description": 1,
+    "variants.colors.name": 1,
+    "status": 1
+}
+
+
+def _top_k_of_block(block: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """K cột lớn nhất của mỗi dòng (giảm dần), score <= 0 thành ô trống (-1, 0)"""
+    rows, n_cols = block.shape
+    indices = np.full((rows, k), -1, dtype=np.int32)
+    scores = np.zeros((rows, k), dtype=np.float32)
+    k_eff = min(k, n_cols)
+    if k_eff == 0 or rows == 0:
+        return indices, scores
+
+    if k_eff < n_cols:
+        top = np.argpartition(-block, k_eff - 1, axis=1)[:, :k_eff]
+    else:
+        top = np.broadcast_to(np.arange(n_cols), (rows, n_cols))
+    top_scores = np.take_along_axis(block, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+    # Chỉ giữ láng giềng có similarity > 0
+    valid = top_scores > 0
+    indices[:, :k_eff] = np.where(valid, top, -1)
+    scores[:, :k_eff] = np.where(valid, top_scores, 0)
+    return indices, scores
+
+
+def compute_top_k_neighbors(
+    tfidf_matrix,
+    k: int = TOP_K_NEIGHBORS,
+    chunk_elements: int = SIMILARITY_CHUNK_ELEMENTS,
+    rows: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Tính top-K láng giềng (cosine) cho các dòng của TF-IDF matrix theo từng chunk
+
+    TF-IDF đã chuẩn hóa L2 nên cosine = tích vô hướng. Mỗi chunk chỉ tạo
+    block (rows × N) rồi giữ lại K cột lớn nhất, peak memory bị chặn bởi chunk_elements.
+    Row đã xóa có vector 0 nên không bao giờ thành láng giềng.
+
+    Args:
+        rows: Chỉ tính cho các row này (cập nhật tăng dần), None = tất cả
+
+    Returns:
+        (indices int32 [len(rows), K], scores float32 [len(rows), K]) sắp xếp giảm dần,
+        ô trống có index -1 và score 0
+    """
+    n_cols = tfidf_matrix.shape[0]
+    rows = np.arange(n_cols) if rows is None else np.asarray(rows, dtype=np.int64)
+    indices = np.full((len(rows), k), -1, dtype=np.int32)
+    scores = np.zeros((len(rows), k), dtype=np.float32)
+    if n_cols == 0 or len(rows) == 0:
+        return indices, scores
+
+    matrix = tfidf_matrix.astype(np.float32, copy=False).tocsr()
+    matrix_t = matrix.T.tocsc()
+    chunk_rows = max(1, chunk_elements // n_cols)
+    for start in range(0, len(rows), chunk_rows):
+        chunk = rows[start:start + chunk_rows]
+        block = (matrix[chunk] @ matrix_t).toarray()
+        block[np.arange(len(chunk)), chunk] = -1  # Bỏ chính sản phẩm đó
+        indices[start:start + len(chunk)], scores[start:start + len(chunk)] = _top_k_of_block(block, k)
+    return indices, scores
+
+
+def _reverse_neighbors(neighbor_indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reverse index (CSR) của danh sách láng giềng: row j được các row
+    referrers[indptr[j]:indptr[j + 1]] chứa trong top-K
+
+    Returns:
+        (indptr int64 [N + 1], referrers int32 [số ô khác -1])
+    """
+    n_rows, k = neighbor_indices.shape
+    flat = neighbor_indices.ravel()
+    valid = flat >= 0
+    targets = flat[valid]
+    owners = np.repeat(np.arange(n_rows, dtype=np.int32), k)[valid]
+    order = np.argsort(targets, kind="stable")
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(targets, minlength=n_rows), out=indptr[1:])
+    return indptr, owners[order]
+
+
+def _reserve(array: np.ndarray, length: int, needed: int, fill=0) -> np.ndarray:
+    """
+    Đảm bảo array có capacity >= needed (theo chiều 0), giữ nguyên length phần tử đầu
+    Thiếu thì cấp phát lớn hơn theo ROW_GROWTH_FACTOR - copy chỉ xảy ra khi tăng capacity
+    """
+    if array.shape[0] >= needed:
+        return array
+    capacity = max(needed, int(array.shape[0] * ROW_GROWTH_FACTOR), array.shape[0] + MIN_GROWTH_ROWS)
+    grown = np.full((capacity,) + array.shape[1:], fill, dtype=array.dtype)
+    grown[:length] = array[:length]
+    return grown
+
+
+def _new_vectorizer() -> TfidfVectorizer:
+    return TfidfVectorizer(
+        ngram_range=(1, 2),      # Unigram + Bigram
+        min_df=1,                 # Minimum document frequency
+        max_df=0.95,              # Maximum document frequency (loại bỏ từ quá phổ biến)
+        lowercase=True,
+        strip_accents=None,       # Giữ nguyên tiếng Việt có dấu
+        token_pattern=r'(?u)\b\w+\b',  # Hỗ trợ Unicode
+        dtype=np.float32
+    )
+
+
+def _fit_model(contents: List[str]):
+    """Phần tính toán nặng của fit (chạy trong process pool, phải là hàm module-level để pickle)"""
+    vectorizer = _new_vectorizer()
+    tfidf_matrix = vectorizer.fit_transform(contents)
+    neighbor_indices, neighbor_scores = compute_top_k_neighbors(tfidf_matrix)
+    return vectorizer, tfidf_matrix, neighbor_indices, neighbor_scores
+
+
+def _content_hash(content: str) -> str:
+    return hashlib.md5(content.encode("utf-8")).hexdigest()
+
 
 class ProductRecommender:
     """
@@ -24,28 +204,129 @@ class ProductRecommender:
     1. Load tất cả sản phẩm từ database
     2. Tạo "content" từ name + description + category + colors
     3. Chuyển content thành TF-IDF vectors
-    4. Tính Cosine Similarity matrix
-    5. Khi cần gợi ý, tìm top N sản phẩm có similarity cao nhất
+    4. Tính Cosine Similarity theo chunk, chỉ giữ top-K láng giềng mỗi sản phẩm
+    5. Khi cần gợi ý, đọc top N từ danh sách láng giềng đã sắp xếp
+    6. upsert_product/remove_product cập nhật tăng dần, scheduler nền fit lại khi drift
     """
     
     def __init__(self):
-        self.vectorizer = TfidfVectorizer(
-            ngram_range=(1, 2),      # Unigram + Bigram
-            min_df=1,                 # Minimum document frequency
-            max_df=0.95,              # Maximum document frequency (loại bỏ từ quá phổ biến)
-            lowercase=True,
-            strip_accents=None,       # Giữ nguyên tiếng Việt có dấu
-            token_pattern=r'(?u)\b\w+\b'  # Hỗ trợ Unicode
-        )
+        self.vectorizer = _new_vectorizer()
         
         self.tfidf_matrix = None
-        self.product_ids: List[str] = []
-        self.product_data: Dict[str, dict] = {}  # Cache product info
-        self.similarity_matrix = None
+        self.product_ids: List[Optional[str]] = []  # None = row đã xóa (dọn khi fit lại)
+        self._row_of: Dict[str, int] = {}  # product_id -> row trong tfidf_matrix / neighbors
+        # Top-K láng giềng: neighbor_indices[i] là các row tương tự row i (giảm dần)
+        self.neighbor_indices: Optional[np.ndarray] = None  # int32 [N, K], -1 = trống
+        self.neighbor_scores: Optional[np.ndarray] = None   # float32 [N, K]
+        # tfidf_matrix / neighbor_* là view [:N] trên các buffer có capacity dư để thêm row
+        self._csr_data: Optional[np.ndarray] = None
+        self._csr_indices: Optional[np.ndarray] = None
+        self._csr_indptr: Optional[np.ndarray] = None
+        self._nnz = 0
+        self._indices_buf: Optional[np.ndarray] = None
+        self._scores_buf: Optional[np.ndarray] = None
+        # Reverse index láng giềng (row -> các row chứa nó), để xóa row không phải quét N×K:
+        # CSR dựng lúc fit/restore + các cặp thêm tăng dần từ đó. Có thể chứa cặp cũ
+        # (row đã tính lại top-K), luôn kiểm tra lại trên neighbor_indices khi dùng
+        self._referrers_indptr: Optional[np.ndarray] = None
+        self._referrers: Optional[np.ndarray] = None
+        self._referrers_added: Dict[int, set] = {}
         self.is_fitted = False
         self.last_updated: Optional[datetime] = None
         self._lock = asyncio.Lock()
         
+        # Cập nhật tăng dần
+        self._content_hashes: Dict[str, str] = {}
+        self._fitted_size = 0
+        self._dead_rows = 0
+        self._changes_since_fit = 0
+        self._drift_terms = 0      # Term (unigram/bigram) chưa có trong vocabulary
+        self._update_terms = 0     # Tổng term của các bản cập nhật
+        self._refit_requested = False
+        self._changes_since_snapshot = 0
+        self.snapshot_info: Optional[dict] = None
+        # Thay đổi trong lúc fit nền: áp dụng lại lên model mới sau khi swap
+        self._recording = False
+        self._replay: Dict[str, Optional[dict]] = {}
+        
+        self._collection = None
+        self._projection: Optional[dict] = None
+        self._scheduler: Optional[asyncio.Task] = None
+        self._tasks: set = set()
+        
+        # Process pool cho fit + trạng thái các job rebuild
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[str, dict] = {}
+        self._current_job: Optional[dict] = None
+        
+    def _apply_state(self, state: dict):
+        """Swap toàn bộ model (từ fit hoặc snapshot) - không có await ở giữa"""
+        self.vectorizer = state["vectorizer"]
+        tfidf_matrix = state["tfidf_matrix"].tocsr()
+        self._csr_data = tfidf_matrix.data
+        self._csr_indices = tfidf_matrix.indices
+        self._csr_indptr = tfidf_matrix.indptr
+        self._nnz = int(tfidf_matrix.indptr[-1])
+        self._indices_buf = state["neighbor_indices"]
+        self._scores_buf = state["neighbor_scores"]
+        self._set_views(tfidf_matrix.shape[0], tfidf_matrix.shape[1])
+        self._referrers_indptr, self._referrers = _reverse_neighbors(self.neighbor_indices)
+        self._referrers_added = {}
+        self.product_ids = state["product_ids"]
+        self._content_hashes = state["content_hashes"]
+        self._row_of = {
+            product_id: row for row, product_id in enumerate(self.product_ids) if product_id is not None
+        }
+        self._fitted_size = len(self._row_of)
+        self._dead_rows = len(self.product_ids) - len(self._row_of)
+        self._changes_since_fit = 0
+        self._drift_terms = 0
+        self._update_terms = 0
+        self._refit_requested = False
+        
+        self.is_fitted = True
+        self.last_updated = datetime.now()
+    
+    def _set_views(self, rows: int, n_features: int):
+        """tfidf_matrix / neighbor_* = rows đầu của buffer (không copy)"""
+        self.tfidf_matrix = sp.csr_matrix(
+            (self._csr_data[:self._nnz], self._csr_indices[:self._nnz], self._csr_indptr[:rows + 1]),
+            shape=(rows, n_features),
+            copy=False
+        )
+        self.neighbor_indices = self._indices_buf[:rows]
+        self.neighbor_scores = self._scores_buf[:rows]
+    
+    def _append_row(self, vector) -> int:
+        """Thêm 1 row TF-IDF (+ row láng giềng trống) vào cuối buffer, trả về row mới"""
+        row, n_features = self.tfidf_matrix.shape
+        vector = vector.tocsr()
+        end = self._nnz + vector.nnz
+        self._csr_data = _reserve(self._csr_data, self._nnz, end)
+        self._csr_indices = _reserve(self._csr_indices, self._nnz, end)
+        self._csr_indptr = _reserve(self._csr_indptr, row + 1, row + 2)
+        self._csr_data[self._nnz:end] = vector.data
+        self._csr_indices[self._nnz:end] = vector.indices
+        self._csr_indptr[row + 1] = end
+        self._nnz = end
+        self._indices_buf = _reserve(self._indices_buf, row, row + 1, fill=-1)
+        self._scores_buf = _reserve(self._scores_buf, row, row + 1)
+        self._indices_buf[row] = -1
+        self._scores_buf[row] = 0
+        self._set_views(row + 1, n_features)
+        return row
+    
+    def _snapshot_state(self) -> dict:
+        return {
+            "vectorizer": self.vectorizer,
+            # Copy: cập nhật tăng dần sửa mảng tại chỗ trong lúc thread đang ghi đĩa
+            "tfidf_matrix": self.tfidf_matrix.copy(),
+            "neighbor_indices": self.neighbor_indices.copy(),
+            "neighbor_scores": self.neighbor_scores.copy(),
+            "product_ids": list(self.product_ids),
+            "content_hashes": dict(self._content_hashes),
+        }
+    
     def _build_content(self, product: dict) -> str:
         """
         Xây dựng nội dung văn bản từ thông tin sản phẩm
@@ -98,27 +379,29 @@ class ProductRecommender:
         content = ' '.join(parts)
         return content.strip()
     
-    async def fit(self, products: List[dict]) -> bool:
+    async def fit(self, products: List[dict], job: Optional[dict] = None) -> bool:
         """
         Train model với danh sách sản phẩm
         
         Args:
             products: List các product documents từ MongoDB
+            job: Job rebuild để cập nhật tiến độ (nếu có)
             
         Returns:
-            True nếu thành công, False nếu thất bại
+            True nếu thành công, False nếu thất bại (model đang phục vụ được giữ nguyên)
         """
         async with self._lock:
+            self._recording = True
             try:
                 if not products:
                     logger.warning("No products to fit recommender")
-                    return False
+                    return self._fit_failed(job, "Không có sản phẩm để train model")
                 
                 logger.info(f"🧠 Fitting recommender with {len(products)} products...")
                 
                 # Reset data
-                self.product_ids = []
-                self.product_data = {}
+                product_ids = []
+                content_hashes = {}
                 contents = []
                 
                 # Chỉ xử lý sản phẩm active
@@ -126,8 +409,7 @@ class ProductRecommender:
                 
                 if len(active_products) < 2:
                     logger.warning("Need at least 2 active products for recommendations")
-                    self.is_fitted = False
-                    return False
+                    return self._fit_failed(job, "Cần ít nhất 2 sản phẩm active để train model")
                 
                 for product in active_products:
                     product_id = str(product.get('_id', ''))
@@ -138,51 +420,481 @@ class ProductRecommender:
                     if not content:
                         continue
                     
-                    self.product_ids.append(product_id)
-                    self.product_data[product_id] = {
-                        'id': product_id,
-                        'name': product.get('name', ''),
-                        'slug': product.get('slug', ''),
-                        'image': product.get('image', ''),
-                        'pricing': product.get('pricing', {}),
-                        'category': product.get('category', {}),
-                        'rating': product.get('rating', {'average': 0, 'count': 0})
-                    }
+                    product_ids.append(product_id)
+                    content_hashes[product_id] = _content_hash(content)
                     contents.append(content)
                 
                 if len(contents) < 2:
                     logger.warning("Not enough valid content for recommendations")
-                    self.is_fitted = False
-                    return False
+                    return self._fit_failed(job, "Không đủ nội dung sản phẩm để train model")
                 
-                # Fit TF-IDF
-                self.tfidf_matrix = self.vectorizer.fit_transform(contents)
+                # Fit TF-IDF + top-K láng giềng theo chunk (không tạo ma trận N×N)
+                # Chạy trong process riêng, model cũ vẫn phục vụ request trong lúc fit
+                self._update_job(job, "fitting", 40)
+                (
+                    vectorizer,
+                    tfidf_matrix,
+                    neighbor_indices,
+                    neighbor_scores
+                ) = await self._run_fit(contents)
                 
-                # Tính Cosine Similarity matrix
-                # Sử dụng sparse matrix để tiết kiệm memory
-                self.similarity_matrix = cosine_similarity(self.tfidf_matrix)
+                self._update_job(job, "swapping", 90)
+                # Swap model mới (không có await ở giữa - request không thấy trạng thái dở dang)
+                self._apply_state({
+                    "vectorizer": vectorizer,
+                    "tfidf_matrix": tfidf_matrix,
+                    "neighbor_indices": neighbor_indices,
+                    "neighbor_scores": neighbor_scores,
+                    "product_ids": product_ids,
+                    "content_hashes": content_hashes,
+                })
                 
-                self.is_fitted = True
-                self.last_updated = datetime.now()
+                # Áp dụng lại các thay đổi xảy ra trong lúc fit
+                replay, self._replay = self._replay, {}
+                self._recording = False
+                for product_id, product in replay.items():
+                    if product is None:
+                        self.remove_product(product_id)
+                    else:
+                        self.upsert_product(product)
                 
                 logger.info(f"✅ Recommender fitted successfully!")
-                logger.info(f"   - Products: {len(self.product_ids)}")
+                logger.info(f"   - Products: {len(self._row_of)}")
                 logger.info(f"   - TF-IDF features: {self.tfidf_matrix.shape[1]}")
-                logger.info(f"   - Matrix size: {self.similarity_matrix.shape}")
+                logger.info(f"   - Neighbors: {self.neighbor_indices.shape} ({self._neighbors_nbytes() / 1024 / 1024:.1f} MB)")
                 
                 return True
                 
             except Exception as e:
                 logger.error(f"❌ Error fitting recommender: {str(e)}")
-                self.is_fitted = False
-                return False
+                return self._fit_failed(job, str(e))
+            finally:
+                self._recording = False
+                self._replay = {}
+    
+    def _fit_failed(self, job: Optional[dict], error: str) -> bool:
+        """
+        Fit thất bại: model cũ (nếu đã từng fit) tiếp tục phục vụ, is_fitted giữ nguyên
+        (chỉ _apply_state bật cờ, nên chưa từng fit thì vẫn False). Chỉ đánh dấu job failed.
+        """
+        if job is not None:
+            job["status"] = "failed"
+            job["error"] = error
+        return False
+    
+    async def _run_fit(self, contents: List[str]):
+        """Chạy _fit_model trong process pool, pool không dùng được thì chạy trong thread"""
+        loop = asyncio.get_running_loop()
+        try:
+            if self._executor is None:
+                # spawn: process con không thừa hưởng thread/event loop của server
+                self._executor = ProcessPoolExecutor(
+                    max_workers=1,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return await loop.run_in_executor(self._executor, _fit_model, contents)
+        except (BrokenProcessPool, OSError, NotImplementedError) as e:
+            logger.warning(f"⚠️ Process pool unavailable ({e}), fitting in a thread")
+            self._shutdown_executor()
+            return await asyncio.to_thread(_fit_model, contents)
+    
+    def _shutdown_executor(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+    
+    # ---------- incremental updates ----------
+    
+    def upsert_product(self, product: dict) -> bool:
+        """
+        Thêm/cập nhật 1 sản phẩm trên vocabulary đã fit
+        
+        Chỉ tính lại danh sách láng giềng bị ảnh hưởng:
+        - Láng giềng của chính sản phẩm (1 sparse mat-vec)
+        - Sản phẩm khác nhận sản phẩm này nếu similarity lớn hơn láng giềng yếu nhất của nó
+        - Sản phẩm từng có row cũ trong danh sách thì tính lại top-K
+        
+        Returns:
+            True nếu model thay đổi
+        """
+        product_id = str(product.get('_id', ''))
+        if not product_id:
+            return False
+        if self._recording:
+            self._replay[product_id] = product
+        if not self.is_fitted:
+            # Chưa đủ sản phẩm lúc fit - để scheduler thử fit lại
+            self._refit_requested = True
+            return False
+        
+        content = self._build_content(product)
+        if product.get('status', 'active') != 'active' or not content:
+            return self.remove_product(product_id)
+        
+        # Nội dung không đổi (giá, sold_count, tồn kho...) - model không cần cập nhật
+        content_hash = _content_hash(content)
+        if self._content_hashes.get(product_id) == content_hash:
+            return False
+        
+        if product_id in self._row_of:
+            self._unlink_row(self._row_of[product_id])
+        self._track_drift(content)
+        
+        vector = self.vectorizer.transform([content])
+        row = self._append_row(vector)
+        self.product_ids.append(product_id)
+        self._content_hashes[product_id] = content_hash
+        self._row_of[product_id] = row
+        
+        # Similarity với toàn bộ catalog: 1 sparse mat-vec, O(nnz)
+        similarities = (self.tfidf_matrix @ vector.T).toarray().ravel().astype(np.float32)
+        similarities[row] = -1
+        
+        own_indices, own_scores = _top_k_of_block(similarities[None, :], self.neighbor_indices.shape[1])
+        self.neighbor_indices[row] = own_indices[0]
+        self.neighbor_scores[row] = own_scores[0]
+        self._add_referrers([row], own_indices)
+        
+        # Sản phẩm có láng giềng yếu nhất (hoặc ô trống) kém hơn sản phẩm mới
+        weakest = self.neighbor_scores[:row, -1]
+        for other in np.flatnonzero(similarities[:row] > weakest).tolist():
+            self._insert_neighbor(other, row, similarities[other])
+        
+        self._changes_since_fit += 1
+        self._changes_since_snapshot += 1
+        self.last_updated = datetime.now()
+        return True
+    
+    def remove_product(self, product_id: str) -> bool:
+        """Xóa 1 sản phẩm (bị xóa hoặc không còn active)"""
+        if self._recording:
+            self._replay[product_id] = None
+        row = self._row_of.get(product_id)
+        if row is None or not self.is_fitted:
+            return False
+        self._unlink_row(row)
+        self._changes_since_fit += 1
+        self._changes_since_snapshot += 1
+        self.last_updated = datetime.now()
+        return True
+    
+    def _unlink_row(self, row: int):
+        """
+        Vô hiệu hóa 1 row: vector về 0 (không còn là láng giềng của ai),
+        các sản phẩm từng chứa row này tính lại top-K
+        """
+        product_id = self.product_ids[row]
+        self._row_of.pop(product_id, None)
+        self._content_hashes.pop(product_id, None)
+        self.product_ids[row] = None
+        
+        start, end = self.tfidf_matrix.indptr[row], self.tfidf_matrix.indptr[row + 1]
+        self.tfidf_matrix.data[start:end] = 0
+        self.neighbor_indices[row] = -1
+        self.neighbor_scores[row] = 0
+        self._dead_rows += 1
+        
+        affected = self._referrers_of(row)
+        if affected.size:
+            indices, scores = compute_top_k_neighbors(
+                self.tfidf_matrix, k=self.neighbor_indices.shape[1], rows=affected
+            )
+            self.neighbor_indices[affected] = indices
+            self.neighbor_scores[affected] = scores
+            self._add_referrers(affected, indices)
+    
+    def _referrers_of(self, row: int) -> np.ndarray:
+        """Các row hiện đang chứa row trong top-K (reverse index, không quét N×K)"""
+        candidates = []
+        if row + 1 < len(self._referrers_indptr):
+            candidates.append(self._referrers[self._referrers_indptr[row]:self._referrers_indptr[row + 1]])
+        added = self._referrers_added.pop(row, None)
+        if added:
+            candidates.append(np.fromiter(added, dtype=np.int32, count=len(added)))
+        if not candidates:
+            return np.empty(0, dtype=np.int64)
+        candidates = np.unique(np.concatenate(candidates))
+        # Bỏ cặp cũ: row đó đã tính lại top-K và không còn chứa row này
+        return candidates[(self.neighbor_indices[candidates] == row).any(axis=1)].astype(np.int64)
+    
+    def _add_referrers(self, rows: Iterable[int], indices: np.ndarray):
+        """Ghi nhận rows[i] chứa các láng giềng indices[i] (cập nhật tăng dần sau fit)"""
+        for row, neighbors in zip(rows, indices):
+            for neighbor in neighbors[neighbors >= 0].tolist():
+                self._referrers_added.setdefault(neighbor, set()).add(int(row))
+    
+    def _insert_neighbor(self, row: int, neighbor: int, score: float):
+        """Chèn neighbor vào danh sách đã sắp xếp của row, đẩy láng giềng yếu nhất ra"""
+        indices = self.neighbor_indices[row]
+        scores = self.neighbor_scores[row]
+        pos = int(np.searchsorted(-scores, -score, side="right"))
+        indices[pos + 1:] = indices[pos:-1].copy()
+        scores[pos + 1:] = scores[pos:-1].copy()
+        indices[pos] = neighbor
+        scores[pos] = score
+        self._referrers_added.setdefault(neighbor, set()).add(row)
+    
+    def _track_drift(self, content: str):
+        """Đếm term của bản cập nhật không có trong vocabulary đã fit"""
+        analyzer = self.vectorizer.build_analyzer()
+        vocabulary = self.vectorizer.vocabulary_
+        terms = analyzer(content)
+        self._update_terms += len(terms)
+        self._drift_terms += sum(1 for term in terms if term not in vocabulary)
+    
+    @property
+    def vocabulary_drift(self) -> float:
+        if self._update_terms < VOCAB_DRIFT_MIN_TERMS:
+            return 0.0
+        return self._drift_terms / self._update_terms
+    
+    @property
+    def needs_refit(self) -> bool:
+        """Có cần fit lại toàn bộ không (drift vocabulary, nhiều thay đổi, nhiều row rác)"""
+        if self._refit_requested:
+            return True
+        if not self.is_fitted:
+            return False
+        size = max(self._fitted_size, 1)
+        return (
+            self.vocabulary_drift >= VOCAB_DRIFT_THRESHOLD
+            or self._changes_since_fit >= CHURN_THRESHOLD * size
+            or self._dead_rows >= DEAD_ROWS_THRESHOLD * size
+        )
+    
+    # ---------- MongoDB / background refit ----------
+    
+    def attach(self, collection, projection: Optional[dict] = RECOMMENDER_PROJECTION):
+        """Gắn collection dùng cho load()/refresh()"""
+        self._collection = collection
+        self._projection = projection
+    
+    async def load(self, job: Optional[dict] = None) -> bool:
+        """Đọc toàn bộ sản phẩm (chỉ field cần thiết), fit lại và lưu snapshot"""
+        # Ghi nhận thay đổi từ trước lúc đọc - fit() tắt cờ trong finally của nó
+        self._recording = True
+        try:
+            self._update_job(job, "loading", 10)
+            # Fingerprint lấy trước khi đọc: ghi xen giữa chỉ làm snapshot bị coi là cũ (an toàn)
+            fingerprint = await compute_fingerprint(self._collection)
+            products = await self._collection.find({}, self._projection).to_list(length=None)
+            self._update_job(job, "preparing", 30)
+            success = await self.fit(products, job=job)
+        finally:
+            # Lỗi trước khi fit() chạy: không để _replay tăng mãi tới lần fit sau
+            if not self._lock.locked():
+                self._recording = False
+                self._replay = {}
+        if success:
+            await self.save_snapshot(fingerprint)
+        return success
+    
+    # ---------- snapshot ----------
+    
+    async def restore_snapshot(self) -> bool:
+        """
+        Load snapshot trên đĩa nếu khớp catalog hiện tại (version + fingerprint)
+        
+        Returns:
+            True nếu đã load, False nếu chưa có snapshot / snapshot cũ (cần fit)
+        """
+        meta = read_meta()
+        if meta is None or meta.get("version") != SNAPSHOT_VERSION:
+            return False
+        fingerprint = await compute_fingerprint(self._collection)
+        if meta.get("fingerprint") != fingerprint:
+            logger.info(f"Recommender snapshot stale ({meta.get('fingerprint')} != {fingerprint})")
+            return False
+        try:
+            state = await asyncio.to_thread(load_snapshot, meta)
+        except Exception as e:
+            logger.warning(f"⚠️ Cannot load recommender snapshot {meta['path']}: {e}")
+            return False
+        self._apply_state(state)
+        self._changes_since_snapshot = 0
+        self.snapshot_info = {"path": meta["path"], "created_at": meta.get("created_at"), "fingerprint": fingerprint}
+        logger.info(f"✅ Recommender restored from snapshot {meta['path']} ({self._fitted_size} products)")
+        return True
+    
+    async def save_snapshot(self, fingerprint: Optional[dict] = None) -> bool:
+        """Ghi snapshot (trong thread), lỗi ghi đĩa không ảnh hưởng model đang chạy"""
+        if not self.is_fitted:
+            return False
+        try:
+            if fingerprint is None:
+                fingerprint = await compute_fingerprint(self._collection)
+            changes = self._changes_since_snapshot
+            path = await asyncio.to_thread(save_snapshot, self._snapshot_state(), fingerprint)
+            self._changes_since_snapshot -= changes
+            self.snapshot_info = {"path": path, "created_at": datetime.now().isoformat(), "fingerprint": fingerprint}
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ Cannot save recommender snapshot: {e}")
+            return False
+    
+    # ---------- rebuild jobs ----------
+    
+    def _update_job(self, job: Optional[dict], status: str, progress: int):
+        if job is not None:
+            job["status"] = status
+            job["progress"] = progress
+    
+    def start_rebuild(self, reason: str = "manual") -> dict:
+        """
+        Bắt đầu rebuild nền và trả về job ngay (không chờ fit xong)
+        Đang có job chạy thì trả về job đó, không fit 2 lần song song
+        """
+        if self._current_job is not None and self._current_job["status"] not in ("completed", "failed"):
+            return self._current_job
+        
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "reason": reason,
+            "status": "queued",
+            "progress": 0,
+            "started_at": datetime.now().isoformat(),
+            "finished_at": None,
+            "error": None,
+            "stats": None
+        }
+        self._jobs[job["job_id"]] = job
+        while len(self._jobs) > MAX_TRACKED_JOBS:
+            self._jobs.pop(next(iter(self._jobs)))
+        self._current_job = job
+        
+        task = asyncio.create_task(self._run_job(job))
+        job["_task"] = task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+    
+    async def _run_job(self, job: dict) -> bool:
+        try:
+            success = await self.load(job=job)
+            if success:
+                self._update_job(job, "completed", 100)
+            # Thất bại: fit() đã ghi status/error vào job
+            return success
+        except Exception as e:
+            logger.error(f"❌ Recommender rebuild job {job['job_id']} failed: {e}")
+            job["status"] = "failed"
+            job["error"] = str(e)
+            return False
+        finally:
+            job["finished_at"] = datetime.now().isoformat()
+            job["stats"] = self.get_stats()
+    
+    async def wait_job(self, job: dict) -> bool:
+        """Chờ 1 job rebuild chạy xong (startup / scheduler)"""
+        return await job["_task"]
+    
+    def get_job(self, job_id: str) -> Optional[dict]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        return {key: value for key, value in job.items() if not key.startswith("_")}
+    
+    async def refresh(self, product_id: str):
+        """Đọc lại 1 sản phẩm từ MongoDB và cập nhật tăng dần (xóa nếu không còn)"""
+        if self._collection is None:
+            return
+        try:
+            product = await self._collection.find_one({"_id": ObjectId(product_id)}, self._projection)
+        except Exception as e:
+            logger.warning(f"Recommender refresh failed for {product_id}: {e}")
+            return
+        try:
+            if product is None:
+                self.remove_product(product_id)
+            else:
+                self.upsert_product(product)
+        except Exception as e:
+            logger.error(f"Recommender incremental update failed for {product_id}: {e}")
+            self._refit_requested = True
+    
+    def request_refit(self):
+        """Yêu cầu scheduler fit lại ở lần kiểm tra tiếp theo"""
+        self._refit_requested = True
+    
+    async def _refit_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            if self._lock.locked():
+                continue
+            if not self.needs_refit:
+                # Lưu lại snapshot sau các cập nhật tăng dần để lần khởi động sau không phải fit
+                if self._changes_since_snapshot:
+                    await self.save_snapshot()
+                continue
+            try:
+                logger.info(f"🔄 Background refit (drift={self.vocabulary_drift:.2f}, changes={self._changes_since_fit}, dead={self._dead_rows})")
+                await self.wait_job(self.start_rebuild(reason="scheduler"))
+            except Exception as e:
+                logger.error(f"❌ Background refit failed: {e}")
+    
+    def start_scheduler(self, interval: float = REFIT_CHECK_INTERVAL):
+        if self._scheduler is None or self._scheduler.done():
+            self._scheduler = asyncio.create_task(self._refit_loop(interval))
+    
+    async def stop_scheduler(self):
+        """Dừng scheduler và process pool (shutdown)"""
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+            try:
+                await self._scheduler
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._scheduler = None
+        self._shutdown_executor()
+    
+    def on_invalidate(self, tags: Iterable[str], remote: bool):
+        """Worker khác ghi sản phẩm thì cập nhật model của worker này"""
+        if not remote:
+            return
+        for tag in tags:
+            if tag == "products:reindex":
+                self.request_refit()
+            elif tag.startswith("product:"):
+                task = asyncio.ensure_future(self.refresh(tag.split(":", 1)[1]))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+    
+    def _rows_of(self, product_ids: Optional[Iterable[str]]) -> np.ndarray:
+        """Product ids -> rows (bỏ qua id không có trong model)"""
+        if not product_ids:
+            return np.empty(0, dtype=np.int32)
+        rows = [self._row_of[pid] for pid in product_ids if pid in self._row_of]
+        return np.asarray(rows, dtype=np.int32)
+    
+    def _format(self, rows: np.ndarray, scores: np.ndarray) -> List[Tuple[str, float]]:
+        """Rows + scores -> [(product_id, score)]"""
+        return [
+            (self.product_ids[i], round(score, 4))
+            for i, score in zip(rows.tolist(), scores.tolist())
+        ]
+    
+    def _neighbors_for_row(
+        self,
+        idx: int,
+        n: int,
+        min_similarity: float,
+        exclude_rows: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Top N láng giềng của 1 row (đã sắp xếp sẵn, chỉ cần mask + cắt)"""
+        neighbor_rows = self.neighbor_indices[idx]
+        neighbor_scores = self.neighbor_scores[idx]
+        mask = (neighbor_rows >= 0) & (neighbor_scores >= min_similarity)
+        if exclude_rows.size:
+            mask &= ~np.isin(neighbor_rows, exclude_rows)
+        return neighbor_rows[mask][:n], neighbor_scores[mask][:n]
     
     def get_recommendations(
         self, 
         product_id: str, 
         n: int = 8,
-        min_similarity: float = 0.1
-    ) -> List[dict]:
+        min_similarity: float = 0.1,
+        exclude_ids: Optional[List[str]] = None
+    ) -> List[Tuple[str, float]]:
         """
         Lấy N sản phẩm tương tự nhất
         
@@ -190,62 +902,72 @@ class ProductRecommender:
             product_id: ID sản phẩm cần tìm gợi ý
             n: Số lượng sản phẩm gợi ý (default: 8)
             min_similarity: Ngưỡng similarity tối thiểu (default: 0.1)
+            exclude_ids: List ID sản phẩm cần loại trừ
             
         Returns:
-            List các sản phẩm tương tự với score
+            [(product_id, similarity)] giảm dần theo similarity
         """
         if not self.is_fitted:
             logger.warning("Recommender not fitted yet")
             return []
         
-        if product_id not in self.product_ids:
+        # Tìm row của product - O(1)
+        idx = self._row_of.get(product_id)
+        if idx is None:
             logger.warning(f"Product {product_id} not found in recommender")
             return []
         
         try:
-            # Tìm index của product
-            idx = self.product_ids.index(product_id)
-            
-            # Lấy similarity scores cho product này
-            similarity_scores = self.similarity_matrix[idx]
-            
-            # Tạo list (index, score) và sort theo score giảm dần
-            scored_indices = list(enumerate(similarity_scores))
-            scored_indices.sort(key=lambda x: x[1], reverse=True)
-            
-            recommendations = []
-            for i, score in scored_indices:
-                # Bỏ qua chính sản phẩm đó
-                if i == idx:
-                    continue
-                
-                # Chỉ lấy sản phẩm có similarity >= min_similarity
-                if score < min_similarity:
-                    continue
-                
-                rec_product_id = self.product_ids[i]
-                product_info = self.product_data.get(rec_product_id, {})
-                
-                recommendations.append({
-                    **product_info,
-                    'similarity_score': round(float(score), 4)
-                })
-                
-                if len(recommendations) >= n:
-                    break
-            
-            return recommendations
+            rows, scores = self._neighbors_for_row(idx, n, min_similarity, self._rows_of(exclude_ids))
+            return self._format(rows, scores)
             
         except Exception as e:
             logger.error(f"Error getting recommendations: {str(e)}")
             return []
     
+    def get_similarity_scores(self, product_id: str, min_similarity: float = 0.1) -> Dict[str, float]:
+        """{product_id: similarity} của các láng giềng đã lưu (cho gợi ý hybrid)"""
+        idx = self._row_of.get(product_id) if self.is_fitted else None
+        if idx is None:
+            return {}
+        rows, scores = self._neighbors_for_row(
+            idx, self.neighbor_indices.shape[1], min_similarity, np.empty(0, dtype=np.int32)
+        )
+        return {self.product_ids[i]: score for i, score in zip(rows.tolist(), scores.tolist())}
+    
+    def get_recommendations_batch(
+        self,
+        product_ids: List[str],
+        n: int = 8,
+        min_similarity: float = 0.1,
+        exclude_ids: Optional[List[str]] = None
+    ) -> Dict[str, List[Tuple[str, float]]]:
+        """
+        Lấy gợi ý cho nhiều sản phẩm trong 1 lần gọi (trang giỏ hàng, wishlist, email...)
+        
+        Returns:
+            {product_id: [(product_id, similarity)]} - id không có trong model trả về list rỗng
+        """
+        if not self.is_fitted:
+            return {product_id: [] for product_id in product_ids}
+        
+        exclude_rows = self._rows_of(exclude_ids)
+        results = {}
+        for product_id in product_ids:
+            idx = self._row_of.get(product_id)
+            if idx is None:
+                results[product_id] = []
+                continue
+            rows, scores = self._neighbors_for_row(idx, n, min_similarity, exclude_rows)
+            results[product_id] = self._format(rows, scores)
+        return results
+    
     def get_recommendations_by_content(
         self,
         content: str,
         n: int = 8,
         exclude_ids: List[str] = None
-    ) -> List[dict]:
+    ) -> List[Tuple[str, float]]:
         """
         Lấy gợi ý dựa trên nội dung văn bản (cho search/filter)
         
@@ -255,7 +977,7 @@ class ProductRecommender:
             exclude_ids: List ID sản phẩm cần loại trừ
             
         Returns:
-            List sản phẩm tương tự
+            [(product_id, similarity)] giảm dần theo similarity
         """
         if not self.is_fitted:
             return []
@@ -264,53 +986,105 @@ class ProductRecommender:
             # Transform content thành vector
             content_vector = self.vectorizer.transform([content])
             
-            # Tính similarity với tất cả sản phẩm
-            similarities = cosine_similarity(content_vector, self.tfidf_matrix)[0]
-            
-            # Sort và lấy top N
-            scored_indices = list(enumerate(similarities))
-            scored_indices.sort(key=lambda x: x[1], reverse=True)
-            
-            exclude_ids = exclude_ids or []
-            recommendations = []
-            
-            for i, score in scored_indices:
-                product_id = self.product_ids[i]
-                
-                if product_id in exclude_ids:
-                    continue
-                
-                if score < 0.05:  # Minimum threshold
-                    continue
-                
-                product_info = self.product_data.get(product_id, {})
-                recommendations.append({
-                    **product_info,
-                    'similarity_score': round(float(score), 4)
-                })
-                
-                if len(recommendations) >= n:
-                    break
+            # Tính similarity với tất cả sản phẩm (sparse · sparse, không tạo ma trận N×N)
+            similarities = cosine_similarity(content_vector, self.tfidf_matrix, dense_output=False).toarray()[0]
             
-            return recommendations
+            # Threshold + loại trừ bằng mask, top N bằng argpartition thay vì sort cả catalog
+            mask = similarities >= 0.05  # Minimum threshold
+            exclude_rows = self._rows_of(exclude_ids)
+            if exclude_rows.size:
+                mask[exclude_rows] = False
+            candidates = np.flatnonzero(mask)
+            if candidates.size > n:
+                candidates = candidates[np.argpartition(-similarities[candidates], n - 1)[:n]]
+            candidates = candidates[np.argsort(-similarities[candidates], kind="stable")]
             
+            return self._format(candidates, similarities[candidates])
+
         except Exception as e:
             logger.error(f"Error in content-based search: {str(e)}")
             return []
-    
+
+    def get_recommendations_for_profile(
+        self,
+        weights: Dict[str, float],
+        n: int = 8,
+        min_similarity: float = 0.05,
+        exclude_ids: Optional[Iterable[str]] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Gợi ý cá nhân hóa từ profile user
+
+        Profile = tổng có trọng số các vector TF-IDF của sản phẩm user đã tương tác
+        (wishlist, giỏ hàng, đơn hàng), chuẩn hóa L2 -> score mọi sản phẩm bằng
+        1 sparse mat-vec, O(nnz) thay vì so từng cặp
+
+        Args:
+            weights: {product_id: trọng số tương tác}
+            exclude_ids: Sản phẩm cần loại trừ (thường là chính các sản phẩm trong profile)
+
+        Returns:
+            [(product_id, score)] giảm dần theo score
+        """
+        if not self.is_fitted:
+            return []
+
+        known = [(self._row_of[pid], weight) for pid, weight in weights.items() if pid in self._row_of]
+        if not known:
+            return []
+        rows = np.fromiter((row for row, _ in known), dtype=np.int32, count=len(known))
+        row_weights = np.fromiter((weight for _, weight in known), dtype=np.float32, count=len(known))
+
+        profile = sp.csr_matrix(row_weights[None, :]) @ self.tfidf_matrix[rows]
+        norm = np.sqrt(profile.multiply(profile).sum())
+        if norm == 0:
+            return []
+        profile = profile / norm
+
+        similarities = (self.tfidf_matrix @ profile.T).toarray().ravel()
+        mask = similarities >= min_similarity
+        exclude_rows = self._rows_of(exclude_ids)
+        if exclude_rows.size:
+            mask[exclude_rows] = False
+        candidates = np.flatnonzero(mask)
+        if candidates.size > n:
+            candidates = candidates[np.argpartition(-similarities[candidates], n - 1)[:n]]
+        candidates = candidates[np.argsort(-similarities[candidates], kind="stable")]
+        return [
+            (self.product_ids[i], round(float(similarities[i]), 4))
+            for i in candidates.tolist()
+        ]
+
     def mark_dirty(self):
         """
         Đánh dấu cần rebuild model (khi có thay đổi sản phẩm)
+        Model hiện tại vẫn phục vụ request, scheduler nền sẽ fit lại
         """
-        self.is_fitted = False
-        logger.info("📌 Recommender marked as dirty, needs rebuild")
+        self.request_refit()
+        logger.info("📌 Recommender marked as dirty, will refit in background")
+    
+    def _neighbors_nbytes(self) -> int:
+        if self.neighbor_indices is None:
+            return 0
+        return (
+            self.neighbor_indices.nbytes + self.neighbor_scores.nbytes
+            + self._referrers.nbytes + self._referrers_indptr.nbytes
+        )
     
     def get_stats(self) -> dict:
         """Lấy thống kê về recommender"""
         return {
             'is_fitted': self.is_fitted,
-            'total_products': len(self.product_ids),
+            'total_products': len(self._row_of),
             'total_features': self.tfidf_matrix.shape[1] if self.tfidf_matrix is not None else 0,
+            'neighbors_per_product': self.neighbor_indices.shape[1] if self.neighbor_indices is not None else 0,
+            'neighbors_memory_bytes': self._neighbors_nbytes(),
+            'changes_since_fit': self._changes_since_fit,
+            'dead_rows': self._dead_rows,
+            'vocabulary_drift': round(self.vocabulary_drift, 4),
+            'needs_refit': self.needs_refit,
+            'current_job': self._current_job["job_id"] if self._current_job else None,
+            'snapshot': self.snapshot_info,
             'last_updated': self.last_updated.isoformat() if self.last_updated else None
         }
 
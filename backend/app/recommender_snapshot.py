@@ -0,0 +1,177 @@
+"""
+Snapshot trên đĩa cho ProductRecommender - khởi động nhanh không cần fit lại
+
+Layout (mỗi snapshot 1 thư mục, CURRENT trỏ tới snapshot mới nhất):
+    {RECOMMENDER_SNAPSHOT_DIR}/
+        CURRENT                     -> tên thư mục snapshot hiện tại
+        v{version}-{timestamp}/
+            meta.json               -> version, fingerprint catalog, kích thước
+            tfidf_data.npy          -> CSR data (float32)
+            tfidf_indices.npy       -> CSR indices (int32)
+            tfidf_indptr.npy        -> CSR indptr
+            neighbor_indices.npy    -> int32 [N, K]
+            neighbor_scores.npy     -> float32 [N, K]
+            products.pkl            -> product_ids, content hashes
+            vectorizer.pkl          -> TfidfVectorizer đã fit
+
+Các mảng numpy được load bằng mmap (copy-on-write): không copy lúc khởi động,
+trang nào bị cập nhật tăng dần mới được copy vào RAM. Vectorizer được unpickle ngay
+khi load: sau đó worker không còn mở file nào theo đường dẫn, snapshot cũ bị _prune
+(do worker khác lưu bản mới) không làm hỏng model đang chạy - mmap vẫn giữ inode.
+Snapshot chỉ dùng khi version và fingerprint (số sản phẩm + max updated_at) khớp DB.
+"""
+
+import json
+import logging
+import os
+import pickle
+import shutil
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import numpy as np
+import scipy.sparse as sp
+
+logger = logging.getLogger(__name__)
+
+RECOMMENDER_SNAPSHOT_DIR = os.getenv("RECOMMENDER_SNAPSHOT_DIR", "data/recommender")
+# Tăng khi đổi format hoặc cách tính model (content, vectorizer, K) - snapshot cũ bị bỏ qua
+SNAPSHOT_VERSION = 2
+SNAPSHOTS_TO_KEEP = 2
+
+_ARRAYS = ("tfidf_data", "tfidf_indices", "tfidf_indptr", "neighbor_indices", "neighbor_scores")
+
+
+async def compute_fingerprint(collection) -> Dict[str, Any]:
+    """Fingerprint catalog: số sản phẩm + updated_at lớn nhất (dùng index updated_at, không scan)"""
+    count = await collection.count_documents({})
+    latest = await collection.find_one({}, {"updated_at": 1}, sort=[("updated_at", -1)])
+    updated_at = latest.get("updated_at") if latest else None
+    if isinstance(updated_at, datetime):
+        updated_at = updated_at.isoformat()
+    return {"count": count, "max_updated_at": str(updated_at) if updated_at is not None else None}
+
+
+def _current_path(directory: str) -> Optional[str]:
+    try:
+        with open(os.path.join(directory, "CURRENT"), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    path = os.path.join(directory, name)
+    return path if name and os.path.isdir(path) else None
+
+
+def read_meta(directory: Optional[str] = None) -> Optional[dict]:
+    """meta.json của snapshot hiện tại (None nếu chưa có / hỏng)"""
+    path = _current_path(directory or RECOMMENDER_SNAPSHOT_DIR)
+    if path is None:
+        return None
+    try:
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    meta["path"] = path
+    return meta
+
+
+def save_snapshot(state: dict, fingerprint: dict, directory: Optional[str] = None) -> str:
+    """
+    Ghi snapshot ra thư mục tạm rồi rename + cập nhật CURRENT (atomic)
+    Nhiều worker cùng ghi cũng không làm hỏng snapshot đang được đọc
+
+    Args:
+        state: tfidf_matrix, neighbor_indices, neighbor_scores, product_ids,
+               content_hashes, vectorizer
+        directory: None = RECOMMENDER_SNAPSHOT_DIR (đọc lúc gọi)
+    """
+    directory = directory or RECOMMENDER_SNAPSHOT_DIR
+    os.makedirs(directory, exist_ok=True)
+    name = f"v{SNAPSHOT_VERSION}-{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    tmp_path = os.path.join(directory, f".tmp-{name}")
+    final_path = os.path.join(directory, name)
+    os.makedirs(tmp_path)
+    try:
+        tfidf_matrix = sp.csr_matrix(state["tfidf_matrix"])
+        arrays = {
+            "tfidf_data": tfidf_matrix.data.astype(np.float32, copy=False),
+            "tfidf_indices": tfidf_matrix.indices,
+            "tfidf_indptr": tfidf_matrix.indptr,
+            "neighbor_indices": state["neighbor_indices"],
+            "neighbor_scores": state["neighbor_scores"],
+        }
+        for key, array in arrays.items():
+            np.save(os.path.join(tmp_path, f"{key}.npy"), np.ascontiguousarray(array))
+
+        with open(os.path.join(tmp_path, "products.pkl"), "wb") as f:
+            pickle.dump({
+                "product_ids": state["product_ids"],
+                "content_hashes": state["content_hashes"],
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(os.path.join(tmp_path, "vectorizer.pkl"), "wb") as f:
+            pickle.dump(state["vectorizer"], f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        meta = {
+            "version": SNAPSHOT_VERSION,
+            "fingerprint": fingerprint,
+            "created_at": datetime.now().isoformat(),
+            "shape": list(tfidf_matrix.shape),
+            "neighbors_per_product": int(arrays["neighbor_indices"].shape[1]),
+        }
+        with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+        os.replace(tmp_path, final_path)
+        current_tmp = os.path.join(directory, f".CURRENT-{os.getpid()}")
+        with open(current_tmp, "w", encoding="utf-8") as f:
+            f.write(name)
+        os.replace(current_tmp, os.path.join(directory, "CURRENT"))
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    _prune(directory, keep=name)
+    return final_path
+
+
+def _prune(directory: str, keep: str):
+    """Giữ SNAPSHOTS_TO_KEEP snapshot mới nhất (worker khác có thể vẫn đang mmap bản trước)"""
+    snapshots = sorted(
+        (entry for entry in os.listdir(directory) if entry.startswith("v") and entry != keep),
+        reverse=True
+    )
+    for entry in snapshots[SNAPSHOTS_TO_KEEP - 1:]:
+        shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+
+
+def load_snapshot(meta: dict) -> dict:
+    """
+    Load snapshot (mmap copy-on-write cho các mảng numpy)
+
+    Returns:
+        state giống save_snapshot
+    """
+    path = meta["path"]
+    arrays = {
+        key: np.load(os.path.join(path, f"{key}.npy"), mmap_mode="c")
+        for key in _ARRAYS
+    }
+    tfidf_matrix = sp.csr_matrix(
+        (arrays["tfidf_data"], arrays["tfidf_indices"], arrays["tfidf_indptr"]),
+        shape=tuple(meta["shape"]),
+        copy=False
+    )
+    with open(os.path.join(path, "products.pkl"), "rb") as f:
+        products = pickle.load(f)
+    with open(os.path.join(path, "vectorizer.pkl"), "rb") as f:
+        vectorizer = pickle.load(f)
+    return {
+        "tfidf_matrix": tfidf_matrix,
+        "neighbor_indices": arrays["neighbor_indices"],
+        "neighbor_scores": arrays["neighbor_scores"],
+        "vectorizer": vectorizer,
+        **products,
+    }
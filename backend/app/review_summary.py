@@ -0,0 +1,227 @@
+"""
+Tóm tắt đánh giá của sản phẩm, lưu ngay trong products.rating
+
+    rating: {
+        "average": 4.3,                                  # làm tròn 1 chữ số
+        "count": 120,
+        "sum": 516,
+        "distribution": {"1": 2, "2": 3, "3": 10, "4": 40, "5": 65}
+    }
+
+Trang chi tiết sản phẩm đọc phân bố sao từ đây thay vì quét toàn bộ reviews.
+Sản phẩm cũ chỉ có {average, count} được tính lại bằng 1 lệnh $group ở lần đọc đầu tiên.
+
+Mỗi lần tạo / sửa / xóa review chỉ $inc count, sum, distribution (atomic, không đọc lại
+reviews), average được đặt lại từ đúng giá trị vừa $inc. RatingReconciler chạy nền định kỳ:
+1 lệnh $group trên toàn bộ reviews rồi sửa các sản phẩm bị lệch (ghi lỗi giữa chừng, sửa tay DB...).
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+RATING_STARS = (1, 2, 3, 4, 5)
+RECONCILE_INTERVAL = 6 * 3600   # Đối soát lại toàn bộ định kỳ (seconds)
+RECONCILE_BATCH_SIZE = 500      # Batch cursor khi duyệt products
+
+
+def empty_rating() -> dict:
+    return {"average": 0.0, "count": 0, "sum": 0, "distribution": {str(star): 0 for star in RATING_STARS}}
+
+
+def has_summary(rating: Optional[dict]) -> bool:
+    """products.rating đã có đủ sum + distribution (không phải dạng cũ {average, count})"""
+    return isinstance(rating, dict) and isinstance(rating.get("distribution"), dict) and "sum" in rating
+
+
+def rating_from_counts(counts: Dict[int, int]) -> dict:
+    """{số sao: số review} -> products.rating"""
+    rating = empty_rating()
+    for star in RATING_STARS:
+        count = int(counts.get(star, 0))
+        rating["distribution"][str(star)] = count
+        rating["count"] += count
+        rating["sum"] += star * count
+    rating["average"] = round(rating["sum"] / rating["count"], 1) if rating["count"] else 0.0
+    return rating
+
+
+def distribution_of(rating: Optional[dict]) -> Dict[int, int]:
+    """Phân bố sao dạng {1: n, ..., 5: n} cho response"""
+    distribution = (rating or {}).get("distribution") or {}
+    return {star: int(distribution.get(str(star), 0)) for star in RATING_STARS}
+
+
+async def compute_rating(reviews_collection, product_id: str) -> dict:
+    """Tính lại tóm tắt của 1 sản phẩm bằng 1 lệnh $group (chạy trên MongoDB, không tải review về)"""
+    pipeline = [
+        {"$match": {"product_id": product_id, "rating": {"$in": list(RATING_STARS)}}},
+        {"$group": {"_id": "$rating", "count": {"$sum": 1}}},
+    ]
+    counts = {}
+    async for row in reviews_collection.aggregate(pipeline):
+        counts[row["_id"]] = row["count"]
+    return rating_from_counts(counts)
+
+
+def _average(rating: dict) -> float:
+    count = rating.get("count", 0)
+    return round(rating.get("sum", 0) / count, 1) if count > 0 else 0.0
+
+
+async def apply_rating_change(products_collection, reviews_collection, product_id: str,
+                              added: Optional[int] = None, removed: Optional[int] = None) -> Optional[dict]:
+    """
+    Cập nhật products.rating sau khi 1 review được tạo (added), xóa (removed) hoặc đổi số sao (cả hai)
+    Gọi SAU khi đã ghi review. Trả về rating mới (None nếu không có sản phẩm)
+    """
+    inc: Dict[str, int] = {}
+    for star, sign in ((added, 1), (removed, -1)):
+        if star in RATING_STARS:
+            inc["rating.count"] = inc.get("rating.count", 0) + sign
+            inc["rating.sum"] = inc.get("rating.sum", 0) + sign * star
+            key = f"rating.distribution.{star}"
+            inc[key] = inc.get(key, 0) + sign
+    inc = {key: value for key, value in inc.items() if value}
+    if not inc:
+        return None
+
+    # Chỉ $inc khi đã có tóm tắt đầy đủ - dạng cũ {average, count} thì tính lại bằng $group
+    product = await products_collection.find_one_and_update(
+        {"_id": ObjectId(product_id), "rating.sum": {"$exists": True}},
+        {"$inc": inc},
+        projection={"rating": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if product is None:
+        rating = await compute_rating(reviews_collection, product_id)
+        result = await products_collection.update_one({"_id": ObjectId(product_id)}, {"$set": {"rating": rating}})
+        return rating if result.matched_count else None
+
+    rating = product["rating"]
+    rating["average"] = _average(rating)
+    # Ghi average chỉ khi count/sum chưa bị request khác $inc tiếp - request đó sẽ tự ghi average của nó
+    await products_collection.update_one(
+        {"_id": product["_id"], "rating.count": rating["count"], "rating.sum": rating["sum"]},
+        {"$set": {"rating.average": rating["average"]}}
+    )
+    return rating
+
+
+class RatingReconciler:
+    """Đối soát products.rating với reviews bằng 1 lệnh $group, sửa các sản phẩm bị lệch"""
+
+    def __init__(self):
+        self._products_collection = None
+        self._reviews_collection = None
+        self._on_repaired: Optional[Callable[[str], Awaitable]] = None
+        self._lock = asyncio.Lock()
+        self._scheduler: Optional[asyncio.Task] = None
+        self.last_run: Optional[dict] = None
+
+    def attach(self, products_collection, reviews_collection, on_repaired: Optional[Callable[[str], Awaitable]] = None):
+        """on_repaired(product_id): đồng bộ index in-memory sau khi sửa 1 sản phẩm"""
+        self._products_collection = products_collection
+        self._reviews_collection = reviews_collection
+        self._on_repaired = on_repaired
+
+    @staticmethod
+    def _matches(current: Optional[dict], expected: dict) -> bool:
+        return (
+            has_summary(current)
+            and current.get("count") == expected["count"]
+            and current.get("sum") == expected["sum"]
+            and current.get("average") == expected["average"]
+            and distribution_of(current) == distribution_of(expected)
+        )
+
+    async def reconcile(self) -> dict:
+        if self._products_collection is None:
+            return {"checked": 0, "repaired": 0}
+        async with self._lock:
+            started = datetime.now()
+            pipeline = [
+                {"$match": {"rating": {"$in": list(RATING_STARS)}}},
+                {"$group": {"_id": {"product_id": "$product_id", "rating": "$rating"}, "count": {"$sum": 1}}},
+            ]
+            counts: Dict[str, Dict[int, int]] = {}
+            async for row in self._reviews_collection.aggregate(pipeline, allowDiskUse=True):
+                key = row["_id"]
+                counts.setdefault(str(key["product_id"]), {})[key["rating"]] = row["count"]
+
+            checked = 0
+            repaired_ids = []
+            cursor = self._products_collection.find({}, {"rating": 1}).batch_size(RECONCILE_BATCH_SIZE)
+            async for product in cursor:
+                checked += 1
+                product_id = str(product["_id"])
+                current = product.get("rating")
+                if self._matches(current, rating_from_counts(counts.get(product_id, {}))):
+                    continue
+                # Lệch: có thể do review ghi sau lệnh $group ở trên -> tính lại riêng sản phẩm này,
+                # chỉ ghi nếu rating chưa đổi kể từ lúc đọc
+                expected = await compute_rating(self._reviews_collection, product_id)
+                if self._matches(current, expected):
+                    continue
+                result = await self._products_collection.update_one(
+                    {"_id": product["_id"], "rating": current}, {"$set": {"rating": expected}}
+                )
+                if result.modified_count:
+                    repaired_ids.append(product_id)
+
+            if self._on_repaired is not None:
+                for product_id in repaired_ids:
+                    try:
+                        await self._on_repaired(product_id)
+                    except Exception as e:
+                        logger.warning(f"Rating reconcile: sync {product_id} failed: {e}")
+
+            self.last_run = {
+                "at": started.isoformat(),
+                "duration_ms": round((datetime.now() - started).total_seconds() * 1000, 1),
+                "checked": checked,
+                "repaired": len(repaired_ids),
+            }
+            if repaired_ids:
+                logger.warning(f"Rating reconcile repaired {len(repaired_ids)}/{checked} products")
+            else:
+                logger.info(f"Rating reconcile: {checked} products in sync")
+            return self.last_run
+
+    async def _reconcile_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.error(f"Rating reconcile failed: {e}")
+
+    def start_scheduler(self, interval: float = RECONCILE_INTERVAL):
+        if self._scheduler is None or self._scheduler.done():
+            self._scheduler = asyncio.create_task(self._reconcile_loop(interval))
+
+    async def stop_scheduler(self):
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+            try:
+                await self._scheduler
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._scheduler = None
+
+    def get_stats(self) -> dict:
+        return {
+            "scheduled": self._scheduler is not None and not self._scheduler.done(),
+            "interval_seconds": RECONCILE_INTERVAL,
+            "last_run": self.last_run,
+        }
+
+
+# Singleton instance
+rating_reconciler = RatingReconciler()
@@ -130,7 +130,8 @@ class CategoryUpdate(BaseModel):
 
 class CategoryResponse(CategoryBase):
     id: str = Field(..., description="ID danh mục")
-    product_count: int = Field(0, description="Số lượng sản phẩm")
+    product_count: int = Field(0, description="Số lượng sản phẩm (cả danh mục con)")
+    direct_product_count: Optional[int] = Field(0, description="Số lượng sản phẩm trực tiếp trong danh mục")
     subcategories_count: Optional[int] = Field(0, description="Số lượng danh mục con")
     created_at: Optional[str] = None
     updated_at: Optional[str] = None
@@ -237,9 +238,35 @@ class ProductListResponse(BaseModel):
     success: bool
     products: list[ProductResponse]
     total: int
-    page: int = 1
+    page: Optional[int] = Field(1, description="Trang hiện tại (null khi phân trang bằng cursor)")
     limit: int = 24
     totalPages: int = 0
+    next_cursor: Optional[str] = Field(None, description="Cursor cho trang tiếp theo (keyset pagination)")
+    total_is_estimate: bool = Field(False, description="total là giá trị ước lượng/cache, không phải đếm chính xác")
+    facets: Optional[dict] = Field(None, description="Số lượng theo sizes/colors/brands/categories/status và khoảng giá (include_facets=true)")
+
+class ProductSearchResponse(ProductListResponse):
+    query: str
+    scores: dict[str, float] = Field(default_factory=dict, description="Điểm BM25 theo product id")
+
+class AutocompleteProduct(BaseModel):
+    id: str
+    name: str
+    slug: str
+    image: Optional[str] = None
+    pricing: Optional[dict] = None
+
+class AutocompleteResponse(BaseModel):
+    success: bool
+    query: str
+    terms: list[str] = Field(default_factory=list, description="Gợi ý hoàn thành từ khóa (có dấu)")
+    products: list[AutocompleteProduct] = Field(default_factory=list)
+
+class RecommendationBatchRequest(BaseModel):
+    product_ids: list[str] = Field(..., min_length=1, max_length=100, description="Danh sách ID sản phẩm")
+    limit: int = Field(8, ge=1, le=20, description="Số gợi ý mỗi sản phẩm")
+    exclude_input: bool = Field(True, description="Loại các sản phẩm đầu vào khỏi kết quả")
+    in_stock_only: bool = Field(True, description="Chỉ gợi ý sản phẩm còn hàng")
 
 class ProductDeleteResponse(BaseModel):
     success: bool
@@ -258,6 +285,15 @@ class WishlistResponse(BaseModel):
     wishlist: list[WishlistItem]
     total: int
 
+class WishlistProductResponse(ProductResponse):
+    added_at: Optional[str] = None
+    is_available: bool = Field(True, description="Còn bán (active và còn hàng)")
+    unavailable_reason: Optional[str] = Field(None, description="inactive / out_of_stock")
+
+class WishlistProductListResponse(ProductListResponse):
+    products: list[WishlistProductResponse]
+    missing: list[WishlistItem] = Field(default_factory=list, description="Sản phẩm trong trang hiện tại đã bị xóa")
+
 class WishlistToggleResponse(BaseModel):
     success: bool
     message: str
@@ -275,6 +311,11 @@ class ReviewBase(BaseModel):
 class ReviewCreate(ReviewBase):
     pass
 
+class ReviewUpdate(BaseModel):
+    user_id: str = Field(..., description="Người viết review")
+    rating: Optional[int] = Field(None, ge=1, le=5, description="Đánh giá từ 1-5 sao")
+    comment: Optional[str] = Field(None, max_length=2000, description="Bình luận")
+
 class ReviewResponse(ReviewBase):
     id: str = Field(..., description="ID đánh giá")
     user_name: str = Field(..., description="Tên người dùng")
@@ -288,6 +329,8 @@ class ReviewListResponse(BaseModel):
     total: int
     average_rating: float = Field(0.0, ge=0, le=5)
     rating_distribution: dict = Field(default_factory=dict)  # {1: count, 2: count, ...}
+    limit: int = 20
+    next_cursor: Optional[str] = Field(None, description="Cursor cho trang tiếp theo (keyset pagination)")
 
 
 # Order Schemas
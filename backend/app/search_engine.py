@@ -0,0 +1,545 @@
+"""
+Full-text search engine cho sản phẩm (in-memory)
+
+- Inverted index trên name, sku, category, brand, màu sắc, short_description
+  sau khi fold_text (không dấu, đ -> d): "ao thun" khớp "Áo Thun"
+- Xếp hạng BM25F: mỗi field có trọng số và chuẩn hóa độ dài riêng. Điểm trong posting
+  list được tính theo độ dài trung bình lúc chấm; khi độ dài trung bình hiện tại lệch quá
+  AVG_LENGTH_DRIFT (do thêm/sửa/xóa), toàn bộ posting được chấm lại
+- Từ cuối của query khớp theo prefix (gõ tới đâu tìm tới đó / autocomplete)
+- Chịu lỗi chính tả: ứng viên tìm qua symmetric delete (SymSpell),
+  kiểm tra lại bằng khoảng cách Damerau-Levenshtein
+- Các từ trong query phải cùng khớp (AND), không có kết quả thì nới thành OR
+
+Query chỉ chạm vào posting list của các từ trong query (numpy), không quét collection.
+"""
+
+import asyncio
+import bisect
+import functools
+import logging
+import math
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from bson import ObjectId
+
+from app.text_utils import iter_surface_tokens, tokenize
+
+logger = logging.getLogger(__name__)
+
+# Field -> trọng số BM25F
+FIELD_WEIGHTS: Dict[str, float] = {
+    "name": 3.0,
+    "sku": 2.0,
+    "category": 2.0,
+    "brand": 1.5,
+    "colors": 1.0,
+    "description": 1.0,
+}
+_FIELDS = list(FIELD_WEIGHTS)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+AVG_LENGTH_DRIFT = 0.1       # Lệch độ dài trung bình (tương đối) để chấm lại toàn bộ posting
+
+PREFIX_MIN_LENGTH = 2        # Prefix ngắn hơn thì chỉ khớp chính xác
+PREFIX_MAX_EXPANSIONS = 30   # Số từ tối đa mở rộng từ 1 prefix (ưu tiên từ phổ biến)
+PREFIX_WEIGHT = 0.8
+TYPO_MIN_LENGTH = 4          # Từ ngắn hơn không sửa lỗi chính tả (quá nhiều ứng viên)
+TYPO_WEIGHT = 0.6
+
+
+def _field_texts(product: dict) -> Dict[str, str]:
+    """Lấy nội dung văn bản của từng field"""
+    category = product.get("category") or {}
+    brand = product.get("brand") or {}
+    variants = product.get("variants") or {}
+    colors = variants.get("colors", []) if isinstance(variants, dict) else []
+    return {
+        "name": product.get("name") or "",
+        "sku": product.get("sku") or "",
+        "category": category.get("name", "") if isinstance(category, dict) else "",
+        "brand": brand.get("name", "") if isinstance(brand, dict) else "",
+        "colors": " ".join(
+            c.get("name", "") for c in colors if isinstance(c, dict)
+        ) if isinstance(colors, list) else "",
+        "description": product.get("short_description") or "",
+    }
+
+
+@functools.lru_cache(maxsize=65536)
+def _fold_token(surface: str) -> Tuple[str, ...]:
+    """Fold 1 từ (đã NFC + lower) - cache vì vocabulary nhỏ hơn rất nhiều so với số từ"""
+    return tuple(tokenize(surface))
+
+
+def _deletes(term: str) -> Set[str]:
+    """Các biến thể xóa 1 ký tự (symmetric delete)"""
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+def _edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Damerau-Levenshtein (optimal string alignment), dừng sớm khi vượt max_distance"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = current[0]
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (
+                previous_previous is not None
+                and i > 1 and j > 1
+                and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]
+            ):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+            row_min = min(row_min, current[j])
+        if row_min > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+class ProductSearchEngine:
+    """
+    Search engine cho products
+
+    Workflow:
+    1. build(products) khi startup (cùng projection với facet index)
+    2. upsert(product) / remove(product_id) sau mỗi lần ghi sản phẩm
+    3. search(q) -> (product ids theo thứ tự điểm, total); autocomplete(q)
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._collection = None
+        self._projection: Optional[dict] = None
+        self._tasks: set = set()
+        self._reset()
+        self.is_ready = False
+        self.last_built: Optional[datetime] = None
+
+    def _reset(self):
+        self._ids: List[Optional[str]] = []
+        self._row_of: Dict[str, int] = {}
+        self._free_rows: List[int] = []
+        self._row_terms: List[Optional[List[str]]] = []
+        self._row_fields: List[Optional[Dict[str, List[str]]]] = []
+        self._row_status: List[Optional[str]] = []
+        self._row_category: List[Optional[str]] = []
+        self._row_meta: List[Optional[dict]] = []
+        # term -> {row: điểm BM25F đã bão hòa (chưa nhân idf)}
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._vocab: List[str] = []                 # sorted, cho prefix
+        self._delete_index: Dict[str, Set[str]] = {}  # biến thể xóa 1 ký tự -> terms
+        self._display: Dict[str, str] = {}          # term không dấu -> dạng hiển thị có dấu
+        self._length_sums: Dict[str, int] = {field: 0 for field in _FIELDS}
+        self._doc_count = 0
+        # Độ dài trung bình dùng để chấm các posting hiện có
+        self._scored_avgs: Dict[str, float] = {field: 1.0 for field in _FIELDS}
+        self.rescored = 0
+        # Cache numpy theo term / theo row, xóa khi có ghi
+        self._posting_arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._row_arrays: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    # ---------- build / maintain ----------
+
+    def attach(self, collection, projection: Optional[dict] = None):
+        """Gắn collection + projection dùng cho load()/refresh()"""
+        self._collection = collection
+        self._projection = projection
+
+    async def load(self) -> int:
+        products = await self._collection.find({}, self._projection).to_list(length=None)
+        self.build(products)
+        return len(products)
+
+    def build(self, products: List[dict]):
+        with self._lock:
+            self._reset()
+            analyzed = []
+            for product in products:
+                product_id = str(product.get("_id", ""))
+                if not product_id or product_id in self._row_of:
+                    continue
+                field_terms = self._analyze(product)
+                for field in _FIELDS:
+                    self._length_sums[field] += len(field_terms[field])
+                self._doc_count += 1
+                self._row_of[product_id] = len(analyzed)
+                analyzed.append((product_id, product, field_terms))
+
+            # Độ dài trung bình tính xong mới chấm điểm được
+            self._scored_avgs = self._current_avgs()
+            for product_id, product, field_terms in analyzed:
+                self._insert(product_id, product, field_terms, count_lengths=False)
+            self.is_ready = True
+            self.last_built = datetime.now()
+        logger.info(f"Search index built with {self._doc_count} products, {len(self._postings)} terms")
+
+    async def refresh(self, product_id: str):
+        """Đọc lại 1 sản phẩm từ MongoDB và cập nhật index (xóa nếu không còn)"""
+        if not self.is_ready or self._collection is None:
+            return
+        try:
+            product = await self._collection.find_one({"_id": ObjectId(product_id)}, self._projection)
+        except Exception as e:
+            logger.warning(f"Search index refresh failed for {product_id}: {e}")
+            return
+        if product is None:
+            self.remove(product_id)
+        else:
+            self.upsert(product)
+
+    def upsert(self, product: dict):
+        with self._lock:
+            product_id = str(product.get("_id", ""))
+            if not product_id:
+                return
+            if product_id in self._row_of:
+                self._unlink(self._row_of[product_id])
+            self._insert(product_id, product, self._analyze(product))
+            self._rescore_if_drifted()
+
+    def remove(self, product_id: str):
+        with self._lock:
+            row = self._row_of.get(product_id)
+            if row is not None:
+                self._unlink(row)
+                self._rescore_if_drifted()
+
+    def _analyze(self, product: dict) -> Dict[str, List[str]]:
+        field_terms = {}
+        for field, text in _field_texts(product).items():
+            terms = []
+            for surface in iter_surface_tokens(text):
+                folded = _fold_token(surface)
+                terms.extend(folded)
+                # Ghi nhớ dạng có dấu để hiển thị gợi ý (field đầu tiên - name - được ưu tiên)
+                if len(folded) == 1 and folded[0] not in self._display:
+                    self._display[folded[0]] = surface
+            field_terms[field] = terms
+        return field_terms
+
+    def _insert(self, product_id: str, product: dict, field_terms: Dict[str, List[str]], count_lengths: bool = True):
+        if count_lengths:
+            for field in _FIELDS:
+                self._length_sums[field] += len(field_terms[field])
+            self._doc_count += 1
+
+        if product_id in self._row_of and self._row_of[product_id] >= len(self._ids):
+            row = len(self._ids)  # build(): row đã được gán theo thứ tự
+        elif self._free_rows:
+            row = self._free_rows.pop()
+        else:
+            row = len(self._ids)
+        if row == len(self._ids):
+            self._ids.append(None)
+            self._row_terms.append(None)
+            self._row_fields.append(None)
+            self._row_status.append(None)
+            self._row_category.append(None)
+            self._row_meta.append(None)
+
+        pseudo_tf = self._pseudo_tf(field_terms)
+        for term, tf in pseudo_tf.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                bisect.insort(self._vocab, term)
+                if len(term) >= TYPO_MIN_LENGTH - 1:
+                    for variant in _deletes(term):
+                        self._delete_index.setdefault(variant, set()).add(term)
+            postings[row] = tf * (BM25_K1 + 1) / (tf + BM25_K1)
+            self._posting_arrays.pop(term, None)
+
+        category = product.get("category") or {}
+        self._ids[row] = product_id
+        self._row_terms[row] = list(pseudo_tf)
+        self._row_fields[row] = field_terms
+        self._row_status[row] = product.get("status", "active")
+        self._row_category[row] = category.get("slug") if isinstance(category, dict) else None
+        self._row_meta[row] = {
+            "id": product_id,
+            "name": product.get("name", ""),
+            "slug": product.get("slug", ""),
+            "image": product.get("image", ""),
+            "pricing": product.get("pricing", {}),
+        }
+        self._row_of[product_id] = row
+        self._row_arrays = None
+
+    def _unlink(self, row: int):
+        for term in self._row_terms[row] or []:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(row, None)
+            self._posting_arrays.pop(term, None)
+            if not postings:
+                del self._postings[term]
+                self._display.pop(term, None)
+                pos = bisect.bisect_left(self._vocab, term)
+                if pos < len(self._vocab) and self._vocab[pos] == term:
+                    self._vocab.pop(pos)
+                if len(term) >= TYPO_MIN_LENGTH - 1:
+                    for variant in _deletes(term):
+                        terms = self._delete_index.get(variant)
+                        if terms is not None:
+                            terms.discard(term)
+                            if not terms:
+                                del self._delete_index[variant]
+
+        for field, terms in (self._row_fields[row] or {}).items():
+            self._length_sums[field] -= len(terms)
+        self._doc_count -= 1
+
+        self._row_of.pop(self._ids[row], None)
+        self._ids[row] = None
+        self._row_terms[row] = None
+        self._row_fields[row] = None
+        self._row_status[row] = None
+        self._row_category[row] = None
+        self._row_meta[row] = None
+        self._free_rows.append(row)
+        self._row_arrays = None
+
+    def _current_avgs(self) -> Dict[str, float]:
+        if not self._doc_count:
+            return {field: 1.0 for field in _FIELDS}
+        return {field: (self._length_sums[field] / self._doc_count) or 1.0 for field in _FIELDS}
+
+    def _pseudo_tf(self, field_terms: Dict[str, List[str]]) -> Dict[str, float]:
+        """BM25F: tf' = sum(w_f * tf_f / (1 - b + b * len_f / avg_f)) theo độ dài trung bình đã chấm"""
+        pseudo_tf: Dict[str, float] = {}
+        for field, terms in field_terms.items():
+            if not terms:
+                continue
+            norm = 1 - BM25_B + BM25_B * len(terms) / self._scored_avgs[field]
+            weight = FIELD_WEIGHTS[field] / norm
+            for term in terms:
+                pseudo_tf[term] = pseudo_tf.get(term, 0.0) + weight
+        return pseudo_tf
+
+    def _rescore_if_drifted(self):
+        """
+        Chấm lại mọi posting khi độ dài trung bình lệch quá AVG_LENGTH_DRIFT so với lúc chấm
+
+        Mỗi lần ghi chỉ chấm row của chính nó, nên không có bước này điểm của các row cũ
+        (và thứ hạng giữa row cũ / row mới) trôi dần theo catalog. Chi phí O(tổng posting),
+        chỉ xảy ra sau khá nhiều lần ghi.
+        """
+        current = self._current_avgs()
+        if all(
+            abs(current[field] - scored) <= AVG_LENGTH_DRIFT * scored
+            for field, scored in self._scored_avgs.items()
+        ):
+            return
+        self._scored_avgs = current
+        for row, field_terms in enumerate(self._row_fields):
+            if field_terms is None:
+                continue
+            for term, tf in self._pseudo_tf(field_terms).items():
+                self._postings[term][row] = tf * (BM25_K1 + 1) / (tf + BM25_K1)
+        self._posting_arrays.clear()
+        self.rescored += 1
+
+    # ---------- query ----------
+
+    def _arrays_for(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        cached = self._posting_arrays.get(term)
+        if cached is None:
+            postings = self._postings[term]
+            rows = np.fromiter(postings.keys(), dtype=np.int32, count=len(postings))
+            scores = np.fromiter(postings.values(), dtype=np.float32, count=len(postings))
+            cached = self._posting_arrays[term] = (rows, scores)
+        return cached
+
+    def _row_filters(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(active mask, category code) theo row - build lại sau mỗi lần ghi"""
+        if self._row_arrays is None:
+            active = np.fromiter(
+                (status == "active" for status in self._row_status),
+                dtype=bool, count=len(self._row_status)
+            )
+            categories = np.array(self._row_category, dtype=object)
+            self._row_arrays = (active, categories)
+        return self._row_arrays
+
+    def _idf(self, term: str) -> float:
+        df = len(self._postings.get(term, ()))
+        return math.log(1 + (self._doc_count - df + 0.5) / (df + 0.5))
+
+    def _vocab_with_prefix(self, prefix: str) -> List[str]:
+        """Các term bắt đầu bằng prefix - bisect rồi duyệt theo index (không copy phần còn lại của vocab)"""
+        vocab = self._vocab
+        matches = []
+        for i in range(bisect.bisect_left(vocab, prefix), len(vocab)):
+            if not vocab[i].startswith(prefix):
+                break
+            matches.append(vocab[i])
+        return matches
+
+    def _prefix_terms(self, prefix: str) -> List[str]:
+        matches = self._vocab_with_prefix(prefix)
+        if len(matches) > PREFIX_MAX_EXPANSIONS:
+            matches.sort(key=lambda t: -len(self._postings[t]))
+            matches = matches[:PREFIX_MAX_EXPANSIONS]
+        return matches
+
+    def _typo_terms(self, token: str) -> List[str]:
+        max_distance = 1 if len(token) < 8 else 2
+        candidates: Set[str] = set(self._delete_index.get(token, ()))  # token thiếu 1 ký tự
+        for variant in _deletes(token):
+            if variant in self._postings:                             # token thừa 1 ký tự
+                candidates.add(variant)
+            candidates.update(self._delete_index.get(variant, ()))    # thay thế / đảo chỗ
+        return [
+            term for term in candidates
+            if _edit_distance(token, term, max_distance) <= max_distance
+        ]
+
+    def _expand(self, token: str, is_last: bool) -> Dict[str, float]:
+        """Token -> {term trong index: hệ số}"""
+        expansions: Dict[str, float] = {}
+        if token in self._postings:
+            expansions[token] = 1.0
+        if is_last and len(token) >= PREFIX_MIN_LENGTH:
+            for term in self._prefix_terms(token):
+                expansions.setdefault(term, PREFIX_WEIGHT)
+        if token not in self._postings and len(token) >= TYPO_MIN_LENGTH:
+            for term in self._typo_terms(token):
+                expansions.setdefault(term, TYPO_WEIGHT)
+        return expansions
+
+    def search(
+        self,
+        query: str,
+        offset: int = 0,
+        limit: int = 24,
+        category_slug: Optional[str] = None,
+        active_only: bool = True,
+        prefix: bool = True,
+    ) -> Tuple[List[Tuple[str, float]], int]:
+        """
+        Tìm kiếm sản phẩm
+
+        Args:
+            query: Chuỗi tìm kiếm (có dấu hoặc không dấu)
+            offset, limit: Phân trang trên danh sách đã xếp hạng
+            category_slug: Chỉ lấy sản phẩm thuộc category
+            active_only: Bỏ qua sản phẩm không active
+            prefix: Từ cuối khớp theo prefix (gõ dở)
+
+        Returns:
+            ([(product_id, score)], total)
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return [], 0
+
+        with self._lock:
+            size = len(self._ids)
+            if size == 0:
+                return [], 0
+
+            total_scores = np.zeros(size, dtype=np.float32)
+            matched_all = np.ones(size, dtype=bool)
+            matched_any = np.zeros(size, dtype=bool)
+            for i, token in enumerate(tokens):
+                expansions = self._expand(token, is_last=prefix and i == len(tokens) - 1)
+                token_scores = np.zeros(size, dtype=np.float32)
+                for term, factor in expansions.items():
+                    rows, scores = self._arrays_for(term)
+                    weighted = scores * np.float32(factor * self._idf(term))
+                    token_scores[rows] = np.maximum(token_scores[rows], weighted)
+                token_matched = token_scores > 0
+                total_scores += token_scores
+                matched_all &= token_matched
+                matched_any |= token_matched
+
+            # AND giữa các từ, không có kết quả thì nới thành OR
+            mask = matched_all if matched_all.any() else matched_any
+            active, categories = self._row_filters()
+            if active_only:
+                mask &= active
+            if category_slug:
+                mask &= categories == category_slug
+
+            candidates = np.flatnonzero(mask)
+            total = int(candidates.size)
+            wanted = offset + limit
+            if total == 0 or offset >= total:
+                return [], total
+
+            candidate_scores = total_scores[candidates]
+            if wanted < total:
+                top = np.argpartition(-candidate_scores, wanted - 1)[:wanted]
+            else:
+                top = np.arange(total)
+            # Điểm giảm dần, hòa điểm thì theo row để kết quả ổn định giữa các trang
+            order = top[np.lexsort((candidates[top], -candidate_scores[top]))]
+            page = order[offset:wanted]
+            return [
+                (self._ids[candidates[i]], round(float(candidate_scores[i]), 4))
+                for i in page
+            ], total
+
+    def autocomplete(self, query: str, limit: int = 8) -> dict:
+        """
+        Gợi ý khi đang gõ: hoàn thành từ cuối (theo độ phổ biến) + sản phẩm khớp nhất
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return {"terms": [], "products": []}
+
+        with self._lock:
+            last = tokens[-1]
+            head = " ".join(self._display.get(t, t) for t in tokens[:-1])
+            completions = self._vocab_with_prefix(last) if len(last) >= PREFIX_MIN_LENGTH - 1 else []
+            completions.sort(key=lambda t: (-len(self._postings[t]), t))
+            terms = [
+                f"{head} {self._display.get(term, term)}".strip()
+                for term in completions[:limit]
+            ]
+
+            results, _ = self.search(query, limit=limit)
+            products = [self._row_meta[self._row_of[product_id]] for product_id, _ in results]
+            return {"terms": terms, "products": products}
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "is_ready": self.is_ready,
+                "total_products": self._doc_count,
+                "total_terms": len(self._postings),
+                "typo_variants": len(self._delete_index),
+                "rescored": self.rescored,
+                "last_built": self.last_built.isoformat() if self.last_built else None,
+            }
+
+    # ---------- cross-worker ----------
+
+    def on_invalidate(self, tags: Iterable[str], remote: bool):
+        """Worker khác ghi sản phẩm thì đọc lại từ DB (giống facet index)"""
+        if not remote or not self.is_ready:
+            return
+        for tag in tags:
+            if tag == "products:reindex":
+                task = asyncio.ensure_future(self.load())
+            elif tag.startswith("product:"):
+                task = asyncio.ensure_future(self.refresh(tag.split(":", 1)[1]))
+            else:
+                continue
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+
+# Singleton instance
+search_engine = ProductSearchEngine()
@@ -0,0 +1,34 @@
+"""
+Tiện ích xử lý chuỗi tiếng Việt dùng chung (đăng ký, đổi mật khẩu, tìm kiếm)
+"""
+
+import re
+import unicodedata
+from typing import Iterator, List
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def remove_accents(input_str):
+    return ''.join((c for c in unicodedata.normalize('NFKD', input_str) if not unicodedata.combining(c)))
+
+
+def fold_text(text: str) -> str:
+    """
+    Chuẩn hóa để so khớp không dấu: bỏ dấu, đ -> d, chữ thường
+    ("Áo Thun Đen" -> "ao thun den")
+    """
+    if not text:
+        return ""
+    return remove_accents(text).replace("đ", "d").replace("Đ", "D").lower()
+
+
+def tokenize(text: str) -> List[str]:
+    """Tách từ sau khi fold_text"""
+    return _TOKEN_PATTERN.findall(fold_text(text))
+
+
+def iter_surface_tokens(text: str) -> Iterator[str]:
+    """Tách từ giữ nguyên dấu (NFC, chữ thường) - dạng hiển thị của các từ mà tokenize() fold"""
+    for match in _TOKEN_PATTERN.finditer(unicodedata.normalize("NFC", text).lower()):
+        yield match.group(0)
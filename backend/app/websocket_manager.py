@@ -1,14 +1,25 @@
 """
 WebSocket Manager for Admin Dashboard Realtime Updates
 Manages WebSocket connections and broadcasts dashboard updates
+
+Chạy nhiều worker: mỗi worker chỉ giữ kết nối admin của chính nó, nên event dashboard
+được publish qua Redis (publish_event) để worker khác broadcast cho admin của họ.
 """
 
 from fastapi import WebSocket
 from typing import List, Dict, Any
 import json
 import asyncio
+import logging
 from datetime import datetime
 
+from app.cache import add_event_listener, publish_event
+
+logger = logging.getLogger(__name__)
+
+
+DASHBOARD_EVENT_TOPIC = "dashboard"
+
 
 class ConnectionManager:
     """Manages WebSocket connections for admin dashboard"""
@@ -28,7 +39,7 @@ class ConnectionManager:
             "connected_at": datetime.now().isoformat(),
             "last_ping": datetime.now().isoformat()
         }
-        print(f"🔌 WebSocket connected: {client_id} (Total: {len(self.active_connections)})")
+        logger.info(f"🔌 WebSocket connected: {client_id} (Total: {len(self.active_connections)})")
         
     def disconnect(self, websocket: WebSocket):
         """Remove a WebSocket connection"""
@@ -37,14 +48,14 @@ class ConnectionManager:
         if websocket in self.connection_info:
             client_id = self.connection_info[websocket].get("client_id", "unknown")
             del self.connection_info[websocket]
-            print(f"🔌 WebSocket disconnected: {client_id} (Total: {len(self.active_connections)})")
+            logger.info(f"🔌 WebSocket disconnected: {client_id} (Total: {len(self.active_connections)})")
             
     async def send_personal_message(self, message: dict, websocket: WebSocket):
         """Send message to a specific client"""
         try:
             await websocket.send_json(message)
         except Exception as e:
-            print(f"❌ Error sending personal message: {e}")
+            logger.warning(f"❌ Error sending personal message: {e}")
             self.disconnect(websocket)
             
     async def broadcast(self, message: dict):
@@ -57,7 +68,7 @@ class ConnectionManager:
             try:
                 await connection.send_json(message)
             except Exception as e:
-                print(f"❌ Error broadcasting to client: {e}")
+                logger.warning(f"❌ Error broadcasting to client: {e}")
                 disconnected.append(connection)
                 
         # Clean up disconnected clients
@@ -72,7 +83,9 @@ class ConnectionManager:
             "timestamp": datetime.now().isoformat()
         }
         await self.broadcast(message)
-        print(f"📡 Broadcasted {event_type} to {len(self.active_connections)} clients")
+        # Admin đang kết nối tới worker khác
+        publish_event(DASHBOARD_EVENT_TOPIC, message)
+        logger.debug("📡 Broadcasted %s to %s clients", event_type, len(self.active_connections))
         
     def get_connection_count(self) -> int:
         """Get number of active connections"""
@@ -95,6 +108,7 @@ class ConnectionManager:
 
 # Singleton instance
 dashboard_manager = ConnectionManager()
+add_event_listener(DASHBOARD_EVENT_TOPIC, dashboard_manager.broadcast)
 
 
 async def notify_new_order(order_data: dict):
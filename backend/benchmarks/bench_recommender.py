@@ -0,0 +1,313 @@
+"""
+Benchmark ProductRecommender trên catalog thời trang tổng hợp
+
+Đo cho mỗi kích thước catalog (mặc định 1k, 10k, 100k sản phẩm):
+    - fit_seconds: thời gian ProductRecommender.fit (TF-IDF + top-K láng giềng)
+    - peak_rss_mb: RSS cao nhất (process benchmark + process pool fit)
+    - model_bytes: TF-IDF matrix, neighbor arrays, vectorizer (pickle)
+    - latency: p50/p99/mean (ms) của get_recommendations và get_recommendations_by_content
+
+Mỗi kích thước chạy trong 1 subprocess riêng để peak RSS không bị cộng dồn.
+Catalog sinh với seed cố định - cùng seed + cùng code cho ra cùng dữ liệu.
+
+Usage (từ thư mục backend/):
+    python -m benchmarks.bench_recommender
+    python -m benchmarks.bench_recommender --sizes 1000 10000 --queries 2000
+    python -m benchmarks.bench_recommender --baseline benchmarks/results/old.json
+
+Kết quả ghi ra benchmarks/results/recommender-<timestamp>.json (hoặc --output).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import pickle
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+DEFAULT_QUERIES = 1_000
+DEFAULT_SEED = 42
+RECOMMENDATION_LIMIT = 8
+
+# ==================== SYNTHETIC CATALOG ====================
+
+CATEGORIES = [
+    "Áo thun", "Áo sơ mi", "Áo polo", "Áo khoác", "Áo len", "Áo hoodie",
+    "Quần jeans", "Quần tây", "Quần short", "Quần jogger", "Váy", "Đầm",
+    "Chân váy", "Giày sneaker", "Giày tây", "Sandal", "Túi xách", "Balo",
+    "Mũ", "Thắt lưng", "Ví da", "Khăn choàng", "Đồ ngủ", "Đồ thể thao",
+]
+MATERIALS = [
+    "cotton", "cotton compact", "linen", "lụa", "kaki", "denim", "nỉ", "len",
+    "dạ", "da thật", "da PU", "polyester", "thun lạnh", "voan", "nhung", "jean co giãn",
+]
+STYLES = [
+    "basic", "oversize", "slim fit", "regular fit", "form rộng", "công sở",
+    "dạo phố", "vintage", "Hàn Quốc", "streetwear", "tối giản", "thể thao",
+    "dự tiệc", "đi biển", "unisex", "cổ điển",
+]
+DETAILS = [
+    "cổ tròn", "cổ bẻ", "tay ngắn", "tay dài", "có túi", "in hình", "thêu logo",
+    "kẻ sọc", "họa tiết hoa", "trơn", "phối màu", "cạp cao", "ống suông",
+    "dây rút", "khóa kéo", "nút gỗ",
+]
+COLORS = [
+    "Đen", "Trắng", "Xám", "Be", "Nâu", "Xanh navy", "Xanh rêu", "Xanh dương",
+    "Đỏ đô", "Hồng pastel", "Vàng mustard", "Cam đất", "Tím than", "Kem",
+]
+BRANDS = [
+    "Vyron", "Vyron Basic", "Saigon Denim", "Hanoi Atelier", "Lụa Việt",
+    "Urban Move", "Mộc Studio", "Sóng Apparel", "Phố Style", "Lá Boutique",
+]
+DESCRIPTION_TEMPLATES = [
+    "{category} chất liệu {material} mềm mại, thoáng mát, phong cách {style}.",
+    "Thiết kế {detail} {style}, dễ phối đồ, phù hợp mặc hằng ngày.",
+    "{category} {style} từ {material} cao cấp, đường may tỉ mỉ, bền màu.",
+    "Mẫu {category_lower} {detail} thời thượng, chất {material} đứng form.",
+]
+CONTENT_QUERIES = [
+    "áo thun cotton basic", "quần jeans ống suông", "váy lụa dự tiệc",
+    "giày sneaker trắng", "áo khoác dạ công sở", "túi xách da thật",
+    "đầm họa tiết hoa đi biển", "hoodie oversize streetwear", "áo sơ mi linen",
+    "quần tây slim fit", "chân váy kaki cạp cao", "balo thể thao unisex",
+]
+
+
+def generate_catalog(size: int, seed: int = DEFAULT_SEED) -> List[dict]:
+    """Sinh size sản phẩm có các field mà ProductRecommender._build_content đọc"""
+    rng = random.Random(seed)
+    products = []
+    for i in range(size):
+        category = rng.choice(CATEGORIES)
+        material = rng.choice(MATERIALS)
+        style = rng.choice(STYLES)
+        detail = rng.choice(DETAILS)
+        values = {
+            "category": category,
+            "category_lower": category.lower(),
+            "material": material,
+            "style": style,
+            "detail": detail,
+        }
+        description = " ".join(
+            template.format(**values)
+            for template in rng.sample(DESCRIPTION_TEMPLATES, 2)
+        )
+        products.append({
+            "_id": f"{i:024x}",
+            "name": f"{category} {material} {style} {detail} {rng.randint(100, 999)}",
+            "short_description": description,
+            "category": {"name": category},
+            "brand": {"name": rng.choice(BRANDS)},
+            "variants": {"colors": [{"name": color} for color in rng.sample(COLORS, rng.randint(1, 4))]},
+            "status": "active" if rng.random() > 0.03 else "inactive",
+        })
+    return products
+
+
+# ==================== MEASUREMENT ====================
+
+def _peak_rss_mb() -> Dict[str, float]:
+    """ru_maxrss là KB trên Linux, bytes trên macOS"""
+    scale = 1 / 1024 if sys.platform != "darwin" else 1 / (1024 * 1024)
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return {"self": round(own, 1), "fit_process": round(children, 1), "peak": round(max(own, children), 1)}
+
+
+def _latency_stats(samples_ns: List[int]) -> Dict[str, float]:
+    samples = np.asarray(samples_ns, dtype=np.float64) / 1e6
+    return {
+        "count": int(samples.size),
+        "p50_ms": round(float(np.percentile(samples, 50)), 4),
+        "p99_ms": round(float(np.percentile(samples, 99)), 4),
+        "mean_ms": round(float(samples.mean()), 4),
+        "max_ms": round(float(samples.max()), 4),
+    }
+
+
+def _model_bytes(recommender) -> Dict[str, int]:
+    tfidf = recommender.tfidf_matrix
+    sizes = {
+        "tfidf_matrix": int(tfidf.data.nbytes + tfidf.indices.nbytes + tfidf.indptr.nbytes),
+        "neighbors": int(recommender.neighbor_indices.nbytes + recommender.neighbor_scores.nbytes),
+        "vectorizer_pickle": len(pickle.dumps(recommender.vectorizer, protocol=pickle.HIGHEST_PROTOCOL)),
+    }
+    sizes["total"] = sum(sizes.values())
+    return sizes
+
+
+async def _bench_size(size: int, queries: int, seed: int) -> dict:
+    from app.recommendation import ProductRecommender
+
+    products = generate_catalog(size, seed)
+    recommender = ProductRecommender()
+
+    start = time.perf_counter()
+    fitted = await recommender.fit(products)
+    fit_seconds = time.perf_counter() - start
+    if not fitted:
+        raise RuntimeError(f"fit failed for {size} products")
+
+    rng = random.Random(seed + 1)
+    product_ids = [pid for pid in recommender.product_ids if pid is not None]
+    sample_ids = [rng.choice(product_ids) for _ in range(queries)]
+    sample_texts = [rng.choice(CONTENT_QUERIES) for _ in range(queries)]
+
+    # Warm-up: cache của numpy/scipy
+    recommender.get_recommendations(sample_ids[0], n=RECOMMENDATION_LIMIT)
+    recommender.get_recommendations_by_content(sample_texts[0], n=RECOMMENDATION_LIMIT)
+
+    by_id = []
+    for product_id in sample_ids:
+        t = time.perf_counter_ns()
+        recommender.get_recommendations(product_id, n=RECOMMENDATION_LIMIT)
+        by_id.append(time.perf_counter_ns() - t)
+
+    by_content = []
+    for text in sample_texts:
+        t = time.perf_counter_ns()
+        recommender.get_recommendations_by_content(text, n=RECOMMENDATION_LIMIT)
+        by_content.append(time.perf_counter_ns() - t)
+
+    stats = recommender.get_stats()
+    await recommender.stop_scheduler()
+    return {
+        "catalog_size": size,
+        "indexed_products": stats["total_products"],
+        "features": stats["total_features"],
+        "fit_seconds": round(fit_seconds, 3),
+        "rss_mb": _peak_rss_mb(),
+        "model_bytes": _model_bytes(recommender),
+        "latency": {
+            "get_recommendations": _latency_stats(by_id),
+            "get_recommendations_by_content": _latency_stats(by_content),
+        },
+    }
+
+
+# ==================== RUNNER ====================
+
+def _environment() -> dict:
+    import scipy
+    import sklearn
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "scikit_learn": sklearn.__version__,
+        "git_commit": commit,
+    }
+
+
+def _run_isolated(size: int, queries: int, seed: int) -> dict:
+    """Chạy 1 kích thước trong subprocess mới (peak RSS sạch)"""
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_recommender",
+         "--single", str(size), "--queries", str(queries), "--seed", str(seed)],
+        cwd=BACKEND_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"benchmark {size} failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def _compare(results: List[dict], baseline_path: str):
+    """In chênh lệch so với 1 file kết quả trước (ratio > 1 = chậm hơn / tốn hơn)"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {run["catalog_size"]: run for run in json.load(f)["results"]}
+
+    metrics = [
+        ("fit_seconds", lambda r: r["fit_seconds"]),
+        ("peak_rss_mb", lambda r: r["rss_mb"]["peak"]),
+        ("model_bytes", lambda r: r["model_bytes"]["total"]),
+        ("by_id_p99_ms", lambda r: r["latency"]["get_recommendations"]["p99_ms"]),
+        ("by_content_p99_ms", lambda r: r["latency"]["get_recommendations_by_content"]["p99_ms"]),
+    ]
+    print(f"\nSo với baseline {baseline_path}:")
+    for run in results:
+        old = baseline.get(run["catalog_size"])
+        if old is None:
+            continue
+        parts = []
+        for name, get in metrics:
+            before, after = get(old), get(run)
+            ratio = after / before if before else float("inf")
+            parts.append(f"{name} {before} -> {after} (x{ratio:.2f})")
+        print(f"  {run['catalog_size']:>7}: " + ", ".join(parts))
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark ProductRecommender")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Các kích thước catalog")
+    parser.add_argument("--queries", type=int, default=DEFAULT_QUERIES, help="Số query đo latency mỗi loại")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--output", help="File JSON kết quả (mặc định benchmarks/results/recommender-<timestamp>.json)")
+    parser.add_argument("--baseline", help="File kết quả trước đó để so sánh")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)  # Dùng nội bộ: chạy 1 kích thước, in JSON
+    args = parser.parse_args(argv)
+
+    if args.single:
+        print(json.dumps(asyncio.run(_bench_size(args.single, args.queries, args.seed))))
+        return
+
+    results = []
+    for size in args.sizes:
+        print(f"▶ {size} sản phẩm...", flush=True)
+        run = _run_isolated(size, args.queries, args.seed)
+        latency = run["latency"]
+        print(
+            f"  fit {run['fit_seconds']}s, peak RSS {run['rss_mb']['peak']}MB, "
+            f"model {run['model_bytes']['total'] / 1024 / 1024:.1f}MB, "
+            f"by_id p50/p99 {latency['get_recommendations']['p50_ms']}/{latency['get_recommendations']['p99_ms']}ms, "
+            f"by_content p50/p99 {latency['get_recommendations_by_content']['p50_ms']}/"
+            f"{latency['get_recommendations_by_content']['p99_ms']}ms",
+            flush=True
+        )
+        results.append(run)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"recommender-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    report = {
+        "benchmark": "recommender",
+        "created_at": datetime.now().isoformat(),
+        "seed": args.seed,
+        "queries": args.queries,
+        "environment": _environment(),
+        "results": results,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"✅ Đã ghi {output}")
+
+    if args.baseline:
+        _compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
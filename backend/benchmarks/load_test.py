@@ -0,0 +1,777 @@
+"""
+Load test các API chính của storefront + admin
+
+Seed dữ liệu tổng hợp (sản phẩm, danh mục, user, đơn hàng, đánh giá, giỏ hàng) rồi cho
+N virtual user chạy song song các kịch bản trộn theo trọng số:
+    - products:        GET /api/products (sort, trang), filter (category/size/màu/giá), search
+    - categories:      GET /api/categories, /api/categories/tree
+    - recommendations: GET /api/products/{id}/recommendations (hybrid / content)
+    - cart:            thêm -> sửa số lượng -> xem -> xóa (POST/PUT/GET/DELETE /api/cart/*)
+    - orders:          POST /api/orders, GET /api/orders/user/{user_id}
+    - admin:           GET /api/admin/dashboard, /api/admin/orders
+
+Báo cáo theo từng endpoint: số request, lỗi (status >= 400 hoặc exception), throughput,
+p50/p90/p99/max latency (ms, đo phía client).
+
+Chế độ chạy:
+    - Mặc định: app chạy trong process (httpx ASGITransport), MongoDB thay bằng mongomock-motor
+      (pip install mongomock-motor) - không cần server, phù hợp để so sánh trước/sau 1 thay đổi.
+      mongomock chưa có $type / $toObjectId (aggregation) mà dashboard admin dùng - được bổ sung
+      ở đây nên mọi endpoint đều được đo ở cả 2 chế độ
+    - --mongo-url: seed vào MongoDB thật (database --db-name, bị xóa trước khi seed)
+    - --base-url: bắn vào server đang chạy; seed trước bằng --seed-only rồi khởi động server
+      (index in-memory được build lúc startup), chạy lại với --no-seed
+
+Usage (từ thư mục backend/):
+    python -m benchmarks.load_test
+    python -m benchmarks.load_test --concurrency 50 --duration 60
+    python -m benchmarks.load_test --scenarios products cart --products 20000
+    python -m benchmarks.load_test --mongo-url mongodb://localhost:27017 --seed-only
+    python -m benchmarks.load_test --mongo-url mongodb://localhost:27017 --base-url http://localhost:8000 --no-seed
+    python -m benchmarks.load_test --baseline benchmarks/results/old.json
+
+Kết quả ghi ra benchmarks/results/load-<timestamp>.json (hoặc --output).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.bench_recommender import (
+    BRANDS, COLORS, CONTENT_QUERIES, DESCRIPTION_TEMPLATES, DETAILS, MATERIALS, STYLES,
+    RESULTS_DIR, _environment,
+)
+
+DEFAULT_SEED = 42
+DEFAULT_DB_NAME = "vyronfashion_loadtest"
+DEFAULT_VOLUMES = {"products": 2_000, "users": 1_000, "orders": 5_000, "reviews": 5_000, "carts": 500}
+INSERT_BATCH = 1_000
+PASSWORD = "loadtest123"
+
+# Danh mục gốc -> danh mục con (cùng tên với CATEGORIES của bench_recommender)
+ROOT_CATEGORIES = {
+    "Thời trang nam": ["Áo thun", "Áo sơ mi", "Áo polo", "Quần jeans", "Quần tây", "Quần short", "Quần jogger"],
+    "Thời trang nữ": ["Váy", "Đầm", "Chân váy", "Áo len", "Áo hoodie", "Áo khoác", "Đồ ngủ"],
+    "Giày dép": ["Giày sneaker", "Giày tây", "Sandal"],
+    "Phụ kiện": ["Túi xách", "Balo", "Mũ", "Thắt lưng", "Ví da", "Khăn choàng", "Đồ thể thao"],
+}
+SIZES = ["XS", "S", "M", "L", "XL", "XXL"]
+ORDER_STATUSES = ["pending"] * 2 + ["processing"] * 2 + ["shipped"] * 2 + ["delivered"] * 3 + ["completed"] * 4 + ["cancelled"]
+SORTS = ["newest", "price_asc", "price_desc", "popular", "best_sellers"]
+SEARCH_TERMS = CONTENT_QUERIES + ["áo thun", "jeans", "lụa", "sneaker", "hoodie", "váy", "da thật", "linen"]
+CITIES = ["Hà Nội", "TP. Hồ Chí Minh", "Đà Nẵng", "Cần Thơ", "Hải Phòng", "Huế", "Nha Trang"]
+
+# Kịch bản -> trọng số (tỉ lệ lượt chạy của mỗi virtual user)
+SCENARIO_WEIGHTS = {
+    "products": 35,
+    "categories": 10,
+    "recommendations": 15,
+    "cart": 20,
+    "orders": 12,
+    "admin": 8,
+}
+
+
+def _slugify(text: str) -> str:
+    from app.text_utils import remove_accents
+    return re.sub(r"[^a-z0-9]+", "-", remove_accents(text).lower()).strip("-")
+
+
+# ==================== DATABASE ====================
+
+COLLECTIONS = ["users", "categories", "products", "reviews", "orders", "cart"]
+
+
+def prepare_database(args):
+    """
+    Chọn MongoDB cho app trước khi import app.main (main đọc collection lúc import)
+    - --mongo-url: MongoDB thật, database --db-name
+    - mặc định: mongomock-motor (in-memory)
+    """
+    # Không ghi đè snapshot recommender / log của môi trường dev
+    workdir = tempfile.mkdtemp(prefix="vyron-loadtest-")
+    os.environ.setdefault("RECOMMENDER_SNAPSHOT_DIR", os.path.join(workdir, "recommender"))
+    os.environ.setdefault("LOG_FILE", os.path.join(workdir, "app.log"))
+    os.environ.setdefault("LOG_CONSOLE_LEVEL", "WARNING")
+
+    if args.mongo_url:
+        os.environ["MONGODB_URL"] = args.mongo_url
+        os.environ["DATABASE_NAME"] = args.db_name
+        import app.database as database
+        return database
+
+    try:
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        raise SystemExit("❌ Cần mongomock-motor (pip install mongomock-motor) hoặc chỉ định --mongo-url")
+
+    _install_mongomock_operators()
+    import app.database as database
+    client = AsyncMongoMockClient()
+    database.client = client
+    database.database = client[args.db_name]
+    for name in COLLECTIONS + ["addresses", "coupons", "returns", "settings"]:
+        setattr(database, f"{name}_collection", database.database[name])
+    return database
+
+
+# BSON type alias của toán tử $type (bool trước int: bool là subclass của int)
+_BSON_TYPE_ALIASES = (
+    (bool, "bool"), (int, "int"), (float, "double"), (str, "string"), (datetime, "date"),
+    (dict, "object"), (list, "array"), (tuple, "array"), (bytes, "binData"),
+)
+
+
+def _install_mongomock_operators():
+    """
+    Thêm $type và $toObjectId (aggregation expression) vào parser của mongomock
+    Dashboard admin dùng $type để xử lý created_at kiểu date lẫn string,
+    $toObjectId để $lookup user/product từ id lưu dạng string
+    """
+    from bson import ObjectId
+    from bson.errors import InvalidId
+    from mongomock import OperationFailure, aggregate
+
+    if "$type" in aggregate.type_operators:
+        return
+    handle_type_operator = aggregate._Parser._handle_type_operator
+    handle_type_convertion_operator = aggregate._Parser._handle_type_convertion_operator
+
+    def _handle_type_operator(parser, operator, values):
+        if operator != "$type":
+            return handle_type_operator(parser, operator, values)
+        if isinstance(values, list) and len(values) == 1:
+            values = values[0]
+        try:
+            value = parser.parse(values)
+        except KeyError:
+            return "missing"
+        if value is None:
+            return "null"
+        if isinstance(value, ObjectId):
+            return "objectId"
+        if isinstance(value, int) and not isinstance(value, bool) and not -2**31 <= value < 2**31:
+            return "long"
+        for python_type, alias in _BSON_TYPE_ALIASES:
+            if isinstance(value, python_type):
+                return alias
+        raise NotImplementedError(f"$type: chưa hỗ trợ kiểu {type(value).__name__} với mongomock")
+
+    def _handle_type_convertion_operator(parser, operator, values):
+        if operator != "$toObjectId":
+            return handle_type_convertion_operator(parser, operator, values)
+        try:
+            value = parser.parse(values)
+        except KeyError:
+            return None
+        if value is None or isinstance(value, ObjectId):
+            return value
+        try:
+            return ObjectId(value)
+        except (InvalidId, TypeError):
+            raise OperationFailure(f"Failed to parse objectId '{value}' in $convert with no onError value")
+
+    aggregate.type_operators.append("$type")
+    aggregate.type_convertion_operators.append("$toObjectId")
+    aggregate._Parser._handle_type_operator = _handle_type_operator
+    aggregate._Parser._handle_type_convertion_operator = _handle_type_convertion_operator
+
+
+# ==================== SEED DATA ====================
+
+def generate_categories(now: datetime) -> List[dict]:
+    from bson import ObjectId
+
+    categories = []
+    for root_name, children in ROOT_CATEGORIES.items():
+        root_id = ObjectId()
+        categories.append({
+            "_id": root_id, "name": root_name, "slug": _slugify(root_name), "description": "",
+            "parent_id": None, "status": "active", "created_at": now.isoformat(), "updated_at": now.isoformat(),
+        })
+        for name in children:
+            categories.append({
+                "_id": ObjectId(), "name": name, "slug": _slugify(name), "description": "",
+                "parent_id": str(root_id), "status": "active", "created_at": now.isoformat(), "updated_at": now.isoformat(),
+            })
+    return categories
+
+
+def generate_products(count: int, categories: List[dict], rng: random.Random, now: datetime) -> List[dict]:
+    from bson import ObjectId
+
+    leaves = [c for c in categories if c["parent_id"]]
+    color_docs = [
+        {"name": name, "slug": _slugify(name), "hex": f"#{rng.randrange(0x1000000):06x}"}
+        for name in COLORS
+    ]
+    products = []
+    for i in range(count):
+        category = rng.choice(leaves)
+        material, style, detail = rng.choice(MATERIALS), rng.choice(STYLES), rng.choice(DETAILS)
+        values = {
+            "category": category["name"], "category_lower": category["name"].lower(),
+            "material": material, "style": style, "detail": detail,
+        }
+        name = f"{category['name']} {material} {style} {detail}"
+        brand = rng.choice(BRANDS)
+        original = rng.randrange(150, 2500) * 1000
+        discount = rng.choice([0, 0, 0, 10, 20, 30, 50])
+        quantity = rng.choice([0] + [rng.randint(1, 300)] * 9)
+        sizes = sorted(rng.sample(SIZES, rng.randint(2, len(SIZES))), key=SIZES.index)
+        product_id = ObjectId()
+        image = f"https://res.cloudinary.com/loadtest/products/{product_id}.jpg"
+        created_at = now - timedelta(days=rng.uniform(0, 365))
+        products.append({
+            "_id": product_id,
+            "name": name,
+            "slug": f"{_slugify(name)}-{i}",
+            "sku": f"LT{i:06d}",
+            "brand": {"name": brand, "slug": _slugify(brand)},
+            "category": {"name": category["name"], "slug": category["slug"]},
+            "pricing": {
+                "original": original,
+                "sale": original * (100 - discount) // 100,
+                "discount_percent": discount,
+                "currency": "VND",
+            },
+            "short_description": " ".join(t.format(**values) for t in rng.sample(DESCRIPTION_TEMPLATES, 2)),
+            "image": image,
+            "images": [image],
+            "variants": {
+                "colors": [{**color, "available": True, "images": [image]} for color in rng.sample(color_docs, rng.randint(1, 4))],
+                "sizes": [{"name": size, "available": quantity > 0, "stock": quantity // len(sizes)} for size in sizes],
+            },
+            "inventory": {"in_stock": quantity > 0, "quantity": quantity, "low_stock_threshold": 10},
+            "status": "active" if rng.random() > 0.03 else "inactive",
+            "rating": {"average": 0.0, "count": 0},
+            "sold_count": 0,
+            "wishlist_count": 0,
+            "created_at": created_at,
+            "updated_at": created_at,
+        })
+    return products
+
+
+def generate_users(count: int, products: List[dict], rng: random.Random, now: datetime) -> List[dict]:
+    import bcrypt
+    from bson import ObjectId
+
+    # Hash 1 lần với cost thấp - seed không cần đo bcrypt
+    password = bcrypt.hashpw(PASSWORD.encode("utf-8"), bcrypt.gensalt(rounds=4)).decode("utf-8")
+    product_ids = [str(p["_id"]) for p in products]
+    users = []
+    for i in range(count):
+        users.append({
+            "_id": ObjectId(),
+            "username": f"loadtest{i}",
+            "email": f"loadtest{i}@example.com",
+            "password": password,
+            "name": f"Khách hàng {i}",
+            "createdAt": now - timedelta(days=rng.uniform(0, 720)),
+            "role": "user",
+            "emailVerified": True,
+            "phone": f"09{rng.randrange(10 ** 8):08d}",
+            "memberLevel": rng.choice(["bronze", "bronze", "silver", "gold"]),
+            "wishlist": rng.sample(product_ids, min(len(product_ids), rng.choice([0, 0, 1, 3, 5, 12]))),
+        })
+    return users
+
+
+def _order_item(product: dict, rng: random.Random) -> dict:
+    return {
+        "product_id": str(product["_id"]),
+        "product_name": product["name"],
+        "product_image": product["image"],
+        "variant_color": rng.choice(product["variants"]["colors"])["slug"],
+        "variant_size": rng.choice(product["variants"]["sizes"])["name"],
+        "quantity": rng.choice([1, 1, 1, 2, 3]),
+        "price": product["pricing"]["sale"],
+    }
+
+
+def _shipping_address(user: dict, rng: random.Random) -> dict:
+    return {
+        "full_name": user["name"],
+        "phone": user["phone"],
+        "email": user["email"],
+        "street": f"{rng.randint(1, 500)} Nguyễn Trãi",
+        "ward": f"Phường {rng.randint(1, 20)}",
+        "city": rng.choice(CITIES),
+    }
+
+
+def generate_orders(count: int, users: List[dict], products: List[dict], rng: random.Random, now: datetime) -> List[dict]:
+    orders = []
+    for i in range(count):
+        user = rng.choice(users)
+        items = [_order_item(p, rng) for p in rng.sample(products, rng.choice([1, 1, 2, 2, 3, 4]))]
+        created_at = now - timedelta(days=rng.uniform(0, 90) ** 1.3 / 90 ** 0.3)  # dồn về các ngày gần đây
+        payment_method = "COD" if rng.random() < 0.7 else "VietQR"
+        orders.append({
+            "user_id": str(user["_id"]),
+            "order_number": f"VF{created_at.strftime('%Y%m%d')}{i:06d}",
+            "items": items,
+            "total_amount": sum(item["price"] * item["quantity"] for item in items),
+            "shipping_address": _shipping_address(user, rng),
+            "payment_method": payment_method,
+            "payment_status": "pending" if payment_method == "COD" else rng.choice(["paid"] * 9 + ["awaiting_payment"]),
+            "status": rng.choice(ORDER_STATUSES),
+            "note": "",
+            "created_at": created_at.isoformat(),
+            "updated_at": created_at.isoformat(),
+        })
+    return orders
+
+
+def generate_reviews(count: int, users: List[dict], products: List[dict], rng: random.Random, now: datetime) -> List[dict]:
+    # Sản phẩm bán chạy có nhiều đánh giá hơn (phân phối lệch)
+    weights = [1.0 / (rank + 1) ** 0.8 for rank in range(len(products))]
+    seen = set()
+    reviews = []
+    attempts = 0
+    while len(reviews) < count and attempts < count * 5:
+        attempts += 1
+        product = rng.choices(products, weights=weights)[0]
+        user = rng.choice(users)
+        key = (product["_id"], user["_id"])
+        if key in seen:
+            continue
+        seen.add(key)
+        created_at = (now - timedelta(days=rng.uniform(0, 365))).isoformat()
+        reviews.append({
+            "product_id": str(product["_id"]),
+            "user_id": str(user["_id"]),
+            "rating": rng.choices([1, 2, 3, 4, 5], weights=[3, 4, 10, 33, 50])[0],
+            "comment": rng.choice(["", "Chất vải đẹp, đúng size", "Giao hàng nhanh", "Màu hơi khác ảnh", "Sẽ ủng hộ tiếp"]),
+            "created_at": created_at,
+            "updated_at": created_at,
+        })
+    return reviews
+
+
+def generate_carts(count: int, users: List[dict], products: List[dict], rng: random.Random, now: datetime) -> List[dict]:
+    carts = []
+    for user in rng.sample(users, min(count, len(users))):
+        items = [_order_item(p, rng) for p in rng.sample(products, rng.randint(1, 5))]
+        carts.append({
+            "user_id": str(user["_id"]),
+            "items": items,
+            "created_at": now.isoformat(),
+            "updated_at": now.isoformat(),
+        })
+    return carts
+
+
+def _apply_counters(products: List[dict], users: List[dict], orders: List[dict], reviews: List[dict]):
+    """sold_count / wishlist_count / rating của sản phẩm khớp với dữ liệu đã sinh"""
+    by_id = {str(p["_id"]): p for p in products}
+    for order in orders:
+        if order["status"] == "cancelled":
+            continue
+        for item in order["items"]:
+            by_id[item["product_id"]]["sold_count"] += item["quantity"]
+    for user in users:
+        for product_id in user["wishlist"]:
+            by_id[product_id]["wishlist_count"] += 1
+    totals: Dict[str, List[int]] = {}
+    for review in reviews:
+        totals.setdefault(review["product_id"], []).append(review["rating"])
+    for product_id, ratings in totals.items():
+        by_id[product_id]["rating"] = {"average": round(sum(ratings) / len(ratings), 1), "count": len(ratings)}
+
+
+async def _insert(collection, documents: List[dict]):
+    for start in range(0, len(documents), INSERT_BATCH):
+        await collection.insert_many(documents[start:start + INSERT_BATCH], ordered=False)
+
+
+async def seed(database, volumes: Dict[str, int], seed_value: int) -> Dict[str, int]:
+    """Xóa các collection liên quan rồi ghi dữ liệu tổng hợp (cùng seed -> cùng phân phối dữ liệu)"""
+    rng = random.Random(seed_value)
+    now = datetime.now()
+
+    categories = generate_categories(now)
+    products = generate_products(volumes["products"], categories, rng, now)
+    users = generate_users(volumes["users"], products, rng, now)
+    orders = generate_orders(volumes["orders"], users, products, rng, now)
+    reviews = generate_reviews(volumes["reviews"], users, products, rng, now)
+    carts = generate_carts(volumes["carts"], users, products, rng, now)
+    _apply_counters(products, users, orders, reviews)
+
+    documents = {
+        "categories": categories, "products": products, "users": users,
+        "orders": orders, "reviews": reviews, "cart": carts,
+    }
+    for name, docs in documents.items():
+        collection = getattr(database, f"{name}_collection")
+        await collection.delete_many({})
+        await _insert(collection, docs)
+    return {name: len(docs) for name, docs in documents.items()}
+
+
+async def load_dataset(database) -> dict:
+    """Id dùng trong kịch bản - đọc lại từ DB (dùng được cả khi --no-seed)"""
+    products = await database.products_collection.find(
+        {"status": "active"},
+        {"name": 1, "image": 1, "pricing": 1, "category.slug": 1, "variants.colors.slug": 1, "variants.sizes.name": 1}
+    ).to_list(length=None)
+    users = await database.users_collection.find({"role": "user"}, {"name": 1, "email": 1, "phone": 1}).to_list(length=None)
+    categories = await database.categories_collection.distinct("slug")
+    if not products or not users:
+        raise SystemExit("❌ Database chưa có sản phẩm/user - chạy seed trước (bỏ --no-seed)")
+    for product in products:
+        product.setdefault("variants", {}).setdefault("colors", [])
+        product["variants"].setdefault("sizes", [])
+    return {"products": products, "users": users, "categories": categories}
+
+
+# ==================== SCENARIOS ====================
+
+class Recorder:
+    """Latency (ns) + status theo tên endpoint; tắt trong lúc warm-up"""
+
+    def __init__(self):
+        self.enabled = False
+        self.latencies: Dict[str, List[int]] = {}
+        self.statuses: Dict[str, Counter] = {}
+        self.errors: Dict[str, int] = {}
+        self.total = 0
+
+    async def request(self, name: str, call: Awaitable):
+        start = time.perf_counter_ns()
+        try:
+            response = await call
+            status_code = response.status_code
+        except Exception as e:
+            response, status_code = None, type(e).__name__
+        elapsed = time.perf_counter_ns() - start
+        if self.enabled:
+            self.total += 1
+            self.latencies.setdefault(name, []).append(elapsed)
+            self.statuses.setdefault(name, Counter())[str(status_code)] += 1
+            if response is None or response.status_code >= 400:
+                self.errors[name] = self.errors.get(name, 0) + 1
+        return response
+
+
+class Scenarios:
+    """Mỗi kịch bản là 1 lượt của virtual user (có thể gồm nhiều request)"""
+
+    def __init__(self, dataset: dict, recorder: Recorder):
+        self.catalog = dataset["products"]
+        self.customers = dataset["users"]
+        self.category_slugs = dataset["categories"]
+        self.recorder = recorder
+
+    async def products(self, client, rng: random.Random, user: dict):
+        record = self.recorder.request
+        params = {"page": rng.choices([1, 2, 3, 5], weights=[6, 2, 1, 1])[0], "sort": rng.choice(SORTS), "status": "active"}
+        await record("GET /api/products", client.get("/api/products", params=params))
+
+        product = rng.choice(self.catalog)
+        params = {"category_slug": product["category"]["slug"], "sort": rng.choice(SORTS), "status": "active"}
+        if rng.random() < 0.5 and product["variants"]["sizes"]:
+            params["sizes"] = rng.choice(product["variants"]["sizes"])["name"]
+        if rng.random() < 0.4 and product["variants"]["colors"]:
+            params["colors"] = rng.choice(product["variants"]["colors"])["slug"]
+        if rng.random() < 0.3:
+            params["price_min"], params["price_max"] = 200_000, rng.choice([500_000, 1_000_000, 2_000_000])
+        params["include_facets"] = rng.random() < 0.3
+        await record("GET /api/products?filters", client.get("/api/products", params=params))
+
+        params = {"search": rng.choice(SEARCH_TERMS), "sort": rng.choice(SORTS[:3]), "status": "active"}
+        await record("GET /api/products?search", client.get("/api/products", params=params))
+
+    async def categories(self, client, rng: random.Random, user: dict):
+        record = self.recorder.request
+        await record("GET /api/categories", client.get("/api/categories"))
+        if rng.random() < 0.3:
+            await record("GET /api/categories/tree", client.get("/api/categories/tree"))
+
+    async def recommendations(self, client, rng: random.Random, user: dict):
+        product_id = str(rng.choice(self.catalog)["_id"])
+        strategy = "hybrid" if rng.random() < 0.75 else "content"
+        await self.recorder.request(
+            f"GET /api/products/{{id}}/recommendations?{strategy}",
+            client.get(f"/api/products/{product_id}/recommendations", params={"limit": 8, "strategy": strategy})
+        )
+
+    async def cart(self, client, rng: random.Random, user: dict):
+        record = self.recorder.request
+        user_id = str(user["_id"])
+        product = rng.choice(self.catalog)
+        color = rng.choice(product["variants"]["colors"])["slug"] if product["variants"]["colors"] else None
+        size = rng.choice(product["variants"]["sizes"])["name"] if product["variants"]["sizes"] else None
+        variant = {k: v for k, v in (("color", color), ("size", size)) if v is not None}
+
+        await record("POST /api/cart/add", client.post(
+            "/api/cart/add", params={"user_id": user_id, "product_id": str(product["_id"]), "quantity": 1, **variant}
+        ))
+        await record("PUT /api/cart/{user_id}/{item_index}", client.put(f"/api/cart/{user_id}/0", params={"quantity": rng.randint(1, 3)}))
+        await record("GET /api/cart/{user_id}", client.get(f"/api/cart/{user_id}"))
+        # Giỏ hàng không phình mãi: bỏ lại sản phẩm vừa thêm (75%)
+        if rng.random() < 0.75:
+            await record("DELETE /api/cart/{user_id}/item", client.delete(
+                f"/api/cart/{user_id}/item", params={"product_id": str(product["_id"]), **variant}
+            ))
+
+    async def orders(self, client, rng: random.Random, user: dict):
+        record = self.recorder.request
+        user_id = str(user["_id"])
+        if rng.random() < 0.4:
+            items = []
+            for product in rng.sample(self.catalog, rng.randint(1, 3)):
+                items.append({
+                    "product_id": str(product["_id"]),
+                    "product_name": product["name"],
+                    "product_image": product.get("image", ""),
+                    "variant_color": product["variants"]["colors"][0]["slug"] if product["variants"]["colors"] else None,
+                    "variant_size": product["variants"]["sizes"][0]["name"] if product["variants"]["sizes"] else None,
+                    "quantity": 1,
+                    "price": product["pricing"].get("sale") or product["pricing"].get("original", 0),
+                })
+            body = {
+                "user_id": user_id,
+                "items": items,
+                "total_amount": sum(item["price"] for item in items),
+                "shipping_address": {
+                    "full_name": user.get("name", ""), "phone": user.get("phone", "0900000000"), "email": user.get("email", ""),
+                    "street": "1 Nguyễn Trãi", "ward": "Phường 1", "city": rng.choice(CITIES),
+                },
+                "payment_method": "COD",
+            }
+            await record("POST /api/orders", client.post("/api/orders", json=body))
+        await record("GET /api/orders/user/{user_id}", client.get(f"/api/orders/user/{user_id}"))
+
+    async def admin(self, client, rng: random.Random, user: dict):
+        record = self.recorder.request
+        await record("GET /api/admin/dashboard", client.get("/api/admin/dashboard"))
+        await record("GET /api/admin/orders", client.get("/api/admin/orders", params={"page": rng.randint(1, 5)}))
+
+
+# ==================== RUNNER ====================
+
+async def _virtual_user(index: int, client, scenarios: Scenarios, weights: Dict[str, int],
+                        users: List[dict], deadline: float, recorder: Recorder, max_requests: Optional[int], seed_value: int):
+    rng = random.Random(seed_value * 1_000 + index)
+    names = list(weights)
+    handlers: List[Callable] = [getattr(scenarios, name) for name in names]
+    weight_values = [weights[name] for name in names]
+    while time.perf_counter() < deadline:
+        if max_requests and recorder.total >= max_requests:
+            return
+        handler = rng.choices(handlers, weights=weight_values)[0]
+        await handler(client, rng, rng.choice(users))
+
+
+async def _run_load(client, scenarios: Scenarios, weights: Dict[str, int], args) -> float:
+    recorder = scenarios.recorder
+    # Virtual user i dùng nhóm user riêng -> thao tác giỏ hàng (sửa item index 0) không giẫm lên nhau
+    groups = [scenarios.customers[i::args.concurrency] or scenarios.customers for i in range(args.concurrency)]
+
+    async def run_phase(seconds: float, max_requests: Optional[int]) -> float:
+        start = time.perf_counter()
+        deadline = start + seconds
+        await asyncio.gather(*(
+            _virtual_user(i, client, scenarios, weights, groups[i], deadline, recorder, max_requests, args.seed)
+            for i in range(args.concurrency)
+        ))
+        return time.perf_counter() - start
+
+    if args.warmup > 0:
+        print(f"🔥 Warm-up {args.warmup}s...", flush=True)
+        await run_phase(args.warmup, None)
+    recorder.enabled = True
+    print(f"▶ {args.concurrency} virtual users, {args.duration}s...", flush=True)
+    return await run_phase(args.duration, args.requests)
+
+
+async def _wait_background_jobs(timeout: float = 300):
+    """Chờ recommender fit nền xong (startup) để đo ở trạng thái ổn định"""
+    from app.recommendation import recommender
+
+    job_id = recommender.get_stats()["current_job"]
+    deadline = time.perf_counter() + timeout
+    while job_id and time.perf_counter() < deadline:
+        job = recommender.get_job(job_id)
+        if job is None or job["status"] in ("completed", "failed"):
+            return
+        await asyncio.sleep(0.2)
+
+
+def _summarize(recorder: Recorder, elapsed: float) -> dict:
+    endpoints = {}
+    all_samples = []
+    for name in sorted(recorder.latencies):
+        samples = np.asarray(recorder.latencies[name], dtype=np.float64) / 1e6
+        all_samples.append(samples)
+        errors = recorder.errors.get(name, 0)
+        endpoints[name] = {
+            "requests": int(samples.size),
+            "errors": errors,
+            "error_rate": round(errors / samples.size, 4),
+            "rps": round(samples.size / elapsed, 2),
+            "p50_ms": round(float(np.percentile(samples, 50)), 3),
+            "p90_ms": round(float(np.percentile(samples, 90)), 3),
+            "p99_ms": round(float(np.percentile(samples, 99)), 3),
+            "max_ms": round(float(samples.max()), 3),
+            "mean_ms": round(float(samples.mean()), 3),
+            "statuses": dict(recorder.statuses[name]),
+        }
+    merged = np.concatenate(all_samples) if all_samples else np.zeros(1)
+    return {
+        "elapsed_seconds": round(elapsed, 3),
+        "total": {
+            "requests": recorder.total,
+            "errors": sum(recorder.errors.values()),
+            "rps": round(recorder.total / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(float(np.percentile(merged, 50)), 3),
+            "p99_ms": round(float(np.percentile(merged, 99)), 3),
+        },
+        "endpoints": endpoints,
+    }
+
+
+def _print_summary(summary: dict):
+    width = max([len(name) for name in summary["endpoints"]] + [8])
+    print(f"\n{'endpoint':<{width}} {'req':>7} {'err':>5} {'rps':>8} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}")
+    for name, stats in summary["endpoints"].items():
+        print(
+            f"{name:<{width}} {stats['requests']:>7} {stats['errors']:>5} {stats['rps']:>8.1f} "
+            f"{stats['p50_ms']:>9.2f} {stats['p90_ms']:>9.2f} {stats['p99_ms']:>9.2f} {stats['max_ms']:>9.2f}"
+        )
+    total = summary["total"]
+    print(
+        f"{'TOTAL':<{width}} {total['requests']:>7} {total['errors']:>5} {total['rps']:>8.1f} "
+        f"{total['p50_ms']:>9.2f} {'':>9} {total['p99_ms']:>9.2f}  (ms, {summary['elapsed_seconds']}s)"
+    )
+
+
+def _compare(summary: dict, baseline_path: str):
+    """In chênh lệch so với 1 file kết quả trước (p99 ratio > 1 = chậm hơn, rps ratio < 1 = ít hơn)"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["summary"]
+
+    print(f"\nSo với baseline {baseline_path}:")
+    rows = list(summary["endpoints"].items()) + [("TOTAL", summary["total"])]
+    old_rows = {**baseline["endpoints"], "TOTAL": baseline["total"]}
+    for name, stats in rows:
+        old = old_rows.get(name)
+        if old is None:
+            continue
+        parts = []
+        for metric in ("rps", "p50_ms", "p99_ms"):
+            before, after = old[metric], stats[metric]
+            ratio = after / before if before else float("inf")
+            parts.append(f"{metric} {before} -> {after} (x{ratio:.2f})")
+        print(f"  {name}: " + ", ".join(parts))
+
+
+async def _run(args) -> Optional[dict]:
+    database = prepare_database(args)
+    volumes = {name: getattr(args, name) for name in DEFAULT_VOLUMES}
+
+    if not args.no_seed:
+        if args.mongo_url and "loadtest" not in args.db_name and not args.force:
+            raise SystemExit(f"❌ Seed sẽ xóa dữ liệu trong '{args.db_name}' - dùng --force nếu chắc chắn")
+        start = time.perf_counter()
+        counts = await seed(database, volumes, args.seed)
+        print(f"🌱 Seeded {counts} trong {time.perf_counter() - start:.1f}s", flush=True)
+    if args.seed_only:
+        return None
+
+    dataset = await load_dataset(database)
+    import httpx
+
+    if args.base_url:
+        client = httpx.AsyncClient(
+            base_url=args.base_url, timeout=args.timeout,
+            limits=httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        )
+        main = None
+    else:
+        import app.main as main
+        await main.startup_event()
+        await _wait_background_jobs()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://loadtest", timeout=args.timeout)
+
+    weights = {name: SCENARIO_WEIGHTS[name] for name in args.scenarios}
+    recorder = Recorder()
+    try:
+        elapsed = await _run_load(client, Scenarios(dataset, recorder), weights, args)
+    finally:
+        await client.aclose()
+        if main is not None:
+            await main.shutdown_event()
+
+    return {
+        "benchmark": "load",
+        "created_at": datetime.now().isoformat(),
+        "target": args.base_url or ("in-process+mongodb" if args.mongo_url else "in-process+mongomock"),
+        "seed": args.seed,
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "scenarios": weights,
+        "volumes": volumes,
+        "environment": _environment(),
+        "summary": _summarize(recorder, elapsed),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Load test API storefront + admin")
+    parser.add_argument("--concurrency", type=int, default=20, help="Số virtual user chạy song song")
+    parser.add_argument("--duration", type=float, default=30, help="Thời gian đo (giây)")
+    parser.add_argument("--warmup", type=float, default=5, help="Thời gian warm-up không tính vào kết quả (giây)")
+    parser.add_argument("--requests", type=int, help="Dừng sớm khi đủ số request")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIO_WEIGHTS), default=list(SCENARIO_WEIGHTS))
+    parser.add_argument("--timeout", type=float, default=30, help="Timeout mỗi request (giây)")
+    for name, default in DEFAULT_VOLUMES.items():
+        parser.add_argument(f"--{name}", type=int, default=default, help=f"Số {name} seed (mặc định {default})")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--mongo-url", help="MongoDB thật (mặc định mongomock-motor in-memory)")
+    parser.add_argument("--db-name", default=DEFAULT_DB_NAME, help="Database dùng để seed / đọc dữ liệu")
+    parser.add_argument("--base-url", help="Bắn vào server đang chạy (vd. http://localhost:8000), cần --mongo-url")
+    parser.add_argument("--no-seed", action="store_true", help="Dùng dữ liệu đã có trong --db-name")
+    parser.add_argument("--seed-only", action="store_true", help="Chỉ seed rồi thoát (cần --mongo-url)")
+    parser.add_argument("--force", action="store_true", help="Cho phép seed (xóa dữ liệu) vào database không chứa 'loadtest'")
+    parser.add_argument("--output", help="File JSON kết quả (mặc định benchmarks/results/load-<timestamp>.json)")
+    parser.add_argument("--baseline", help="File kết quả trước đó để so sánh")
+    args = parser.parse_args(argv)
+
+    if (args.base_url or args.seed_only) and not args.mongo_url:
+        parser.error("--base-url / --seed-only cần --mongo-url (server phải đọc cùng database)")
+    if args.concurrency < 1:
+        parser.error("--concurrency phải >= 1")
+
+    report = asyncio.run(_run(args))
+    if report is None:
+        return
+
+    _print_summary(report["summary"])
+    output = args.output or os.path.join(RESULTS_DIR, f"load-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"✅ Đã ghi {output}")
+
+    if args.baseline:
+        _compare(report["summary"], args.baseline)
+    if report["summary"]["total"]["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
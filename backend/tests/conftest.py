@@ -0,0 +1,13 @@
+"""
+Fixtures dùng chung cho test backend
+
+Chạy: cd backend && pip install -r requirements-dev.txt && pytest -q
+Test async chạy qua plugin pytest của anyio (đi kèm fastapi/httpx), chỉ dùng asyncio.
+"""
+
+import pytest
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
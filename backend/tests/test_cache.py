@@ -0,0 +1,192 @@
+"""
+TTLCache + registry: LRU/TTL, invalidation theo tag, single-flight, event bus giữa các worker
+"""
+
+import asyncio
+import itertools
+
+import pytest
+
+from app import cache
+from app.cache import TTLCache, get_cache, invalidate_tags
+
+_names = itertools.count()
+
+
+@pytest.fixture
+def make_cache():
+    """Cache đăng ký vào registry với tên riêng, gỡ ra sau test"""
+    created = []
+
+    def make(**kwargs):
+        name = f"test-{next(_names)}"
+        created.append(name)
+        return get_cache(name, **kwargs)
+
+    yield make
+    for name in created:
+        cache._caches.pop(name, None)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_ttl_expiry(clock):
+    c = TTLCache("ttl", ttl=10)
+    c.set("a", 1)
+    clock[0] += 9
+    assert c.get("a") == 1
+    clock[0] += 2
+    assert c.get("a") is None
+    assert len(c) == 0
+    assert c.expirations == 1
+
+
+def test_lru_eviction_keeps_recently_used():
+    c = TTLCache("lru", maxsize=2)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.get("a")
+    c.set("c", 3)
+    assert "a" in c and "c" in c and "b" not in c
+    assert c.evictions == 1
+
+
+def test_invalidate_tag_only_drops_tagged_entries():
+    c = TTLCache("tags")
+    c.set("p1", 1, tags=("product:1", "products"))
+    c.set("p2", 2, tags=("product:2", "products"))
+    c.set("other", 3)
+    assert c.invalidate_tag("product:1") == 1
+    assert "p1" not in c and "p2" in c and "other" in c
+    assert c.invalidate_tag("products") == 1
+    assert "other" in c
+    # Tag index không còn giữ key đã xóa
+    assert c._tag_index == {}
+
+
+def test_invalidate_tags_across_registered_caches(make_cache):
+    first, second = make_cache(), make_cache()
+    first.set("x", 1, tags=("orders",))
+    second.set("y", 2, tags=("orders", "dashboard"))
+    second.set("z", 3, tags=("dashboard",))
+    assert invalidate_tags("orders") == 2
+    assert "x" not in first and "y" not in second and "z" in second
+
+
+@pytest.mark.anyio
+async def test_get_or_compute_single_flight():
+    c = TTLCache("flight")
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "value"
+
+    results = await asyncio.gather(*(c.get_or_compute("k", compute) for _ in range(5)))
+    assert results == ["value"] * 5
+    assert calls == 1
+    assert c.coalesced == 4
+    assert c.get("k") == "value"
+
+
+@pytest.mark.anyio
+async def test_invalidate_during_compute_is_not_cached():
+    c = TTLCache("discard")
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def compute():
+        started.set()
+        await release.wait()
+        return "stale"
+
+    task = asyncio.ensure_future(c.get_or_compute("k", compute, tags=("products",)))
+    await started.wait()
+    c.invalidate_tag("products")
+    release.set()
+    assert await task == "stale"
+    assert "k" not in c
+
+
+@pytest.mark.anyio
+async def test_get_or_compute_serves_stale_while_refreshing(clock):
+    c = TTLCache("swr", ttl=10, stale_ttl=60)
+    c.set("k", "old")
+    clock[0] += 20
+
+    async def compute():
+        return "new"
+
+    assert await c.get_or_compute("k", compute) == "old"
+    await asyncio.gather(*(flight.task for flight in list(c._inflight.values())))
+    assert c.get("k") == "new"
+    assert c.stale_hits == 1
+
+
+class _RecordingBackend:
+    shared = True
+
+    def __init__(self):
+        self.events = []
+
+    async def publish_event(self, topic, data):
+        self.events.append((topic, data))
+
+    async def invalidate(self, tags):
+        return None
+
+
+@pytest.mark.anyio
+async def test_event_bus(monkeypatch):
+    backend = _RecordingBackend()
+    monkeypatch.setattr(cache, "_backend", backend)
+    monkeypatch.setattr(cache, "_event_listeners", {})
+
+    cache.publish_event("dashboard", {"type": "order"})
+    await asyncio.gather(*cache._pending_publishes)
+    assert backend.events == [("dashboard", {"type": "order"})]
+
+    received = []
+
+    async def on_async(data):
+        received.append(("async", data))
+
+    cache.add_event_listener("cooccurrence", lambda data: received.append(("sync", data)))
+    cache.add_event_listener("cooccurrence", on_async)
+    cache._on_remote_event("cooccurrence", {"kind": "order"})
+    cache._on_remote_event("other", {"ignored": True})
+    await asyncio.gather(*cache._pending_event_handlers)
+    assert received == [("sync", {"kind": "order"}), ("async", {"kind": "order"})]
+    # Event không đi qua tag invalidation
+    assert "cooccurrence" not in cache._tag_invalidated_at
+
+
+def test_invalidation_listener_receives_tags(monkeypatch):
+    received = []
+    monkeypatch.setattr(cache, "_invalidation_listeners", [lambda tags, remote: received.append((tuple(tags), remote))])
+    invalidate_tags("a", "b")
+    cache._on_remote_invalidate(["c"])
+    assert received == [(("a", "b"), False), (("c",), True)]
+
+
+def test_tag_timestamps_are_pruned(monkeypatch):
+    monkeypatch.setattr(cache, "_caches", {"prune": TTLCache("prune", ttl=30, stale_ttl=30)})
+    monkeypatch.setattr(cache, "_tag_invalidated_at", {})
+    monkeypatch.setattr(cache, "_tag_pruned_at", 0.0)
+    now = [10_000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+
+    for user in range(100):
+        invalidate_tags(f"wishlist:user:{user}")
+    assert len(cache._tag_invalidated_at) == 100
+
+    now[0] += 3600
+    invalidate_tags("orders")
+    assert set(cache._tag_invalidated_at) == {"orders"}
@@ -0,0 +1,107 @@
+"""
+Giỏ hàng: $inc / $set theo items.$ (khớp product + biến thể) và $pull đúng item
+"""
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from app import main  # noqa: E402
+
+pytestmark = pytest.mark.anyio
+
+USER_ID = "user-1"
+
+
+@pytest.fixture
+async def db(monkeypatch):
+    database = mongomock_motor.AsyncMongoMockClient()["test"]
+    monkeypatch.setattr(main, "cart_collection", database["cart"])
+    monkeypatch.setattr(main, "products_collection", database["products"])
+    shirt = await database["products"].insert_one({
+        "name": "Áo thun", "image": "shirt.jpg", "pricing": {"sale": 100},
+        "variants": {"colors": [{"slug": "den", "name": "Đen", "images": ["shirt-den.jpg"]}]},
+    })
+    jeans = await database["products"].insert_one({"name": "Quần jeans", "pricing": {"original": 300}})
+    return database, str(shirt.inserted_id), str(jeans.inserted_id)
+
+
+async def _items(database) -> list:
+    cart = await database["cart"].find_one({"user_id": USER_ID})
+    return [(item["product_id"], item["variant_color"], item["variant_size"], item["quantity"]) for item in cart["items"]]
+
+
+async def test_add_increments_matching_variant_in_place(db):
+    database, shirt, jeans = db
+    await main.add_to_cart(user_id=USER_ID, product_id=shirt, color="den", size="M", quantity=1)
+    await main.add_to_cart(user_id=USER_ID, product_id=shirt, color="den", size="L", quantity=1)
+    await main.add_to_cart(user_id=USER_ID, product_id=jeans, color=None, size=None, quantity=2)
+    await main.add_to_cart(user_id=USER_ID, product_id=shirt, color="den", size="L", quantity=3)
+
+    assert await _items(database) == [
+        (shirt, "den", "M", 1),
+        (shirt, "den", "L", 4),
+        (jeans, None, None, 2),
+    ]
+    cart = await database["cart"].find_one({"user_id": USER_ID})
+    assert cart["items"][0]["product_image"] == "shirt-den.jpg"
+    assert cart["items"][2]["price"] == 300
+    assert await database["cart"].count_documents({}) == 1
+
+    with pytest.raises(HTTPException) as exc_info:
+        await main.add_to_cart(user_id=USER_ID, product_id=str(ObjectId()), color=None, size=None, quantity=1)
+    assert exc_info.value.status_code == 404
+
+
+async def test_update_quantity_targets_one_element(db):
+    database, shirt, jeans = db
+    for size in ("M", "L"):
+        await main.add_to_cart(user_id=USER_ID, product_id=shirt, color="den", size=size, quantity=1)
+    await main.add_to_cart(user_id=USER_ID, product_id=jeans, color=None, size=None, quantity=1)
+
+    await main.update_cart_item_quantity_by_variant(user_id=USER_ID, product_id=shirt, color="den", size="L", quantity=5)
+    await main.update_cart_item_quantity(user_id=USER_ID, item_index=2, quantity=7)
+    assert await _items(database) == [
+        (shirt, "den", "M", 1),
+        (shirt, "den", "L", 5),
+        (jeans, None, None, 7),
+    ]
+
+    with pytest.raises(HTTPException) as exc_info:
+        await main.update_cart_item_quantity_by_variant(user_id=USER_ID, product_id=shirt, color="den", size="XL", quantity=2)
+    assert exc_info.value.status_code == 404
+    with pytest.raises(HTTPException) as exc_info:
+        await main.update_cart_item_quantity(user_id=USER_ID, item_index=3, quantity=2)
+    assert exc_info.value.status_code == 400
+    with pytest.raises(HTTPException) as exc_info:
+        await main.update_cart_item_quantity(user_id="no-cart", item_index=0, quantity=2)
+    assert exc_info.value.status_code == 404
+
+
+async def test_remove_pulls_only_the_matching_item(db):
+    database, shirt, jeans = db
+    for size in ("S", "M", "L"):
+        await main.add_to_cart(user_id=USER_ID, product_id=shirt, color="den", size=size, quantity=1)
+    await main.add_to_cart(user_id=USER_ID, product_id=jeans, color=None, size=None, quantity=1)
+
+    await main.remove_cart_item_by_variant(user_id=USER_ID, product_id=shirt, color="den", size="M")
+    assert await _items(database) == [
+        (shirt, "den", "S", 1),
+        (shirt, "den", "L", 1),
+        (jeans, None, None, 1),
+    ]
+    # Legacy theo index: đọc item tại index rồi $pull theo product + biến thể
+    await main.remove_cart_item(user_id=USER_ID, item_index=1)
+    assert await _items(database) == [(shirt, "den", "S", 1), (jeans, None, None, 1)]
+
+    with pytest.raises(HTTPException) as exc_info:
+        await main.remove_cart_item_by_variant(user_id=USER_ID, product_id=shirt, color="den", size="M")
+    assert exc_info.value.status_code == 404
+    with pytest.raises(HTTPException) as exc_info:
+        await main.remove_cart_item(user_id=USER_ID, item_index=5)
+    assert exc_info.value.status_code == 400
+    with pytest.raises(HTTPException) as exc_info:
+        await main.remove_cart_item_by_variant(user_id="no-cart", product_id=shirt, color=None, size=None)
+    assert exc_info.value.status_code == 404
@@ -0,0 +1,103 @@
+"""
+CategoryTree: count sản phẩm active theo cây con, cập nhật tăng dần, breadcrumb
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from app.category_tree import CategoryTree
+
+
+def _category(name: str, parent=None, minutes: int = 0, status: str = "active") -> dict:
+    return {
+        "_id": ObjectId(),
+        "name": name,
+        "slug": name.lower(),
+        "parent_id": str(parent["_id"]) if parent else None,
+        "status": status,
+        "created_at": datetime(2024, 1, 1) + timedelta(minutes=minutes),
+    }
+
+
+def _product(slug: str, status: str = "active") -> dict:
+    return {"_id": ObjectId(), "category": {"slug": slug}, "status": status}
+
+
+@pytest.fixture
+def tree_data():
+    men = _category("Nam", minutes=0)
+    women = _category("Nu", minutes=1)
+    shirts = _category("Ao", parent=men, minutes=2)
+    tees = _category("Thun", parent=shirts, minutes=3)
+    products = [_product("nam"), _product("ao"), _product("thun"), _product("thun"),
+                _product("thun", status="draft"), _product("nu")]
+    return {"men": men, "women": women, "shirts": shirts, "tees": tees}, products
+
+
+def _tree(categories, products) -> CategoryTree:
+    tree = CategoryTree()
+    tree.build(list(categories.values()), products)
+    return tree
+
+
+def test_rolled_up_counts(tree_data):
+    categories, products = tree_data
+    tree = _tree(categories, products)
+    men = tree.get_category("nam")
+    assert (men["direct_product_count"], men["product_count"], men["subcategories_count"]) == (1, 4, 1)
+    assert tree.get_category("ao")["product_count"] == 3
+    assert tree.get_category(str(categories["tees"]["_id"]))["product_count"] == 2
+    assert [c["slug"] for c in tree.list_categories(parent_id="null")] == ["nam", "nu"]
+
+
+def test_subtree_and_breadcrumb(tree_data):
+    categories, products = tree_data
+    tree = _tree(categories, products)
+    roots = tree.subtree()
+    assert [root["slug"] for root in roots] == ["nam", "nu"]
+    assert roots[0]["children"][0]["children"][0]["slug"] == "thun"
+    assert [step["slug"] for step in tree.breadcrumb("thun")] == ["nam", "ao", "thun"]
+    assert tree.breadcrumb("missing") == []
+
+
+def test_apply_product_moves_counts(tree_data):
+    categories, products = tree_data
+    tree = _tree(categories, products)
+    product_id = str(products[2]["_id"])
+
+    assert tree.apply_product(product_id, {"category": {"slug": "nu"}, "status": "active"})
+    assert tree.get_category("thun")["product_count"] == 1
+    assert tree.get_category("nu")["product_count"] == 2
+    assert tree.get_category("nam")["product_count"] == 3
+
+    assert not tree.apply_product(product_id, {"category": {"slug": "nu"}, "status": "active"})
+    assert tree.apply_product(product_id, None)
+    assert tree.get_category("nu")["product_count"] == 1
+
+
+def test_parent_cycle_does_not_loop(tree_data):
+    categories, products = tree_data
+    categories["men"]["parent_id"] = str(categories["tees"]["_id"])
+    tree = _tree(categories, products)
+    assert tree.get_category("nam")["product_count"] >= 1
+    assert len(tree.breadcrumb("thun")) == 3
+
+
+@pytest.mark.anyio
+async def test_load_and_refresh_product(tree_data):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    categories, products = tree_data
+    db = mongomock_motor.AsyncMongoMockClient().db
+    await db.categories.insert_many(list(categories.values()))
+    await db.products.insert_many(products)
+
+    tree = CategoryTree()
+    tree.attach(db.categories, db.products)
+    assert await tree.load() == 4
+    assert tree.get_category("nam")["product_count"] == 4
+
+    await db.products.update_one({"_id": products[0]["_id"]}, {"$set": {"status": "inactive"}})
+    await tree.refresh_product(str(products[0]["_id"]))
+    assert tree.get_category("nam")["product_count"] == 3
@@ -0,0 +1,172 @@
+"""
+CooccurrenceEngine: đếm cặp khi build và khi có đơn hàng / toggle wishlist xen giữa lúc build
+"""
+
+import asyncio
+import copy
+from typing import Callable, Optional
+
+import pytest
+from bson import ObjectId
+from mongomock.filtering import filter_applies
+
+from app.cooccurrence import CooccurrenceEngine
+
+pytestmark = pytest.mark.anyio
+
+
+class _LiveCursor:
+    """Duyệt theo _id tăng dần và đọc document lúc tới lượt (giống cursor MongoDB thật)"""
+
+    def __init__(self, collection: "LiveCollection", query: dict):
+        self._collection = collection
+        self._query = query
+        self._last: Optional[ObjectId] = None
+
+    def batch_size(self, size: int) -> "_LiveCursor":
+        return self
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        await asyncio.sleep(0)
+        for doc_id in sorted(self._collection.docs):
+            if self._last is not None and doc_id <= self._last:
+                continue
+            doc = self._collection.docs[doc_id]
+            if not filter_applies(self._query, doc):
+                continue
+            self._last = doc_id
+            result = copy.deepcopy(doc)
+            if self._collection.on_read is not None:
+                self._collection.on_read(result)
+            return result
+        raise StopAsyncIteration
+
+
+class LiveCollection:
+    """Collection tối thiểu cho build(): find (cursor sống) + find_one sort _id"""
+
+    def __init__(self, docs=()):
+        self.docs = {doc["_id"]: doc for doc in docs}
+        self.on_read: Optional[Callable[[dict], None]] = None
+
+    def find(self, query: dict, projection: Optional[dict] = None) -> _LiveCursor:
+        return _LiveCursor(self, query)
+
+    async def find_one(self, query: dict, projection: Optional[dict] = None, sort=None) -> Optional[dict]:
+        ids = sorted(self.docs, reverse=bool(sort and sort[0][1] < 0))
+        for doc_id in ids:
+            if filter_applies(query, self.docs[doc_id]):
+                return dict(self.docs[doc_id])
+        return None
+
+    def insert(self, doc: dict) -> dict:
+        doc.setdefault("_id", ObjectId())
+        self.docs[doc["_id"]] = doc
+        return doc
+
+
+def _order(*product_ids: str, status: str = "pending") -> dict:
+    return {"_id": ObjectId(), "items": [{"product_id": pid} for pid in product_ids], "status": status}
+
+
+def _pair(matrix, engine: CooccurrenceEngine, a: str, b: str) -> float:
+    if a not in engine._index or b not in engine._index:
+        return 0.0
+    cols, vals = matrix.row(engine._index[a])
+    hits = vals[cols == engine._index[b]]
+    return float(hits[0]) if hits.size else 0.0
+
+
+def _count(matrix, engine: CooccurrenceEngine, product_id: str) -> float:
+    if product_id not in engine._index:
+        return 0.0
+    return float(matrix.counts[engine._index[product_id]])
+
+
+async def _engine(orders=(), users=()):
+    orders_collection, users_collection = LiveCollection(orders), LiveCollection(users)
+    engine = CooccurrenceEngine()
+    engine.attach(orders_collection, users_collection)
+    return engine, orders_collection, users_collection
+
+
+async def test_build_counts_orders_and_wishlists():
+    engine, _, _ = await _engine(
+        orders=[_order("a", "b"), _order("a", "b", "c"), _order("a", "c", status="cancelled")],
+        users=[{"_id": ObjectId(), "wishlist": ["a", {"product_id": "c"}]}, {"_id": ObjectId(), "wishlist": []}],
+    )
+    assert await engine.build()
+    assert _pair(engine.bought, engine, "a", "b") == 2
+    assert _pair(engine.bought, engine, "a", "c") == 1
+    assert _count(engine.bought, engine, "a") == 2
+    assert _pair(engine.liked, engine, "a", "c") == 1
+    assert engine.frequently_bought_together("a", n=1)[0][0] == "b"
+
+
+async def test_order_created_during_build_is_counted_once():
+    engine, orders, _ = await _engine(orders=[_order("x", "y"), _order("p", "q")])
+
+    def create_order(doc):
+        if doc["items"][0]["product_id"] == "x" and orders.on_read is not None:
+            orders.on_read = None
+            new = orders.insert(_order("a", "b"))
+            engine.add_order(new["items"], order_id=new["_id"])
+
+    orders.on_read = create_order
+    assert await engine.build()
+    assert _pair(engine.bought, engine, "a", "b") == 1
+    assert _count(engine.bought, engine, "a") == 1
+
+
+async def test_order_cancelled_during_build_is_removed_once():
+    first, second = _order("a", "b"), _order("c", "d")
+    engine, orders, _ = await _engine(orders=[first, second])
+
+    def cancel_both(doc):
+        if doc["_id"] == first["_id"]:
+            # Cursor đã đọc đơn đầu, đơn sau bị hủy trước khi cursor tới
+            for order in (first, second):
+                order["status"] = "cancelled"
+                engine.add_order(order["items"], -1, order_id=order["_id"])
+
+    orders.on_read = cancel_both
+    assert await engine.build()
+    assert _pair(engine.bought, engine, "a", "b") == 0
+    assert _count(engine.bought, engine, "a") == 0
+    assert _count(engine.bought, engine, "c") == 0
+
+
+async def test_wishlist_toggle_during_build_is_counted_once():
+    reader, late = ObjectId(), ObjectId()
+    users = [
+        {"_id": min(reader, late), "wishlist": ["a"]},
+        {"_id": max(reader, late), "wishlist": ["a"]},
+    ]
+    engine, _, users_collection = await _engine(users=users)
+
+    def toggle(doc):
+        if doc["_id"] != users[0]["_id"]:
+            return
+        # User đầu: cursor đã đọc trước khi toggle -> phải replay
+        # User sau: toggle trước khi cursor tới, cursor đọc thấy version mới -> bỏ replay
+        for user in users:
+            others = list(user["wishlist"])
+            user["wishlist"].append("b")
+            user["wishlist_version"] = user.get("wishlist_version", 0) + 1
+            engine.add_wishlist_item("b", others, user_id=str(user["_id"]), version=user["wishlist_version"])
+
+    users_collection.on_read = toggle
+    assert await engine.build()
+    assert _pair(engine.liked, engine, "a", "b") == 2
+    assert _count(engine.liked, engine, "b") == 2
+
+
+async def test_remote_event_applies_without_database():
+    engine, _, _ = await _engine(orders=[_order("a", "b")])
+    assert await engine.build()
+    other = CooccurrenceEngine()
+    other.on_event(engine.add_order([{"product_id": "a"}, {"product_id": "b"}], order_id=ObjectId()))
+    assert _pair(other.bought, other, "a", "b") == 1
@@ -0,0 +1,144 @@
+"""
+ProductFacetIndex: filter bằng bitset phải khớp với query MongoDB tương ứng
+"""
+
+import random
+
+import pytest
+from bson import ObjectId
+
+from app.facet_index import ProductFacetIndex
+
+mongomock = pytest.importorskip("mongomock")
+
+SIZES = ["S", "M", "L", "XL"]
+COLORS = ["den", "trang", "do"]
+BRANDS = ["vyron", "basic"]
+CATEGORIES = ["ao-thun", "quan-jean", "vay"]
+
+
+def _product(rng: random.Random) -> dict:
+    price = rng.choice([None, 99000, 150000, 150000, 299000, 450000])
+    return {
+        "_id": ObjectId(),
+        "name": f"P{rng.random()}",
+        "status": rng.choice(["active", "active", "draft"]),
+        "brand": {"slug": rng.choice(BRANDS)},
+        "category": {"slug": rng.choice(CATEGORIES)},
+        "pricing": {"sale": price} if price is not None else {},
+        "variants": {
+            "sizes": [{"name": size} for size in rng.sample(SIZES, rng.randint(0, 3))],
+            "colors": [{"slug": color} for color in rng.sample(COLORS, rng.randint(1, 2))],
+        },
+    }
+
+
+@pytest.fixture
+def catalog():
+    rng = random.Random(7)
+    products = [_product(rng) for _ in range(120)]
+    collection = mongomock.MongoClient().db.products
+    collection.insert_many([dict(p) for p in products])
+    index = ProductFacetIndex()
+    index.build(products)
+    return index, collection
+
+
+def _mongo_ids(collection, query, sort=(("_id", -1),)):
+    return [str(doc["_id"]) for doc in collection.find(query).sort(list(sort))]
+
+
+def _index_ids(result):
+    return [str(doc["_id"]) for doc in result["products"]]
+
+
+@pytest.mark.parametrize("filters, query", [
+    ({}, {}),
+    ({"sizes": ["M"]}, {"variants.sizes.name": {"$in": ["M"]}}),
+    ({"sizes": ["S", "XL"], "colors": ["den"]},
+     {"variants.sizes.name": {"$in": ["S", "XL"]}, "variants.colors.slug": {"$in": ["den"]}}),
+    ({"brands": ["vyron"], "categories": ["vay", "ao-thun"], "status": ["active"]},
+     {"brand.slug": {"$in": ["vyron"]}, "category.slug": {"$in": ["vay", "ao-thun"]}, "status": {"$in": ["active"]}}),
+])
+def test_facet_filters_match_mongo(catalog, filters, query):
+    index, collection = catalog
+    expected = _mongo_ids(collection, query)
+    result = index.query(filters, limit=1000)
+    assert result["total"] == len(expected)
+    assert _index_ids(result) == expected
+
+
+def test_price_range_and_sort(catalog):
+    index, collection = catalog
+    sort = [("pricing.sale", 1), ("_id", 1)]
+    query = {"pricing.sale": {"$gte": 100000, "$lte": 300000}}
+    expected = _mongo_ids(collection, query, sort)
+    result = index.query({}, price_min=100000, price_max=300000, sort_spec=sort, limit=1000)
+    assert _index_ids(result) == expected
+
+
+def test_pagination_returns_one_extra(catalog):
+    index, collection = catalog
+    expected = _mongo_ids(collection, {"status": "active"})
+    first = index.query({"status": ["active"]}, skip=0, limit=10)
+    second = index.query({"status": ["active"]}, skip=10, limit=10)
+    assert _index_ids(first) == expected[:11]
+    assert _index_ids(second) == expected[10:21]
+
+
+def test_facet_counts_ignore_own_filter(catalog):
+    index, collection = catalog
+    result = index.query({"colors": ["den"], "sizes": ["M"]}, include_facets=True)
+    facets = result["facets"]
+    # Đếm màu: chỉ áp filter size, không áp filter màu
+    for color in COLORS:
+        expected = collection.count_documents({"variants.sizes.name": "M", "variants.colors.slug": color})
+        assert facets["colors"].get(color, 0) == expected
+    for size in SIZES:
+        expected = collection.count_documents({"variants.colors.slug": "den", "variants.sizes.name": size})
+        assert facets["sizes"].get(size, 0) == expected
+
+
+def test_upsert_and_remove_update_bitsets(catalog):
+    index, collection = catalog
+    product = _product(random.Random(1))
+    product["variants"]["sizes"] = [{"name": "XXL"}]
+    product["pricing"] = {"sale": 1}
+    index.upsert(product)
+    assert _index_ids(index.query({"sizes": ["XXL"]})) == [str(product["_id"])]
+    assert _index_ids(index.query({}, price_max=1)) == [str(product["_id"])]
+
+    product = dict(product, variants={"sizes": [{"name": "S"}], "colors": []})
+    index.upsert(product)
+    assert index.query({"sizes": ["XXL"]})["total"] == 0
+
+    total = index.query({})["total"]
+    index.remove(str(product["_id"]))
+    assert index.query({})["total"] == total - 1
+    assert index.query({}, price_max=1)["total"] == 0
+    # Row được tái sử dụng cho sản phẩm mới
+    row = index._free_rows[-1]
+    index.upsert(_product(random.Random(2)))
+    assert not index._free_rows or index._free_rows[-1] != row
+
+
+def test_counter_update_resorts_without_reindexing(catalog):
+    index, collection = catalog
+    sort = [("wishlist_count", -1), ("_id", -1)]
+    product_id = _index_ids(index.query({}, sort_spec=sort, limit=1000))[-1]
+    facets_before = index.query({}, include_facets=True)["facets"]
+    old_doc = index.get_docs([product_id])[product_id]
+
+    assert index.set_counter(product_id, "wishlist_count", 3)
+    collection.update_one({"_id": ObjectId(product_id)}, {"$set": {"wishlist_count": 3}})
+    assert _index_ids(index.query({}, sort_spec=sort, limit=1000)) == _mongo_ids(collection, {}, sort)
+    assert _index_ids(index.query({}, sort_spec=sort, limit=1))[0] == product_id
+    assert index.query({}, include_facets=True)["facets"] == facets_before
+    assert "wishlist_count" not in old_doc  # Doc đã trả cho request trước không bị sửa
+
+    # Delta từ worker khác, không xuống dưới 0
+    index.on_counter_event({"product_id": product_id, "field": "wishlist_count", "delta": -1})
+    assert index.get_docs([product_id])[product_id]["wishlist_count"] == 2
+    index.on_counter_event({"product_id": product_id, "field": "wishlist_count", "delta": -5})
+    assert index.get_docs([product_id])[product_id]["wishlist_count"] == 0
+    assert not index.set_counter(str(ObjectId()), "wishlist_count", 1)
@@ -0,0 +1,91 @@
+"""
+Logging: QueueHandler -> QueueListener ghi JSON kèm request_id từ CorrelationIdMiddleware
+"""
+
+import io
+import json
+import logging
+import time
+
+import pytest
+
+from app import logger_config
+from app.logger_config import CorrelationIdMiddleware, DebugSamplingFilter, JsonFormatter
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def log_output(monkeypatch):
+    """Thay handler của QueueListener bằng buffer (pipeline queue thật, thread ghi thật)"""
+    buffer = io.StringIO()
+    handler = logging.StreamHandler(buffer)
+    handler.setFormatter(JsonFormatter())
+    monkeypatch.setattr(logger_config._listener, "handlers", (handler,))
+    return buffer
+
+
+def _read_lines(buffer: io.StringIO, count: int, timeout: float = 2.0) -> list:
+    """Chờ thread listener ghi đủ count dòng"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        lines = buffer.getvalue().splitlines()
+        if len(lines) >= count:
+            return [json.loads(line) for line in lines]
+        time.sleep(0.01)
+    raise AssertionError(f"expected {count} log lines, got {buffer.getvalue()!r}")
+
+
+async def _call(app, headers=()):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": list(headers)}
+    await app(scope, receive, send)
+    return dict(messages[0]["headers"])
+
+
+async def test_request_logs_are_json_with_correlation_id(log_output):
+    log = logging.getLogger("test_logging")
+
+    async def endpoint(scope, receive, send):
+        log.info("xử lý đơn hàng", extra={"order_id": "o1"})
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    app = CorrelationIdMiddleware(endpoint)
+    headers = await _call(app, [(b"x-request-id", b"req-123")])
+    assert headers[b"x-request-id"] == b"req-123"
+    generated = (await _call(app))[b"x-request-id"].decode()
+    log.warning("ngoài request")
+
+    first, second, outside = _read_lines(log_output, 3)
+    assert first["msg"] == "xử lý đơn hàng"
+    assert first["level"] == "INFO"
+    assert first["logger"] == "test_logging"
+    assert first["request_id"] == "req-123"
+    assert first["order_id"] == "o1"
+    assert second["request_id"] == generated and len(generated) == 16
+    assert "request_id" not in outside
+
+
+def test_debug_sampling_keeps_or_drops_whole_requests():
+    sampler = DebugSamplingFilter(rate=0.5)
+
+    def record(level: int, request_id: str) -> logging.LogRecord:
+        item = logging.LogRecord("test_logging", level, __file__, 1, "msg", (), None)
+        item.request_id = request_id
+        return item
+
+    kept = {
+        request_id: [sampler.filter(record(logging.DEBUG, request_id)) for _ in range(5)]
+        for request_id in (f"req-{i}" for i in range(200))
+    }
+    assert all(len(set(decisions)) == 1 for decisions in kept.values())
+    assert 0.3 < sum(decisions[0] for decisions in kept.values()) / len(kept) < 0.7
+    assert sampler.filter(record(logging.INFO, "req-0"))
@@ -0,0 +1,92 @@
+"""
+Metrics Prometheus: histogram bucket cộng dồn, CommandListener ghép started/succeeded/failed
+"""
+
+from types import SimpleNamespace
+
+from app.metrics import Histogram, MongoCommandMetrics, mongodb_command_duration_seconds, mongodb_command_failures_total
+
+
+def _samples(metric) -> dict:
+    """{dòng trước giá trị: giá trị} của metric đã render (bỏ HELP/TYPE)"""
+    samples = {}
+    for line in metric.render():
+        if not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("test_seconds", "test", ("route",), buckets=(0.5, 0.1, 1.0))
+    for value in (0.05, 0.1, 0.3, 0.7, 2.0, 3.0):
+        histogram.observe(value, "/a")
+    histogram.observe(0.2, "/b")
+
+    samples = _samples(histogram)
+    assert samples['test_seconds_bucket{route="/a",le="0.1"}'] == 2  # value == bound thuộc bucket đó
+    assert samples['test_seconds_bucket{route="/a",le="0.5"}'] == 3
+    assert samples['test_seconds_bucket{route="/a",le="1.0"}'] == 4
+    assert samples['test_seconds_bucket{route="/a",le="+Inf"}'] == 6
+    assert samples['test_seconds_count{route="/a"}'] == 6
+    assert abs(samples['test_seconds_sum{route="/a"}'] - 6.15) < 1e-9
+    assert samples['test_seconds_bucket{route="/b",le="0.1"}'] == 0
+    assert samples['test_seconds_bucket{route="/b",le="+Inf"}'] == 1
+
+    # Thứ tự bucket tăng dần trong output
+    bounds = [line.split('le="')[1].split('"')[0] for line in histogram.render() if '{route="/a",le=' in line]
+    assert bounds == ["0.1", "0.5", "1.0", "+Inf"]
+
+
+def _event(command_name: str, request_id: int, connection_id=("localhost", 27017), **command):
+    return SimpleNamespace(
+        command_name=command_name,
+        request_id=request_id,
+        connection_id=connection_id,
+        command={command_name: command.pop("collection", "test_listener"), **command},
+        duration_micros=0,
+    )
+
+
+def _finished(started, duration_ms: float):
+    return SimpleNamespace(
+        command_name=started.command_name,
+        request_id=started.request_id,
+        connection_id=started.connection_id,
+        duration_micros=int(duration_ms * 1000),
+    )
+
+
+def test_command_listener_pairs_started_and_finished():
+    listener = MongoCommandMetrics(slow_ms=50)
+    before = _samples(mongodb_command_duration_seconds)
+    count_key = 'mongodb_command_duration_seconds_count{collection="test_listener",command="find"}'
+
+    fast = _event("find", 1, filter={"email": "a@example.com"})
+    slow = _event("find", 2, filter={"status": "active", "price": {"$gte": 100}}, sort={"price": 1})
+    # Cùng request_id khác connection là command khác
+    other_connection = _event("find", 1, connection_id=("localhost", 27018))
+    failed = _event("aggregate", 3, pipeline=[{"$match": {"user_id": "u1"}}])
+    for event in (fast, slow, other_connection, failed):
+        listener.started(event)
+    listener.started(_event("ping", 4))  # Command nội bộ không đo
+
+    listener.succeeded(_finished(slow, 120))
+    listener.succeeded(_finished(fast, 2))
+    listener.succeeded(_finished(other_connection, 3))
+    listener.failed(_finished(failed, 80))
+    listener.succeeded(_finished(fast, 2))                    # Không có started tương ứng: bỏ qua
+    listener.succeeded(_finished(_event("ping", 4), 500))
+
+    after = _samples(mongodb_command_duration_seconds)
+    assert after[count_key] - before.get(count_key, 0) == 3
+    failures = _samples(mongodb_command_failures_total)
+    assert failures['mongodb_command_failures_total{collection="test_listener",command="aggregate"}'] >= 1
+    assert listener._pending == {}
+
+    samples = listener.get_slow_samples()
+    assert [sample["command"] for sample in samples] == ["aggregate", "find"]  # mới nhất trước
+    assert samples[0]["failed"] is True
+    assert samples[0]["detail"] == {"pipeline": [{"$match": {"user_id": "?"}}]}
+    assert samples[1]["duration_ms"] == 120
+    assert samples[1]["detail"] == {"filter": {"status": "?", "price": {"$gte": "?"}}, "sort": {"price": "?"}}
@@ -0,0 +1,76 @@
+"""
+Keyset pagination: cursor encode/decode và duyệt hết các trang không trùng, không sót
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from app.pagination import apply_keyset, decode_cursor, encode_cursor, with_tiebreaker
+
+mongomock = pytest.importorskip("mongomock")
+
+
+@pytest.fixture
+def products():
+    collection = mongomock.MongoClient().db.products
+    base = datetime(2024, 1, 1)
+    docs = []
+    for i in range(23):
+        docs.append({
+            "_id": ObjectId(),
+            "name": f"P{i}",
+            # Nhiều giá trị trùng + vài giá trị null để kiểm tra tiebreaker và nhánh null
+            "pricing": {"sale": None if i % 7 == 0 else (i % 4) * 100000},
+            "created_at": base + timedelta(hours=i // 3),
+        })
+    collection.insert_many(docs)
+    return collection
+
+
+def _walk(collection, sort_spec, limit=5, scope="test"):
+    seen = []
+    cursor = None
+    while True:
+        query = apply_keyset({}, sort_spec, cursor, scope)
+        page = list(collection.find(query).sort(sort_spec).limit(limit))
+        seen.extend(doc["_id"] for doc in page)
+        if len(page) < limit:
+            return seen
+        cursor = encode_cursor(page[-1], sort_spec, scope)
+
+
+def test_with_tiebreaker_follows_last_direction():
+    assert with_tiebreaker([("rating", 1)]) == [("rating", 1), ("_id", 1)]
+    assert with_tiebreaker([("created_at", -1)]) == [("created_at", -1), ("_id", -1)]
+    assert with_tiebreaker([("_id", 1)]) == [("_id", 1)]
+
+
+def test_cursor_round_trip_keeps_types():
+    doc = {"_id": ObjectId(), "created_at": datetime(2024, 5, 6, 7, 8, 9), "pricing": {"sale": None}}
+    spec = [("created_at", -1), ("pricing.sale", 1), ("_id", -1)]
+    cursor = encode_cursor(doc, spec, scope="newest")
+    assert decode_cursor(cursor, spec, scope="newest") == [doc["created_at"], None, doc["_id"]]
+
+
+def test_cursor_rejects_other_scope_and_garbage():
+    spec = [("_id", -1)]
+    cursor = encode_cursor({"_id": ObjectId()}, spec, scope="newest")
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, spec, scope="price_asc")
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor", spec)
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, [("created_at", -1), ("_id", -1)], scope="newest")
+
+
+@pytest.mark.parametrize("sort_spec", [
+    [("created_at", -1), ("_id", -1)],
+    [("pricing.sale", 1), ("_id", 1)],
+    [("pricing.sale", -1), ("_id", -1)],
+    [("pricing.sale", 1), ("created_at", -1), ("_id", -1)],
+])
+def test_walk_matches_single_query(products, sort_spec):
+    expected = [doc["_id"] for doc in products.find({}).sort(sort_spec)]
+    assert _walk(products, sort_spec) == expected
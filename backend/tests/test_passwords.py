@@ -0,0 +1,65 @@
+"""
+PasswordHasher: queue bcrypt đầy trả 503, hash lại nền khi cost cũ thấp hơn BCRYPT_ROUNDS
+"""
+
+import asyncio
+import threading
+
+import bcrypt
+import pytest
+
+from app.passwords import PasswordHasher, PasswordHasherBusy
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_full_queue_is_rejected_with_503():
+    hasher = PasswordHasher(workers=1, max_queue=1, rounds=4)
+    release = threading.Event()
+    try:
+        # 1 việc đang chạy + 1 việc chờ = đầy
+        running = [asyncio.create_task(hasher._run("verify", release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert hasher.get_stats()["pending"] == 2
+
+        with pytest.raises(PasswordHasherBusy) as exc_info:
+            await hasher._run("verify", release.wait)
+        assert exc_info.value.status_code == 503
+        assert exc_info.value.headers == {"Retry-After": "1"}
+
+        release.set()
+        assert await asyncio.gather(*running) == [True, True]
+        assert hasher.get_stats()["pending"] == 0
+        # Hết tải thì nhận việc lại bình thường
+        assert await hasher.verify("secret", await hasher.hash("secret"))
+    finally:
+        release.set()
+        await hasher.shutdown()
+
+
+async def test_needs_rehash_and_background_upgrade():
+    old_hash = bcrypt.hashpw(b"secret", bcrypt.gensalt(4)).decode("utf-8")
+    hasher = PasswordHasher(workers=1, max_queue=4, rounds=5)
+    assert hasher.needs_rehash(old_hash)
+    assert not PasswordHasher(rounds=4).needs_rehash(old_hash)
+    assert not hasher.needs_rehash("not-a-bcrypt-hash")
+
+    saved = []
+
+    async def save(new_hash: str) -> bool:
+        saved.append(new_hash)
+        return True
+
+    hasher.schedule_rehash("secret", old_hash, save)
+    await hasher.shutdown()  # Chờ task rehash nền
+
+    assert len(saved) == 1
+    assert saved[0].startswith("$2b$05$")
+    assert not hasher.needs_rehash(saved[0])
+    assert bcrypt.checkpw(b"secret", saved[0].encode("utf-8"))
+
+    # Hash đã đủ cost: không tạo task
+    hasher.schedule_rehash("secret", saved[0], save)
+    assert not hasher._tasks
+    await hasher.shutdown()
+    assert len(saved) == 1
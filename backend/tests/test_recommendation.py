@@ -0,0 +1,253 @@
+"""
+ProductRecommender: top-K láng giềng theo chunk, cập nhật tăng dần, replay sau fit, snapshot
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+import scipy.sparse as sp
+from sklearn.metrics.pairwise import cosine_similarity
+
+from app import recommender_snapshot
+from app.recommendation import ProductRecommender, _fit_model, compute_top_k_neighbors
+
+WORDS = [
+    "áo", "quần", "váy", "thun", "sơ mi", "jean", "kaki", "linen", "cotton", "len",
+    "basic", "oversize", "slim", "công sở", "dạo phố", "mùa hè", "mùa đông", "họa tiết",
+]
+COLORS = ["đen", "trắng", "xanh", "đỏ", "be", "nâu"]
+
+
+def _random_tfidf(rows: int = 60, cols: int = 40, seed: int = 7):
+    rng = np.random.default_rng(seed)
+    dense = rng.random((rows, cols), dtype=np.float32)
+    dense[dense < 0.8] = 0  # Thưa như TF-IDF thật, vài row không có term chung
+    dense[5] = 0            # Row rỗng (sản phẩm đã xóa)
+    norms = np.linalg.norm(dense, axis=1, keepdims=True)
+    return sp.csr_matrix(np.divide(dense, norms, out=np.zeros_like(dense), where=norms > 0))
+
+
+def _dense_top_k(matrix, k: int):
+    similarities = cosine_similarity(matrix)
+    np.fill_diagonal(similarities, -1)
+    expected = []
+    for row in similarities:
+        order = np.argsort(-row, kind="stable")[:k]
+        expected.append([(int(j), float(row[j])) for j in order if row[j] > 0])
+    return expected
+
+
+def test_top_k_matches_dense_similarity():
+    matrix = _random_tfidf()
+    k = 8
+    # chunk_elements nhỏ để chia nhiều chunk
+    indices, scores = compute_top_k_neighbors(matrix, k=k, chunk_elements=500)
+    assert indices.shape == scores.shape == (matrix.shape[0], k)
+
+    for row, expected in enumerate(_dense_top_k(matrix, k)):
+        valid = indices[row] >= 0
+        got_scores = scores[row][valid]
+        assert np.all(np.diff(got_scores) <= 1e-6)  # giảm dần
+        assert row not in indices[row]
+        np.testing.assert_allclose(got_scores, [score for _, score in expected], rtol=1e-5)
+        # Hòa điểm có thể đổi thứ tự, so theo tập láng giềng có điểm chắc chắn trong top-K
+        if expected and len(expected) == k:
+            cutoff = expected[-1][1]
+            assert {j for j, s in expected if s > cutoff + 1e-6} <= set(indices[row][valid].tolist())
+        else:
+            assert set(indices[row][valid].tolist()) == {j for j, _ in expected}
+
+    # Row rỗng không có láng giềng và không là láng giềng của ai
+    assert np.all(indices[5] == -1)
+    assert not np.any(indices == 5)
+
+
+def test_top_k_for_selected_rows():
+    matrix = _random_tfidf()
+    full_indices, full_scores = compute_top_k_neighbors(matrix, k=5)
+    rows = np.array([3, 17, 42])
+    indices, scores = compute_top_k_neighbors(matrix, k=5, chunk_elements=60, rows=rows)
+    np.testing.assert_allclose(scores, full_scores[rows], rtol=1e-6)
+    np.testing.assert_array_equal(indices, full_indices[rows])
+
+
+def _product(i: int, rng) -> dict:
+    return {
+        "_id": f"p{i}",
+        "name": " ".join(rng.choice(WORDS, size=3, replace=False)),
+        "short_description": " ".join(rng.choice(WORDS, size=4)),
+        "category": {"name": str(rng.choice(["Áo", "Quần", "Váy"]))},
+        "variants": {"colors": [{"name": str(c)} for c in rng.choice(COLORS, size=2, replace=False)]},
+        "status": "active",
+    }
+
+
+def _recommender(monkeypatch, during_fit=None) -> ProductRecommender:
+    """Fit trong thread (test không spawn process), during_fit chạy giữa lúc fit"""
+    recommender = ProductRecommender()
+
+    async def run_fit(contents):
+        if during_fit is not None:
+            during_fit(recommender)
+        return await asyncio.to_thread(_fit_model, contents)
+
+    monkeypatch.setattr(recommender, "_run_fit", run_fit)
+    return recommender
+
+
+def _assert_neighbors_consistent(recommender: ProductRecommender):
+    """Top-K tăng dần khớp tính lại từ đầu, reverse index khớp neighbor_indices"""
+    indices, scores = compute_top_k_neighbors(
+        recommender.tfidf_matrix, k=recommender.neighbor_indices.shape[1]
+    )
+    np.testing.assert_allclose(recommender.neighbor_scores, scores, atol=1e-5)
+    live = np.array([pid is not None for pid in recommender.product_ids])
+    assert not np.isin(recommender.neighbor_indices, np.flatnonzero(~live)).any()
+    for row in range(len(recommender.product_ids)):
+        expected = np.flatnonzero((recommender.neighbor_indices == row).any(axis=1))
+        np.testing.assert_array_equal(recommender._referrers_of(row), expected)
+
+
+@pytest.mark.anyio
+async def test_incremental_updates_match_full_recompute(monkeypatch):
+    rng = np.random.default_rng(3)
+    recommender = _recommender(monkeypatch)
+    assert await recommender.fit([_product(i, rng) for i in range(80)])
+
+    for i in range(80, 110):
+        assert recommender.upsert_product(_product(i, rng))
+    for i in range(0, 30, 3):
+        assert recommender.remove_product(f"p{i}")
+    for i in (1, 50, 95):
+        assert recommender.upsert_product(_product(i, rng))  # Sửa nội dung: row cũ bị xóa
+
+    assert len(recommender._row_of) == 100
+    assert recommender._dead_rows == 13
+    _assert_neighbors_consistent(recommender)
+    assert all(pid not in {f"p{i}" for i in range(0, 30, 3)}
+               for pid, _ in recommender.get_recommendations("p1", n=20))
+
+
+@pytest.mark.anyio
+async def test_writes_during_fit_are_replayed(monkeypatch):
+    rng = np.random.default_rng(5)
+    products = [_product(i, rng) for i in range(40)]
+    added = _product(100, rng)
+
+    def write_during_fit(recommender):
+        recommender.upsert_product(added)
+        recommender.remove_product("p7")
+
+    recommender = _recommender(monkeypatch, during_fit=write_during_fit)
+    assert await recommender.fit(products)
+
+    assert "p100" in recommender._row_of
+    assert "p7" not in recommender._row_of
+    assert not recommender._recording and recommender._replay == {}
+    _assert_neighbors_consistent(recommender)
+
+
+@pytest.mark.anyio
+async def test_failed_fit_keeps_serving_model(monkeypatch):
+    rng = np.random.default_rng(11)
+    recommender = _recommender(monkeypatch)
+
+    job = {"status": "preparing"}
+    assert not await recommender.fit([_product(0, rng)], job=job)
+    assert not recommender.is_fitted  # Chưa từng fit
+    assert job["status"] == "failed" and job["error"]
+
+    assert await recommender.fit([_product(i, rng) for i in range(30)])
+    before = recommender.get_recommendations("p1", n=5)
+    assert before
+
+    async def broken_fit(contents):
+        raise MemoryError("out of memory")
+
+    monkeypatch.setattr(recommender, "_run_fit", broken_fit)
+    job = {"status": "preparing"}
+    assert not await recommender.fit([_product(i, rng) for i in range(40)], job=job)
+    assert job["status"] == "failed" and job["error"] == "out of memory"
+
+    job = {"status": "preparing"}
+    assert not await recommender.fit([], job=job)
+    assert job["status"] == "failed"
+
+    assert recommender.is_fitted
+    assert recommender.get_recommendations("p1", n=5) == before
+    assert not recommender._recording
+
+
+@pytest.mark.anyio
+async def test_snapshot_roundtrip_and_stale_fingerprint(monkeypatch, tmp_path):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    monkeypatch.setattr(recommender_snapshot, "RECOMMENDER_SNAPSHOT_DIR", str(tmp_path))
+    rng = np.random.default_rng(13)
+    collection = mongomock_motor.AsyncMongoMockClient()["test"]["products"]
+    start = datetime(2025, 1, 1)
+    await collection.insert_many([
+        {**_product(i, rng), "updated_at": start + timedelta(minutes=i)} for i in range(40)
+    ])
+
+    fitted = _recommender(monkeypatch)
+    fitted.attach(collection)
+    assert not await fitted.restore_snapshot()  # Chưa có snapshot
+    assert await fitted.load()
+    assert fitted.snapshot_info is not None
+    assert (tmp_path / "CURRENT").exists()
+
+    restored = ProductRecommender()
+    restored.attach(collection)
+    assert await restored.restore_snapshot()
+    assert restored.product_ids == fitted.product_ids
+    np.testing.assert_array_equal(restored.neighbor_indices, fitted.neighbor_indices)
+    assert restored.get_recommendations("p3", n=8) == fitted.get_recommendations("p3", n=8)
+    # Mảng mmap copy-on-write vẫn cập nhật tăng dần được, file trên đĩa không đổi
+    assert restored.upsert_product(_product(3, rng))
+    _assert_neighbors_consistent(restored)
+    again = ProductRecommender()
+    again.attach(collection)
+    assert await again.restore_snapshot()
+    np.testing.assert_array_equal(again.neighbor_indices, fitted.neighbor_indices)
+
+    # Catalog đổi (thêm sản phẩm) -> fingerprint khác, snapshot bị bỏ qua
+    await collection.insert_one({**_product(99, rng), "updated_at": start + timedelta(days=1)})
+    stale = ProductRecommender()
+    stale.attach(collection)
+    assert not await stale.restore_snapshot()
+    assert not stale.is_fitted
+
+
+@pytest.mark.anyio
+async def test_profile_recommendations_match_dense_scores(monkeypatch):
+    rng = np.random.default_rng(17)
+    recommender = _recommender(monkeypatch)
+    assert recommender.get_recommendations_for_profile({"p1": 1.0}) == []  # Chưa fit
+    assert await recommender.fit([_product(i, rng) for i in range(60)])
+    recommender.remove_product("p9")
+
+    weights = {"p1": 1.0, "p2": 2.0, "p4": 3.0, "p9": 5.0, "unknown": 4.0}
+    result = recommender.get_recommendations_for_profile(
+        weights, n=10, min_similarity=0.0, exclude_ids=weights.keys()
+    )
+
+    # Profile chỉ gồm sản phẩm còn trong model (p9 đã xóa, unknown không có)
+    dense = recommender.tfidf_matrix.toarray()
+    profile = sum(weight * dense[recommender._row_of[pid]] for pid, weight in weights.items()
+                  if pid in recommender._row_of)
+    profile /= np.linalg.norm(profile)
+    expected = dense @ profile
+    excluded = {"p1", "p2", "p4", "p9", "unknown"}
+    ranked = sorted(
+        ((pid, float(score)) for pid, score in zip(recommender.product_ids, expected)
+         if pid is not None and pid not in excluded),
+        key=lambda item: -item[1]
+    )
+
+    assert len(result) == 10
+    assert not {pid for pid, _ in result} & excluded
+    np.testing.assert_allclose([score for _, score in result], [score for _, score in ranked[:10]], atol=1e-4)
+    assert [score for _, score in result] == sorted((score for _, score in result), reverse=True)
+    assert recommender.get_recommendations_for_profile({"p9": 1.0, "unknown": 1.0}) == []
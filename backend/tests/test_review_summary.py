@@ -0,0 +1,106 @@
+"""
+products.rating: $inc khi tạo / sửa / xóa review, fallback $group cho dạng cũ, đối soát
+"""
+
+import pytest
+from bson import ObjectId
+
+from app.review_summary import (
+    RatingReconciler,
+    apply_rating_change,
+    compute_rating,
+    distribution_of,
+    empty_rating,
+    rating_from_counts,
+)
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def db():
+    return mongomock_motor.AsyncMongoMockClient().db
+
+
+async def _new_product(db, rating=None) -> str:
+    result = await db.products.insert_one({"name": "Áo", "rating": rating if rating is not None else empty_rating()})
+    return str(result.inserted_id)
+
+
+async def _write_review(db, product_id: str, rating: int) -> ObjectId:
+    result = await db.reviews.insert_one({"product_id": product_id, "rating": rating})
+    return result.inserted_id
+
+
+async def _stored(db, product_id: str) -> dict:
+    return (await db.products.find_one({"_id": ObjectId(product_id)}))["rating"]
+
+
+def test_rating_from_counts():
+    rating = rating_from_counts({5: 3, 4: 1, 1: 1})
+    assert rating["count"] == 5
+    assert rating["sum"] == 20
+    assert rating["average"] == 4.0
+    assert distribution_of(rating) == {1: 1, 2: 0, 3: 0, 4: 1, 5: 3}
+
+
+async def test_create_edit_delete(db):
+    product_id = await _new_product(db)
+
+    first = await _write_review(db, product_id, 5)
+    await apply_rating_change(db.products, db.reviews, product_id, added=5)
+    await _write_review(db, product_id, 3)
+    await apply_rating_change(db.products, db.reviews, product_id, added=3)
+    rating = await _stored(db, product_id)
+    assert (rating["count"], rating["sum"], rating["average"]) == (2, 8, 4.0)
+    assert distribution_of(rating) == {1: 0, 2: 0, 3: 1, 4: 0, 5: 1}
+
+    # Sửa 5 -> 2 sao: count giữ nguyên
+    await db.reviews.update_one({"_id": first}, {"$set": {"rating": 2}})
+    await apply_rating_change(db.products, db.reviews, product_id, added=2, removed=5)
+    rating = await _stored(db, product_id)
+    assert (rating["count"], rating["sum"], rating["average"]) == (2, 5, 2.5)
+    assert distribution_of(rating) == {1: 0, 2: 1, 3: 1, 4: 0, 5: 0}
+
+    # Sửa nhưng giữ nguyên số sao: không ghi gì
+    assert await apply_rating_change(db.products, db.reviews, product_id, added=2, removed=2) is None
+
+    await db.reviews.delete_one({"_id": first})
+    await apply_rating_change(db.products, db.reviews, product_id, removed=2)
+    rating = await _stored(db, product_id)
+    assert rating == {**rating_from_counts({3: 1}), "average": 3.0}
+    assert rating == await compute_rating(db.reviews, product_id)
+
+
+async def test_legacy_rating_recomputed(db):
+    product_id = await _new_product(db, rating={"average": 4.5, "count": 2})
+    for stars in (4, 5, 5):
+        await _write_review(db, product_id, stars)
+    rating = await apply_rating_change(db.products, db.reviews, product_id, added=5)
+    assert rating == rating_from_counts({4: 1, 5: 2})
+    assert await _stored(db, product_id) == rating
+
+
+async def test_missing_product(db):
+    assert await apply_rating_change(db.products, db.reviews, str(ObjectId()), added=5) is None
+
+
+async def test_reconciler_repairs_drift(db):
+    in_sync = await _new_product(db, rating=rating_from_counts({5: 1}))
+    await _write_review(db, in_sync, 5)
+    drifted = await _new_product(db, rating=rating_from_counts({5: 4}))
+    await _write_review(db, drifted, 1)
+
+    repaired = []
+
+    async def on_repaired(product_id):
+        repaired.append(product_id)
+
+    reconciler = RatingReconciler()
+    reconciler.attach(db.products, db.reviews, on_repaired)
+    result = await reconciler.reconcile()
+    assert (result["checked"], result["repaired"]) == (2, 1)
+    assert repaired == [drifted]
+    assert await _stored(db, drifted) == rating_from_counts({1: 1})
@@ -0,0 +1,115 @@
+"""
+ProductSearchEngine: khớp không dấu, prefix, lỗi chính tả, filter và cập nhật tăng dần
+"""
+
+from bson import ObjectId
+
+from app.search_engine import ProductSearchEngine
+
+
+def _product(name: str, category=("Áo thun", "ao-thun"), status="active", **extra) -> dict:
+    return {
+        "_id": ObjectId(),
+        "name": name,
+        "sku": extra.pop("sku", ""),
+        "status": status,
+        "category": {"name": category[0], "slug": category[1]},
+        "brand": {"name": "Vyron", "slug": "vyron"},
+        "variants": {"colors": [{"name": color} for color in extra.pop("colors", [])]},
+        **extra,
+    }
+
+
+def _engine(*products) -> ProductSearchEngine:
+    engine = ProductSearchEngine()
+    engine.build(list(products))
+    return engine
+
+
+def _ids(results):
+    return [product_id for product_id, _ in results[0]]
+
+
+def test_accent_insensitive_match():
+    tee = _product("Áo Thun Cổ Tròn")
+    jeans = _product("Quần Jean Slim", category=("Quần", "quan"))
+    engine = _engine(tee, jeans)
+    assert _ids(engine.search("ao thun")) == [str(tee["_id"])]
+    assert _ids(engine.search("QUẦN jean")) == [str(jeans["_id"])]
+
+
+def test_name_outranks_description():
+    in_name = _product("Sơ mi linen")
+    in_description = _product("Áo basic", short_description="chất liệu linen mát")
+    engine = _engine(in_description, in_name)
+    assert _ids(engine.search("linen", prefix=False)) == [str(in_name["_id"]), str(in_description["_id"])]
+
+
+def test_prefix_and_typo():
+    hoodie = _product("Hoodie nỉ bông")
+    engine = _engine(hoodie, _product("Áo khoác gió"))
+    assert _ids(engine.search("hood")) == [str(hoodie["_id"])]
+    assert _ids(engine.search("hodie", prefix=False)) == [str(hoodie["_id"])]
+    assert engine.autocomplete("ho")["terms"][0].lower() == "hoodie"
+
+
+def test_and_then_or_fallback():
+    black = _product("Áo thun đen", colors=["Đen"])
+    white = _product("Áo thun trắng", colors=["Trắng"])
+    engine = _engine(black, white)
+    assert _ids(engine.search("thun den")) == [str(black["_id"])]
+    # Không sản phẩm nào có cả 2 từ -> nới thành OR
+    results, total = engine.search("den trang", prefix=False)
+    assert total == 2
+
+
+def test_filters_and_paging():
+    products = [_product(f"Áo polo {i}") for i in range(5)]
+    draft = _product("Áo polo nháp", status="draft")
+    other = _product("Áo polo váy", category=("Váy", "vay"))
+    engine = _engine(*products, draft, other)
+
+    _, total = engine.search("polo")
+    assert total == 6
+    _, total = engine.search("polo", active_only=False)
+    assert total == 7
+    assert _ids(engine.search("polo", category_slug="vay")) == [str(other["_id"])]
+
+    first = _ids(engine.search("polo", limit=3))
+    second = _ids(engine.search("polo", offset=3, limit=3))
+    assert len(first) == 3 and len(second) == 3
+    assert not set(first) & set(second)
+
+
+def test_upsert_and_remove():
+    product = _product("Áo sơ mi")
+    engine = _engine(product, _product("Quần short", category=("Quần", "quan")))
+    product_id = str(product["_id"])
+
+    engine.upsert(dict(product, name="Áo len cổ lọ"))
+    assert _ids(engine.search("len")) == [product_id]
+    assert _ids(engine.search("so mi")) == []
+
+    engine.remove(product_id)
+    assert engine.search("len") == ([], 0)
+    assert engine.get_stats()["total_products"] == 1
+
+
+def test_scores_follow_average_length_after_writes():
+    products = [_product(f"Áo thun {i}") for i in range(5)]
+    engine = _engine(*products)
+    # Tên dài hơn hẳn -> độ dài trung bình của field name tăng, index phải chấm lại
+    for i in range(10):
+        product = _product(f"Áo thun dáng rộng cổ tròn tay lỡ phối viền {i}")
+        products.append(product)
+        engine.upsert(product)
+    engine.remove(str(products[0]["_id"]))
+    assert engine.get_stats()["rescored"] > 0
+
+    rebuilt = _engine(*products[1:])
+    results, total = engine.search("ao thun", limit=20)
+    expected, expected_total = rebuilt.search("ao thun", limit=20)
+    assert total == expected_total == 14
+    scores = dict(results)
+    for product_id, score in expected:
+        assert abs(scores[product_id] - score) <= 0.1 * score
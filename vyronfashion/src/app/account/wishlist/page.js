@@ -8,8 +8,14 @@ import { Heart } from 'lucide-react'
 import * as wishlistAPI from '@/lib/api/wishlist'
 import * as productAPI from '@/lib/api/products'
 
+const WISHLIST_PAGE_SIZE = 24
+
 export default function WishlistPage() {
   const [wishlist, setWishlist] = useState([])
+  const [missing, setMissing] = useState([])
+  const [page, setPage] = useState(1)
+  const [total, setTotal] = useState(0)
+  const [totalPages, setTotalPages] = useState(1)
   const [loading, setLoading] = useState(true)
 
   // Lấy user ID từ localStorage
@@ -29,26 +35,38 @@ export default function WishlistPage() {
   }
 
   useEffect(() => {
-    fetchWishlist()
-  }, [])
+    fetchWishlist(page)
+  }, [page])
 
-  const fetchWishlist = async () => {
+  const fetchWishlist = async (targetPage = page) => {
     try {
       setLoading(true)
       const userId = getCurrentUserId()
       
       if (!userId) {
         setWishlist([])
+        setMissing([])
+        setTotal(0)
         setLoading(false)
         return
       }
 
-      // Lấy danh sách sản phẩm trong wishlist
-      const response = await wishlistAPI.getWishlistProducts(userId)
+      // Lấy 1 trang sản phẩm trong wishlist
+      const response = await wishlistAPI.getWishlistProducts(userId, { page: targetPage, limit: WISHLIST_PAGE_SIZE })
+      const pages = Math.max(1, response.totalPages || 1)
+      // Trang hiện tại rỗng sau khi xóa (vd: xóa món cuối của trang cuối) -> lùi về trang trước
+      if (targetPage > pages) {
+        setPage(pages)
+        return
+      }
       setWishlist(response.products || [])
+      setMissing(response.missing || [])
+      setTotal(response.total || 0)
+      setTotalPages(pages)
     } catch (error) {
       console.error('Error fetching wishlist:', error)
       setWishlist([])
+      setMissing([])
     } finally {
       setLoading(false)
     }
@@ -90,7 +108,7 @@ export default function WishlistPage() {
         description="Các sản phẩm bạn đã lưu"
       />
 
-      {wishlist.length === 0 ? (
+      {total === 0 ? (
         <EmptyState
           icon={Heart}
           title="Danh sách yêu thích trống"
@@ -100,8 +118,26 @@ export default function WishlistPage() {
         />
       ) : (
         <>
-          <WishlistStats items={wishlist} />
-          <WishlistGrid items={wishlist} onRemove={handleRemoveItem} />
+          <WishlistStats items={wishlist} total={total} />
+          <WishlistGrid items={wishlist} missing={missing} onRemove={handleRemoveItem} />
+
+          {totalPages > 1 && (
+            <div className="wishlist-pagination">
+              <button
+                onClick={() => setPage(p => Math.max(1, p - 1))}
+                disabled={page <= 1}
+              >
+                Trang trước
+              </button>
+              <span>Trang {page} / {totalPages}</span>
+              <button
+                onClick={() => setPage(p => Math.min(totalPages, p + 1))}
+                disabled={page >= totalPages}
+              >
+                Trang sau
+              </button>
+            </div>
+          )}
         </>
       )}
 
@@ -109,6 +145,27 @@ export default function WishlistPage() {
         .wishlist-page {
           max-width: 1400px;
         }
+        .wishlist-pagination {
+          display: flex;
+          align-items: center;
+          justify-content: center;
+          gap: 16px;
+          margin-top: 32px;
+          font-size: 14px;
+          color: #4b5563;
+        }
+        .wishlist-pagination button {
+          padding: 8px 16px;
+          border: 1px solid #d1d5db;
+          border-radius: 8px;
+          background: white;
+          font-weight: 500;
+          cursor: pointer;
+        }
+        .wishlist-pagination button:disabled {
+          opacity: 0.5;
+          cursor: not-allowed;
+        }
       `}</style>
     </div>
   )
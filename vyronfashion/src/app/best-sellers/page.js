@@ -7,6 +7,7 @@ import ProductToolbar from '@/components/category/ProductToolbar';
 import EnhancedProductCard from '@/components/category/EnhancedProductCard';
 import EmptyResults from '@/components/category/EmptyResults';
 import { FireIcon } from '@heroicons/react/24/solid';
+import { useWishlisted } from '@/hooks/useWishlisted';
 
 /**
  * Best Sellers Page Component
@@ -42,6 +43,7 @@ export default function BestSellersPage() {
   const [products, setProducts] = useState([]);
   const [totalProducts, setTotalProducts] = useState(0);
   const [filterOptions, setFilterOptions] = useState({});
+  const wishlisted = useWishlisted(products);
 
   // User state (mock - replace with real auth)
   const [isAuthenticated, setIsAuthenticated] = useState(false);
@@ -290,7 +292,7 @@ export default function BestSellersPage() {
                           #{index + 1}
                         </div>
                       )}
-                      <EnhancedProductCard product={product} />
+                      <EnhancedProductCard product={product} wishlisted={wishlisted[product.id]} />
                     </div>
                   ))}
                 </div>
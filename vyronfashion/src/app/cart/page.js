@@ -370,7 +370,14 @@ export default function CartPage() {
     // Update via API
     try {
       setIsUpdating(true);
-      await cartAPI.updateCartItemQuantity(userId, item.itemIndex, newQuantity);
+      // Cập nhật theo product_id + variant thay vì index (index lệch khi tab khác sửa giỏ hàng)
+      await cartAPI.updateCartItemQuantity(
+        userId,
+        item.product_id,
+        item.variant_color,
+        item.variant_size,
+        newQuantity
+      );
       // Dispatch event to update cart count in header
       if (typeof window !== 'undefined') {
         window.dispatchEvent(new Event('cartChanged'));
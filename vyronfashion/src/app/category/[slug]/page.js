@@ -7,6 +7,7 @@ import ProductToolbar from '@/components/category/ProductToolbar';
 import EnhancedProductCard from '@/components/category/EnhancedProductCard';
 import EmptyResults from '@/components/category/EmptyResults';
 import { motion } from 'framer-motion';
+import { useWishlisted } from '@/hooks/useWishlisted';
 
 /**
  * Category Page Component
@@ -53,6 +54,7 @@ export default function CategoryPage({ params }) {
   const [products, setProducts] = useState([]);
   const [totalProducts, setTotalProducts] = useState(0);
   const [filterOptions, setFilterOptions] = useState({});
+  const wishlisted = useWishlisted(products);
 
   // User state (mock - replace with real auth)
   const [isAuthenticated, setIsAuthenticated] = useState(false);
@@ -333,7 +335,7 @@ export default function CategoryPage({ params }) {
                 {/* Product Grid */}
                 <div className="grid grid-cols-2 md:grid-cols-3 xl:grid-cols-4 gap-4 md:gap-6">
                   {products.map((product) => (
-                    <EnhancedProductCard key={product.id} product={product} />
+                    <EnhancedProductCard key={product.id} product={product} wishlisted={wishlisted[product.id]} />
                   ))}
                 </div>
 
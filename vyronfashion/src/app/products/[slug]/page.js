@@ -30,6 +30,9 @@ export default function ProductDetailPage({ params }) {
   const [loading, setLoading] = useState(true);
   const [reviews, setReviews] = useState([]);
   const [reviewsLoading, setReviewsLoading] = useState(true);
+  const [ratingDistribution, setRatingDistribution] = useState({});
+  const [reviewsCursor, setReviewsCursor] = useState(null);
+  const [loadingMoreReviews, setLoadingMoreReviews] = useState(false);
   const [selectedVariant, setSelectedVariant] = useState({
     color: null,
     size: null
@@ -45,6 +48,25 @@ export default function ProductDetailPage({ params }) {
   const [wishlistLoading, setWishlistLoading] = useState(false);
   const addToCartButtonRef = useRef(null);
 
+  // Áp dụng 1 trang review: trang đầu thay danh sách, trang sau (cursor) nối thêm
+  const applyReviewsPage = (reviewsData, append = false) => {
+    const page = reviewsData.reviews || [];
+    setReviews(prev => (append ? [...prev, ...page] : page));
+    setReviewsCursor(reviewsData.next_cursor || null);
+    setRatingDistribution(reviewsData.rating_distribution || {});
+    
+    // Cập nhật rating từ tóm tắt của sản phẩm
+    if (reviewsData.average_rating) {
+      setProduct(prev => ({
+        ...prev,
+        rating: {
+          average: reviewsData.average_rating,
+          count: reviewsData.total
+        }
+      }));
+    }
+  };
+
   // Get current user ID
   const getCurrentUserId = () => {
     if (typeof window !== 'undefined') {
@@ -140,21 +162,11 @@ export default function ProductDetailPage({ params }) {
           // Load reviews
           try {
             const reviewsData = await reviewAPI.getProductReviews(foundProduct.id);
-            setReviews(reviewsData.reviews || []);
-            
-            // Cập nhật rating từ reviews
-            if (reviewsData.average_rating) {
-              setProduct(prev => ({
-                ...prev,
-                rating: {
-                  average: reviewsData.average_rating,
-                  count: reviewsData.total
-                }
-              }))
-            }
+            applyReviewsPage(reviewsData);
           } catch (reviewError) {
             console.error('Error loading reviews:', reviewError);
             setReviews([]);
+            setReviewsCursor(null);
           } finally {
             setReviewsLoading(false);
           }
@@ -501,26 +513,28 @@ export default function ProductDetailPage({ params }) {
         product_id: product.id
       })
       
-      // Reload reviews
+      // Reload reviews (về trang đầu)
       const reviewsData = await reviewAPI.getProductReviews(product.id)
-      setReviews(reviewsData.reviews || [])
-      
-      // Cập nhật rating
-      if (reviewsData.average_rating) {
-        setProduct(prev => ({
-          ...prev,
-          rating: {
-            average: reviewsData.average_rating,
-            count: reviewsData.total
-          }
-        }))
-      }
+      applyReviewsPage(reviewsData)
     } catch (error) {
       console.error('Error submitting review:', error)
       throw error
     }
   }
 
+  const handleLoadMoreReviews = async () => {
+    if (!reviewsCursor || loadingMoreReviews) return
+    setLoadingMoreReviews(true)
+    try {
+      const reviewsData = await reviewAPI.getProductReviews(product.id, { cursor: reviewsCursor })
+      applyReviewsPage(reviewsData, true)
+    } catch (error) {
+      console.error('Error loading more reviews:', error)
+    } finally {
+      setLoadingMoreReviews(false)
+    }
+  }
+
   // Loading state
   if (loading) {
     return (
@@ -631,7 +645,11 @@ export default function ProductDetailPage({ params }) {
             <ProductReviews
               product={product}
               reviews={reviews}
+              ratingDistribution={ratingDistribution}
               loading={reviewsLoading}
+              hasMore={!!reviewsCursor}
+              loadingMore={loadingMoreReviews}
+              onLoadMore={handleLoadMoreReviews}
               onSubmit={handleReviewSubmit}
             />
           </div>
@@ -42,10 +42,10 @@ export function QuickActionsGrid() {
           console.error('Error fetching orders:', error)
         }
 
-        // Fetch wishlist count
+        // Fetch wishlist count - chỉ cần total, lấy 1 sản phẩm là đủ
         try {
-          const wishlistResponse = await wishlistAPI.getWishlistProducts(userId)
-          setWishlistCount(wishlistResponse.products?.length || wishlistResponse.total || 0)
+          const wishlistResponse = await wishlistAPI.getWishlistProducts(userId, { limit: 1 })
+          setWishlistCount(wishlistResponse.total || 0)
         } catch (error) {
           console.error('Error fetching wishlist:', error)
         }
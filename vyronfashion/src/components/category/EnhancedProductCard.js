@@ -54,14 +54,14 @@ const getHexColor = (color) => {
  * - Quick add with size selection
  * - Lazy loading images with fixed aspect ratio (3:4)
  * - Hover: Available colors + Quick View
- * - Wishlist toggle
+ * - Wishlist toggle (trạng thái ban đầu do trang danh sách truyền vào qua useWishlisted)
  * - Optimized with React.memo
  */
-const EnhancedProductCard = memo(function EnhancedProductCard({ product }) {
+const EnhancedProductCard = memo(function EnhancedProductCard({ product, wishlisted }) {
   const [selectedSize, setSelectedSize] = useState(null);
   const [selectedColor, setSelectedColor] = useState(null);
   const [hoveredColor, setHoveredColor] = useState(null);
-  const [isWishlisted, setIsWishlisted] = useState(false);
+  const [isWishlisted, setIsWishlisted] = useState(!!wishlisted);
   const [imageLoaded, setImageLoaded] = useState(false);
   const [showQuickView, setShowQuickView] = useState(false);
   const [wishlistCount, setWishlistCount] = useState(product.wishlist_count || 0);
@@ -85,25 +85,12 @@ const EnhancedProductCard = memo(function EnhancedProductCard({ product }) {
     return null
   }
   
-  // Kiểm tra product có trong wishlist không (khi mount)
+  // Trạng thái yêu thích do trang danh sách kiểm tra 1 lần cho cả trang (useWishlisted)
   useEffect(() => {
-    const checkWishlist = async () => {
-      const userId = getCurrentUserId()
-      if (!userId) return
-      
-      try {
-        const wishlist = await wishlistAPI.getWishlist(userId)
-        const productInWishlist = wishlist.wishlist?.some(
-          item => (typeof item === 'object' ? item.product_id : item) === product.id
-        )
-        setIsWishlisted(productInWishlist || false)
-      } catch (error) {
-        console.error('Error checking wishlist:', error)
-      }
+    if (wishlisted !== undefined) {
+      setIsWishlisted(wishlisted)
     }
-    
-    checkWishlist()
-  }, [product.id])
+  }, [wishlisted])
 
   // Map từ API format sang format cũ của component
   const price = product.pricing?.sale || product.pricing?.original || product.price || 0
@@ -5,11 +5,13 @@ import Link from 'next/link';
 import EnhancedProductCard from '@/components/category/EnhancedProductCard';
 import { FireIcon } from '@heroicons/react/24/solid';
 import * as productAPI from '@/lib/api/products';
+import { useWishlisted } from '@/hooks/useWishlisted';
 
 export default function BestSellers() {
   const [products, setProducts] = useState([]);
   const [loading, setLoading] = useState(true);
   const [sortOrder, setSortOrder] = useState('desc'); // 'desc' = giảm dần, 'asc' = tăng dần
+  const wishlisted = useWishlisted(products);
 
   // Fetch sản phẩm bán chạy từ API
   useEffect(() => {
@@ -134,7 +136,7 @@ export default function BestSellers() {
                   <FireIcon className="w-3 h-3" />
                   {product.sold_count || 0} đã bán
                 </div>
-                <EnhancedProductCard product={transformedProduct} />
+                <EnhancedProductCard product={transformedProduct} wishlisted={wishlisted[transformedProduct.id]} />
               </div>
             );
           })}
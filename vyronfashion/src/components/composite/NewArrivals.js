@@ -5,12 +5,14 @@ import ProductCard from '@/components/ui/ProductCard';
 import EnhancedProductCard from '@/components/category/EnhancedProductCard';
 import { ChevronLeftIcon, ChevronRightIcon } from '@heroicons/react/24/outline';
 import * as productAPI from '@/lib/api/products';
+import { useWishlisted } from '@/hooks/useWishlisted';
 
 export default function NewArrivals() {
   const [currentIndex, setCurrentIndex] = useState(0);
   const [itemsPerView, setItemsPerView] = useState(4);
   const [newProducts, setNewProducts] = useState([]);
   const [loading, setLoading] = useState(true);
+  const wishlisted = useWishlisted(newProducts);
 
   // Load new products from API
   useEffect(() => {
@@ -146,7 +148,7 @@ export default function NewArrivals() {
                   className="flex-shrink-0 px-3"
                   style={{ width: `${100 / itemsPerView}%` }}
                 >
-                  <EnhancedProductCard product={product} />
+                  <EnhancedProductCard product={product} wishlisted={wishlisted[product.id]} />
                 </div>
               ))}
             </div>
@@ -5,7 +5,16 @@ import { Star } from 'lucide-react'
 import { formatCurrency } from '@/lib/formatCurrency'
 import { checkUserOrderedProduct } from '@/lib/api/orders'
 
-export default function ProductReviews({ product, reviews = [], loading = false, onSubmit }) {
+export default function ProductReviews({
+  product,
+  reviews = [],
+  ratingDistribution = {},
+  loading = false,
+  hasMore = false,
+  loadingMore = false,
+  onLoadMore,
+  onSubmit
+}) {
   const [showForm, setShowForm] = useState(false)
   const [rating, setRating] = useState(0)
   const [hoverRating, setHoverRating] = useState(0)
@@ -139,7 +148,8 @@ export default function ProductReviews({ product, reviews = [], loading = false,
           
           <div className="flex-1">
             {[5, 4, 3, 2, 1].map((star) => {
-              const count = reviews.filter(r => r.rating === star).length
+              // Phân bố sao của cả sản phẩm (rating_distribution), không phải chỉ trang đang hiển thị
+              const count = Number(ratingDistribution?.[star] || 0)
               const percentage = reviewCount > 0 ? (count / reviewCount) * 100 : 0
               
               return (
@@ -315,6 +325,19 @@ export default function ProductReviews({ product, reviews = [], loading = false,
               </div>
             </div>
           ))}
+
+          {hasMore && (
+            <div className="text-center">
+              <button
+                type="button"
+                onClick={onLoadMore}
+                disabled={loadingMore}
+                className="px-6 py-2 bg-white border border-gray-300 text-gray-700 rounded-lg font-semibold hover:bg-gray-100 transition-colors disabled:opacity-60 disabled:cursor-not-allowed"
+              >
+                {loadingMore ? 'Đang tải...' : 'Xem thêm đánh giá'}
+              </button>
+            </div>
+          )}
         </div>
       )}
     </div>
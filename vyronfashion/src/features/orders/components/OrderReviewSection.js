@@ -37,7 +37,7 @@ function ReviewForm({ item, productId, onReviewSubmitted }) {
     }
 
     try {
-      const response = await reviewAPI.getProductReviews(productId)
+      const response = await reviewAPI.getProductReviews(productId, { user_id: userId, limit: 1 })
       const userReview = response.reviews?.find(r => r.user_id === userId)
       if (userReview) {
         setExistingReview(userReview)
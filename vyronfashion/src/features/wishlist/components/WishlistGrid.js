@@ -6,8 +6,13 @@ import { formatCurrency } from '@/lib/formatCurrency'
 import { getProductImage, handleImageError } from '@/lib/imageHelper'
 import styles from './WishlistGrid.module.css'
 
-export function WishlistGrid({ items = [], onRemove }) {
-  if (!items || items.length === 0) {
+const UNAVAILABLE_LABELS = {
+  inactive: 'Ngừng bán',
+  out_of_stock: 'Hết hàng'
+}
+
+export function WishlistGrid({ items = [], missing = [], onRemove }) {
+  if ((!items || items.length === 0) && (!missing || missing.length === 0)) {
     return null
   }
 
@@ -16,11 +21,17 @@ export function WishlistGrid({ items = [], onRemove }) {
       {items.map((product) => {
         const price = product.pricing?.sale || product.pricing?.original || 0
         const originalPrice = product.pricing?.original && product.pricing?.sale ? product.pricing.original : null
+        const unavailable = product.is_available === false
         
         return (
-          <div key={product.id} className={styles.card}>
+          <div key={product.id} className={`${styles.card} ${unavailable ? styles.unavailable : ''}`}>
             <Link href={`/products/${product.slug}`} className={styles.imageLink}>
               <div className={styles.imageContainer}>
+                {unavailable && (
+                  <span className={styles.unavailableBadge}>
+                    {UNAVAILABLE_LABELS[product.unavailable_reason] || 'Không khả dụng'}
+                  </span>
+                )}
                 <img
                   src={getProductImage(product)}
                   alt={product.name}
@@ -58,6 +69,27 @@ export function WishlistGrid({ items = [], onRemove }) {
           </div>
         )
       })}
+
+      {/* Sản phẩm đã bị xóa khỏi hệ thống - chỉ còn cho phép bỏ khỏi danh sách */}
+      {missing.map((item) => (
+        <div key={item.product_id} className={`${styles.card} ${styles.unavailable}`}>
+          <div className={`${styles.imageContainer} ${styles.missingImage}`}>
+            <Heart size={32} />
+            <span className={styles.unavailableBadge}>Không còn tồn tại</span>
+          </div>
+          <div className={styles.content}>
+            <h3 className={styles.title}>Sản phẩm không còn tồn tại</h3>
+            <button
+              onClick={() => onRemove(item.product_id)}
+              className={styles.removeButton}
+              title="Xóa khỏi yêu thích"
+            >
+              <Trash2 size={18} />
+              <span>Xóa</span>
+            </button>
+          </div>
+        </div>
+      ))}
     </div>
   )
 }
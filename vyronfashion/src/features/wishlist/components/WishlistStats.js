@@ -3,8 +3,9 @@
 import { Heart } from 'lucide-react'
 import styles from './WishlistStats.module.css'
 
-export function WishlistStats({ items = [] }) {
-  const totalItems = items.length
+export function WishlistStats({ items = [], total }) {
+  // total: số sản phẩm của cả wishlist (items chỉ là trang hiện tại)
+  const totalItems = total ?? items.length
   const totalValue = items.reduce((sum, item) => {
     const price = item.pricing?.sale || item.pricing?.original || 0
     return sum + price
@@ -27,7 +28,9 @@ export function WishlistStats({ items = [] }) {
           <Heart size={24} />
         </div>
         <div className={styles.content}>
-          <div className={styles.label}>Tổng giá trị</div>
+          <div className={styles.label}>
+            {totalItems > items.length ? 'Tổng giá trị (trang này)' : 'Tổng giá trị'}
+          </div>
           <div className={styles.value}>
             {new Intl.NumberFormat('vi-VN', {
               style: 'currency',
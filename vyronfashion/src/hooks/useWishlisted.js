@@ -0,0 +1,55 @@
+'use client';
+
+import { useState, useEffect, useRef } from 'react';
+import * as wishlistAPI from '@/lib/api/wishlist';
+
+const getCurrentUserId = () => {
+  if (typeof window === 'undefined') return null;
+  try {
+    const user = JSON.parse(localStorage.getItem('user') || 'null');
+    return user?.id || user?._id || null;
+  } catch (e) {
+    return null;
+  }
+};
+
+/**
+ * Trạng thái yêu thích của cả danh sách sản phẩm - 1 request checkWishlisted
+ * cho mỗi lần danh sách đổi (chỉ hỏi các id chưa kiểm tra, vd: khi "xem thêm"),
+ * thay vì mỗi card tự tải toàn bộ wishlist
+ *
+ * Returns:
+ * - { [productId]: boolean } - id chưa có trong map = chưa biết (chưa đăng nhập / đang tải)
+ */
+export function useWishlisted(products) {
+  const [wishlisted, setWishlisted] = useState({});
+  const checkedRef = useRef(new Set());
+  const idsKey = (products || []).map((product) => product?.id).filter(Boolean).join(',');
+
+  useEffect(() => {
+    const userId = getCurrentUserId();
+    if (!userId || !idsKey) return;
+
+    const ids = idsKey.split(',').filter((id) => !checkedRef.current.has(id));
+    if (ids.length === 0) return;
+    ids.forEach((id) => checkedRef.current.add(id));
+
+    let cancelled = false;
+    let done = false;
+    wishlistAPI.checkWishlisted(userId, ids).then((result) => {
+      done = true;
+      if (!cancelled) {
+        setWishlisted((prev) => ({ ...prev, ...result }));
+      }
+    });
+    return () => {
+      cancelled = true;
+      // Danh sách đổi trước khi có kết quả -> cho phép hỏi lại các id này
+      if (!done) ids.forEach((id) => checkedRef.current.delete(id));
+    };
+  }, [idsKey]);
+
+  return wishlisted;
+}
+
+export default useWishlisted;
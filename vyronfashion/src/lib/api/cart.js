@@ -40,7 +40,41 @@ export async function getCart(userId) {
   }
 }
 
-export async function updateCartItemQuantity(userId, itemIndex, quantity) {
+/**
+ * Cập nhật số lượng sản phẩm trong giỏ hàng theo product + variant
+ * @param {string} userId - User ID
+ * @param {string} productId - Product ID
+ * @param {string} color - Variant color (optional)
+ * @param {string} size - Variant size (optional)
+ * @param {number} quantity - Số lượng mới (>= 1)
+ */
+export async function updateCartItemQuantity(userId, productId, color = null, size = null, quantity = 1) {
+  try {
+    const queryParams = new URLSearchParams({ product_id: productId, quantity: quantity.toString() });
+    if (color) queryParams.append('color', color);
+    if (size) queryParams.append('size', size);
+    
+    const response = await fetch(`${API_BASE_URL}/api/cart/${userId}/item?${queryParams.toString()}`, {
+      method: 'PUT',
+    });
+    
+    if (!response.ok) {
+      const error = await response.json();
+      throw new Error(error.detail || 'Không thể cập nhật số lượng');
+    }
+    
+    return await response.json();
+  } catch (error) {
+    console.error('Error updating cart item quantity:', error);
+    throw error;
+  }
+}
+
+/**
+ * Cập nhật số lượng bằng index (legacy)
+ * @deprecated Sử dụng updateCartItemQuantity với productId thay thế
+ */
+export async function updateCartItemQuantityByIndex(userId, itemIndex, quantity) {
   try {
     const response = await fetch(`${API_BASE_URL}/api/cart/${userId}/${itemIndex}?quantity=${quantity}`, {
       method: 'PUT',
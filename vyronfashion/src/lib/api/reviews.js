@@ -31,11 +31,17 @@ export async function createReview(reviewData) {
 }
 
 /**
- * Lấy danh sách đánh giá của sản phẩm
+ * Lấy danh sách đánh giá của sản phẩm (phân trang bằng cursor)
+ * @param {Object} params - { rating, user_id, sort, limit, cursor }
  */
-export async function getProductReviews(productId) {
+export async function getProductReviews(productId, params = {}) {
   try {
-    const response = await fetch(`${API_BASE_URL}/api/reviews/product/${productId}`)
+    const query = new URLSearchParams()
+    Object.entries(params).forEach(([key, value]) => {
+      if (value !== undefined && value !== null && value !== '') query.append(key, value)
+    })
+    const qs = query.toString()
+    const response = await fetch(`${API_BASE_URL}/api/reviews/product/${productId}${qs ? `?${qs}` : ''}`)
     
     if (!response.ok) {
       if (response.status === 404) return { reviews: [], total: 0, average_rating: 0, rating_distribution: {} }
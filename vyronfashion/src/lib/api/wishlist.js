@@ -52,11 +52,12 @@ export async function getWishlist(userId) {
 }
 
 /**
- * Lấy danh sách sản phẩm trong wishlist
+ * Lấy danh sách sản phẩm trong wishlist (theo thứ tự wishlist, có phân trang)
+ * @param {Object} params - { page, limit }
  */
-export async function getWishlistProducts(userId) {
+export async function getWishlistProducts(userId, { page = 1, limit = 100 } = {}) {
   try {
-    const response = await fetch(`${API_BASE_URL}/api/wishlist/${userId}/products`)
+    const response = await fetch(`${API_BASE_URL}/api/wishlist/${userId}/products?page=${page}&limit=${limit}`)
     
     if (!response.ok) {
       throw new Error(`HTTP error! status: ${response.status}`)
@@ -69,3 +70,26 @@ export async function getWishlistProducts(userId) {
   }
 }
 
+/**
+ * Kiểm tra hàng loạt sản phẩm đã nằm trong wishlist chưa (trang danh sách sản phẩm)
+ * @returns {Promise<Object>} { [productId]: boolean }
+ */
+export async function checkWishlisted(userId, productIds) {
+  if (!userId || !productIds?.length) return {}
+  try {
+    const response = await fetch(
+      `${API_BASE_URL}/api/wishlist/${userId}/contains?product_ids=${productIds.join(',')}`
+    )
+    
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`)
+    }
+    
+    const data = await response.json()
+    return data.wishlisted || {}
+  } catch (error) {
+    console.error('Error checking wishlist:', error)
+    return {}
+  }
+}
+